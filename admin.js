@@ -776,8 +776,8 @@ async function handleTimesheetUpload(e) {
         const result = await response.json();
         
         if (result.success && result.loadingId) {
-            // Start polling for progress
-            await pollLoadingProgress(result.loadingId, statusDiv);
+            // Follow the progress until the load finishes
+            followLoadingProgress(result.loadingId, statusDiv);
         } else {
             statusDiv.className = 'status-message error';
             statusDiv.textContent = result.error || 'Ошибка загрузки табельных данных';
@@ -794,6 +794,54 @@ async function handleTimesheetUpload(e) {
     }
 }
 
+// Follow loading progress through the server's event stream; browsers
+// without EventSource poll instead
+function followLoadingProgress(loadingId, statusDiv) {
+    if (!window.EventSource) {
+        return pollLoadingProgress(loadingId, statusDiv);
+    }
+    
+    // EventSource reconnects by itself and resumes with Last-Event-ID
+    const source = new EventSource(`${ADMIN_API_BASE_URL}/admin/load/progress/${loadingId}/stream`);
+    
+    source.addEventListener('progress', (event) => {
+        if (showLoadingProgress(JSON.parse(event.data), statusDiv)) {
+            source.close();
+        }
+    });
+    
+    source.onerror = () => {
+        // CLOSED means the server refused the stream (unknown load, server error)
+        if (source.readyState === EventSource.CLOSED) {
+            statusDiv.className = 'status-message error';
+            statusDiv.textContent = 'Ошибка получения статуса загрузки';
+        }
+    };
+}
+
+// Show one progress state; returns true once the load has finished
+function showLoadingProgress(progress, statusDiv) {
+    updateProgressDisplay(progress, statusDiv);
+    
+    if (progress.status === 'completed') {
+        statusDiv.className = 'status-message success';
+        statusDiv.innerHTML = `
+            <div><strong>Загрузка завершена!</strong></div>
+            <div>${progress.message}</div>
+            <div>Всего подразделений: ${progress.totalEmployees ? Math.ceil(progress.totalEmployees / 10) : 'N/A'}</div>
+            <div>Обработано сотрудников: ${progress.processedEmployees || 0}</div>
+            <div>Загружено событий: ${progress.eventsLoaded || 0}</div>
+            ${progress.eventsNew !== undefined ? `<div>Новых: ${progress.eventsNew}, уже сохраненных: ${progress.eventsKnown || 0}</div>` : ''}
+        `;
+        return true;
+    } else if (progress.status === 'error') {
+        statusDiv.className = 'status-message error';
+        statusDiv.textContent = progress.message || 'Ошибка загрузки';
+        return true;
+    }
+    return false;
+}
+
 // Poll for loading progress
 async function pollLoadingProgress(loadingId, statusDiv) {
     const maxPolls = 1800; // 30 minutes max (1800 * 1 second)
@@ -805,21 +853,7 @@ async function pollLoadingProgress(loadingId, statusDiv) {
             const progress = await response.json();
             
             if (progress.success) {
-                updateProgressDisplay(progress, statusDiv);
-                
-                if (progress.status === 'completed') {
-                    statusDiv.className = 'status-message success';
-                    statusDiv.innerHTML = `
-                        <div><strong>Загрузка завершена!</strong></div>
-                        <div>${progress.message}</div>
-                        <div>Всего подразделений: ${progress.totalEmployees ? Math.ceil(progress.totalEmployees / 10) : 'N/A'}</div>
-                        <div>Обработано сотрудников: ${progress.processedEmployees || 0}</div>
-                        <div>Загружено событий: ${progress.eventsLoaded || 0}</div>
-                    `;
-                    return;
-                } else if (progress.status === 'error') {
-                    statusDiv.className = 'status-message error';
-                    statusDiv.textContent = progress.message || 'Ошибка загрузки';
+                if (showLoadingProgress(progress, statusDiv)) {
                     return;
                 }
                 
@@ -1013,7 +1047,9 @@ async function loadTimeEvents() {
         
         adminTimeEventsData = await response.json();
         displayTimeEvents(adminTimeEventsData);
-        document.getElementById('events-total').textContent = adminTimeEventsData.length;
+        // Показана первая страница; остальное доступно через выгрузку (?format=csv)
+        const hasMore = response.headers.get('X-Next-Cursor');
+        document.getElementById('events-total').textContent = adminTimeEventsData.length + (hasMore ? '+' : '');
     } catch (error) {
         console.error('Error loading time events:', error);
         tbody.innerHTML = '<tr><td colspan="5" style="text-align: center; color: #dc3545;">Ошибка загрузки данных</td></tr>';
@@ -0,0 +1,114 @@
+require('dotenv').config();
+const cluster = require('cluster');
+const os = require('os');
+const log = require('./utils/logger')('cluster');
+
+// Clustered serving mode: node backend/cluster.js
+// - the primary initializes the database once and runs the background work
+//   (partition maintenance, load jobs, the production sync); it serves nothing
+// - CLUSTER_WORKERS processes run server.js and share the port
+// - DB_POOL_BUDGET connections are split evenly between all the processes
+// - SIGHUP replaces the workers one at a time with fresh ones (rolling
+//   restart, picks up new code of everything but the primary), SIGTERM and
+//   SIGINT stop them gracefully; a worker that dies is replaced
+const WORKERS = parseInt(process.env.CLUSTER_WORKERS) || os.cpus().length;
+const POOL_BUDGET = parseInt(process.env.DB_POOL_BUDGET) || 20;
+// A retiring worker gets this long to finish its requests before it is killed
+const SHUTDOWN_TIMEOUT_MS = parseInt(process.env.CLUSTER_SHUTDOWN_TIMEOUT_MS) || 30000;
+const RESPAWN_DELAY_MS = 1000;
+
+let shuttingDown = false;
+let restarting = false;
+
+// Disconnect a worker and wait until it has exited
+function retire(worker) {
+  return new Promise((resolve) => {
+    const timer = setTimeout(() => {
+      log.warn('Worker did not finish in time, killing it', { pid: worker.process.pid, timeoutMs: SHUTDOWN_TIMEOUT_MS });
+      worker.process.kill();
+    }, SHUTDOWN_TIMEOUT_MS);
+    worker.once('exit', () => {
+      clearTimeout(timer);
+      resolve();
+    });
+    worker.disconnect();
+  });
+}
+
+// Start a worker and wait until it accepts connections
+function spawn() {
+  const worker = cluster.fork();
+  return new Promise((resolve, reject) => {
+    worker.once('listening', () => resolve(worker));
+    worker.once('exit', (code, signal) => reject(new Error(`worker ${worker.process.pid} exited during startup (${signal || code})`)));
+  });
+}
+
+// Every current worker is replaced only after its successor listens, so the
+// port is never left without a process
+async function rollingRestart() {
+  if (restarting || shuttingDown) return;
+  restarting = true;
+  try {
+    const workers = Object.values(cluster.workers);
+    log.info('Rolling restart started', { workers: workers.length });
+    for (const worker of workers) {
+      await spawn();
+      await retire(worker);
+    }
+    log.info('Rolling restart completed');
+  } finally {
+    restarting = false;
+  }
+}
+
+async function startPrimary() {
+  // Set before database_pg is loaded; workers inherit the environment
+  process.env.DB_POOL_MAX = String(Math.max(2, Math.floor(POOL_BUDGET / (WORKERS + 1))));
+
+  const db = require('./database_pg');
+  const startup = require('./utils/startup');
+
+  log.info('Cluster primary started', { pid: process.pid, workers: WORKERS, poolPerProcess: parseInt(process.env.DB_POOL_MAX) });
+
+  // Workers only start once the schema exists
+  await startup.initialize();
+
+  cluster.on('exit', (worker, code, signal) => {
+    if (shuttingDown || worker.exitedAfterDisconnect) return;
+    log.error('Worker died, starting a new one', { pid: worker.process.pid, exit: signal || code });
+    setTimeout(() => {
+      if (!shuttingDown) cluster.fork();
+    }, RESPAWN_DELAY_MS);
+  });
+
+  const shutdown = async () => {
+    if (shuttingDown) return;
+    shuttingDown = true;
+    log.info('Shutting down gracefully');
+    await Promise.all(Object.values(cluster.workers).map(retire));
+    await db.close();
+    process.exit(0);
+  };
+
+  process.on('SIGHUP', () => {
+    rollingRestart().catch(error => log.error('Rolling restart failed', error));
+  });
+  process.on('SIGTERM', shutdown);
+  process.on('SIGINT', shutdown);
+
+  for (let i = 0; i < WORKERS; i++) {
+    cluster.fork();
+  }
+
+  await startup.initialSync();
+}
+
+if (cluster.isPrimary) {
+  startPrimary().catch(error => {
+    log.error('Failed to start cluster', error);
+    process.exit(1);
+  });
+} else {
+  require('./server');
+}
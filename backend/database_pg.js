@@ -1,5 +1,10 @@
-const { Pool } = require('pg');
+const { Pool, Client } = require('pg');
+const { performance } = require('perf_hooks');
 require('dotenv').config();
+const log = require('./utils/logger')('db');
+const metrics = require('./utils/metrics');
+const requestTiming = require('./utils/requestTiming');
+const { createLruCache } = require('./utils/lruCache');
 
 // Database configuration
 const dbConfig = {
@@ -8,13 +13,187 @@ const dbConfig = {
   database: process.env.DB_NAME || 'hr_tracker',
   user: process.env.DB_USER || 'hr_user',
   password: process.env.DB_PASSWORD || 'hr_secure_password',
-  max: 20,
+  // cluster.js sets this to each process' share of DB_POOL_BUDGET
+  max: parseInt(process.env.DB_POOL_MAX) || 20,
   idleTimeoutMillis: 30000,
   connectionTimeoutMillis: 2000,
   options: '-c timezone=Asia/Almaty'
 };
 
-const pool = new Pool(dbConfig);
+// Queries running at least this long are logged, with their parameters redacted
+const SLOW_QUERY_MS = parseInt(process.env.DB_SLOW_QUERY_MS) || 500;
+const SLOW_QUERY_SQL_CHARS = 2000;
+
+// Instrumentation, served by /api/metrics: every query of the pool, through
+// query()/queryRow()/queryRows(), pool.query() or a checked-out client, is
+// timed under a label, and every checkout is timed (waiting for a connection,
+// holding it) under the endpoint it serves. Query and wait time also go to
+// the Server-Timing header of the request (utils/requestTiming.js).
+const queryDuration = metrics.histogram('db_query_duration_seconds', 'Query latency by query label', ['label']);
+const queryErrors = metrics.counter('db_query_errors_total', 'Failed queries by query label', ['label']);
+const slowQueries = metrics.counter('db_slow_queries_total', `Queries running ${SLOW_QUERY_MS} ms or longer by query label`, ['label']);
+const checkoutWait = metrics.histogram('db_pool_checkout_wait_seconds', 'Time spent waiting for a pool connection by endpoint', ['endpoint']);
+const checkoutHold = metrics.histogram('db_pool_checkout_hold_seconds', 'Time a pool connection was held by endpoint', ['endpoint']);
+
+// Without an explicit label a query is labelled by its statement and first
+// table ("select time_records", "insert time_events"); SQL built per call
+// keeps the labels it produces in check with this cache
+const labelCache = createLruCache({ max: 2000 });
+const TARGET_PATTERNS = {
+  insert: /\bINTO\s+([\w."]+)/i,
+  update: /^UPDATE\s+(?:ONLY\s+)?([\w."]+)/i,
+  create: /\b(?:TABLE|INDEX|VIEW)\s+(?:IF\s+NOT\s+EXISTS\s+)?([\w."]+)/i,
+  alter: /\bTABLE\s+(?:IF\s+EXISTS\s+)?(?:ONLY\s+)?([\w."]+)/i,
+  drop: /\b(?:TABLE|INDEX|VIEW)\s+(?:IF\s+EXISTS\s+)?([\w."]+)/i
+};
+const NO_TARGET = new Set(['begin', 'commit', 'rollback', 'savepoint', 'release', 'set', 'show', 'analyze', 'vacuum']);
+
+function deriveLabel(text) {
+  const sql = text.replace(/--[^\n]*/g, ' ').replace(/\s+/g, ' ').trim();
+  const keyword = (sql.match(/^\w+/) || ['query'])[0].toLowerCase();
+  if (NO_TARGET.has(keyword)) return keyword;
+  const target = sql.match(TARGET_PATTERNS[keyword] || /\bFROM\s+(?:ONLY\s+)?([\w."]+)/i);
+  if (!target) return keyword;
+  // One label for all monthly partitions of time_events
+  const table = target[1].replace(/"/g, '').toLowerCase().replace(/_y\d{4}m\d{2}$/, '_yYYYYmMM');
+  return `${keyword} ${table}`;
+}
+
+function labelOf(config) {
+  if (config.label) return config.label;
+  let label = labelCache.get(config.text);
+  if (label === undefined) {
+    label = deriveLabel(config.text);
+    labelCache.set(config.text, label);
+  }
+  return label;
+}
+
+// Parameters as their types only; values never reach the log
+function redactParams(values) {
+  if (!Array.isArray(values)) return [];
+  return values.map((value) => {
+    if (value === null || value === undefined) return null;
+    if (Array.isArray(value)) return `<array(${value.length})>`;
+    if (value instanceof Date) return '<date>';
+    if (Buffer.isBuffer(value)) return `<bytes(${value.length})>`;
+    return `<${typeof value}>`;
+  });
+}
+
+// SQL for the log: string literals blanked, whitespace collapsed, cut short
+function redactSql(text) {
+  const sql = text.replace(/'(?:[^']|'')*'/g, "'?'").replace(/\s+/g, ' ').trim();
+  return sql.length > SLOW_QUERY_SQL_CHARS ? `${sql.slice(0, SLOW_QUERY_SQL_CHARS)}...` : sql;
+}
+
+// Returns the function to call with the outcome of the query
+function startQuery(config, values, timing) {
+  const label = labelOf(config);
+  const started = performance.now();
+  const endSpan = requestTiming.begin(timing, 'db');
+
+  return (error, result) => {
+    endSpan();
+    const ms = performance.now() - started;
+    queryDuration.observe({ label }, ms / 1000);
+    if (error) queryErrors.inc({ label });
+    if (ms >= SLOW_QUERY_MS) {
+      slowQueries.inc({ label });
+      log.warn('Slow query', {
+        label,
+        durationMs: Math.round(ms),
+        rows: result ? result.rowCount : null,
+        endpoint: requestTiming.endpointOf(timing),
+        sql: redactSql(config.text),
+        params: redactParams(config.values || values),
+        error: error ? error.message : undefined
+      });
+    }
+  };
+}
+
+// Client of the pool that times its queries; `timing` is the request timing
+// record of whoever has it checked out. An explicit label is passed as
+// { text, values, label }. Submittables (cursors) go through untimed.
+class InstrumentedClient extends Client {
+  query(config, values, callback) {
+    if (!config || typeof config.submit === 'function') return super.query(config, values, callback);
+    if (typeof values === 'function') {
+      callback = values;
+      values = undefined;
+    }
+    const finish = startQuery(typeof config === 'string' ? { text: config } : config, values, this.timing);
+
+    if (typeof callback === 'function') {
+      return super.query(config, values, (error, result) => {
+        finish(error, result);
+        callback(error, result);
+      });
+    }
+    return super.query(config, values).then(
+      (result) => {
+        finish(null, result);
+        return result;
+      },
+      (error) => {
+        finish(error);
+        throw error;
+      }
+    );
+  }
+}
+
+// Pool that times checkouts. pool.query() checks out through connect() too,
+// synchronously, so the request that asked is the one charged.
+class InstrumentedPool extends Pool {
+  connect(callback) {
+    const timing = requestTiming.current();
+    const endpoint = requestTiming.endpointOf(timing);
+    const started = performance.now();
+    const endWait = requestTiming.begin(timing, 'pool');
+
+    const checkedOut = (client) => {
+      endWait();
+      checkoutWait.observe({ endpoint }, (performance.now() - started) / 1000);
+
+      // pg-pool gives the client a fresh release() on every checkout
+      const release = client.release;
+      const heldFrom = performance.now();
+      client.timing = timing;
+      client.release = (error) => {
+        client.timing = undefined;
+        checkoutHold.observe({ endpoint }, (performance.now() - heldFrom) / 1000);
+        return release(error);
+      };
+      return client;
+    };
+
+    if (typeof callback === 'function') {
+      return super.connect((error, client, done) => {
+        if (error) {
+          endWait();
+          return callback(error, client, done);
+        }
+        checkedOut(client);
+        return callback(error, client, client.release);
+      });
+    }
+    return super.connect().then(checkedOut, (error) => {
+      endWait();
+      throw error;
+    });
+  }
+}
+
+const pool = new InstrumentedPool({ ...dbConfig, Client: InstrumentedClient });
+
+metrics.gauge('db_pool_connections', 'Pool connections by state', () => [
+  { labels: { state: 'active' }, value: pool.totalCount - pool.idleCount },
+  { labels: { state: 'idle' }, value: pool.idleCount }
+]);
+metrics.gauge('db_pool_waiting', 'Checkouts waiting for a pool connection', () => pool.waitingCount);
+metrics.gauge('db_pool_max_connections', 'Pool size limit', () => dbConfig.max);
 
 // Set timezone for all connections
 pool.on('connect', async (client) => {
@@ -27,7 +206,8 @@ pool.on('connect', async (client) => {
 });
 
 // Create database schema
-async function initializeDatabase() {
+// Base tables; everything after them comes from the migrations
+async function createBaseTables() {
   try {
     // Set timezone for this connection
     await pool.query("SET TIME ZONE 'Asia/Almaty'");
@@ -88,7 +268,8 @@ async function initializeDatabase() {
       )
     `);
 
-    // Time events table
+    // Time events table. Migration 017 turns it into monthly partitions and
+    // 022 adds its natural key, on new databases as on existing ones
     await pool.query(`
       CREATE TABLE IF NOT EXISTS time_events (
         id SERIAL PRIMARY KEY,
@@ -182,7 +363,8 @@ async function initializeDatabase() {
       ON work_schedules_1c(work_month)
     `);
 
-    // Employee schedule assignments table
+    // Employee schedule assignments table. Migration 023 adds valid_during
+    // and the constraint against overlapping assignments
     await pool.query(`
       CREATE TABLE IF NOT EXISTS employee_schedule_assignments (
         id SERIAL PRIMARY KEY,
@@ -208,11 +390,6 @@ async function initializeDatabase() {
       ON employee_schedule_assignments(schedule_code)
     `);
 
-    await pool.query(`
-      CREATE INDEX IF NOT EXISTS idx_employee_schedule_assignments_dates 
-      ON employee_schedule_assignments(start_date, end_date)
-    `);
-
     await pool.query(`
       CREATE INDEX IF NOT EXISTS idx_employee_schedule_assignments_active 
       ON employee_schedule_assignments(employee_number, end_date) 
@@ -235,23 +412,92 @@ async function initializeDatabase() {
   }
 }
 
+async function initializeDatabase() {
+  await createBaseTables();
+  await checkMigrations();
+}
+
+// Schema from migrations/ the code depends on, one check per migration file.
+// initializeDatabase() only creates the base tables; these are left to the
+// migrations, which bring new and existing databases to the same schema.
+const REQUIRED_MIGRATIONS = {
+  '014_time_records_dirty.sql': "to_regclass('time_records_dirty') IS NOT NULL",
+  '015_schedules_1c_catalog.sql': "to_regclass('schedules_1c') IS NOT NULL",
+  '016_sargable_date_indexes.sql': "to_regclass('idx_employees_object_bin_code') IS NOT NULL",
+  '017_time_events_partitioning.sql': "EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('time_events'))",
+  '018_keyset_indexes.sql': "to_regclass('idx_time_events_datetime_id') IS NOT NULL AND to_regclass('idx_time_records_date_employee') IS NOT NULL",
+  '019_daily_attendance.sql': "to_regclass('daily_attendance') IS NOT NULL",
+  '020_payroll_shifts.sql': "to_regclass('payroll_shifts') IS NOT NULL",
+  '021_load_jobs.sql': "to_regclass('load_jobs') IS NOT NULL AND to_regclass('load_job_checkpoints') IS NOT NULL",
+  '022_time_events_natural_key.sql': "EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'time_events_natural_key' AND conrelid = to_regclass('time_events'))",
+  '023_assignment_validity.sql': "EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'employee_schedule_assignments_no_overlap')"
+};
+
+// Files of REQUIRED_MIGRATIONS not applied yet, in the order to run them
+async function pendingMigrations() {
+  const checks = Object.values(REQUIRED_MIGRATIONS)
+    .map((condition, i) => `(${condition}) AS m${i}`);
+  const applied = (await pool.query(`SELECT ${checks.join(', ')}`)).rows[0];
+
+  return Object.keys(REQUIRED_MIGRATIONS).filter((file, i) => !applied[`m${i}`]);
+}
+
+// Throws, naming the migrations to run, when the database is behind the code
+async function checkMigrations() {
+  const missing = await pendingMigrations();
+  if (missing.length > 0) {
+    throw new Error(
+      `Database schema is behind the code, run node migrations/run_migration.js --pending (migrations/README.md): ${missing.join(', ')}`
+    );
+  }
+}
+
+// Query config of the helpers; label names the query in /api/metrics instead
+// of the one derived from its SQL
+function queryConfig(text, params, label) {
+  return label ? { text, values: params, label } : text;
+}
+
 // Helper function to execute queries
-function query(text, params) {
-  return pool.query(text, params);
+function query(text, params, label) {
+  return pool.query(queryConfig(text, params, label), params);
 }
 
 // Helper function for single row queries
-async function queryRow(text, params) {
-  const result = await pool.query(text, params);
+async function queryRow(text, params, label) {
+  const result = await pool.query(queryConfig(text, params, label), params);
   return result.rows[0];
 }
 
 // Helper function for multiple row queries
-async function queryRows(text, params) {
-  const result = await pool.query(text, params);
+async function queryRows(text, params, label) {
+  const result = await pool.query(queryConfig(text, params, label), params);
   return result.rows;
 }
 
+// Helper function to run a callback inside a transaction pinned to one client.
+// client.afterCommit(fn) registers work (e.g. cache invalidation) that must
+// only run once the transaction's changes are visible to other connections.
+async function withTransaction(callback) {
+  const client = await pool.connect();
+  const afterCommit = [];
+  client.afterCommit = (fn) => afterCommit.push(fn);
+  let result;
+  try {
+    await client.query('BEGIN');
+    result = await callback(client);
+    await client.query('COMMIT');
+  } catch (error) {
+    await client.query('ROLLBACK');
+    throw error;
+  } finally {
+    delete client.afterCommit;
+    client.release();
+  }
+  afterCommit.forEach(fn => fn());
+  return result;
+}
+
 // Close database connection
 async function close() {
   await pool.end();
@@ -262,6 +508,10 @@ module.exports = {
   query,
   queryRow,
   queryRows,
+  withTransaction,
   close,
-  initializeDatabase
+  createBaseTables,
+  initializeDatabase,
+  pendingMigrations,
+  checkMigrations
 };
\ No newline at end of file
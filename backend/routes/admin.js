@@ -2,6 +2,21 @@ const express = require('express');
 const router = express.Router();
 const db = require('../database_pg');
 const apiSync = require('../utils/apiSync_pg');
+const timeRecordsEngine = require('../utils/timeRecordsEngine');
+const dirtyDays = require('../utils/dirtyDays');
+const jsonStream = require('../utils/jsonStream');
+const scheduleImport = require('../utils/scheduleImport');
+const employeeUpdates = require('../utils/employeeUpdates');
+const scheduleAssignments = require('../utils/scheduleAssignments');
+const queryFilters = require('../utils/queryFilters');
+const keyset = require('../utils/keyset');
+const reportCache = require('../utils/reportCache');
+const employeeSync = require('../utils/employeeSync');
+const payrollShifts = require('../utils/payrollShifts');
+const loadJobs = require('../utils/loadJobs');
+const scheduleCalendar = require('../utils/scheduleCalendar');
+const assignmentsAsOf = require('../utils/assignmentsAsOf');
+const log = require('../utils/logger')('admin');
 
 // Get all employees with department and position info
 router.get('/admin/employees', (req, res) => {
@@ -19,9 +34,9 @@ router.get('/admin/employees', (req, res) => {
         LEFT JOIN (
             SELECT DISTINCT ON (esa.employee_number) 
                 esa.employee_number,
-                ws1c.schedule_name
+                s1c.schedule_name
             FROM employee_schedule_assignments esa
-            LEFT JOIN work_schedules_1c ws1c ON esa.schedule_code = ws1c.schedule_code
+            LEFT JOIN schedules_1c s1c ON esa.schedule_code = s1c.schedule_code
             WHERE esa.end_date IS NULL
             ORDER BY esa.employee_number, esa.created_at DESC
         ) ws ON e.table_number = ws.employee_number
@@ -31,7 +46,7 @@ router.get('/admin/employees', (req, res) => {
     db.queryRows(query).then(rows => {
         res.json(rows);
     }).catch(err => {
-        console.error('Error fetching employees:', err);
+        log.error('Error fetching employees', err);
         res.status(500).json({ error: 'Internal server error' });
     });
 });
@@ -51,13 +66,13 @@ router.get('/admin/departments', async (req, res) => {
         
         query += ' ORDER BY object_name';
         
-        console.log('Departments query:', query, 'params:', params);
+        log.debug('Departments query', { query, params });
         const rows = await db.queryRows(query, params);
-        console.log(`Found ${rows.length} departments for organization: ${organization || 'all'}`);
+        log.debug('Found departments', { organization: organization || 'all', count: rows.length });
         
         res.json(rows);
     } catch (err) {
-        console.error('Error fetching departments:', err);
+        log.error('Error fetching departments', err);
         res.status(500).json({ error: 'Internal server error' });
     }
 });
@@ -68,7 +83,7 @@ router.get('/admin/positions', async (req, res) => {
         const rows = await db.queryRows('SELECT * FROM positions ORDER BY staff_position_name');
         res.json(rows);
     } catch (err) {
-        console.error('Error fetching positions:', err);
+        log.error('Error fetching positions', err);
         res.status(500).json({ error: 'Internal server error' });
     }
 });
@@ -93,15 +108,15 @@ router.post('/admin/check', (req, res) => {
 // Sync employees from external API
 router.post('/admin/sync/employees', async (req, res) => {
     try {
-        console.log('Starting employee sync...');
-        const count = await apiSync.syncEmployees();
+        log.info('Starting employee sync');
+        const stats = await apiSync.syncEmployees();
         res.json({ 
             success: true, 
-            message: `Синхронизировано ${count} сотрудников`,
-            count: count
+            message: `Синхронизировано ${stats.count} сотрудников (новых: ${stats.inserted}, изменено: ${stats.updated}, без изменений: ${stats.unchanged})`,
+            ...stats
         });
     } catch (error) {
-        console.error('Employee sync error:', error);
+        log.error('Employee sync error', error);
         res.status(500).json({ 
             success: false, 
             error: 'Ошибка синхронизации сотрудников: ' + error.message 
@@ -112,15 +127,15 @@ router.post('/admin/sync/employees', async (req, res) => {
 // Sync departments from external API
 router.post('/admin/sync/departments', async (req, res) => {
     try {
-        console.log('Starting department sync...');
-        const count = await apiSync.syncDepartments();
+        log.info('Starting department sync');
+        const stats = await apiSync.syncDepartments();
         res.json({ 
             success: true, 
-            message: `Синхронизировано ${count} подразделений`,
-            count: count
+            message: `Синхронизировано ${stats.count} подразделений (новых: ${stats.inserted}, изменено: ${stats.updated}, без изменений: ${stats.unchanged})`,
+            ...stats
         });
     } catch (error) {
-        console.error('Department sync error:', error);
+        log.error('Department sync error', error);
         res.status(500).json({ 
             success: false, 
             error: 'Ошибка синхронизации подразделений: ' + error.message 
@@ -131,15 +146,15 @@ router.post('/admin/sync/departments', async (req, res) => {
 // Sync positions from external API
 router.post('/admin/sync/positions', async (req, res) => {
     try {
-        console.log('Starting position sync...');
-        const count = await apiSync.syncPositions();
+        log.info('Starting position sync');
+        const stats = await apiSync.syncPositions();
         res.json({ 
             success: true, 
-            message: `Синхронизировано ${count} должностей`,
-            count: count
+            message: `Синхронизировано ${stats.count} должностей (новых: ${stats.inserted}, изменено: ${stats.updated}, без изменений: ${stats.unchanged})`,
+            ...stats
         });
     } catch (error) {
-        console.error('Position sync error:', error);
+        log.error('Position sync error', error);
         res.status(500).json({ 
             success: false, 
             error: 'Ошибка синхронизации должностей: ' + error.message 
@@ -148,9 +163,10 @@ router.post('/admin/sync/positions', async (req, res) => {
 });
 
 // Load time events from external API with progress tracking
+// The load is queued in load_jobs and run by a worker of any backend process
 router.post('/admin/load/timesheet', async (req, res) => {
     try {
-        const { tableNumber, dateFrom, dateTo, objectBin } = req.body;
+        const { tableNumber, dateFrom, dateTo, objectBin, replaceMonths } = req.body;
         
         if (!dateFrom || !dateTo) {
             return res.status(400).json({ 
@@ -159,45 +175,21 @@ router.post('/admin/load/timesheet', async (req, res) => {
             });
         }
 
-        console.log('Loading timesheet data:', { tableNumber, dateFrom, dateTo, objectBin });
+        log.info('Loading timesheet data', { tableNumber, dateFrom, dateTo, objectBin, replaceMonths });
         
-        // Start the loading process in the background and return immediately
-        const loadingId = Date.now().toString();
-        
-        // Store progress state with automatic cleanup
-        if (!global.loadingProgress) {
-            global.loadingProgress = {};
-        }
-        
-        // Clean up old progress entries (older than 1 hour)
-        const oneHourAgo = Date.now() - (60 * 60 * 1000);
-        Object.keys(global.loadingProgress).forEach(key => {
-            const progress = global.loadingProgress[key];
-            if (progress.startTime && new Date(progress.startTime).getTime() < oneHourAgo) {
-                delete global.loadingProgress[key];
-            }
-        });
-        
-        global.loadingProgress[loadingId] = {
-            status: 'starting',
-            message: 'Инициализация загрузки...',
-            currentDepartment: '',
-            eventsLoaded: 0,
-            totalEmployees: 0,
-            processedEmployees: 0,
-            startTime: new Date()
-        };
-        
-        // Start loading in background
-        loadTimesheetWithProgress(loadingId, { tableNumber, dateFrom, dateTo, objectBin });
+        // Повторный запрос с теми же параметрами присоединяется к активной загрузке
+        const { job, created } = await loadJobs.enqueueTimesheetLoad({ tableNumber, dateFrom, dateTo, objectBin, replaceMonths });
         
         res.json({ 
             success: true, 
-            loadingId: loadingId,
-            message: 'Загрузка начата. Используйте GET /admin/load/progress/:id для получения статуса'
+            loadingId: String(job.id),
+            alreadyRunning: !created,
+            message: created
+                ? 'Загрузка поставлена в очередь. Используйте GET /admin/load/progress/:id для получения статуса'
+                : 'Такая загрузка уже выполняется. Используйте GET /admin/load/progress/:id для получения статуса'
         });
     } catch (error) {
-        console.error('Timesheet load error:', error);
+        log.error('Timesheet load error', error);
         res.status(500).json({ 
             success: false, 
             error: 'Ошибка загрузки табельных данных: ' + error.message 
@@ -206,74 +198,102 @@ router.post('/admin/load/timesheet', async (req, res) => {
 });
 
 // Get loading progress
-router.get('/admin/load/progress/:id', (req, res) => {
-    const { id } = req.params;
-    const progress = global.loadingProgress?.[id];
-    
-    if (!progress) {
-        return res.status(404).json({ 
+router.get('/admin/load/progress/:id', async (req, res) => {
+    try {
+        const job = await loadJobs.getJob(req.params.id);
+        
+        if (!job) {
+            return res.status(404).json({ 
+                success: false, 
+                error: 'Процесс загрузки не найден' 
+            });
+        }
+        
+        res.json({
+            success: true,
+            ...loadJobs.progressView(job)
+        });
+    } catch (error) {
+        log.error('Error reading load progress', error);
+        res.status(500).json({ 
             success: false, 
-            error: 'Процесс загрузки не найден' 
+            error: 'Ошибка получения статуса загрузки: ' + error.message 
         });
     }
-    
-    res.json({
-        success: true,
-        ...progress
-    });
 });
 
-// Background loading function with progress updates
-async function loadTimesheetWithProgress(loadingId, params) {
+// Interval of comment lines that keep proxies from closing an idle progress stream
+const PROGRESS_HEARTBEAT_MS = 15000;
+// Reconnect delay suggested to EventSource
+const PROGRESS_RETRY_MS = 3000;
+
+function isFinished(view) {
+    return view.status === 'completed' || view.status === 'error';
+}
+
+// Loading progress as Server-Sent Events: one `progress` event per update,
+// its id is the update's seq. A reconnecting client sends Last-Event-ID and
+// only gets the state again if it changed; a finished job that the client has
+// already seen in full is answered with 204, which stops EventSource retrying.
+router.get('/admin/load/progress/:id/stream', async (req, res) => {
+    let job;
     try {
-        const progress = global.loadingProgress[loadingId];
-        
-        // Update progress callback
-        const updateProgress = (update) => {
-            Object.assign(progress, update);
-        };
-        
-        updateProgress({
-            status: 'loading',
-            message: 'Загрузка событий из внешнего API...'
+        job = await loadJobs.getJob(req.params.id);
+    } catch (error) {
+        log.error('Error reading load progress', error);
+        return res.status(500).json({ 
+            success: false, 
+            error: 'Ошибка получения статуса загрузки: ' + error.message 
         });
-        
-        // Загрузка событий из внешнего API с прогрессом
-        const totalEvents = await apiSync.loadTimeEventsWithProgress(params, updateProgress);
+    }
 
-        updateProgress({
-            status: 'processing',
-            message: 'Обработка и сохранение записей...'
+    if (!job) {
+        return res.status(404).json({ 
+            success: false, 
+            error: 'Процесс загрузки не найден' 
         });
+    }
 
-        // Обработка и сохранение событий
-        const processed = await apiSync.processTimeRecords();
-        
-        updateProgress({
-            status: 'completed',
-            message: `Загрузка завершена! Загружено ${totalEvents} событий, обработано ${processed} записей`,
-            eventsLoaded: totalEvents,
-            recordsProcessed: processed,
-            endTime: new Date()
-        });
-        
-        // Clean up after 2 minutes (reduced from 5)
-        setTimeout(() => {
-            if (global.loadingProgress && global.loadingProgress[loadingId]) {
-                delete global.loadingProgress[loadingId];
-            }
-        }, 2 * 60 * 1000);
-        
-    } catch (error) {
-        console.error('Background loading error:', error);
-        global.loadingProgress[loadingId] = {
-            ...global.loadingProgress[loadingId],
-            status: 'error',
-            message: 'Ошибка загрузки: ' + error.message,
-            error: error.message
-        };
+    const lastEventId = req.get('Last-Event-ID') || req.query.lastEventId;
+    let lastSeq = lastEventId !== undefined && !isNaN(parseInt(lastEventId)) ? parseInt(lastEventId) : -1;
+    const current = loadJobs.progressView(job);
+
+    if (isFinished(current) && (current.seq || 0) <= lastSeq) {
+        return res.status(204).end();
     }
-}
+
+    res.set({
+        'Content-Type': 'text/event-stream; charset=utf-8',
+        'Cache-Control': 'no-cache',
+        'Connection': 'keep-alive',
+        'X-Accel-Buffering': 'no'
+    });
+    res.flushHeaders();
+    res.write(`retry: ${PROGRESS_RETRY_MS}\n\n`);
+
+    let unsubscribe = null;
+    const heartbeat = setInterval(() => res.write(': heartbeat\n\n'), PROGRESS_HEARTBEAT_MS);
+
+    const close = () => {
+        clearInterval(heartbeat);
+        if (unsubscribe) unsubscribe();
+    };
+
+    const send = (view) => {
+        const seq = view.seq || 0;
+        if (seq <= lastSeq && !isFinished(view)) return;
+        lastSeq = Math.max(lastSeq, seq);
+        res.write(`id: ${seq}\nevent: progress\ndata: ${JSON.stringify({ success: true, ...view })}\n\n`);
+        if (isFinished(view)) {
+            close();
+            res.end();
+        }
+    };
+
+    req.on('close', close);
+    unsubscribe = loadJobs.subscribe(job.id, send);
+    send(current);
+});
 
 // Get organizations for dropdown
 router.get('/admin/organizations', async (req, res) => {
@@ -283,16 +303,64 @@ router.get('/admin/organizations', async (req, res) => {
         );
         res.json(rows);
     } catch (err) {
-        console.error('Error fetching organizations:', err);
+        log.error('Error fetching organizations', err);
         res.status(500).json({ error: 'Internal server error' });
     }
 });
 
+// Keyset order of the list endpoints, see utils/keyset.js
+const TIME_EVENTS_KEYS = [['te.event_datetime', 'timestamp'], ['te.id', 'integer']];
+const TIME_RECORDS_KEYS = [['tr.date', 'date'], ['tr.employee_number', 'text']];
+
+// Serve a filtered list either as one keyset page (JSON array, next page
+// cursor in the X-Next-Cursor header) or, with ?format=ndjson|csv, as a
+// streamed export of every matching row
+async function sendKeysetList(req, res, { select, where, params, keys, filename }) {
+    const { cursor, limit, format } = req.query;
+    
+    if (format && !keyset.EXPORT_FORMATS[format]) {
+        return res.status(400).json({ error: `Unsupported format: ${format}. Use ndjson or csv` });
+    }
+    
+    const conditions = [where];
+    if (cursor) {
+        const values = keyset.decodeCursor(cursor, keys.length);
+        if (!values) {
+            return res.status(400).json({ error: 'Invalid cursor' });
+        }
+        conditions.push(keyset.after(keys, values, params));
+    }
+    
+    if (format) {
+        return keyset.streamExport(res, {
+            sql: `${select} WHERE ${conditions.join(' AND ')} ORDER BY ${keyset.orderBy(keys)}`,
+            params,
+            format,
+            filename
+        });
+    }
+    
+    const size = keyset.pageSize(limit);
+    const rows = await db.queryRows(`
+        ${select.replace(/^\s*SELECT/, `SELECT ${keyset.keyColumns(keys)},`)}
+        WHERE ${conditions.join(' AND ')}
+        ORDER BY ${keyset.orderBy(keys)}
+        LIMIT ${size + 1}
+    `, params);
+    
+    const page = keyset.takePage(rows, size, keys.length);
+    if (page.nextCursor) {
+        res.set('X-Next-Cursor', page.nextCursor);
+        res.set('Access-Control-Expose-Headers', 'X-Next-Cursor');
+    }
+    res.json(page.rows);
+}
+
 // Get time events with filters
-router.get('/admin/time-events', (req, res) => {
+router.get('/admin/time-events', async (req, res) => {
     const { organization, department, dateFrom, dateTo } = req.query;
     
-    let query = `
+    const select = `
         SELECT 
             te.*,
             e.full_name,
@@ -303,46 +371,29 @@ router.get('/admin/time-events', (req, res) => {
         FROM time_events te
         LEFT JOIN employees e ON te.employee_number = e.table_number
         LEFT JOIN departments d ON e.object_code = d.object_code
-        WHERE 1=1
     `;
     
     const params = [];
     
-    if (organization) {
-        query += ` AND e.object_bin = $${params.length + 1}`;
-        params.push(organization);
-    }
-    
-    if (department) {
-        query += ` AND d.object_code = $${params.length + 1}`;
-        params.push(department);
-    }
+    const where = '1=1' + queryFilters.createFilters(params)
+        .equals('e.object_bin', organization)
+        .equals('e.object_code', department)
+        .dates('te.event_datetime', dateFrom, dateTo)
+        .toSql();
     
-    if (dateFrom) {
-        query += ` AND te.event_datetime::date >= $${params.length + 1}`;
-        params.push(dateFrom);
-    }
-    
-    if (dateTo) {
-        query += ` AND te.event_datetime::date <= $${params.length + 1}`;
-        params.push(dateTo);
-    }
-    
-    query += ` ORDER BY te.event_datetime DESC LIMIT 1000`;
-    
-    db.queryRows(query, params).then(rows => {
-        res.json(rows);
-    }).catch(err => {
-        console.error('Error fetching time events:', err);
+    try {
+        await sendKeysetList(req, res, { select, where, params, keys: TIME_EVENTS_KEYS, filename: 'time-events' });
+    } catch (err) {
+        log.error('Error fetching time events', err);
         res.status(500).json({ error: 'Internal server error' });
-    });
+    }
 });
 
 // Get time records with filters
-router.get('/admin/time-records', (req, res) => {
+router.get('/admin/time-records', async (req, res) => {
     const { organization, department, month, status } = req.query;
     
-    let query = `
+    const select = `
         SELECT 
             tr.*,
             tr.off_schedule,
@@ -354,39 +405,23 @@ router.get('/admin/time-records', (req, res) => {
         FROM time_records tr
         LEFT JOIN employees e ON tr.employee_number = e.table_number
         LEFT JOIN departments d ON e.object_code = d.object_code
-        WHERE 1=1
     `;
     
     const params = [];
     
-    if (organization) {
-        query += ` AND e.object_bin = $${params.length + 1}`;
-        params.push(organization);
-    }
-    
-    if (department) {
-        query += ` AND d.object_code = $${params.length + 1}`;
-        params.push(department);
-    }
-    
-    if (month) {
-        query += ` AND to_char(tr.date, 'YYYY-MM') = $${params.length + 1}`;
-        params.push(month);
-    }
-    
-    if (status) {
-        query += ` AND tr.status = $${params.length + 1}`;
-        params.push(status);
-    }
-    
-    query += ` ORDER BY tr.date DESC, e.full_name ASC LIMIT 1000`;
+    const where = '1=1' + queryFilters.createFilters(params)
+        .equals('e.object_bin', organization)
+        .equals('e.object_code', department)
+        .month('tr.date', month)
+        .equals('tr.status', status)
+        .toSql();
     
-    db.queryRows(query, params).then(rows => {
-        res.json(rows);
-    }).catch(err => {
-        console.error('Error fetching time records:', err);
+    try {
+        await sendKeysetList(req, res, { select, where, params, keys: TIME_RECORDS_KEYS, filename: 'time-records' });
+    } catch (err) {
+        log.error('Error fetching time records', err);
         res.status(500).json({ error: 'Internal server error' });
-    });
+    }
 });
 
 // Recalculate time records from time_events
@@ -395,7 +430,7 @@ router.post('/admin/ai-webhook-proxy', async (req, res) => {
     try {
         const { branch_id, hall_area, kitchen_area, seats_count, date_start, date_end } = req.body;
         
-        console.log('AI webhook proxy request:', { branch_id, hall_area, kitchen_area, seats_count, date_start, date_end });
+        log.info('AI webhook proxy request', { branch_id, hall_area, kitchen_area, seats_count, date_start, date_end });
         
         // Validate required fields
         if (!branch_id || !date_start || !date_end) {
@@ -415,7 +450,7 @@ router.post('/admin/ai-webhook-proxy', async (req, res) => {
             date_end 
         };
         
-        console.log('Sending request to webhook:', webhookUrl, webhookData);
+        log.debug('Sending request to webhook', { webhookUrl, webhookData });
         
         const fetch = require('node-fetch');
         const response = await fetch(webhookUrl, {
@@ -428,7 +463,7 @@ router.post('/admin/ai-webhook-proxy', async (req, res) => {
         
         if (!response.ok) {
             const errorMessage = `Webhook responded with status: ${response.status}`;
-            console.warn(errorMessage);
+            log.warn('Webhook request failed', { status: response.status });
             
             // Handle specific error codes
             if (response.status === 404) {
@@ -451,7 +486,7 @@ router.post('/admin/ai-webhook-proxy', async (req, res) => {
         }
         
         const result = await response.json();
-        console.log('Webhook response:', result);
+        log.debug('Webhook response', { result });
         
         res.json({
             success: true,
@@ -460,7 +495,7 @@ router.post('/admin/ai-webhook-proxy', async (req, res) => {
         });
         
     } catch (error) {
-        console.error('AI webhook proxy error:', error);
+        log.error('AI webhook proxy error', error);
         res.status(500).json({ 
             error: 'Failed to send AI recommendation',
             message: error.message 
@@ -470,9 +505,22 @@ router.post('/admin/ai-webhook-proxy', async (req, res) => {
 
 router.post('/admin/recalculate-time-records', async (req, res) => {
     try {
-        const { organization, department, month } = req.body;
+        const { organization, department, month, mode } = req.body;
+        
+        // Incremental mode: recompute only the employee-days marked dirty
+        if (mode === 'dirty') {
+            log.info('Starting incremental recalculation of dirty time records');
+            const stats = await timeRecordsEngine.recalculateDirtyDays();
+            
+            return res.json({
+                success: true,
+                message: `Пересчитано ${stats.dirtyDays} измененных дней`,
+                mode,
+                ...stats
+            });
+        }
         
-        console.log('Starting filtered time records recalculation with filters:', { organization, department, month });
+        log.info('Starting filtered time records recalculation', { organization, department, month });
         
         // Month is required
         if (!month) {
@@ -482,203 +530,16 @@ router.post('/admin/recalculate-time-records', async (req, res) => {
             });
         }
         
-        // Build filter conditions for time_events query
-        let whereConditions = ['te.employee_number IS NOT NULL'];
-        let deleteWhereConditions = ['1=1'];
-        const params = [];
-        const deleteParams = [];
-        
-        // Month filter (required)
-        whereConditions.push(`to_char(te.event_datetime, 'YYYY-MM') = $${params.length + 1}`);
-        params.push(month);
-        
-        deleteWhereConditions.push(`to_char(date, 'YYYY-MM') = $${deleteParams.length + 1}`);
-        deleteParams.push(month);
-        
-        // Organization filter (optional)
-        if (organization) {
-            whereConditions.push(`e.object_bin = $${params.length + 1}`);
-            params.push(organization);
-            
-            deleteWhereConditions.push(`employee_number IN (SELECT table_number FROM employees WHERE object_bin = $${deleteParams.length + 1})`);
-            deleteParams.push(organization);
-        }
-        
-        // Department filter (optional)
-        if (department) {
-            whereConditions.push(`e.object_code = $${params.length + 1}`);
-            params.push(department);
-            
-            deleteWhereConditions.push(`employee_number IN (SELECT table_number FROM employees WHERE object_code = $${deleteParams.length + 1})`);
-            deleteParams.push(department);
+        if (!queryFilters.monthBounds(month)) {
+            return res.status(400).json({
+                success: false,
+                error: 'Месяц должен быть в формате YYYY-MM'
+            });
         }
         
-        // Delete existing filtered time_records (not all records)
-        const deleteQuery = `DELETE FROM time_records WHERE ${deleteWhereConditions.join(' AND ')}`;
-        const deleteResult = await db.query(deleteQuery, deleteParams);
-        console.log(`Deleted ${deleteResult.rowCount} existing time records for the filtered period`);
-        
-        // Get filtered time events with employee work schedules
-        const timeEventsQuery = `
-            SELECT 
-                te.employee_number,
-                to_char(te.event_datetime::date, 'YYYY-MM-DD') as date,
-                te.event_datetime,
-                te.event_type,
-                e.id as employee_id,
-                ws1c.work_start_time,
-                ws1c.work_end_time,
-                ws1c.work_hours,
-                ws1c.schedule_name
-            FROM time_events te
-            LEFT JOIN employees e ON te.employee_number = e.table_number
-            LEFT JOIN departments d ON e.object_code = d.object_code
-            LEFT JOIN (
-                SELECT DISTINCT ON (esa.employee_number) 
-                    esa.employee_number,
-                    esa.schedule_code,
-                    ws1c.work_start_time,
-                    ws1c.work_end_time,
-                    ws1c.work_hours,
-                    ws1c.schedule_name
-                FROM employee_schedule_assignments esa
-                LEFT JOIN work_schedules_1c ws1c ON esa.schedule_code = ws1c.schedule_code
-                WHERE esa.end_date IS NULL
-                ORDER BY esa.employee_number, esa.created_at DESC
-            ) ws1c ON e.table_number = ws1c.employee_number
-            WHERE ${whereConditions.join(' AND ')}
-            ORDER BY te.employee_number, te.event_datetime
-        `;
-        
-        const timeEvents = await db.queryRows(timeEventsQuery, params);
-        
-        console.log(`Found ${timeEvents.length} time events to process`);
-        
-        // Group events by employee and date
-        const groupedEvents = {};
-        timeEvents.forEach(event => {
-            const key = `${event.employee_number}_${event.date}`;
-            if (!groupedEvents[key]) {
-                groupedEvents[key] = {
-                    employee_number: event.employee_number,
-                    employee_id: event.employee_id,
-                    date: event.date,
-                    work_start_time: event.work_start_time,
-                    work_end_time: event.work_end_time,
-                    work_hours: event.work_hours,
-                    schedule_name: event.schedule_name,
-                    events: []
-                };
-            }
-            groupedEvents[key].events.push(event);
-        });
-        
-        console.log(`Processing ${Object.keys(groupedEvents).length} employee-day combinations`);
-        
-        let processedCount = 0;
-        
-        for (const key in groupedEvents) {
-            const dayData = groupedEvents[key];
-            const events = dayData.events.sort((a, b) => new Date(a.event_datetime) - new Date(b.event_datetime));
-            
-            // IMPROVED LOGIC: Find first entry and last exit
-            let checkIn = null;
-            let checkOut = null;
-            
-            // Get all entry events (type 1) and exit events (type 2)
-            const entryEvents = events.filter(e => e.event_type === '1').sort((a, b) => new Date(a.event_datetime) - new Date(b.event_datetime));
-            const exitEvents = events.filter(e => e.event_type === '2').sort((a, b) => new Date(a.event_datetime) - new Date(b.event_datetime));
-            
-            if (entryEvents.length > 0) {
-                checkIn = entryEvents[0].event_datetime; // FIRST entry of the day
-            }
-            
-            if (exitEvents.length > 0) {
-                checkOut = exitEvents[exitEvents.length - 1].event_datetime; // LAST exit of the day
-            }
-            
-            // Fallback for type 0 events if no typed events exist
-            if (!checkIn && !checkOut && events.length > 0) {
-                if (events.length === 1) {
-                    const hour = new Date(events[0].event_datetime).getHours();
-                    if (hour < 12) {
-                        checkIn = events[0].event_datetime;
-                    } else {
-                        checkOut = events[0].event_datetime;
-                    }
-                } else {
-                    checkIn = events[0].event_datetime;
-                    checkOut = events[events.length - 1].event_datetime;
-                }
-            }
-            
-            // ENHANCED: Check if this is a scheduled workday with specific date check
-            const scheduledWorkday = await isScheduledWorkday(dayData.employee_number, dayData.date);
-            
-            // Use actual schedule data if found, otherwise use general schedule info
-            const scheduleForCalculation = scheduledWorkday || dayData;
-            
-            // IMPROVED: Calculate hours using advanced logic with schedule verification
-            const hoursCalculation = calculateAdvancedHours(
-                checkIn, 
-                checkOut, 
-                scheduleForCalculation, 
-                dayData.date
-            );
-            
-            // IMPROVED: Use enhanced status determination with night shift support
-            const status = determineShiftStatus(checkIn, checkOut, scheduleForCalculation);
-            
-            // Legacy hours_worked field uses final_hours for backward compatibility
-            const hoursWorked = hoursCalculation.final_hours;
-            
-            console.log(`📊 Hours breakdown for ${dayData.employee_number} on ${dayData.date}:`);
-            console.log(`   Actual: ${hoursCalculation.actual_hours?.toFixed(2)}h`);
-            console.log(`   Planned: ${hoursCalculation.planned_hours?.toFixed(2)}h`);
-            console.log(`   Final: ${hoursCalculation.final_hours?.toFixed(2)}h`);
-            console.log(`   Overtime: ${hoursCalculation.overtime_hours?.toFixed(2)}h`);
-            console.log(`   Scheduled: ${hoursCalculation.is_scheduled_workday ? 'Yes' : 'No'}`);
-            console.log(`   Lunch break: ${hoursCalculation.has_lunch_break ? 'Yes' : 'No'}`);
-            
-            await db.query(`
-                INSERT INTO time_records 
-                (employee_id, employee_number, date, check_in, check_out, 
-                 hours_worked, planned_hours, actual_hours, overtime_hours,
-                 status, off_schedule, is_scheduled_workday, has_lunch_break,
-                 created_at, updated_at)
-                VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, NOW(), NOW())
-                ON CONFLICT (employee_number, date) DO UPDATE SET
-                    check_in = EXCLUDED.check_in,
-                    check_out = EXCLUDED.check_out,
-                    hours_worked = EXCLUDED.hours_worked,
-                    planned_hours = EXCLUDED.planned_hours,
-                    actual_hours = EXCLUDED.actual_hours,
-                    overtime_hours = EXCLUDED.overtime_hours,
-                    status = EXCLUDED.status,
-                    off_schedule = EXCLUDED.off_schedule,
-                    is_scheduled_workday = EXCLUDED.is_scheduled_workday,
-                    has_lunch_break = EXCLUDED.has_lunch_break,
-                    updated_at = NOW()
-            `, [
-                dayData.employee_id,
-                dayData.employee_number,
-                dayData.date,
-                checkIn,
-                checkOut,
-                hoursWorked,                          // $6 - legacy hours_worked
-                hoursCalculation.planned_hours,       // $7 - planned_hours
-                hoursCalculation.actual_hours,        // $8 - actual_hours  
-                hoursCalculation.overtime_hours,      // $9 - overtime_hours
-                status,                               // $10 - status
-                !hoursCalculation.is_scheduled_workday, // $11 - off_schedule
-                hoursCalculation.is_scheduled_workday,  // $12 - is_scheduled_workday
-                hoursCalculation.has_lunch_break      // $13 - has_lunch_break
-            ]);
-            
-            processedCount++;
-        }
+        const stats = await timeRecordsEngine.recalculateMonth({ organization, department, month });
         
-        console.log(`Filtered recalculation completed. Processed ${processedCount} records for filters:`, { organization, department, month });
+        log.info('Filtered recalculation completed', { organization, department, month, ...stats });
         
         // Build descriptive message about what was processed
         let filterDescription = `месяц: ${month}`;
@@ -688,14 +549,17 @@ router.post('/admin/recalculate-time-records', async (req, res) => {
         res.json({
             success: true,
             message: `Пересчет завершен успешно с учетом фильтров (${filterDescription})`,
-            processedRecords: processedCount,
-            totalEvents: timeEvents.length,
-            deletedRecords: deleteResult.rowCount,
+            processedRecords: stats.processedRecords,
+            totalEvents: stats.totalEvents,
+            deletedRecords: stats.deletedRecords,
+            employees: stats.employees,
+            durationMs: stats.durationMs,
+            employeeDaysPerSecond: stats.employeeDaysPerSecond,
             filters: { organization, department, month }
         });
         
     } catch (error) {
-        console.error('Time records recalculation error:', error);
+        log.error('Time records recalculation error', error);
         res.status(500).json({
             success: false,
             error: 'Ошибка пересчета рабочего времени: ' + error.message
@@ -727,7 +591,7 @@ router.get('/admin/schedules/templates', async (req, res) => {
         const templates = await db.queryRows(query);
         res.json(templates);
     } catch (error) {
-        console.error('Error fetching schedule templates:', error);
+        log.error('Error fetching schedule templates', error);
         res.status(500).json({ error: 'Internal server error' });
     }
 });
@@ -771,7 +635,7 @@ router.get('/admin/schedules/templates/:id', async (req, res) => {
         
         res.json({ template, dates, employees });
     } catch (error) {
-        console.error('Error fetching schedule template:', error);
+        log.error('Error fetching schedule template', error);
         res.status(500).json({ error: 'Internal server error' });
     }
 });
@@ -807,7 +671,7 @@ router.post('/admin/schedules/templates', async (req, res) => {
         res.json({ success: true, template: templateResult });
     } catch (error) {
         await db.query('ROLLBACK');
-        console.error('Error creating schedule template:', error);
+        log.error('Error creating schedule template', error);
         res.status(500).json({ error: 'Internal server error' });
     }
 });
@@ -854,7 +718,7 @@ router.put('/admin/schedules/templates/:id', async (req, res) => {
         res.json({ success: true, template: templateResult });
     } catch (error) {
         await db.query('ROLLBACK');
-        console.error('Error updating schedule template:', error);
+        log.error('Error updating schedule template', error);
         res.status(500).json({ error: 'Internal server error' });
     }
 });
@@ -893,7 +757,7 @@ router.post('/admin/schedules/assign', async (req, res) => {
             });
         }
         
-        console.log(`Assigning schedule "${template.name}" to ${employee_ids.length} employees from ${start_date}`);
+        log.info('Assigning schedule template', { template: template.name, employees: employee_ids.length, start_date });
         
         await db.query('BEGIN');
         
@@ -915,7 +779,7 @@ router.post('/admin/schedules/assign', async (req, res) => {
                     continue;
                 }
                 
-                console.log(`Processing employee: ${employee.full_name} (${employee.table_number})`);
+                log.debug('Processing employee', { tableNumber: employee.table_number });
                 
                 // Check for overlapping schedules in the future
                 const existingSchedule = await db.queryRow(`
@@ -935,7 +799,7 @@ router.post('/admin/schedules/assign', async (req, res) => {
                 `, [employee_id, start_date]);
                 
                 if (existingSchedule) {
-                    console.log(`Found existing schedule for ${employee.full_name}: ${existingSchedule.template_name} from ${existingSchedule.start_date}`);
+                    log.debug('Found existing schedule', { tableNumber: employee.table_number, template: existingSchedule.template_name, startDate: existingSchedule.start_date });
                     
                     // Check if new start date is after existing start date
                     const newStartDate = new Date(start_date);
@@ -953,7 +817,7 @@ router.post('/admin/schedules/assign', async (req, res) => {
                             WHERE id = $2
                         `, [endDateStr, existingSchedule.id]);
                         
-                        console.log(`Ended previous schedule for ${employee.full_name} on ${endDateStr}`);
+                        log.debug('Ended previous schedule', { tableNumber: employee.table_number, endDate: endDateStr });
                     } else {
                         // New schedule starts before or same as existing - remove existing schedule entirely
                         await db.query(`
@@ -961,7 +825,7 @@ router.post('/admin/schedules/assign', async (req, res) => {
                             WHERE id = $1
                         `, [existingSchedule.id]);
                         
-                        console.log(`Removed previous schedule for ${employee.full_name} (conflicting dates)`);
+                        log.debug('Removed previous schedule (conflicting dates)', { tableNumber: employee.table_number });
                     }
                 }
                 
@@ -972,11 +836,11 @@ router.post('/admin/schedules/assign', async (req, res) => {
                     VALUES ($1, $2, $3, $4, $5)
                 `, [employee_id, employee.table_number, template_id, start_date, assigned_by || 'admin']);
                 
-                console.log(`Assigned new schedule to ${employee.full_name} from ${start_date}`);
+                log.debug('Assigned new schedule', { tableNumber: employee.table_number, start_date });
                 assignedCount++;
                 
             } catch (empError) {
-                console.error(`Error processing employee ${employee_id}:`, empError);
+                log.error('Error processing employee', { employee_id, error: empError });
                 errors.push(`Ошибка для сотрудника ${employee_id}: ${empError.message}`);
                 skippedCount++;
             }
@@ -989,7 +853,7 @@ router.post('/admin/schedules/assign', async (req, res) => {
             message += `, пропущено ${skippedCount} сотрудников`;
         }
         
-        console.log(`Assignment completed: ${assignedCount} assigned, ${skippedCount} skipped`);
+        log.info('Schedule template assignment completed', { assigned: assignedCount, skipped: skippedCount });
         
         res.json({ 
             success: true, 
@@ -1001,7 +865,7 @@ router.post('/admin/schedules/assign', async (req, res) => {
         
     } catch (error) {
         await db.query('ROLLBACK');
-        console.error('Error assigning schedule:', error);
+        log.error('Error assigning schedule', error);
         res.status(500).json({ 
             success: false,
             error: 'Ошибка при назначении графика: ' + error.message 
@@ -1053,7 +917,7 @@ router.get('/admin/schedules/available-employees', async (req, res) => {
         const employees = await db.queryRows(query, params);
         res.json(employees);
     } catch (error) {
-        console.error('Error fetching available employees:', error);
+        log.error('Error fetching available employees', error);
         res.status(500).json({ error: 'Internal server error' });
     }
 });
@@ -1076,27 +940,37 @@ router.get('/admin/schedules/employee/:employeeId/history', async (req, res) =>
         
         res.json(history);
     } catch (error) {
-        console.error('Error fetching employee schedule history:', error);
+        log.error('Error fetching employee schedule history', error);
         res.status(500).json({ error: 'Internal server error' });
     }
 });
 
+// Hit/miss counters of the in-process caches and the background sync queue
+router.get('/admin/cache/stats', (req, res) => {
+    res.json({
+        success: true,
+        reports: reportCache.stats(),
+        scheduleCalendar: scheduleCalendar.stats(),
+        employeeSync: employeeSync.stats()
+    });
+});
+
 // ==================== CLEAR TABLE ENDPOINTS ====================
 
 // Clear all time_events
 router.delete('/admin/time-events/clear-all', async (req, res) => {
     try {
-        console.log('Clearing all time_events...');
-        
-        await db.query('BEGIN');
+        log.warn('Clearing all time_events');
         
-        // Удаляем все записи из time_events
-        const result = await db.query('DELETE FROM time_events');
-        const deletedCount = result.rowCount || 0;
-        
-        await db.query('COMMIT');
+        // TRUNCATE очищает все месячные партиции без построчного удаления
+        const deletedCount = await db.withTransaction(async (client) => {
+            const result = await client.query('SELECT COUNT(*)::int as count FROM time_events');
+            await client.query('TRUNCATE time_events, daily_attendance');
+            return result.rows[0].count;
+        });
+        reportCache.clear();
         
-        console.log(`Deleted ${deletedCount} records from time_events`);
+        log.warn('Cleared time_events', { deleted: deletedCount });
         
         res.json({
             success: true,
@@ -1104,8 +978,7 @@ router.delete('/admin/time-events/clear-all', async (req, res) => {
             deletedCount: deletedCount
         });
     } catch (error) {
-        await db.query('ROLLBACK');
-        console.error('Error clearing time_events:', error);
+        log.error('Error clearing time_events', error);
         res.status(500).json({
             success: false,
             error: 'Ошибка при очистке таблицы событий: ' + error.message
@@ -1116,7 +989,7 @@ router.delete('/admin/time-events/clear-all', async (req, res) => {
 // Clear all time_records
 router.delete('/admin/time-records/clear-all', async (req, res) => {
     try {
-        console.log('Clearing all time_records...');
+        log.warn('Clearing all time_records');
         
         await db.query('BEGIN');
         
@@ -1125,8 +998,9 @@ router.delete('/admin/time-records/clear-all', async (req, res) => {
         const deletedCount = result.rowCount || 0;
         
         await db.query('COMMIT');
+        reportCache.clear();
         
-        console.log(`Deleted ${deletedCount} records from time_records`);
+        log.warn('Cleared time_records', { deleted: deletedCount });
         
         res.json({
             success: true,
@@ -1135,7 +1009,7 @@ router.delete('/admin/time-records/clear-all', async (req, res) => {
         });
     } catch (error) {
         await db.query('ROLLBACK');
-        console.error('Error clearing time_records:', error);
+        log.error('Error clearing time_records', error);
         res.status(500).json({
             success: false,
             error: 'Ошибка при очистке таблицы табеля: ' + error.message
@@ -1153,7 +1027,7 @@ router.get('/admin/reports/late-employees', async (req, res) => {
         // Если дата не указана, используем сегодняшнюю
         const reportDate = date || new Date().toISOString().split('T')[0];
         
-        console.log('Getting late employees report for:', reportDate, 'org:', organization, 'dept:', department);
+        log.debug('Getting late employees report', { reportDate, organization, department });
 
         // Строим SQL запрос с фильтрами
         let query = `
@@ -1171,21 +1045,20 @@ router.get('/admin/reports/late-employees', async (req, res) => {
                 esa.end_date
             FROM employees e
             LEFT JOIN departments d ON e.object_code = d.object_code
-            JOIN employee_schedule_assignments esa ON e.table_number = esa.employee_number
+            JOIN employee_schedule_assignments esa ON ${assignmentsAsOf.asOfCondition('esa', 'e.table_number', '$1')}
             JOIN work_schedules_1c ws ON esa.schedule_code = ws.schedule_code AND ws.work_date = $1
             LEFT JOIN (
-                SELECT DISTINCT ON (employee_number, DATE(event_datetime))
+                SELECT DISTINCT ON (employee_number)
                     employee_number,
                     event_datetime,
-                    DATE(event_datetime) as event_date
+                    $1::date as event_date
                 FROM time_events 
                 WHERE event_type = 'вход' 
-                    AND DATE(event_datetime) = $1
-                ORDER BY employee_number, DATE(event_datetime), event_datetime ASC
+                    AND event_datetime >= $1::date
+                    AND event_datetime < $1::date + 1
+                ORDER BY employee_number, event_datetime ASC
             ) te ON e.table_number = te.employee_number
-            WHERE (esa.start_date <= $1)
-                AND (esa.end_date IS NULL OR esa.end_date >= $1)
-                AND ws.work_start_time IS NOT NULL
+            WHERE ws.work_start_time IS NOT NULL
                 AND ws.work_hours > 0
         `;
 
@@ -1255,7 +1128,7 @@ router.get('/admin/reports/late-employees', async (req, res) => {
         // Фильтруем только опоздавших и отсутствующих
         const filteredEmployees = lateEmployees.filter(emp => emp.status === 'late' || emp.status === 'absent');
 
-        console.log(`Found ${filteredEmployees.length} late/absent employees`);
+        log.debug('Found late/absent employees', { count: filteredEmployees.length });
 
         res.json({
             success: true,
@@ -1265,7 +1138,7 @@ router.get('/admin/reports/late-employees', async (req, res) => {
         });
 
     } catch (error) {
-        console.error('Error getting late employees report:', error);
+        log.error('Error getting late employees report', error);
         res.status(500).json({
             success: false,
             error: 'Ошибка при получении отчета по опоздавшим: ' + error.message
@@ -1290,7 +1163,7 @@ router.get('/admin/reports/organizations', async (req, res) => {
             data: result.rows
         });
     } catch (error) {
-        console.error('Error getting organizations for reports:', error);
+        log.error('Error getting organizations for reports', error);
         res.status(500).json({
             success: false,
             error: 'Ошибка при получении списка организаций: ' + error.message
@@ -1324,7 +1197,7 @@ router.get('/admin/reports/departments', async (req, res) => {
             data: result.rows
         });
     } catch (error) {
-        console.error('Error getting departments for reports:', error);
+        log.error('Error getting departments for reports', error);
         res.status(500).json({
             success: false,
             error: 'Ошибка при получении списка подразделений: ' + error.message
@@ -1334,327 +1207,96 @@ router.get('/admin/reports/departments', async (req, res) => {
 
 // ==================== 1C WORK SCHEDULES IMPORT ENDPOINT ====================
 
-// ADVANCED HOURS CALCULATOR WITH SCHEDULE-BASED LOGIC
-function calculateAdvancedHours(checkIn, checkOut, scheduleData, workDate) {
-    if (!checkIn || !checkOut) {
-        return {
-            actual_hours: 0,
-            planned_hours: 0,
-            overtime_hours: 0,
-            is_scheduled_workday: false,
-            has_lunch_break: false
-        };
-    }
-    
-    const inTime = new Date(checkIn);
-    let outTime = new Date(checkOut);
-    
-    // Get schedule information
-    const startTime = scheduleData.work_start_time;
-    const endTime = scheduleData.work_end_time;
-    const plannedHours = parseFloat(scheduleData.work_hours) || 8;
-    const scheduleName = scheduleData.schedule_name || '';
-    
-    // Check if this is a scheduled workday
-    const isScheduledWorkday = !!scheduleData.schedule_name;
-    
-    // Determine if night shift
-    const isNightShift = startTime && endTime && (
-        startTime > endTime ||
-        plannedHours > 12 ||
-        (startTime >= "22:00" || startTime >= "23:00") ||
-        (endTime <= "08:00" || endTime <= "06:00") ||
-        scheduleName.toLowerCase().includes('ночная') ||
-        scheduleName.includes('00:00')
-    );
-    
-    // Handle night shift time calculation
-    if (isNightShift && outTime <= inTime) {
-        outTime.setDate(outTime.getDate() + 1);
-        console.log(`🌙 Night shift: adjusted checkout to next day`);
-    }
-    
-    // Calculate raw actual hours
-    let actualHours = (outTime - inTime) / (1000 * 60 * 60);
-    
-    // Handle edge cases
-    if (actualHours < 0) {
-        actualHours = actualHours + 24;
-    }
-    if (actualHours > 16) {
-        console.warn(`⚠️ Unusually long shift: ${actualHours.toFixed(2)}h`);
-        actualHours = Math.min(actualHours, 16); // Cap at 16 hours
-    }
-    
-    // Determine if lunch break should be deducted
-    const hasLunchBreak = actualHours > 4 && !isNightShift;
-    
-    // Calculate final hours based on schedule logic
-    let finalHours, overtimeHours = 0;
-    
-    if (isScheduledWorkday) {
-        console.log(`📅 Scheduled workday: ${scheduleName} (${plannedHours}h planned)`);
-        
-        // Deduct lunch break if applicable
-        let workingHours = actualHours;
-        if (hasLunchBreak) {
-            workingHours = Math.max(0, actualHours - 1); // Deduct 1 hour lunch
-            console.log(`🍽️ Lunch break deducted: ${actualHours.toFixed(2)}h → ${workingHours.toFixed(2)}h`);
-        }
-        
-        if (workingHours > plannedHours) {
-            // Overtime: cap at planned hours, calculate overtime separately
-            finalHours = plannedHours;
-            overtimeHours = workingHours - plannedHours;
-            console.log(`⏰ Overtime detected: ${plannedHours}h + ${overtimeHours.toFixed(2)}h overtime → capped at ${finalHours}h`);
-        } else {
-            // Within scheduled hours or early departure
-            finalHours = workingHours;
-            console.log(`✅ Within schedule: ${finalHours.toFixed(2)}h of ${plannedHours}h planned`);
-        }
-    } else {
-        // No schedule: count actual hours
-        console.log(`🚫 No schedule: counting actual hours`);
-        finalHours = hasLunchBreak ? Math.max(0, actualHours - 1) : actualHours;
-    }
-    
-    return {
-        actual_hours: Math.max(0, actualHours),
-        planned_hours: isScheduledWorkday ? plannedHours : 0,
-        overtime_hours: Math.max(0, overtimeHours),
-        is_scheduled_workday: isScheduledWorkday,
-        has_lunch_break: hasLunchBreak,
-        final_hours: Math.max(0, finalHours)
-    };
-}
-
-// CHECK IF DATE IS SCHEDULED WORKDAY
-async function isScheduledWorkday(employeeNumber, workDate) {
-    try {
-        // Check if the specific date exists in employee's work schedule
-        const scheduleEntry = await db.queryRow(`
-            SELECT 
-                ws1c.work_date,
-                ws1c.work_hours,
-                ws1c.time_type,
-                ws1c.schedule_name,
-                ws1c.work_start_time,
-                ws1c.work_end_time
-            FROM employee_schedule_assignments esa
-            JOIN work_schedules_1c ws1c ON esa.schedule_code = ws1c.schedule_code
-            WHERE esa.employee_number = $1 
-            AND esa.end_date IS NULL
-            AND ws1c.work_date = $2
-            LIMIT 1
-        `, [employeeNumber, workDate]);
-        
-        return scheduleEntry || null;
-    } catch (error) {
-        console.error('Error checking scheduled workday:', error);
-        return null;
-    }
-}
-
-// LEGACY FUNCTION - DEPRECATED BUT KEPT FOR COMPATIBILITY
-function calculateShiftHours(checkIn, checkOut, scheduleData) {
-    const result = calculateAdvancedHours(checkIn, checkOut, scheduleData, null);
-    return result.final_hours;
-}
-
-// Enhanced status determination for night shifts
-function determineShiftStatus(checkIn, checkOut, scheduleData) {
-    const actualHours = calculateShiftHours(checkIn, checkOut, scheduleData);
-    const expectedHours = parseInt(scheduleData.work_hours) || 8;
-    const startTime = scheduleData.work_start_time;
-    const endTime = scheduleData.work_end_time;
-    
-    // Check if employee worked without assigned schedule
-    const offSchedule = !scheduleData.schedule_name;
-    
-    if (!checkIn) return 'absent';
-    
-    const inTime = new Date(checkIn);
-    
-    // Parse expected start time for comparison
-    let expectedStart = new Date(inTime);
-    if (startTime) {
-        const [hours, minutes] = startTime.split(':').map(Number);
-        expectedStart.setHours(hours, minutes, 0, 0);
-        
-        // For night shifts starting late (22:00+), adjust date if needed
-        if (hours >= 22 && inTime.getHours() < 12) {
-            expectedStart.setDate(expectedStart.getDate() - 1);
-        }
-    }
-    
-    // Calculate lateness in minutes
-    const lateness = (inTime - expectedStart) / (1000 * 60);
-    
-    // Determine status
-    if (lateness <= 5) return 'on_time';           // Within 5 minutes
-    if (lateness <= 30) return 'late';             // Up to 30 minutes late
-    if (actualHours < expectedHours * 0.8) return 'early_leave'; // Left significantly early
-    
-    return 'late';
-}
-
-// Function to extract work times from schedule name
-function extractWorkTimesFromScheduleName(scheduleName) {
-    if (!scheduleName) return { work_start_time: null, work_end_time: null };
-    
-    // Regex pattern for time format: HH:MM-HH:MM at the beginning of the name
-    const timePattern = /^(\d{2}:\d{2})-(\d{2}:\d{2})/;
-    const match = scheduleName.match(timePattern);
-    
-    if (match) {
-        console.log(`Extracted times from "${scheduleName}": ${match[1]} - ${match[2]}`);
-        return {
-            work_start_time: match[1],
-            work_end_time: match[2]
-        };
-    }
-    
-    console.log(`Could not extract times from "${scheduleName}"`);
-    return { work_start_time: null, work_end_time: null };
-}
+// Schedules are small (a year of days each), report progress every few of them
+const IMPORT_SCHEDULES_CHUNK_SIZE = 10;
 
-// Import work schedules data from 1C
+// Import work schedules data from 1C.
+// The body is parsed as a stream and every schedule is written with one
+// statement as soon as it has been read, so export size does not matter.
 router.post('/admin/schedules/import-1c', async (req, res) => {
+    const progress = jsonStream.createProgressStream(req, res);
+    const fields = {};
+    const errors = [];
+    const statistics = {
+        totalSchedulesReceived: 0,
+        totalSchedulesProcessed: 0,
+        totalSchedulesUpdated: 0,
+        totalWorkDaysInserted: 0,
+        totalWorkDaysUpdated: 0,
+        totalWorkDaysUnchanged: 0,
+        totalWorkDaysDeleted: 0,
+        errorsCount: 0
+    };
+    
     try {
-        const { ДатаВыгрузки, КоличествоГрафиков, Графики } = req.body;
-        
-        console.log('Received 1C schedules import request:', {
-            exportDate: ДатаВыгрузки,
-            schedulesCount: КоличествоГрафиков,
-            schedulesReceived: Графики?.length || 0
-        });
-        
-        // Basic validation
-        if (!Графики || !Array.isArray(Графики) || Графики.length === 0) {
-            return res.status(400).json({
-                success: false,
-                error: 'Нет данных для импорта. Массив "Графики" отсутствует или пуст.'
-            });
-        }
-        
-        let totalProcessed = 0;
-        let totalInserted = 0;
-        let totalUpdated = 0;
-        let errors = [];
-        
-        // Process each schedule
-        for (const график of Графики) {
-            try {
-                const { НаименованиеГрафика, КодГрафика, РабочиеДни } = график;
+        await jsonStream.processJsonArrayInChunks(req, {
+            arrayKey: 'Графики',
+            fields,
+            chunkSize: IMPORT_SCHEDULES_CHUNK_SIZE
+        }, async (графики) => {
+            for (const график of графики) {
+                statistics.totalSchedulesReceived++;
                 
-                // Validate schedule data
-                if (!НаименованиеГрафика || !КодГрафика || !РабочиеДни || !Array.isArray(РабочиеДни)) {
-                    errors.push(`Неполные данные для графика: ${НаименованиеГрафика || КодГрафика || 'UNKNOWN'}`);
+                const { schedule, errors: validationErrors } = scheduleImport.prepareSchedule(график);
+                errors.push(...validationErrors);
+                if (!schedule) {
                     continue;
                 }
                 
-                console.log(`Processing schedule: ${НаименованиеГрафика} (${КодГрафика}) with ${РабочиеДни.length} work days`);
-                
-                // Start transaction for this schedule
-                await db.query('BEGIN');
-                
-                // Delete existing records for this schedule code (replace existing data)
-                const deleteResult = await db.query(
-                    'DELETE FROM work_schedules_1c WHERE schedule_code = $1',
-                    [КодГрафика]
-                );
-                
-                const deletedCount = deleteResult.rowCount || 0;
-                if (deletedCount > 0) {
-                    console.log(`Deleted ${deletedCount} existing records for schedule ${КодГрафика}`);
-                }
-                
-                let scheduleInsertCount = 0;
-                
-                // Extract work times from schedule name (fallback if not provided by 1C)
-                const extractedTimes = extractWorkTimesFromScheduleName(НаименованиеГрафика);
-                
-                // Insert new records for this schedule
-                for (const рабочийДень of РабочиеДни) {
-                    const { 
-                        Дата, 
-                        Месяц, 
-                        ВидУчетаВремени, 
-                        ДополнительноеЗначение,
-                        ВремяНачалоРаботы,
-                        ВремяЗавершениеРаботы 
-                    } = рабочийДень;
+                try {
+                    const result = await db.withTransaction(client => scheduleImport.importSchedule(client, schedule));
                     
-                    // Validate work day data
-                    if (!Дата || !Месяц || !ВидУчетаВремени || ДополнительноеЗначение === undefined) {
-                        errors.push(`Неполные данные для рабочего дня в графике ${НаименованиеГрафика}: ${JSON.stringify(рабочийДень)}`);
-                        continue;
+                    statistics.totalSchedulesProcessed++;
+                    statistics.totalWorkDaysInserted += result.inserted;
+                    statistics.totalWorkDaysUpdated += result.updated;
+                    statistics.totalWorkDaysUnchanged += result.unchanged;
+                    statistics.totalWorkDaysDeleted += result.deleted;
+                    if (result.existing > 0) {
+                        statistics.totalSchedulesUpdated++;
                     }
-                    
-                    // Use times from 1C if provided, otherwise use extracted times from schedule name
-                    const finalStartTime = ВремяНачалоРаботы || extractedTimes.work_start_time;
-                    const finalEndTime = ВремяЗавершениеРаботы || extractedTimes.work_end_time;
-                    
-                    // Insert work day record
-                    await db.query(`
-                        INSERT INTO work_schedules_1c 
-                        (schedule_name, schedule_code, work_date, work_month, time_type, work_hours, work_start_time, work_end_time)
-                        VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
-                    `, [
-                        НаименованиеГрафика,
-                        КодГрафика,
-                        Дата,              // work_date
-                        Месяц,             // work_month
-                        ВидУчетаВремени,   // time_type
-                        ДополнительноеЗначение,  // work_hours
-                        finalStartTime,    // work_start_time (from 1C or extracted)
-                        finalEndTime       // work_end_time (from 1C or extracted)
-                    ]);
-                    
-                    scheduleInsertCount++;
+                } catch (scheduleError) {
+                    const errorMsg = `Ошибка обработки графика ${schedule.name || schedule.code}: ${scheduleError.message}`;
+                    log.error('Error importing 1C schedule', { schedule: schedule.code, error: scheduleError });
+                    errors.push(errorMsg);
                 }
-                
-                await db.query('COMMIT');
-                
-                console.log(`Successfully processed schedule ${НаименованиеГрафика}: inserted ${scheduleInsertCount} work days`);
-                totalProcessed++;
-                totalInserted += scheduleInsertCount;
-                if (deletedCount > 0) {
-                    totalUpdated++;
-                }
-                
-            } catch (scheduleError) {
-                await db.query('ROLLBACK');
-                const errorMsg = `Ошибка обработки графика ${график.НаименованиеГрафика || график.КодГрафика || 'UNKNOWN'}: ${scheduleError.message}`;
-                console.error(errorMsg, scheduleError);
-                errors.push(errorMsg);
             }
-        }
-        
-        const response = {
-            success: true,
-            message: `Импорт завершен успешно`,
-            statistics: {
-                totalSchedulesReceived: Графики.length,
-                totalSchedulesProcessed: totalProcessed,
-                totalSchedulesUpdated: totalUpdated,
-                totalWorkDaysInserted: totalInserted,
-                errorsCount: errors.length
-            },
-            exportDate: ДатаВыгрузки,
-            errors: errors.length > 0 ? errors : undefined
-        };
-        
-        console.log('1C import completed:', response.statistics);
-        res.json(response);
-        
+            
+            statistics.errorsCount = errors.length;
+            progress.update({ statistics });
+        });
     } catch (error) {
-        console.error('Error importing 1C schedules:', error);
-        res.status(500).json({
+        log.error('Error importing 1C schedules', error);
+        return progress.end(jsonStream.isJsonError(error) ? 400 : 500, {
+            success: false,
+            error: 'Ошибка импорта данных из 1С: ' + error.message,
+            statistics
+        });
+    }
+    
+    log.info('Received 1C schedules import request', {
+        exportDate: fields.ДатаВыгрузки,
+        schedulesCount: fields.КоличествоГрафиков,
+        schedulesReceived: statistics.totalSchedulesReceived
+    });
+    
+    // Basic validation
+    if (statistics.totalSchedulesReceived === 0) {
+        return progress.end(400, {
             success: false,
-            error: 'Ошибка импорта данных из 1С: ' + error.message
+            error: 'Нет данных для импорта. Массив "Графики" отсутствует или пуст.'
         });
     }
+    
+    const response = {
+        success: true,
+        message: `Импорт завершен успешно`,
+        statistics,
+        exportDate: fields.ДатаВыгрузки,
+        errors: errors.length > 0 ? errors : undefined
+    };
+    
+    log.info('1C import completed', response.statistics);
+    progress.end(200, response);
 });
 
 // Get work schedules from 1C with filters
@@ -1730,7 +1372,7 @@ router.get('/admin/schedules/1c', async (req, res) => {
         });
         
     } catch (error) {
-        console.error('Error fetching 1C schedules:', error);
+        log.error('Error fetching 1C schedules', error);
         res.status(500).json({ error: 'Internal server error' });
     }
 });
@@ -1739,22 +1381,23 @@ router.get('/admin/schedules/1c', async (req, res) => {
 router.get('/admin/schedules/1c/list', async (req, res) => {
     try {
         const schedules = await db.queryRows(`
-            SELECT DISTINCT 
+            SELECT 
                 schedule_name,
                 schedule_code,
-                COUNT(*) as work_days_count,
-                MIN(work_date) as start_date,
-                MAX(work_date) as end_date,
-                AVG(work_hours) as avg_hours,
-                MAX(created_at) as last_updated
-            FROM work_schedules_1c
-            GROUP BY schedule_name, schedule_code
+                work_days_count,
+                start_date,
+                end_date,
+                avg_hours,
+                work_start_time,
+                work_end_time,
+                updated_at as last_updated
+            FROM schedules_1c
             ORDER BY schedule_name
         `);
         
         res.json(schedules);
     } catch (error) {
-        console.error('Error fetching 1C schedules list:', error);
+        log.error('Error fetching 1C schedules list', error);
         res.status(500).json({ error: 'Internal server error' });
     }
 });
@@ -1774,89 +1417,67 @@ router.post('/admin/schedules/assign-employee', async (req, res) => {
             });
         }
         
-        await db.query('BEGIN');
-        
-        try {
+        const result = await db.withTransaction(async (client) => {
             // Check if employee exists
-            const employee = await db.queryRow(
+            const employee = (await client.query(
                 'SELECT id, full_name FROM employees WHERE table_number = $1',
                 [employee_number]
-            );
+            )).rows[0];
             
             if (!employee) {
-                await db.query('ROLLBACK');
-                return res.json({
-                    success: false,
-                    error: 'Сотрудник не найден',
-                    skipped: true
-                });
+                return { error: 'Сотрудник не найден' };
             }
             
             // Check if schedule exists
-            const schedule = await db.queryRow(
-                'SELECT DISTINCT schedule_code, schedule_name FROM work_schedules_1c WHERE schedule_code = $1',
+            const schedule = (await client.query(
+                'SELECT schedule_code, schedule_name FROM schedules_1c WHERE schedule_code = $1',
                 [schedule_code]
-            );
+            )).rows[0];
             
             if (!schedule) {
-                await db.query('ROLLBACK');
-                return res.json({
-                    success: false,
-                    error: 'График не найден',
-                    skipped: true
-                });
+                return { error: 'График не найден' };
             }
             
-            // Close any existing active schedule
-            const existingSchedule = await db.queryRow(`
-                SELECT id, schedule_code, start_date 
-                FROM employee_schedule_assignments 
-                WHERE employee_number = $1 AND end_date IS NULL
-            `, [employee_number]);
-            
-            if (existingSchedule) {
-                // Set end_date to day before new schedule starts
-                const endDate = new Date(start_date);
-                endDate.setDate(endDate.getDate() - 1);
-                
-                await db.query(`
-                    UPDATE employee_schedule_assignments 
-                    SET end_date = $1, updated_at = CURRENT_TIMESTAMP
-                    WHERE id = $2
-                `, [endDate.toISOString().split('T')[0], existingSchedule.id]);
-            }
-            
-            // Create new assignment
-            const newAssignment = await db.queryRow(`
-                INSERT INTO employee_schedule_assignments 
-                (employee_id, employee_number, schedule_code, start_date, assigned_by)
-                VALUES ($1, $2, $3, $4, '1C')
-                RETURNING *
-            `, [employee.id, employee_number, schedule_code, start_date]);
+            // Insert the assignment; the one in force before it ends the day
+            // before the new start date
+            const placed = await scheduleAssignments.placeAssignments(client, [{
+                employee_id: employee.id,
+                employee_number,
+                schedule_code,
+                start_date
+            }]);
             
-            await db.query('COMMIT');
+            // Days from the new start date on are computed with another schedule
+            await dirtyDays.markEmployeesDirty([employee_number], start_date, null, 'assignment', client);
+            await payrollShifts.refreshEmployees([employee_number], start_date, null, client);
             
-            res.json({
-                success: true,
-                message: 'График успешно назначен',
-                assignment: {
-                    id: newAssignment.id,
-                    employee_number: employee_number,
-                    employee_name: employee.full_name,
-                    schedule_code: schedule_code,
-                    schedule_name: schedule.schedule_name,
-                    start_date: start_date,
-                    previous_schedule_ended: !!existingSchedule
-                }
+            return { employee, schedule, assignment: placed.inserted[0], previousEnded: placed.changed.length > 0 };
+        });
+        
+        if (result.error) {
+            return res.json({
+                success: false,
+                error: result.error,
+                skipped: true
             });
-            
-        } catch (error) {
-            await db.query('ROLLBACK');
-            throw error;
         }
         
+        res.json({
+            success: true,
+            message: 'График успешно назначен',
+            assignment: {
+                id: result.assignment.id,
+                employee_number: employee_number,
+                employee_name: result.employee.full_name,
+                schedule_code: schedule_code,
+                schedule_name: result.schedule.schedule_name,
+                start_date: start_date,
+                previous_schedule_ended: result.previousEnded
+            }
+        });
+        
     } catch (error) {
-        console.error('Error assigning schedule to employee:', error);
+        log.error('Error assigning schedule to employee', error);
         res.status(500).json({
             success: false,
             error: 'Ошибка назначения графика: ' + error.message
@@ -1866,111 +1487,54 @@ router.post('/admin/schedules/assign-employee', async (req, res) => {
 
 // Batch assign schedules to multiple employees
 router.post('/admin/schedules/assign-employees-batch', async (req, res) => {
+    const progress = jsonStream.createProgressStream(req, res);
+    const results = {
+        success: true,
+        totalReceived: 0,
+        assigned: 0,
+        skipped: 0,
+        errors: [],
+        assignments: []
+    };
+    
     try {
-        const { assignments } = req.body;
-        
-        if (!assignments || !Array.isArray(assignments) || assignments.length === 0) {
-            return res.status(400).json({
-                success: false,
-                error: 'Необходимо передать массив назначений'
-            });
-        }
-        
-        const results = {
-            success: true,
-            totalReceived: assignments.length,
-            assigned: 0,
-            skipped: 0,
-            errors: [],
-            assignments: []
-        };
-        
-        for (const assignment of assignments) {
-            const { employee_number, schedule_code, start_date } = assignment;
-            
-            if (!employee_number || !schedule_code || !start_date) {
-                results.errors.push(`Неполные данные: ${JSON.stringify(assignment)}`);
-                results.skipped++;
-                continue;
-            }
+        await jsonStream.processJsonArrayInChunks(req, { arrayKey: 'assignments' }, async (assignments) => {
+            results.totalReceived += assignments.length;
             
             try {
-                await db.query('BEGIN');
-                
-                // Check employee
-                const employee = await db.queryRow(
-                    'SELECT id, full_name FROM employees WHERE table_number = $1',
-                    [employee_number]
-                );
-                
-                if (!employee) {
-                    results.errors.push(`Сотрудник ${employee_number} не найден`);
+                const result = await db.withTransaction(client => scheduleAssignments.assignSchedules(client, assignments));
+                results.assigned += result.assigned;
+                results.skipped += result.skipped;
+                results.errors.push(...result.errors);
+                results.assignments.push(...result.assignments);
+            } catch (error) {
+                // The chunk is rolled back as a whole
+                for (const assignment of assignments) {
+                    results.errors.push(`Ошибка для ${assignment?.employee_number}: ${error.message}`);
                     results.skipped++;
-                    await db.query('ROLLBACK');
-                    continue;
                 }
-                
-                // Check schedule
-                const schedule = await db.queryRow(
-                    'SELECT DISTINCT schedule_code, schedule_name FROM work_schedules_1c WHERE schedule_code = $1',
-                    [schedule_code]
-                );
-                
-                if (!schedule) {
-                    results.errors.push(`График ${schedule_code} не найден`);
-                    results.skipped++;
-                    await db.query('ROLLBACK');
-                    continue;
-                }
-                
-                // Close existing active schedule
-                const existingSchedule = await db.queryRow(`
-                    SELECT id FROM employee_schedule_assignments 
-                    WHERE employee_number = $1 AND end_date IS NULL
-                `, [employee_number]);
-                
-                if (existingSchedule) {
-                    const endDate = new Date(start_date);
-                    endDate.setDate(endDate.getDate() - 1);
-                    
-                    await db.query(`
-                        UPDATE employee_schedule_assignments 
-                        SET end_date = $1, updated_at = CURRENT_TIMESTAMP
-                        WHERE id = $2
-                    `, [endDate.toISOString().split('T')[0], existingSchedule.id]);
-                }
-                
-                // Create new assignment
-                const newAssignment = await db.queryRow(`
-                    INSERT INTO employee_schedule_assignments 
-                    (employee_id, employee_number, schedule_code, start_date, assigned_by)
-                    VALUES ($1, $2, $3, $4, '1C')
-                    RETURNING id
-                `, [employee.id, employee_number, schedule_code, start_date]);
-                
-                await db.query('COMMIT');
-                
-                results.assigned++;
-                results.assignments.push({
-                    employee_number,
-                    employee_name: employee.full_name,
-                    schedule_code,
-                    schedule_name: schedule.schedule_name,
-                    start_date
-                });
-                
-            } catch (error) {
-                await db.query('ROLLBACK');
-                results.errors.push(`Ошибка для ${employee_number}: ${error.message}`);
-                results.skipped++;
             }
+            
+            progress.update({
+                totalReceived: results.totalReceived,
+                assigned: results.assigned,
+                skipped: results.skipped,
+                errorsCount: results.errors.length
+            });
+        });
+        
+        if (results.totalReceived === 0) {
+            return progress.end(400, {
+                success: false,
+                error: 'Необходимо передать массив назначений'
+            });
         }
         
-        res.json(results);
+        progress.end(200, results);
         
     } catch (error) {
-        console.error('Error in batch schedule assignment:', error);
-        res.status(500).json({
+        log.error('Error in batch schedule assignment', error);
+        progress.end(jsonStream.isJsonError(error) ? 400 : 500, {
             success: false,
             error: 'Ошибка массового назначения графиков: ' + error.message
         });
@@ -1994,10 +1558,7 @@ router.get('/admin/employees/:employee_number/current-schedule', async (req, res
                 esa.created_at
             FROM employee_schedule_assignments esa
             LEFT JOIN employees e ON esa.employee_id = e.id
-            LEFT JOIN (
-                SELECT DISTINCT schedule_code, schedule_name 
-                FROM work_schedules_1c
-            ) ws ON esa.schedule_code = ws.schedule_code
+            LEFT JOIN schedules_1c ws ON esa.schedule_code = ws.schedule_code
             WHERE esa.employee_number = $1 AND esa.end_date IS NULL
         `, [employee_number]);
         
@@ -2014,7 +1575,7 @@ router.get('/admin/employees/:employee_number/current-schedule', async (req, res
         });
         
     } catch (error) {
-        console.error('Error fetching current schedule:', error);
+        log.error('Error fetching current schedule', error);
         res.status(500).json({ error: 'Internal server error' });
     }
 });
@@ -2038,10 +1599,7 @@ router.get('/admin/employees/:employee_number/schedule-history', async (req, res
                     ELSE 'ended'
                 END as status
             FROM employee_schedule_assignments esa
-            LEFT JOIN (
-                SELECT DISTINCT schedule_code, schedule_name 
-                FROM work_schedules_1c
-            ) ws ON esa.schedule_code = ws.schedule_code
+            LEFT JOIN schedules_1c ws ON esa.schedule_code = ws.schedule_code
             WHERE esa.employee_number = $1
             ORDER BY esa.start_date DESC
         `, [employee_number]);
@@ -2053,7 +1611,7 @@ router.get('/admin/employees/:employee_number/schedule-history', async (req, res
         });
         
     } catch (error) {
-        console.error('Error fetching schedule history:', error);
+        log.error('Error fetching schedule history', error);
         res.status(500).json({ error: 'Internal server error' });
     }
 });
@@ -2097,6 +1655,9 @@ router.put('/admin/schedules/1c/update-times', async (req, res) => {
         `;
         
         const result = await db.queryRows(updateQuery, [scheduleCode, startTime, endTime]);
+        await scheduleImport.refreshScheduleCatalog([scheduleCode]);
+        scheduleCalendar.invalidate([scheduleCode]);
+        reportCache.invalidateSchedules([scheduleCode]);
         
         // Получаем количество обновленных записей
         const countQuery = `
@@ -2118,7 +1679,7 @@ router.put('/admin/schedules/1c/update-times', async (req, res) => {
         });
         
     } catch (error) {
-        console.error('Error updating schedule times:', error);
+        log.error('Error updating schedule times', error);
         res.status(500).json({
             success: false,
             message: 'Ошибка сервера при обновлении времени',
@@ -2129,189 +1690,86 @@ router.put('/admin/schedules/1c/update-times', async (req, res) => {
 
 // Update employees IIN and payroll data from 1C
 router.post('/admin/employees/update-iin', async (req, res) => {
-    try {
-        const employees = req.body;
-        
-        console.log('Received employee data update request for', employees?.length || 0, 'employees');
-        
-        // Validation
-        if (!Array.isArray(employees) || employees.length === 0) {
-            return res.status(400).json({
-                success: false,
-                error: 'Нет данных для обновления. Ожидается массив сотрудников.'
-            });
+    const progress = jsonStream.createProgressStream(req, res);
+    const errors = [];
+    const addError = (message) => {
+        statistics.errorsCount++;
+        // Only the first 10 errors are returned, no need to keep the rest
+        if (errors.length < 10) {
+            errors.push(message);
         }
-        
-        let totalProcessed = 0;
-        let totalUpdated = 0;
-        let totalSkipped = 0;
-        let errors = [];
-        
-        // Process each employee
-        for (const employee of employees) {
-            try {
-                const { iin, table_number, payroll, full_name } = employee;
-                
-                // Validate employee data - require at least table_number and one of iin/payroll/full_name
-                if (!table_number || (!iin && payroll === undefined && !full_name)) {
-                    errors.push(`Неполные данные: табельный номер=${table_number}, ИИН=${iin}, ФОТ=${payroll}, ФИО=${full_name}`);
-                    totalSkipped++;
-                    continue;
-                }
-                
-                // Validate IIN format if provided (12 digits)
-                if (iin && !/^\d{12}$/.test(iin)) {
-                    errors.push(`Неверный формат ИИН ${iin} для табельного номера ${table_number}. Ожидается 12 цифр.`);
-                    totalSkipped++;
-                    continue;
-                }
-                
-                // Process and validate payroll format if provided
-                let processedPayroll = payroll;
-                if (payroll !== undefined) {
-                    try {
-                        // Handle payroll as string with spaces (from 1C)
-                        if (typeof payroll === 'string') {
-                            // Remove all types of spaces: regular space, non-breaking space, etc.
-                            processedPayroll = payroll.replace(/\s/g, '').replace(/\u00A0/g, '');
-                            
-                            // If empty string after cleaning, treat as undefined
-                            if (processedPayroll === '') {
-                                processedPayroll = undefined;
-                            }
-                        }
-                        
-                        // Convert to number and validate
-                        if (processedPayroll !== undefined) {
-                            processedPayroll = parseFloat(processedPayroll);
-                            
-                            if (isNaN(processedPayroll) || processedPayroll < 0) {
-                                errors.push(`Неверный формат ФОТ "${payroll}" для табельного номера ${table_number}. Ожидается положительное число.`);
-                                totalSkipped++;
-                                continue;
-                            }
-                        }
-                    } catch (error) {
-                        errors.push(`Ошибка обработки ФОТ "${payroll}" для табельного номера ${table_number}: ${error.message}`);
-                        totalSkipped++;
-                        continue;
-                    }
-                }
-                
-                console.log(`Processing employee: ${table_number}${iin ? ` with IIN: ${iin}` : ''}${processedPayroll !== undefined ? ` with payroll: ${processedPayroll} (original: "${payroll}")` : ''}${full_name ? ` with full_name: ${full_name}` : ''}`);
-                
-                // Check if employee exists
-                const checkResult = await db.query(
-                    'SELECT id, iin, payroll, full_name FROM employees WHERE table_number = $1',
-                    [table_number]
-                );
-                
-                if (checkResult.rows.length === 0) {
-                    console.log(`Employee not found: ${table_number}`);
-                    totalSkipped++;
-                    continue;
-                }
-                
-                const existingEmployee = checkResult.rows[0];
-                
-                // Prepare update fields and values
-                let updateFields = [];
-                let updateValues = [];
-                let paramIndex = 1;
-                let hasUpdates = false;
-                
-                // Handle IIN update
-                if (iin) {
-                    if (existingEmployee.iin === null || existingEmployee.iin === '') {
-                        updateFields.push(`iin = $${paramIndex++}`);
-                        updateValues.push(iin);
-                        hasUpdates = true;
-                        console.log(`  - Will update IIN: ${iin}`);
-                    } else {
-                        console.log(`  - Employee ${table_number} already has IIN: ${existingEmployee.iin}, skipping IIN update`);
-                    }
-                }
-                
-                // Handle payroll update (always update if provided)
-                if (processedPayroll !== undefined) {
-                    updateFields.push(`payroll = $${paramIndex++}`);
-                    updateValues.push(processedPayroll);
-                    hasUpdates = true;
-                    console.log(`  - Will update payroll: ${processedPayroll} (original: "${payroll}", previous: ${existingEmployee.payroll})`);
-                }
-                
-                // Handle full_name update (always update if provided)
-                if (full_name) {
-                    updateFields.push(`full_name = $${paramIndex++}`);
-                    updateValues.push(full_name);
-                    hasUpdates = true;
-                    console.log(`  - Will update full_name: ${full_name} (previous: ${existingEmployee.full_name})`);
-                }
-                
-                // Skip if no updates needed
-                if (!hasUpdates) {
-                    console.log(`  - No updates needed for employee ${table_number}`);
-                    totalSkipped++;
-                    continue;
-                }
-                
-                // Add updated_at field
-                updateFields.push(`updated_at = CURRENT_TIMESTAMP`);
-                updateValues.push(table_number); // WHERE clause parameter
-                
-                // Build and execute update query
-                const updateQuery = `
-                    UPDATE employees 
-                    SET ${updateFields.join(', ')}
-                    WHERE table_number = $${paramIndex}
-                `;
-                
-                const updateResult = await db.query(updateQuery, updateValues);
-                
-                if (updateResult.rowCount > 0) {
-                    console.log(`  ✅ Successfully updated employee: ${table_number}`);
-                    totalUpdated++;
+    };
+    const statistics = {
+        totalReceived: 0,
+        totalProcessed: 0,
+        totalUpdated: 0,
+        totalSkipped: 0,
+        errorsCount: 0
+    };
+    
+    try {
+        // Each chunk is validated in memory and written with one SELECT and one UPDATE
+        await jsonStream.processJsonArrayInChunks(req, {}, async (employees) => {
+            statistics.totalReceived += employees.length;
+            
+            const updates = [];
+            for (const employee of employees) {
+                const { update, error } = employeeUpdates.prepareEmployeeUpdate(employee);
+                if (error) {
+                    addError(error);
+                    statistics.totalSkipped++;
                 } else {
-                    console.log(`  ❌ No rows updated for employee: ${table_number}`);
-                    totalSkipped++;
+                    updates.push(update);
                 }
-                
-                totalProcessed++;
-                
-            } catch (employeeError) {
-                const errorMsg = `Ошибка обработки сотрудника ${employee.table_number || 'UNKNOWN'}: ${employeeError.message}`;
-                console.error(errorMsg, employeeError);
-                errors.push(errorMsg);
-                totalSkipped++;
             }
-        }
-        
-        const response = {
-            success: true,
-            message: `Статус ОК, обновлено ${totalUpdated} записей`,
-            statistics: {
-                totalReceived: employees.length,
-                totalProcessed: totalProcessed,
-                totalUpdated: totalUpdated,
-                totalSkipped: totalSkipped,
-                errorsCount: errors.length
-            },
-            errors: errors.length > 0 ? errors.slice(0, 10) : undefined // Limit errors to first 10
-        };
-        
-        console.log('Employee data update completed:', response.statistics);
-        res.json(response);
-        
+            
+            try {
+                const result = await db.withTransaction(client => employeeUpdates.applyEmployeeUpdates(client, updates));
+                statistics.totalProcessed += result.processed;
+                statistics.totalUpdated += result.updated;
+                statistics.totalSkipped += result.skipped;
+            } catch (chunkError) {
+                const errorMsg = `Ошибка обработки сотрудников ${updates[0]?.table_number || ''}…${updates[updates.length - 1]?.table_number || ''}: ${chunkError.message}`;
+                log.error('Error updating employee chunk', { first: updates[0]?.table_number, last: updates[updates.length - 1]?.table_number, error: chunkError });
+                addError(errorMsg);
+                statistics.totalSkipped += updates.length;
+            }
+            
+            progress.update({ statistics });
+        });
     } catch (error) {
-        console.error('Error updating employee data:', error);
-        res.status(500).json({
+        log.error('Error updating employee data', error);
+        return progress.end(jsonStream.isJsonError(error) ? 400 : 500, {
             success: false,
-            error: 'Ошибка обновления данных сотрудников: ' + error.message
+            error: 'Ошибка обновления данных сотрудников: ' + error.message,
+            statistics
         });
     }
+    
+    log.info('Received employee data update request', { employees: statistics.totalReceived });
+    
+    // Validation
+    if (statistics.totalReceived === 0) {
+        return progress.end(400, {
+            success: false,
+            error: 'Нет данных для обновления. Ожидается массив сотрудников.'
+        });
+    }
+    
+    const response = {
+        success: true,
+        message: `Статус ОК, обновлено ${statistics.totalUpdated} записей`,
+        statistics,
+        errors: errors.length > 0 ? errors : undefined
+    };
+    
+    log.info('Employee data update completed', response.statistics);
+    progress.end(200, response);
 });
 
 // Get payroll report
+// Shifts come from payroll_shifts; the response is streamed, so long periods
+// are no longer cut at a fixed row count
 router.get('/admin/reports/payroll', async (req, res) => {
     try {
         const { organization, department, dateFrom, dateTo } = req.query;
@@ -2323,10 +1781,15 @@ router.get('/admin/reports/payroll', async (req, res) => {
             });
         }
         
-        console.log('Payroll report request:', { organization, department, dateFrom, dateTo });
+        log.debug('Payroll report request', { organization, department, dateFrom, dateTo });
         
-        // Правильный запрос: получаем сотрудников с количеством смен в выбранном периоде
-        let query = `
+        const params = [dateFrom, dateTo];
+        const filters = queryFilters.createFilters(params)
+            .equals('e.object_bin', organization)
+            .equals('e.object_code', department);
+        
+        // ФОТ сотрудника делится на все его смены в выбранном периоде
+        const query = `
             WITH employee_shifts AS (
                 SELECT 
                     e.table_number,
@@ -2334,40 +1797,21 @@ router.get('/admin/reports/payroll', async (req, res) => {
                     e.payroll,
                     d.object_name as department_name,
                     d.object_company as organization_name,
-                    ws1c.work_date,
-                    ws1c.work_hours,
-                    ws1c.schedule_name,
+                    ps.work_date,
+                    ps.work_hours,
+                    ps.schedule_name,
                     COUNT(*) OVER (PARTITION BY e.table_number) as shifts_count_in_period
                 FROM employees e
-                INNER JOIN employee_schedule_assignments esa ON e.table_number = esa.employee_number
-                INNER JOIN work_schedules_1c ws1c ON esa.schedule_code = ws1c.schedule_code
+                INNER JOIN payroll_shifts ps ON ps.employee_number = e.table_number
                 LEFT JOIN departments d ON e.object_code = d.object_code
                 WHERE e.status = 1 
                 AND e.payroll IS NOT NULL
-                AND ws1c.work_date >= $1::date
-                AND ws1c.work_date <= $2::date
-                AND esa.start_date <= ws1c.work_date
-                AND (esa.end_date IS NULL OR esa.end_date >= ws1c.work_date)
-        `;
-        
-        const params = [dateFrom, dateTo];
-        
-        // Add organization filter
-        if (organization) {
-            query += ` AND e.object_bin = $${params.length + 1}`;
-            params.push(organization);
-        }
-        
-        // Add department filter
-        if (department) {
-            query += ` AND e.object_code = $${params.length + 1}`;
-            params.push(department);
-        }
-        
-        query += `
+                AND ps.work_date >= $1::date
+                AND ps.work_date <= $2::date
+                ${filters.toSql()}
             )
             SELECT 
-                work_date,
+                to_char(work_date, 'YYYY-MM-DD') as work_date,
                 table_number,
                 full_name,
                 department_name,
@@ -2379,43 +1823,50 @@ router.get('/admin/reports/payroll', async (req, res) => {
                 ROUND(payroll::decimal / shifts_count_in_period, 2) as daily_payroll
             FROM employee_shifts
             ORDER BY full_name, work_date
-            LIMIT 10000
         `;
         
-        const result = await db.query(query, params);
-        console.log(`Payroll report: found ${result.rows.length} records`);
-        
-        // Calculate total
-        const total = result.rows.reduce((sum, row) => sum + parseFloat(row.daily_payroll), 0);
-        
-        res.json({
-            success: true,
-            data: result.rows.map(row => ({
-                work_date: row.work_date.toISOString().split('T')[0],
-                full_name: row.full_name,
-                table_number: row.table_number,
-                department_name: row.department_name,
-                organization_name: row.organization_name,
-                payroll: parseFloat(row.payroll),
-                shifts_count: parseInt(row.shifts_count_in_period),
-                daily_payroll: parseFloat(row.daily_payroll),
-                schedule_name: row.schedule_name,
-                work_hours: parseInt(row.work_hours)
-            })),
-            summary: {
-                total: total.toFixed(2),
-                recordsCount: result.rows.length,
-                dateFrom,
-                dateTo,
-                filters: {
-                    organization: organization || 'Все',
-                    department: department || 'Все'
-                }
+        let total = 0;
+        let recordsCount = 0;
+        
+        await keyset.streamJson(res, {
+            sql: query,
+            params,
+            toItems: (rows) => rows.map(row => {
+                const dailyPayroll = parseFloat(row.daily_payroll);
+                total += dailyPayroll;
+                recordsCount++;
+                return {
+                    work_date: row.work_date,
+                    full_name: row.full_name,
+                    table_number: row.table_number,
+                    department_name: row.department_name,
+                    organization_name: row.organization_name,
+                    payroll: parseFloat(row.payroll),
+                    shifts_count: parseInt(row.shifts_count_in_period),
+                    daily_payroll: dailyPayroll,
+                    schedule_name: row.schedule_name,
+                    work_hours: parseInt(row.work_hours)
+                };
+            }),
+            finish: () => {
+                log.debug('Payroll report streamed', { records: recordsCount });
+                return {
+                    summary: {
+                        total: total.toFixed(2),
+                        recordsCount,
+                        dateFrom,
+                        dateTo,
+                        filters: {
+                            organization: organization || 'Все',
+                            department: department || 'Все'
+                        }
+                    }
+                };
             }
         });
         
     } catch (error) {
-        console.error('Error generating payroll report:', error);
+        log.error('Error generating payroll report', error);
         res.status(500).json({
             success: false,
             error: 'Ошибка при формировании отчета: ' + error.message
@@ -2429,7 +1880,7 @@ router.put('/admin/departments/:id', async (req, res) => {
         const departmentId = req.params.id;
         const { id_iiko, hall_area, kitchen_area, seats_count } = req.body;
         
-        console.log(`Updating department ${departmentId} with data:`, { id_iiko, hall_area, kitchen_area, seats_count });
+        log.info('Updating department', { departmentId, id_iiko, hall_area, kitchen_area, seats_count });
         
         // Validate input
         if (!departmentId || isNaN(departmentId)) {
@@ -2518,7 +1969,7 @@ router.put('/admin/departments/:id', async (req, res) => {
             [departmentId]
         );
         
-        console.log(`✅ Successfully updated department ${departmentId}`);
+        log.info('Updated department', { departmentId });
         
         res.json({
             success: true,
@@ -2527,7 +1978,7 @@ router.put('/admin/departments/:id', async (req, res) => {
         });
         
     } catch (error) {
-        console.error('Error updating department:', error);
+        log.error('Error updating department', error);
         res.status(500).json({
             success: false,
             error: 'Внутренняя ошибка сервера при обновлении подразделения'
@@ -2576,135 +2027,88 @@ router.get('/admin/payroll/attendance', async (req, res) => {
             });
         }
         
-        console.log('Payroll attendance request:', { department_id, from_date, to_date });
+        log.debug('Payroll attendance request', { department_id, from_date, to_date });
         
-        // Get all employees for the department with their shifts
+        // Shifts of the department's employees from payroll_shifts, days off
+        // excluded; one employee's rows are consecutive
         const query = `
-            WITH department_employees AS (
-                -- Get employees for the department by id_iiko
-                SELECT DISTINCT
-                    e.id as employee_id,
-                    e.table_number,
-                    e.full_name,
-                    e.payroll,
-                    e.object_code
-                FROM employees e
-                INNER JOIN departments d ON e.object_code = d.object_code
-                WHERE d.id_iiko = $1::uuid
-                AND e.status = 1
-                AND e.payroll IS NOT NULL
-                AND e.payroll > 0
-            ),
-            employee_shifts AS (
-                -- Get all shifts for these employees in the period
-                SELECT 
-                    de.employee_id,
-                    de.table_number,
-                    de.full_name,
-                    de.payroll,
-                    ws.work_date,
-                    ws.schedule_name,
-                    ws.work_hours
-                FROM department_employees de
-                INNER JOIN employee_schedule_assignments esa ON de.table_number = esa.employee_number
-                INNER JOIN work_schedules_1c ws ON esa.schedule_code = ws.schedule_code
-                WHERE ws.work_date >= $2::date
-                AND ws.work_date <= $3::date
-                AND esa.start_date <= ws.work_date
-                AND (esa.end_date IS NULL OR esa.end_date >= ws.work_date)
-                AND ws.time_type != 'В' -- Exclude weekends/holidays
-                ORDER BY de.full_name, ws.work_date
-            ),
-            employee_shift_counts AS (
-                -- Count shifts per employee
-                SELECT 
-                    employee_id,
-                    COUNT(*) as shift_count
-                FROM employee_shifts
-                GROUP BY employee_id
-            )
             SELECT 
-                es.employee_id::text,
-                es.table_number,
-                es.full_name,
-                es.payroll,
-                es.work_date,
-                es.schedule_name,
-                es.work_hours,
-                esc.shift_count
-            FROM employee_shifts es
-            INNER JOIN employee_shift_counts esc ON es.employee_id = esc.employee_id
-            ORDER BY es.full_name, es.work_date
+                e.id::text as employee_id,
+                e.table_number,
+                e.full_name,
+                e.payroll,
+                to_char(ps.work_date, 'YYYY-MM-DD') as work_date,
+                ps.schedule_name,
+                ps.work_hours,
+                COUNT(*) OVER (PARTITION BY e.id) as shift_count
+            FROM employees e
+            INNER JOIN payroll_shifts ps ON ps.employee_number = e.table_number
+            WHERE e.object_code IN (SELECT object_code FROM departments WHERE id_iiko = $1::uuid)
+            AND e.status = 1
+            AND e.payroll IS NOT NULL
+            AND e.payroll > 0
+            AND ps.work_date >= $2::date
+            AND ps.work_date <= $3::date
+            AND ps.time_type != 'В' -- Exclude weekends/holidays
+            ORDER BY e.full_name, e.id, ps.work_date
         `;
         
-        const result = await db.query(query, [department_id, from_date, to_date]);
-        
-        if (result.rows.length === 0) {
-            return res.json({
-                success: true,
-                data: [],
+        // The employee being collected may continue in the next batch
+        let current = null;
+        let totalEmployees = 0;
+        let totalShifts = 0;
+        let totalPayroll = 0;
+        
+        await keyset.streamJson(res, {
+            sql: query,
+            params: [department_id, from_date, to_date],
+            toItems: (rows) => {
+                const completed = [];
+                
+                rows.forEach(row => {
+                    const payrollTotal = parseFloat(row.payroll);
+                    const shiftCount = parseInt(row.shift_count);
+                    const payrollPerShift = Math.round(payrollTotal / shiftCount * 100) / 100;
+                    
+                    if (!current || current.employee_id !== row.employee_id) {
+                        if (current) completed.push(current);
+                        current = {
+                            employee_id: row.employee_id,
+                            employee_name: row.full_name,
+                            table_number: row.table_number,
+                            payroll_total: payrollTotal,
+                            shifts: []
+                        };
+                        totalEmployees++;
+                    }
+                    
+                    current.shifts.push({
+                        date: row.work_date,
+                        payroll_for_shift: payrollPerShift,
+                        schedule_name: row.schedule_name,
+                        work_hours: parseInt(row.work_hours)
+                    });
+                    totalShifts++;
+                    totalPayroll += payrollPerShift;
+                });
+                
+                return completed;
+            },
+            finish: () => ({
+                items: current ? [current] : [],
                 summary: {
                     department_id,
                     from_date,
                     to_date,
-                    total_employees: 0,
-                    total_shifts: 0,
-                    total_payroll: 0
+                    total_employees: totalEmployees,
+                    total_shifts: totalShifts,
+                    total_payroll: Math.round(totalPayroll * 100) / 100
                 }
-            });
-        }
-        
-        // Group results by employee
-        const employeesMap = new Map();
-        
-        result.rows.forEach(row => {
-            const employeeId = row.employee_id;
-            const payrollTotal = parseFloat(row.payroll);
-            const shiftCount = parseInt(row.shift_count);
-            const payrollPerShift = Math.round(payrollTotal / shiftCount * 100) / 100;
-            
-            if (!employeesMap.has(employeeId)) {
-                employeesMap.set(employeeId, {
-                    employee_id: employeeId,
-                    employee_name: row.full_name,
-                    table_number: row.table_number,
-                    payroll_total: payrollTotal,
-                    shifts: []
-                });
-            }
-            
-            employeesMap.get(employeeId).shifts.push({
-                date: row.work_date.toISOString().split('T')[0],
-                payroll_for_shift: payrollPerShift,
-                schedule_name: row.schedule_name,
-                work_hours: parseInt(row.work_hours)
-            });
-        });
-        
-        // Convert map to array
-        const employeesData = Array.from(employeesMap.values());
-        
-        // Calculate summary
-        const totalShifts = result.rows.length;
-        const totalPayroll = employeesData.reduce((sum, emp) => {
-            return sum + emp.shifts.reduce((shiftSum, shift) => shiftSum + shift.payroll_for_shift, 0);
-        }, 0);
-        
-        res.json({
-            success: true,
-            data: employeesData,
-            summary: {
-                department_id,
-                from_date,
-                to_date,
-                total_employees: employeesData.length,
-                total_shifts: totalShifts,
-                total_payroll: Math.round(totalPayroll * 100) / 100
-            }
+            })
         });
         
     } catch (error) {
-        console.error('Error in payroll attendance endpoint:', error);
+        log.error('Error in payroll attendance endpoint', error);
         res.status(500).json({
             success: false,
             error: 'Ошибка при формировании отчета: ' + error.message
@@ -2712,4 +2116,4 @@ router.get('/admin/payroll/attendance', async (req, res) => {
     }
 });
 
-module.exports = router;
\ No newline at end of file
+module.exports = router;
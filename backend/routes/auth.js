@@ -1,6 +1,7 @@
 const express = require('express');
 const router = express.Router();
 const db = require('../database_pg');
+const log = require('../utils/logger')('auth');
 
 router.post('/login', (req, res) => {
   const { tableNumber, iin } = req.body;
@@ -51,7 +52,7 @@ router.post('/login', (req, res) => {
       iin: employee.iin
     });
   }).catch(err => {
-    console.error('Login error:', err);
+    log.error('Login error', err);
     res.status(500).json({ error: 'Internal server error' });
   });
 });
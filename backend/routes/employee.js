@@ -1,23 +1,28 @@
 const express = require('express');
 const router = express.Router();
 const db = require('../database_pg');
-const { syncEmployeeEvents } = require('../utils/apiSync_pg');
+const employeeSync = require('../utils/employeeSync');
+const { yearMonthBounds, nextDay } = require('../utils/queryFilters');
+const reportCache = require('../utils/reportCache');
+const scheduleCalendar = require('../utils/scheduleCalendar');
+const assignmentsAsOf = require('../utils/assignmentsAsOf');
+const log = require('../utils/logger')('employee');
 
 // DEBUG: Get employee by table number for testing
 router.get('/employee/debug/:tableNumber', async (req, res) => {
   const { tableNumber } = req.params;
   
   try {
-    console.log(`DEBUG: Looking for employee with table_number: ${tableNumber}`);
+    log.debug('Looking up employee', { tableNumber });
     
     const employee = await db.queryRow('SELECT * FROM employees WHERE table_number = $1', [tableNumber]);
     
     if (!employee) {
-      console.log(`DEBUG: No employee found with table_number: ${tableNumber}`);
+      log.debug('Employee not found', { tableNumber });
       
       // Show all employees to debug
       const allEmployees = await db.queryRows('SELECT id, table_number, full_name FROM employees LIMIT 10');
-      console.log('DEBUG: First 10 employees:', allEmployees);
+      log.debug('First 10 employees', { employees: allEmployees });
       
       return res.status(404).json({ 
         error: 'Employee not found',
@@ -25,10 +30,10 @@ router.get('/employee/debug/:tableNumber', async (req, res) => {
       });
     }
     
-    console.log(`DEBUG: Found employee:`, employee);
+    log.debug('Found employee', { employee });
     res.json({ employee });
   } catch (error) {
-    console.error('DEBUG: Error finding employee:', error.message);
+    log.error('Error finding employee', error);
     res.status(500).json({ error: 'Internal server error', details: error.message });
   }
 });
@@ -37,8 +42,7 @@ router.get('/employee/debug/:tableNumber', async (req, res) => {
 router.get('/employee/:id/timesheet/:year/:month', async (req, res) => {
   const { id, year, month } = req.params;
   
-  console.log(`🚨 DEPRECATED API CALLED: /employee/${id}/timesheet/${year}/${month}`);
-  console.log(`🚨 Please use /employee/by-number/TABLE_NUMBER/timesheet/${year}/${month} instead`);
+  log.warn('Deprecated API called, use /employee/by-number/TABLE_NUMBER/timesheet/YEAR/MONTH', { path: `/employee/${id}/timesheet/${year}/${month}` });
   
   // Return clear error to identify source
   return res.status(410).json({
@@ -49,28 +53,28 @@ router.get('/employee/:id/timesheet/:year/:month', async (req, res) => {
   });
   
   try {
-    console.log(`Getting timesheet for employee ID: ${id}`);
+    log.debug('Getting timesheet', { id, year, month });
     
     // Get employee info (using PostgreSQL)
     const employee = await db.queryRow('SELECT * FROM employees WHERE id = $1', [id]);
 
     if (!employee) {
-      console.log(`Employee not found for ID: ${id}`);
+      log.debug('Employee not found', { id });
       return res.status(404).json({ error: 'Employee not found' });
     }
     
-    console.log(`Found employee: ${employee.full_name} (${employee.table_number})`);
+    log.debug('Found employee', { tableNumber: employee.table_number });
 
     // Calculate date range
     const dateStart = `${year}-${month.padStart(2, '0')}-01`;
     const lastDay = new Date(year, month, 0).getDate();
     const dateStop = `${year}-${month.padStart(2, '0')}-${lastDay}`;
 
-    // Sync latest events from API
+    // Sync latest events from API (in the background unless TIMESHEET_SYNC_MODE=blocking)
     try {
-      await syncEmployeeEvents(employee.table_number, dateStart, dateStop, employee.object_bin);
+      await employeeSync.refresh(employee.table_number, dateStart, dateStop, employee.object_bin);
     } catch (syncError) {
-      console.error('Failed to sync events:', syncError);
+      log.error('Failed to sync events', { employeeNumber: employee.table_number, error: syncError });
       // Continue with cached data
     }
 
@@ -90,7 +94,7 @@ router.get('/employee/:id/timesheet/:year/:month', async (req, res) => {
       [employee.table_number, dateStart, dateStop]
     );
     
-    console.log(`Found ${timeRecords.length} time records for ${employee.table_number}`);
+    log.debug('Found time records', { tableNumber: employee.table_number, records: timeRecords.length });
 
     // Create a map of records by date with debug info
     const recordsMap = {};
@@ -100,7 +104,6 @@ router.get('/employee/:id/timesheet/:year/:month', async (req, res) => {
         ? record.date.toISOString().split('T')[0]
         : record.date.toString().split('T')[0];
       recordsMap[dateKey] = record;
-      console.log(`Mapped date key: ${dateKey}`);
     });
 
     // Generate calendar data
@@ -135,7 +138,7 @@ router.get('/employee/:id/timesheet/:year/:month', async (req, res) => {
       calendar
     });
   } catch (error) {
-    console.error('Error getting timesheet:', error.message);
+    log.error('Error getting timesheet', error);
     res.status(500).json({ error: 'Internal server error', details: error.message });
   }
 });
@@ -153,7 +156,7 @@ router.get('/employee/:id/statistics/:year/:month', async (req, res) => {
     const employee = await db.queryRow('SELECT * FROM employees WHERE id = $1', [id]);
     
     if (!employee) {
-      console.log(`Employee not found for statistics ID: ${id}`);
+      log.debug('Employee not found for statistics', { id });
       return res.status(404).json({ error: 'Employee not found' });
     }
     
@@ -239,7 +242,7 @@ router.get('/employee/:id/statistics/:year/:month', async (req, res) => {
       detailedRecords
     });
   } catch (error) {
-    console.error('Error getting statistics:', error.message);
+    log.error('Error getting statistics', error);
     res.status(500).json({ error: 'Internal server error', details: error.message });
   }
 });
@@ -249,17 +252,17 @@ router.get('/employee/:id/time-events', async (req, res) => {
   const { id } = req.params;
   
   try {
-    console.log(`Getting time events for employee ID: ${id}`);
+    log.debug('Getting time events', { id });
     
     // Get employee info (using PostgreSQL)
     const employee = await db.queryRow('SELECT * FROM employees WHERE id = $1', [id]);
 
     if (!employee) {
-      console.log(`Employee not found for time events ID: ${id}`);
+      log.debug('Employee not found for time events', { id });
       return res.status(404).json({ error: 'Employee not found' });
     }
     
-    console.log(`Found employee for time events: ${employee.full_name} (${employee.table_number})`);
+    log.debug('Found employee for time events', { tableNumber: employee.table_number });
 
     // Calculate date range (last 2 months)
     const today = new Date();
@@ -285,13 +288,13 @@ router.get('/employee/:id/time-events', async (req, res) => {
         COUNT(*) as event_count
       FROM time_events
       WHERE employee_number = $1
-      AND DATE(event_datetime) BETWEEN $2 AND $3
+      AND event_datetime >= $2 AND event_datetime < $3
       GROUP BY DATE(event_datetime)
       ORDER BY date DESC`,
-      [employee.table_number, dateFrom, dateTo]
+      [employee.table_number, dateFrom, nextDay(dateTo)]
     );
     
-    console.log(`Found ${timeEvents.length} event days for ${employee.table_number}`);
+    log.debug('Found event days', { tableNumber: employee.table_number, days: timeEvents.length });
 
     // Calculate hours worked for each day
     const processedEvents = timeEvents.map(day => {
@@ -333,7 +336,7 @@ router.get('/employee/:id/time-events', async (req, res) => {
       events: processedEvents
     });
   } catch (error) {
-    console.error('Error getting time events:', error.message);
+    log.error('Error getting time events', error);
     res.status(500).json({ error: 'Internal server error', details: error.message });
   }
 });
@@ -343,28 +346,36 @@ router.get('/employee/by-number/:tableNumber/timesheet/:year/:month', async (req
   const { tableNumber, year, month } = req.params;
   
   try {
-    console.log(`Getting timesheet for employee table_number: ${tableNumber}`);
+    // Calculate date range
+    const dateStart = `${year}-${month.padStart(2, '0')}-01`;
+    const lastDay = new Date(year, month, 0).getDate();
+    const dateStop = `${year}-${month.padStart(2, '0')}-${lastDay}`;
+
+    // Writers of time_records and schedules invalidate this entry; the
+    // background sync refreshes it for the next open
+    const cached = reportCache.timesheets.get(tableNumber, year, month);
+    if (cached) {
+      employeeSync.request(tableNumber, dateStart, dateStop);
+      return res.json(cached);
+    }
+    
+    log.debug('Getting timesheet', { tableNumber, year, month });
     
     // Get employee info by table_number
     const employee = await db.queryRow('SELECT * FROM employees WHERE table_number = $1', [tableNumber]);
 
     if (!employee) {
-      console.log(`Employee not found for table_number: ${tableNumber}`);
+      log.debug('Employee not found', { tableNumber });
       return res.status(404).json({ error: 'Employee not found' });
     }
     
-    console.log(`Found employee: ${employee.full_name} (${employee.table_number})`);
-
-    // Calculate date range
-    const dateStart = `${year}-${month.padStart(2, '0')}-01`;
-    const lastDay = new Date(year, month, 0).getDate();
-    const dateStop = `${year}-${month.padStart(2, '0')}-${lastDay}`;
+    log.debug('Found employee', { tableNumber: employee.table_number });
 
-    // Sync latest events from API
+    // Sync latest events from API (in the background unless TIMESHEET_SYNC_MODE=blocking)
     try {
-      await syncEmployeeEvents(employee.table_number, dateStart, dateStop, employee.object_bin);
+      await employeeSync.refresh(employee.table_number, dateStart, dateStop, employee.object_bin);
     } catch (syncError) {
-      console.error('Failed to sync events:', syncError);
+      log.error('Failed to sync events', { employeeNumber: employee.table_number, error: syncError });
       // Continue with cached data
     }
 
@@ -384,7 +395,7 @@ router.get('/employee/by-number/:tableNumber/timesheet/:year/:month', async (req
       [employee.table_number, dateStart, dateStop]
     );
     
-    console.log(`Found ${timeRecords.length} time records for ${employee.table_number}`);
+    log.debug('Found time records', { tableNumber: employee.table_number, records: timeRecords.length });
 
     // Create a map of records by date with debug info
     const recordsMap = {};
@@ -394,46 +405,29 @@ router.get('/employee/by-number/:tableNumber/timesheet/:year/:month', async (req
         ? record.date.toISOString().split('T')[0]
         : record.date.toString().split('T')[0];
       recordsMap[dateKey] = record;
-      console.log(`Mapped date key: ${dateKey}`);
     });
 
-    // Get employee schedule for the month to determine work days
-    const scheduleAssignment = await db.queryRow(`
-      SELECT esa.schedule_code, esa.start_date, esa.end_date, ws.schedule_name
-      FROM employee_schedule_assignments esa
-      LEFT JOIN (
-        SELECT DISTINCT schedule_code, schedule_name 
-        FROM work_schedules_1c
-      ) ws ON esa.schedule_code = ws.schedule_code
-      WHERE esa.employee_number = $1 
-      AND (esa.end_date IS NULL OR esa.end_date >= $2)
-      ORDER BY esa.start_date DESC
-      LIMIT 1
-    `, [employee.table_number, dateStart]);
+    // Schedule assignments in force during the month; each day is judged by
+    // the one covering it
+    const assignments = await assignmentsAsOf.assignmentsDuring(
+      [employee.table_number], dateStart, nextDay(dateStop)
+    );
+    const scheduleAssignment = assignments.length > 0 ? assignments[assignments.length - 1] : null;
 
-    // Get work days from schedule if exists
+    // Get work days from schedule if exists (in-memory schedule calendar)
     let scheduleWorkDays = {};
-    if (scheduleAssignment && scheduleAssignment.schedule_code) {
-      const workDays = await db.queryRows(`
-        SELECT 
-          to_char(work_date, 'YYYY-MM-DD') as work_date,
-          work_start_time,
-          work_end_time,
-          work_hours
-        FROM work_schedules_1c 
-        WHERE schedule_code = $1 
-        AND work_date BETWEEN $2 AND $3
-        AND work_hours > 0
-      `, [scheduleAssignment.schedule_code, dateStart, dateStop]);
-      
-      workDays.forEach(workDay => {
-        scheduleWorkDays[workDay.work_date] = {
-          isWorkDay: true,
-          startTime: workDay.work_start_time,
-          endTime: workDay.work_end_time,
-          workHours: workDay.work_hours
-        };
-      });
+    await scheduleCalendar.load(assignments.map(assignment => assignment.schedule_code));
+    for (const { schedule_code: code, date_from, date_to } of assignments) {
+      scheduleCalendar.getDays(code, date_from, date_to)
+        .filter(workDay => scheduleCalendar.isWorkDay(code, workDay.work_date))
+        .forEach(workDay => {
+          scheduleWorkDays[workDay.work_date] = {
+            isWorkDay: true,
+            startTime: workDay.work_start_time,
+            endTime: workDay.work_end_time,
+            workHours: workDay.work_hours
+          };
+        });
     }
 
     // Generate calendar data
@@ -504,7 +498,7 @@ router.get('/employee/by-number/:tableNumber/timesheet/:year/:month', async (req
       });
     }
 
-    res.json({
+    const timesheet = {
       employee: {
         id: employee.id,
         fullName: employee.full_name,
@@ -513,9 +507,15 @@ router.get('/employee/by-number/:tableNumber/timesheet/:year/:month', async (req
       year: parseInt(year),
       month: parseInt(month),
       calendar
+    };
+    
+    reportCache.timesheets.set(tableNumber, year, month, timesheet, {
+      employees: [tableNumber],
+      scheduleCodes: assignments.map(assignment => assignment.schedule_code)
     });
+    res.json(timesheet);
   } catch (error) {
-    console.error('Error getting timesheet by table_number:', error.message);
+    log.error('Error getting timesheet by table_number', error);
     res.status(500).json({ error: 'Internal server error', details: error.message });
   }
 });
@@ -524,17 +524,17 @@ router.get('/employee/by-number/:tableNumber/time-events', async (req, res) => {
   const { tableNumber } = req.params;
   
   try {
-    console.log(`Getting time events for employee table_number: ${tableNumber}`);
+    log.debug('Getting time events', { tableNumber });
     
     // Get employee info by table_number
     const employee = await db.queryRow('SELECT * FROM employees WHERE table_number = $1', [tableNumber]);
 
     if (!employee) {
-      console.log(`Employee not found for time events table_number: ${tableNumber}`);
+      log.debug('Employee not found for time events', { tableNumber });
       return res.status(404).json({ error: 'Employee not found' });
     }
     
-    console.log(`Found employee for time events: ${employee.full_name} (${employee.table_number})`);
+    log.debug('Found employee for time events', { tableNumber: employee.table_number });
 
     // Calculate date range (last 2 months)
     const today = new Date();
@@ -560,13 +560,13 @@ router.get('/employee/by-number/:tableNumber/time-events', async (req, res) => {
         COUNT(*) as event_count
       FROM time_events
       WHERE employee_number = $1
-      AND DATE(event_datetime) BETWEEN $2 AND $3
+      AND event_datetime >= $2 AND event_datetime < $3
       GROUP BY DATE(event_datetime)
       ORDER BY date DESC`,
-      [employee.table_number, dateFrom, dateTo]
+      [employee.table_number, dateFrom, nextDay(dateTo)]
     );
     
-    console.log(`Found ${timeEvents.length} event days for ${employee.table_number}`);
+    log.debug('Found event days', { tableNumber: employee.table_number, days: timeEvents.length });
 
     // Calculate hours worked for each day
     const processedEvents = timeEvents.map(day => {
@@ -608,7 +608,7 @@ router.get('/employee/by-number/:tableNumber/time-events', async (req, res) => {
       events: processedEvents
     });
   } catch (error) {
-    console.error('Error getting time events by table_number:', error.message);
+    log.error('Error getting time events by table_number', error);
     res.status(500).json({ error: 'Internal server error', details: error.message });
   }
 });
@@ -618,7 +618,7 @@ router.get('/employee/by-number/:tableNumber/schedule/:year/:month', async (req,
   const { tableNumber, year, month } = req.params;
   
   try {
-    console.log(`Getting schedule for employee ${tableNumber} for ${year}-${month}`);
+    log.debug('Getting schedule', { tableNumber, year, month });
     
     // Get employee's current schedule assignment
     const scheduleAssignment = await db.queryRow(`
@@ -628,13 +628,9 @@ router.get('/employee/by-number/:tableNumber/schedule/:year/:month', async (req,
         esa.end_date,
         ws.schedule_name
       FROM employee_schedule_assignments esa
-      LEFT JOIN (
-        SELECT DISTINCT schedule_code, schedule_name 
-        FROM work_schedules_1c
-      ) ws ON esa.schedule_code = ws.schedule_code
+      LEFT JOIN schedules_1c ws ON esa.schedule_code = ws.schedule_code
       WHERE esa.employee_number = $1 
-      AND (esa.end_date IS NULL OR esa.end_date >= $2)
-      AND esa.start_date <= $3
+      AND esa.valid_during && daterange($2::date, $3::date, '[]')
       ORDER BY esa.start_date DESC
       LIMIT 1
     `, [
@@ -644,7 +640,7 @@ router.get('/employee/by-number/:tableNumber/schedule/:year/:month', async (req,
     ]);
     
     if (!scheduleAssignment) {
-      console.log(`No schedule found for employee ${tableNumber}`);
+      log.debug('No schedule found', { tableNumber });
       return res.json({
         success: true,
         hasSchedule: false,
@@ -653,24 +649,16 @@ router.get('/employee/by-number/:tableNumber/schedule/:year/:month', async (req,
       });
     }
     
-    console.log(`Found schedule: ${scheduleAssignment.schedule_name} (${scheduleAssignment.schedule_code})`);
+    log.debug('Found schedule', { tableNumber, scheduleCode: scheduleAssignment.schedule_code });
     
     // Get work days for this schedule in the requested month
-    const workDays = await db.queryRows(`
-      SELECT 
-        work_date,
-        time_type,
-        work_hours,
-        work_start_time,
-        work_end_time
-      FROM work_schedules_1c
-      WHERE schedule_code = $1
-      AND EXTRACT(YEAR FROM work_date) = $2
-      AND EXTRACT(MONTH FROM work_date) = $3
-      ORDER BY work_date
-    `, [scheduleAssignment.schedule_code, year, month]);
+    const { start: monthStart, end: monthEnd } = yearMonthBounds(year, month) || {};
+    await scheduleCalendar.load([scheduleAssignment.schedule_code]);
+    const workDays = monthStart
+      ? scheduleCalendar.getDays(scheduleAssignment.schedule_code, monthStart, monthEnd)
+      : [];
     
-    console.log(`Found ${workDays.length} work days for schedule`);
+    log.debug('Found schedule days', { tableNumber, days: workDays.length });
     
     res.json({
       success: true,
@@ -692,7 +680,7 @@ router.get('/employee/by-number/:tableNumber/schedule/:year/:month', async (req,
     });
     
   } catch (error) {
-    console.error('Error getting employee schedule:', error.message);
+    log.error('Error getting employee schedule', error);
     res.status(500).json({ error: 'Internal server error', details: error.message });
   }
 });
@@ -702,11 +690,14 @@ router.get('/employee/by-number/:tableNumber/department-stats/:year/:month', asy
   const { tableNumber, year, month } = req.params;
   
   try {
-    console.log(`Getting department stats for employee ${tableNumber}, ${year}-${month}`);
+    const bounds = yearMonthBounds(year, month);
+    if (!bounds) {
+      return res.status(400).json({ error: 'Invalid year or month' });
+    }
     
     // First, get the employee and their department
     const employee = await db.queryRow(`
-      SELECT e.*, d.object_name as department_name, d.object_code as department_code
+      SELECT e.object_code, d.object_name as department_name, d.object_code as department_code
       FROM employees e
       LEFT JOIN departments d ON e.object_code = d.object_code
       WHERE e.table_number = $1
@@ -720,291 +711,147 @@ router.get('/employee/by-number/:tableNumber/department-stats/:year/:month', asy
       return res.status(400).json({ error: 'Employee has no department assigned' });
     }
     
-    console.log(`Employee department: ${employee.department_name} (Code: ${employee.department_code})`);
-    
-    // Get all employees in the same department
-    const departmentEmployees = await db.queryRows(`
-      SELECT e.id, e.table_number, e.full_name, e.object_code
-      FROM employees e
-      WHERE e.object_code = $1
-      ORDER BY e.full_name
-    `, [employee.object_code]);
-    
-    console.log(`Found ${departmentEmployees.length} employees in department`);
-    console.log(`Looking for department stats for: ${tableNumber}`);
-    
-    // Get first and last day of the month
-    const firstDay = `${year}-${month.toString().padStart(2, '0')}-01`;
-    const lastDay = new Date(year, month, 0).getDate();
-    const lastDayOfMonth = `${year}-${month.toString().padStart(2, '0')}-${lastDay.toString().padStart(2, '0')}`;
-    
-    // Generate all days in the month
-    const allDays = [];
-    for (let day = 1; day <= lastDay; day++) {
-      allDays.push(`${year}-${month.toString().padStart(2, '0')}-${day.toString().padStart(2, '0')}`);
+    // Shared by every employee of the department; writers of time_records,
+    // daily_attendance and schedules invalidate it
+    const cached = reportCache.departmentStats.get(employee.object_code, year, month);
+    if (cached) {
+      return res.json(cached);
     }
     
-    // Get time events for all employees in department for this month (first entry and last exit per day)
-    const timeEvents = await db.queryRows(`
-      WITH daily_events AS (
-        SELECT 
-          e.table_number,
-          e.full_name,
-          DATE(te.event_datetime) as event_date,
-          MIN(te.event_datetime) as first_entry,
-          MAX(te.event_datetime) as last_exit,
-          COUNT(*) as event_count
-        FROM time_events te
-        JOIN employees e ON te.employee_number = e.table_number
-        WHERE e.object_code = $1
-        AND DATE(te.event_datetime) >= $2
-        AND DATE(te.event_datetime) <= $3
-        GROUP BY e.table_number, e.full_name, DATE(te.event_datetime)
+    const firstDay = bounds.start;
+    const lastDayOfMonth = `${firstDay.slice(0, 8)}${new Date(year, month, 0).getDate().toString().padStart(2, '0')}`;
+    
+    // Every employee × every day of the month with the day's attendance from
+    // the daily_attendance rollup and the schedule in force that day.
+    // The schedule is the assignment in force on the day; on a day with
+    // attendance but no covering assignment, the most recently created
+    // assignment overlapping the month is used instead.
+    const rows = await db.queryRows(`
+      WITH members AS (
+        SELECT table_number, full_name
+        FROM employees
+        WHERE object_code = $1
+      ),
+      days AS (
+        SELECT day::date as date
+        FROM generate_series($2::date, $3::date - 1, interval '1 day') day
+      ),
+      fallback AS (
+        SELECT DISTINCT ON (esa.employee_number) esa.employee_number, esa.schedule_code
+        FROM employee_schedule_assignments esa
+        JOIN members m ON m.table_number = esa.employee_number
+        WHERE esa.valid_during && daterange($2::date, $3::date)
+        ORDER BY esa.employee_number, esa.created_at DESC
       )
-      SELECT * FROM daily_events
-      ORDER BY event_date, full_name
-    `, [employee.object_code, firstDay, lastDayOfMonth]);
-    
-    // Get schedule assignments for all employees in department
-    const scheduleAssignments = await db.queryRows(`
-      SELECT DISTINCT
-        esa.employee_number,
-        esa.schedule_code,
-        ws1c.schedule_name,
-        esa.start_date,
-        esa.end_date
-      FROM employee_schedule_assignments esa
-      JOIN employees e ON esa.employee_number = e.table_number
-      LEFT JOIN work_schedules_1c ws1c ON esa.schedule_code = ws1c.schedule_code
-      WHERE e.object_code = $1
-      AND (esa.end_date IS NULL OR esa.end_date >= $2)
-      AND esa.start_date <= $3
-    `, [employee.object_code, firstDay, lastDayOfMonth]);
-    
-    // Get all work days for assigned schedules in this month
-    const scheduleCodes = [...new Set(scheduleAssignments.map(sa => sa.schedule_code))];
-    let workDaysSchedule = [];
-    
-    if (scheduleCodes.length > 0) {
-      workDaysSchedule = await db.queryRows(`
-        SELECT 
-          schedule_code,
-          work_date,
-          time_type,
-          work_hours,
-          work_start_time,
-          work_end_time
-        FROM work_schedules_1c
-        WHERE schedule_code = ANY($1)
-        AND EXTRACT(YEAR FROM work_date) = $2
-        AND EXTRACT(MONTH FROM work_date) = $3
-        ORDER BY work_date
-      `, [scheduleCodes, year, month]);
-    }
-    
-    // Also get individual schedules for each employee in department
-    const individualSchedules = {};
-    for (const emp of departmentEmployees) {
-      try {
-        const empSchedule = await db.queryRow(`
-          SELECT 
-            esa.employee_number,
-            esa.schedule_code,
-            ws1c.schedule_name,
-            esa.start_date,
-            esa.end_date
-          FROM employee_schedule_assignments esa
-          LEFT JOIN work_schedules_1c ws1c ON esa.schedule_code = ws1c.schedule_code
-          WHERE esa.employee_number = $1
-          AND (esa.end_date IS NULL OR esa.end_date >= $2)
-          AND esa.start_date <= $3
-          ORDER BY esa.created_at DESC
-          LIMIT 1
-        `, [emp.table_number, firstDay, lastDayOfMonth]);
+      SELECT
+        to_char(d.date, 'YYYY-MM-DD') as date,
+        m.table_number,
+        m.full_name,
+        da.first_entry,
+        da.last_exit,
+        assigned.schedule_code,
+        s.schedule_name
+      FROM members m
+      CROSS JOIN days d
+      LEFT JOIN daily_attendance da ON da.employee_number = m.table_number AND da.date = d.date
+      LEFT JOIN employee_schedule_assignments active
+        ON ${assignmentsAsOf.asOfCondition('active', 'm.table_number', 'd.date')}
+      LEFT JOIN fallback f ON f.employee_number = m.table_number
+      CROSS JOIN LATERAL (
+        SELECT COALESCE(
+          active.schedule_code,
+          CASE WHEN da.employee_number IS NOT NULL THEN f.schedule_code END
+        ) as schedule_code
+      ) assigned
+      LEFT JOIN schedules_1c s ON s.schedule_code = assigned.schedule_code
+    `, [employee.object_code, firstDay, bounds.end]);
+    
+    // Schedule days come from the in-memory schedule calendar
+    await scheduleCalendar.load(rows.map(row => row.schedule_code));
+    
+    // Check if date is in the future (compare dates only, not time)
+    const today = new Date().toISOString().split('T')[0]; // YYYY-MM-DD format
+    const members = [...new Set(rows.map(row => row.table_number))];
+    const scheduleCodes = new Set();
+    
+    const resultData = rows.map(row => {
+      const date = row.date;
+      const hasEvents = Boolean(row.first_entry);
+      const dayOfWeek = new Date(date).getDay();
+      const isWeekend = dayOfWeek === 0 || dayOfWeek === 6;
+      const isFutureDate = date > today;
+      
+      let scheduleData = null;
+      if (row.schedule_code) {
+        scheduleCodes.add(row.schedule_code);
+        const workDay = scheduleCalendar.getDay(row.schedule_code, date);
         
-        if (empSchedule) {
-          console.log(`Individual schedule for ${emp.table_number}:`, {
-            schedule_name: empSchedule.schedule_name,
-            start_date: empSchedule.start_date,
-            end_date: empSchedule.end_date
-          });
-          individualSchedules[emp.table_number] = empSchedule;
+        if (workDay) {
+          // Use specific work day data
+          scheduleData = {
+            scheduleStartTime: workDay.work_start_time,
+            scheduleEndTime: workDay.work_end_time,
+            timeType: workDay.time_type,
+            workHours: workDay.work_hours
+          };
         } else {
-          console.log(`No individual schedule found for ${emp.table_number}`);
-        }
-        
-        if (empSchedule) {
-          // Get work days for this employee's schedule
-          const empWorkDays = await db.queryRows(`
-            SELECT 
-              schedule_code,
-              work_date,
-              time_type,
-              work_hours,
-              work_start_time,
-              work_end_time
-            FROM work_schedules_1c
-            WHERE schedule_code = $1
-            AND EXTRACT(YEAR FROM work_date) = $2
-            AND EXTRACT(MONTH FROM work_date) = $3
-            ORDER BY work_date
-          `, [empSchedule.schedule_code, year, month]);
-          
-          // Add to workDaysSchedule if not already there
-          empWorkDays.forEach(wd => {
-            if (!workDaysSchedule.find(existing => 
-              existing.schedule_code === wd.schedule_code && 
-              existing.work_date.getTime() === wd.work_date.getTime()
-            )) {
-              workDaysSchedule.push(wd);
-            }
-          });
-        }
-      } catch (error) {
-        console.log(`Could not get schedule for employee ${emp.table_number}:`, error.message);
-      }
-    }
-    
-    // Build result data structure
-    const resultData = [];
-    
-    // For each day in the month
-    allDays.forEach(date => {
-      // For each employee in department
-      departmentEmployees.forEach(emp => {
-        // Get schedule for this employee on this date
-        let assignment = scheduleAssignments.find(sa => {
-          if (sa.employee_number !== emp.table_number) return false;
-          
-          const currentDate = new Date(date);
-          const startDate = new Date(sa.start_date);
-          const endDate = sa.end_date ? new Date(sa.end_date) : null;
-          
-          return currentDate >= startDate && (endDate === null || currentDate <= endDate);
-        });
-        
-        // If not found in department assignments, check individual schedules
-        if (!assignment && individualSchedules[emp.table_number]) {
-          const indSchedule = individualSchedules[emp.table_number];
-          const currentDate = new Date(date);
-          const startDate = new Date(indSchedule.start_date);
-          const endDate = indSchedule.end_date ? new Date(indSchedule.end_date) : null;
+          // If no specific work day found, try to get default times from schedule name
+          // (e.g., "09:00-22:00/11мкр 1 смена")
+          const timeMatch = (row.schedule_name || '').match(/(\d{2}:\d{2})-(\d{2}:\d{2})/);
           
-          if (currentDate >= startDate && 
-              (endDate === null || currentDate <= endDate)) {
-            assignment = indSchedule;
-          }
-        }
-        
-        // Get actual time events for this employee on this date (used in multiple places)
-        const dayEvents = timeEvents.find(te => 
-          te.table_number === emp.table_number &&
-          te.event_date.toISOString().split('T')[0] === date
-        );
-        
-        // If still no assignment but employee has actual time data,
-        // use the most recent schedule assignment even if start_date is later
-        if (!assignment && dayEvents && individualSchedules[emp.table_number]) {
-          console.log(`Using fallback schedule for ${emp.table_number} on ${date}: ${individualSchedules[emp.table_number].schedule_name}`);
-          assignment = individualSchedules[emp.table_number];
-        }
-        
-        let scheduleData = null;
-        if (assignment) {
-          // First try to find specific work day record
-          const workDay = workDaysSchedule.find(wd => 
-            wd.schedule_code === assignment.schedule_code &&
-            wd.work_date.toISOString().split('T')[0] === date
-          );
-          
-          if (workDay) {
-            // Use specific work day data
+          // For weekdays, show default schedule even if no specific work_date record
+          if (timeMatch && !isWeekend) {
             scheduleData = {
-              scheduleStartTime: workDay.work_start_time,
-              scheduleEndTime: workDay.work_end_time,
-              timeType: workDay.time_type,
-              workHours: workDay.work_hours
+              scheduleStartTime: timeMatch[1] + ':00',
+              scheduleEndTime: timeMatch[2] + ':00',
+              timeType: 'Рабочее',
+              workHours: 8 // Default work hours
+            };
+          } else if (isWeekend) {
+            scheduleData = {
+              scheduleStartTime: null,
+              scheduleEndTime: null,
+              timeType: 'Выходной',
+              workHours: 0
             };
-          } else {
-            // If no specific work day found, try to get default times from schedule name
-            const scheduleName = assignment.schedule_name || '';
-            let defaultStartTime = null;
-            let defaultEndTime = null;
-            
-            // Extract times from schedule name (e.g., "09:00-22:00/11мкр 1 смена")
-            const timeMatch = scheduleName.match(/(\d{2}:\d{2})-(\d{2}:\d{2})/);
-            if (timeMatch) {
-              defaultStartTime = timeMatch[1] + ':00';
-              defaultEndTime = timeMatch[2] + ':00';
-            }
-            
-            // For weekdays, show default schedule even if no specific work_date record
-            const dayOfWeek = new Date(date).getDay();
-            const isWeekend = dayOfWeek === 0 || dayOfWeek === 6;
-            
-            if (defaultStartTime && defaultEndTime && !isWeekend) {
-              scheduleData = {
-                scheduleStartTime: defaultStartTime,
-                scheduleEndTime: defaultEndTime,
-                timeType: 'Рабочее',
-                workHours: 8 // Default work hours
-              };
-            } else if (isWeekend) {
-              scheduleData = {
-                scheduleStartTime: null,
-                scheduleEndTime: null,
-                timeType: 'Выходной',
-                workHours: 0
-              };
-            }
           }
         }
-        
-        // Determine status
-        const dayOfWeek = new Date(date).getDay();
-        const isWeekend = dayOfWeek === 0 || dayOfWeek === 6;
-        
-        // Check if date is in the future (compare dates only, not time)
-        const today = new Date().toISOString().split('T')[0]; // YYYY-MM-DD format
-        const isFutureDate = date > today;
-        
-        let status = 'absent';
-        
-        if (scheduleData) {
-          if (scheduleData.timeType === 'Выходной') {
-            status = 'weekend';
-            // If employee worked on weekend day, show actual data
-            if (dayEvents) {
-              status = 'weekend_worked';
-            }
-          } else if (dayEvents) {
-            // Has schedule and worked - simplified to just "present"
-            status = 'present';
-          } else {
-            // Has schedule but didn't work
-            status = isFutureDate ? 'planned' : 'absent';
-          }
+      }
+      
+      // Determine status
+      let status = 'absent';
+      
+      if (scheduleData) {
+        if (scheduleData.timeType === 'Выходной') {
+          // If employee worked on weekend day, show actual data
+          status = hasEvents ? 'weekend_worked' : 'weekend';
+        } else if (hasEvents) {
+          // Has schedule and worked - simplified to just "present"
+          status = 'present';
         } else {
-          // No schedule
-          if (isWeekend) {
-            status = dayEvents ? 'weekend_worked' : 'weekend';
-          } else {
-            status = dayEvents ? 'present' : (isFutureDate ? 'planned' : 'absent');
-          }
+          // Has schedule but didn't work
+          status = isFutureDate ? 'planned' : 'absent';
         }
-        
-        resultData.push({
-          date: date,
-          employeeName: emp.full_name,
-          employeeTableNumber: emp.table_number,
-          scheduleStartTime: scheduleData?.scheduleStartTime || null,
-          scheduleEndTime: scheduleData?.scheduleEndTime || null,
-          actualStartTime: dayEvents?.first_entry || null,
-          actualEndTime: dayEvents?.last_exit || null,
-          status: status,
-          isWeekend: isWeekend
-        });
-      });
+      } else {
+        // No schedule
+        if (isWeekend) {
+          status = hasEvents ? 'weekend_worked' : 'weekend';
+        } else {
+          status = hasEvents ? 'present' : (isFutureDate ? 'planned' : 'absent');
+        }
+      }
+      
+      return {
+        date: date,
+        employeeName: row.full_name,
+        employeeTableNumber: row.table_number,
+        scheduleStartTime: scheduleData?.scheduleStartTime || null,
+        scheduleEndTime: scheduleData?.scheduleEndTime || null,
+        actualStartTime: row.first_entry || null,
+        actualEndTime: row.last_exit || null,
+        status: status,
+        isWeekend: isWeekend
+      };
     });
     
     // Sort by date, then by employee name
@@ -1015,10 +862,10 @@ router.get('/employee/by-number/:tableNumber/department-stats/:year/:month', asy
       return a.employeeName.localeCompare(b.employeeName);
     });
     
-    res.json({
+    const stats = {
       success: true,
       departmentName: employee.department_name,
-      employeeCount: departmentEmployees.length,
+      employeeCount: members.length,
       period: {
         year: parseInt(year),
         month: parseInt(month),
@@ -1026,12 +873,18 @@ router.get('/employee/by-number/:tableNumber/department-stats/:year/:month', asy
         dateTo: lastDayOfMonth
       },
       data: resultData
+    };
+    
+    reportCache.departmentStats.set(employee.object_code, year, month, stats, {
+      employees: members,
+      scheduleCodes: [...scheduleCodes]
     });
+    res.json(stats);
     
   } catch (error) {
-    console.error('Error getting department stats:', error.message);
+    log.error('Error getting department stats', error);
     res.status(500).json({ error: 'Internal server error', details: error.message });
   }
 });
 
-module.exports = router;
\ No newline at end of file
+module.exports = router;
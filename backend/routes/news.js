@@ -1,6 +1,7 @@
 const express = require('express');
 const router = express.Router();
 const pool = require('../database_pg');
+const log = require('../utils/logger')('news');
 
 // Получить все новости
 router.get('/news', async (req, res) => {
@@ -31,7 +32,7 @@ router.get('/news', async (req, res) => {
             }
         });
     } catch (error) {
-        console.error('Error fetching news:', error);
+        log.error('Error fetching news', error);
         res.status(500).json({ error: 'Failed to fetch news' });
     }
 });
@@ -48,7 +49,7 @@ router.get('/news/:id', async (req, res) => {
 
         res.json(result.rows[0]);
     } catch (error) {
-        console.error('Error fetching news item:', error);
+        log.error('Error fetching news item', error);
         res.status(500).json({ error: 'Failed to fetch news item' });
     }
 });
@@ -74,7 +75,7 @@ router.post('/news', async (req, res) => {
 
         res.json(result.rows[0]);
     } catch (error) {
-        console.error('Error creating news:', error);
+        log.error('Error creating news', error);
         res.status(500).json({ error: 'Failed to create news' });
     }
 });
@@ -103,7 +104,7 @@ router.put('/news/:id', async (req, res) => {
 
         res.json(result.rows[0]);
     } catch (error) {
-        console.error('Error updating news:', error);
+        log.error('Error updating news', error);
         res.status(500).json({ error: 'Failed to update news' });
     }
 });
@@ -124,7 +125,7 @@ router.delete('/news/:id', async (req, res) => {
 
         res.json({ message: 'News deleted successfully', id: result.rows[0].id });
     } catch (error) {
-        console.error('Error deleting news:', error);
+        log.error('Error deleting news', error);
         res.status(500).json({ error: 'Failed to delete news' });
     }
 });
@@ -3,6 +3,7 @@ const crypto = require('crypto');
 const jwt = require('jsonwebtoken');
 const router = express.Router();
 const db = require('../database_pg');
+const log = require('../utils/logger')('telegram');
 
 // Telegram Bot Token from environment
 const BOT_TOKEN = process.env.TELEGRAM_BOT_TOKEN || '-7765333400:AAG0rFD5IvUwlc83WiXZ5sjqo-YJF-xgmAs';
@@ -14,7 +15,7 @@ function validateTelegramData(initData) {
         // For development/testing - allow bypassing validation
         const isDevelopment = process.env.NODE_ENV !== 'production';
         if (isDevelopment) {
-            console.log('🔧 Development mode: Skipping Telegram hash validation');
+            log.debug('Development mode: skipping Telegram hash validation');
             return true;
         }
         
@@ -23,7 +24,7 @@ function validateTelegramData(initData) {
         
         // If no hash provided, assume development mode
         if (!hash) {
-            console.log('⚠️ No hash in initData, assuming development mode');
+            log.warn('No hash in initData, assuming development mode');
             return true;
         }
         
@@ -43,7 +44,7 @@ function validateTelegramData(initData) {
         
         // Verify hash
         if (calculatedHash !== hash) {
-            console.log('⚠️ Hash validation failed, but allowing in non-production');
+            log.warn('Hash validation failed, but allowing in non-production');
             return true; // Allow in non-production for testing
         }
         
@@ -53,14 +54,14 @@ function validateTelegramData(initData) {
             const currentTime = Math.floor(Date.now() / 1000);
             const maxAge = isDevelopment ? 86400 : 3600; // 24h for dev, 1h for prod
             if (currentTime - authDate > maxAge) {
-                console.log('⚠️ Data too old, but allowing in development');
+                log.warn('Data too old, but allowing in development');
                 return true;
             }
         }
         
         return true;
     } catch (error) {
-        console.error('Telegram data validation error:', error);
+        log.error('Telegram data validation error', error);
         // In development, return true even on errors
         const isDevelopment = process.env.NODE_ENV !== 'production';
         return isDevelopment;
@@ -77,7 +78,7 @@ function parseUserData(initData) {
         }
         return null;
     } catch (error) {
-        console.error('Error parsing user data:', error);
+        log.error('Error parsing user data', error);
         return null;
     }
 }
@@ -87,22 +88,22 @@ router.post('/telegram/link', async (req, res) => {
     try {
         const { initData, employeeNumber, employeeIIN } = req.body;
         
-        console.log('🔗 Telegram link request:', { initData, employeeNumber, employeeIIN });
+        log.debug('Telegram link request', { employeeNumber });
         
         // Support both old (employeeNumber) and new (employeeIIN) parameters
         if (!initData || (!employeeNumber && !employeeIIN)) {
-            console.log('❌ Missing required parameters');
+            log.debug('Missing required parameters');
             return res.status(400).json({ error: 'initData and employeeIIN are required' });
         }
         
         // For development, allow bypassing validation
         const isDevelopment = process.env.NODE_ENV !== 'production';
         const isDevMode = initData === 'dev_mode';
-        console.log('🔧 Development mode:', isDevelopment, 'NODE_ENV:', process.env.NODE_ENV, 'Dev mode request:', isDevMode);
+        log.debug('Telegram link mode', { isDevelopment, nodeEnv: process.env.NODE_ENV, isDevMode });
         let telegramUser = null;
         
         if (isDevMode) {
-            console.log('🧪 Using dev mode mock user (regardless of NODE_ENV)');
+            log.debug('Using dev mode mock user (regardless of NODE_ENV)');
             // Development mode - create mock user
             telegramUser = {
                 id: Math.floor(Math.random() * 1000000) + 100000,
@@ -111,18 +112,18 @@ router.post('/telegram/link', async (req, res) => {
                 username: 'testuser'
             };
         } else {
-            console.log('🔍 Validating real Telegram data');
+            log.debug('Validating real Telegram data');
             // Validate Telegram data
             if (!validateTelegramData(initData)) {
-                console.log('❌ Telegram data validation failed');
+                log.warn('Telegram data validation failed');
                 return res.status(401).json({ error: 'Invalid Telegram data' });
             }
             
             // Parse user data
             telegramUser = parseUserData(initData);
-            console.log('👤 Parsed user data:', telegramUser);
+            log.debug('Parsed Telegram user', { telegramId: telegramUser && telegramUser.id });
             if (!telegramUser) {
-                console.log('❌ Failed to parse user data');
+                log.warn('Failed to parse Telegram user data');
                 return res.status(400).json({ error: 'Invalid user data' });
             }
         }
@@ -207,7 +208,7 @@ router.post('/telegram/link', async (req, res) => {
         });
         
     } catch (error) {
-        console.error('Error linking Telegram account:', error);
+        log.error('Error linking Telegram account', error);
         res.status(500).json({ error: 'Internal server error' });
     }
 });
@@ -217,10 +218,10 @@ router.post('/telegram/auth', async (req, res) => {
     try {
         const { initData } = req.body;
         
-        console.log('🔑 Telegram auth request with initData:', initData.substring(0, 50) + '...');
+        log.debug('Telegram auth request');
         
         if (!initData) {
-            console.log('❌ No initData provided');
+            log.debug('No initData provided');
             return res.status(400).json({ error: 'initData is required' });
         }
         
@@ -325,7 +326,7 @@ router.post('/telegram/auth', async (req, res) => {
         });
         
     } catch (error) {
-        console.error('Error authenticating with Telegram:', error);
+        log.error('Error authenticating with Telegram', error);
         res.status(500).json({ error: 'Internal server error' });
     }
 });
@@ -385,7 +386,7 @@ router.post('/telegram/unlink', async (req, res) => {
         });
         
     } catch (error) {
-        console.error('Error unlinking Telegram account:', error);
+        log.error('Error unlinking Telegram account', error);
         res.status(500).json({ error: 'Internal server error' });
     }
 });
@@ -415,7 +416,7 @@ router.get('/telegram/links', async (req, res) => {
         res.json(links);
         
     } catch (error) {
-        console.error('Error getting Telegram links:', error);
+        log.error('Error getting Telegram links', error);
         res.status(500).json({ error: 'Internal server error' });
     }
 });
@@ -3,9 +3,14 @@ const express = require('express');
 const cors = require('cors');
 const bodyParser = require('body-parser');
 const path = require('path');
+const cluster = require('cluster');
+const { skipStreamedPaths } = require('./utils/jsonStream');
+const requestTiming = require('./utils/requestTiming');
+const metrics = require('./utils/metrics');
 
 const db = require('./database_pg');
-const apiSync = require('./utils/apiSync_pg');
+const startup = require('./utils/startup');
+const loadJobs = require('./utils/loadJobs');
 const authRoutes = require('./routes/auth');
 const employeeRoutes = require('./routes/employee');
 const adminRoutes = require('./routes/admin');
@@ -55,8 +60,11 @@ app.use(cors({
   allowedHeaders: ['Content-Type', 'Authorization'],
   credentials: true
 }));
-app.use(bodyParser.json({ limit: '10mb' }));
+// 1C bulk endpoints read their bodies as a stream (see utils/jsonStream.js)
+app.use(skipStreamedPaths(bodyParser.json({ limit: '10mb' })));
 app.use(bodyParser.urlencoded({ extended: true, limit: '10mb' }));
+// Server-Timing header (db/pool/compute) on every API response
+app.use('/api', requestTiming.middleware);
 
 // Serve main page FIRST
 app.get('/', (req, res) => {
@@ -72,6 +80,9 @@ app.get('/api/health', (req, res) => {
   res.json({ status: 'OK', timestamp: new Date() });
 });
 
+// Prometheus metrics of this process (query latency, pool usage)
+app.get('/api/metrics', metrics.handler);
+
 // API Routes
 app.use('/api', authRoutes);
 app.use('/api', employeeRoutes);
@@ -83,25 +94,21 @@ app.use('/api', newsRoutes);
 app.listen(PORT, '0.0.0.0', async () => {
   console.log(`Server running on port ${PORT}`);
   
-  // Initialize PostgreSQL database
-  try {
-    await db.initializeDatabase();
-    console.log('Database initialized successfully');
-  } catch (error) {
-    console.error('Database initialization failed:', error.message);
-    process.exit(1);
-  }
+  // Progress of load jobs run by other processes, for the SSE streams
+  loadJobs.startListener();
   
-  // Skip initial sync for faster startup in development
-  if (process.env.NODE_ENV === 'production') {
-    console.log('Starting initial data sync...');
-    try {
-      await apiSync.syncAllData();
-      console.log('Initial data sync completed');
-    } catch (error) {
-      console.error('Initial sync failed:', error.message);
-    }
-  } else {
-    console.log('Development mode: Skipping data sync');
-  }
-});
\ No newline at end of file
+  // Under cluster.js the primary has initialized the database and runs the
+  // background work; a worker only serves
+  if (cluster.isWorker) return;
+  
+  await startup.initialize();
+  await startup.initialSync();
+});
+
+// cluster.js retires a worker by disconnecting it: the server stops accepting
+// connections, and once the open ones are done the pool is closed
+if (cluster.isWorker) {
+  process.on('disconnect', () => {
+    db.close().finally(() => process.exit(0));
+  });
+}
@@ -6,9 +6,13 @@ const fs = require('fs');
 const cors = require('cors');
 const bodyParser = require('body-parser');
 const path = require('path');
+const { skipStreamedPaths } = require('./utils/jsonStream');
+const requestTiming = require('./utils/requestTiming');
+const metrics = require('./utils/metrics');
 
 const db = require('./database_pg');
-const apiSync = require('./utils/apiSync_pg');
+const startup = require('./utils/startup');
+const loadJobs = require('./utils/loadJobs');
 const authRoutes = require('./routes/auth');
 const employeeRoutes = require('./routes/employee');
 const adminRoutes = require('./routes/admin');
@@ -27,8 +31,10 @@ app.use(cors({
   ],
   credentials: true
 }));
-app.use(bodyParser.json());
+app.use(skipStreamedPaths(bodyParser.json()));
 app.use(bodyParser.urlencoded({ extended: true }));
+// Server-Timing header (db/pool/compute) on every API response
+app.use('/api', requestTiming.middleware);
 
 // Serve static files
 app.use(express.static(path.join(__dirname, '..')));
@@ -49,31 +55,18 @@ app.get('/api/health', (req, res) => {
   });
 });
 
+// Prometheus metrics of this process (query latency, pool usage)
+app.get('/api/metrics', metrics.handler);
+
 // Redirect HTTP to HTTPS in production (handled by nginx in docker setup)
 
 // Start server
 async function startServer() {
-  // Initialize PostgreSQL database
-  try {
-    await db.initializeDatabase();
-    console.log('Database initialized successfully');
-  } catch (error) {
-    console.error('Database initialization failed:', error.message);
-    process.exit(1);
-  }
-  
-  // Initial sync in production only
-  if (process.env.NODE_ENV === 'production') {
-    console.log('Starting initial data sync...');
-    try {
-      await apiSync.syncAllData();
-      console.log('Initial data sync completed');
-    } catch (error) {
-      console.error('Initial sync failed:', error.message);
-    }
-  } else {
-    console.log('Development mode: Skipping data sync');
-  }
+  // Initialize PostgreSQL database, then the initial sync in production
+  await startup.initialize();
+  // Progress of load jobs run by other processes, for the SSE streams
+  loadJobs.startListener();
+  await startup.initialSync();
 
   // Start HTTPS server if certificates are available
   if (process.env.NODE_ENV === 'production' && 
@@ -1,9 +1,66 @@
 const axios = require('axios');
 const db = require('../database_pg');
+const dirtyDays = require('./dirtyDays');
+const dailyAttendance = require('./dailyAttendance');
+const timeRecordsEngine = require('./timeRecordsEngine');
+const log = require('./logger')('apiSync');
+const reportCache = require('./reportCache');
+const { createEventFetcher, runWithConcurrency } = require('./eventFetcher');
+const timeEventPartitions = require('./timeEventPartitions');
+const { monthBounds, nextDay } = require('./queryFilters');
 
 const API_BASE_URL = process.env.EXTERNAL_API_BASE_URL || 'http://tco.aqnietgroup.com:5555/v1';
+// Per-employee sync must not hang for axios' default (no) timeout
+const SYNC_TIMEOUT_MS = parseInt(process.env.TCO_FETCH_TIMEOUT_MS) || 30000;
 const DEFAULT_BIN = process.env.DEFAULT_BIN || '104992300122';
 
+// Upsert rows into a directory table with one UNNEST statement. Rows whose
+// columns all match the stored values are left untouched, so updated_at
+// only moves on real changes.
+// columns: [[name, pgType], ...], the key column first
+async function bulkUpsert(table, columns, rows) {
+  const [keyColumn, ...dataColumns] = columns.map(([name]) => name);
+
+  // The API may repeat a key; ON CONFLICT cannot touch one row twice
+  const byKey = new Map();
+  for (const row of rows) {
+    if (row[keyColumn] !== undefined && row[keyColumn] !== null) {
+      byKey.set(row[keyColumn], row);
+    }
+  }
+  const uniqueRows = [...byKey.values()];
+
+  const stats = { count: uniqueRows.length, inserted: 0, updated: 0, unchanged: 0 };
+  if (uniqueRows.length === 0) {
+    return stats;
+  }
+
+  const params = columns.map(([name]) => uniqueRows.map(row => row[name] ?? null));
+  const unnest = columns.map(([, type], i) => `$${i + 1}::${type}[]`).join(', ');
+  const names = columns.map(([name]) => name).join(', ');
+
+  const result = await db.query(`
+    INSERT INTO ${table} (${names}, updated_at)
+    SELECT *, CURRENT_TIMESTAMP FROM UNNEST(${unnest}) AS t(${names})
+    ON CONFLICT (${keyColumn}) DO UPDATE SET
+      ${dataColumns.map(name => `${name} = EXCLUDED.${name}`).join(',\n      ')},
+      updated_at = CURRENT_TIMESTAMP
+    WHERE (${dataColumns.map(name => `${table}.${name}`).join(', ')})
+      IS DISTINCT FROM (${dataColumns.map(name => `EXCLUDED.${name}`).join(', ')})
+    RETURNING (xmax = 0) AS inserted
+  `, params);
+
+  stats.inserted = result.rows.filter(row => row.inserted).length;
+  stats.updated = result.rows.length - stats.inserted;
+  stats.unchanged = stats.count - result.rows.length;
+  return stats;
+}
+
+// Stats reported when the API returned nothing and test data was created instead
+function testDataStats() {
+  return { count: 1, inserted: 0, updated: 0, unchanged: 0, testData: true };
+}
+
 async function syncDepartments() {
   try {
     const response = await axios.get(`${API_BASE_URL}/objects`);
@@ -11,40 +68,26 @@ async function syncDepartments() {
 
     // Check if departments is array and not empty
     if (!Array.isArray(departments) || departments.length === 0) {
-      console.log('No departments data from API, creating test data');
+      log.warn('No departments data from API, creating test data');
       await createTestDepartments();
-      return 1;
+      return testDataStats();
     }
 
-    let count = 0;
-    for (const dept of departments) {
-      await db.query(`
-        INSERT INTO departments 
-        (object_code, object_name, object_parent, object_company, object_bin, updated_at) 
-        VALUES ($1, $2, $3, $4, $5, CURRENT_TIMESTAMP)
-        ON CONFLICT (object_code) DO UPDATE SET
-          object_name = EXCLUDED.object_name,
-          object_parent = EXCLUDED.object_parent,
-          object_company = EXCLUDED.object_company,
-          object_bin = EXCLUDED.object_bin,
-          updated_at = CURRENT_TIMESTAMP
-      `, [
-        dept.object_code,
-        dept.object_name,
-        dept.object_parent,
-        dept.object_company,
-        dept.object_bin
-      ]);
-      count++;
-    }
+    const stats = await bulkUpsert('departments', [
+      ['object_code', 'text'],
+      ['object_name', 'text'],
+      ['object_parent', 'text'],
+      ['object_company', 'text'],
+      ['object_bin', 'text']
+    ], departments);
 
-    console.log(`Synced ${count} departments`);
-    return count;
+    log.info('Synced departments', stats);
+    return stats;
   } catch (error) {
-    console.error('Error syncing departments:', error.message);
+    log.error('Error syncing departments', error);
     // Create test data as fallback
     await createTestDepartments();
-    return 1;
+    return testDataStats();
   }
 }
 
@@ -54,35 +97,23 @@ async function syncPositions() {
     const positions = response.data;
 
     if (!Array.isArray(positions) || positions.length === 0) {
-      console.log('No positions data from API, creating test data');
+      log.warn('No positions data from API, creating test data');
       await createTestPositions();
-      return 1;
+      return testDataStats();
     }
 
-    let count = 0;
-    for (const pos of positions) {
-      await db.query(`
-        INSERT INTO positions 
-        (staff_position_code, staff_position_name, object_bin, updated_at) 
-        VALUES ($1, $2, $3, CURRENT_TIMESTAMP)
-        ON CONFLICT (staff_position_code) DO UPDATE SET
-          staff_position_name = EXCLUDED.staff_position_name,
-          object_bin = EXCLUDED.object_bin,
-          updated_at = CURRENT_TIMESTAMP
-      `, [
-        pos.staff_position_code,
-        pos.staff_position_name,
-        pos.object_bin
-      ]);
-      count++;
-    }
+    const stats = await bulkUpsert('positions', [
+      ['staff_position_code', 'text'],
+      ['staff_position_name', 'text'],
+      ['object_bin', 'text']
+    ], positions);
 
-    console.log(`Synced ${count} positions`);
-    return count;
+    log.info('Synced positions', stats);
+    return stats;
   } catch (error) {
-    console.error('Error syncing positions:', error.message);
+    log.error('Error syncing positions', error);
     await createTestPositions();
-    return 1;
+    return testDataStats();
   }
 }
 
@@ -92,41 +123,26 @@ async function syncEmployees() {
     const employees = response.data;
 
     if (!Array.isArray(employees) || employees.length === 0) {
-      console.log('No employees data from API, creating test data');
+      log.warn('No employees data from API, creating test data');
       await createTestEmployees();
-      return 1;
+      return testDataStats();
     }
 
-    let count = 0;
-    for (const emp of employees) {
-      await db.query(`
-        INSERT INTO employees 
-        (object_code, staff_position_code, table_number, full_name, status, object_bin, updated_at) 
-        VALUES ($1, $2, $3, $4, $5, $6, CURRENT_TIMESTAMP)
-        ON CONFLICT (table_number) DO UPDATE SET
-          object_code = EXCLUDED.object_code,
-          staff_position_code = EXCLUDED.staff_position_code,
-          full_name = EXCLUDED.full_name,
-          status = EXCLUDED.status,
-          object_bin = EXCLUDED.object_bin,
-          updated_at = CURRENT_TIMESTAMP
-      `, [
-        emp.object_code,
-        emp.staff_position_code,
-        emp.table_number,
-        emp.full_name,
-        emp.status || 1,
-        emp.object_bin
-      ]);
-      count++;
-    }
-
-    console.log(`Synced ${count} employees`);
-    return count;
+    const stats = await bulkUpsert('employees', [
+      ['table_number', 'text'],
+      ['object_code', 'text'],
+      ['staff_position_code', 'text'],
+      ['full_name', 'text'],
+      ['status', 'int'],
+      ['object_bin', 'text']
+    ], employees.map(emp => ({ ...emp, status: emp.status || 1 })));
+
+    log.info('Synced employees', stats);
+    return stats;
   } catch (error) {
-    console.error('Error syncing employees:', error.message);
+    log.error('Error syncing employees', error);
     await createTestEmployees();
-    return 1;
+    return testDataStats();
   }
 }
 
@@ -188,6 +204,8 @@ async function createTestTimeEvents() {
   await processTimeRecords();
 }
 
+// Recompute time_records of the days with events through timeRecordsEngine:
+// the days are marked dirty and the shift-pairing recalculation picks them up
 async function processTimeRecords(employeeNumber = null) {
   // Если указан конкретный сотрудник, обрабатываем только его
   // Иначе обрабатываем всех сотрудников с недавними событиями
@@ -202,125 +220,127 @@ async function processTimeRecords(employeeNumber = null) {
     whereClause = `WHERE event_datetime >= CURRENT_DATE - INTERVAL '90 days'`;
   }
   
-  const events = await db.queryRows(`
-    SELECT 
-      employee_number,
-      DATE(event_datetime) as date,
-      MIN(CASE WHEN event_type = '1' THEN event_datetime END) as check_in,
-      MAX(CASE WHEN event_type = '2' THEN event_datetime END) as check_out
+  const days = await db.queryRows(`
+    SELECT DISTINCT employee_number, to_char(event_datetime, 'YYYY-MM-DD') as date
     FROM time_events
     ${whereClause}
-    GROUP BY employee_number, DATE(event_datetime)
   `, params);
+  if (days.length === 0) return 0;
 
-  for (const record of events) {
-    let hours_worked = null;
-    let status = 'absent';
-
-    if (record.check_in && record.check_out) {
-      const inTime = new Date(record.check_in);
-      const outTime = new Date(record.check_out);
-      hours_worked = (outTime - inTime) / (1000 * 60 * 60);
+  await dirtyDays.markDirtyDays(days, 'events');
+  const stats = await timeRecordsEngine.recalculateDirtyDays({
+    employeeNumbers: [...new Set(days.map(day => day.employee_number))]
+  });
 
-      // Determine status based on arrival time
-      const inHour = inTime.getHours();
-      const inMinute = inTime.getMinutes();
-      const outHour = outTime.getHours();
-
-      if (inHour < 9 || (inHour === 9 && inMinute === 0)) {
-        status = 'on_time';
-      } else {
-        status = 'late';
-      }
-
-      if (outHour < 18) {
-        status = 'early_leave';
-      }
-    } else if (record.check_in) {
-      status = 'no_exit';
-    }
+  log.info('Time records processed', { records: stats.processedRecords });
+  return stats.processedRecords;
+}
 
-    await db.query(`
-      INSERT INTO time_records (employee_number, date, check_in, check_out, hours_worked, status)
-      VALUES ($1, $2, $3, $4, $5, $6)
-      ON CONFLICT (employee_number, date) DO UPDATE SET
-        check_in = EXCLUDED.check_in,
-        check_out = EXCLUDED.check_out,
-        hours_worked = EXCLUDED.hours_worked,
-        status = EXCLUDED.status,
-        updated_at = CURRENT_TIMESTAMP
-    `, [
-      record.employee_number,
-      record.date,
-      record.check_in,
-      record.check_out,
-      hours_worked,
-      status
-    ]);
-  }
-  
-  console.log(`Обработано ${events.length} записей времени`);
-  return events.length;
+// Received events split into new ones and ones time_events already had
+function eventStats(count, inserted) {
+  return { count, inserted, known: count - inserted };
 }
 
+// Throws when the API or the insert fails, so callers can tell a failed sync
+// from one that found nothing new
 async function syncEmployeeEvents(employeeNumber, dateFrom, dateTo, objectBin) {
-  try {
-    const response = await axios.post(`${API_BASE_URL}/event/filter`, {
-      table_number: employeeNumber,
-      date_from: dateFrom,
-      date_to: dateTo,
-      object_bin: objectBin
-    });
-
-    const events = response.data;
-    if (!Array.isArray(events) || events.length === 0) {
-      console.log('No time events from API for employee:', employeeNumber);
-      return 0;
-    }
-
-    let count = 0;
-    for (const event of events) {
-      await db.query(`
-        INSERT INTO time_events (employee_number, object_code, event_datetime, event_type)
-        VALUES ($1, $2, $3, $4)
-        ON CONFLICT DO NOTHING
-      `, [
-        employeeNumber,
-        event.object_code,
-        event.event_datetime,
-        event.event_type
-      ]);
-      count++;
-    }
+  const response = await axios.post(`${API_BASE_URL}/event/filter`, {
+    table_number: employeeNumber,
+    date_from: dateFrom,
+    date_to: dateTo,
+    object_bin: objectBin
+  }, { timeout: SYNC_TIMEOUT_MS });
+
+  const events = response.data;
+  if (!Array.isArray(events) || events.length === 0) {
+    log.debug('No time events from API', { employeeNumber });
+    return eventStats(0, 0);
+  }
 
-    console.log(`Synced ${count} time events for employee ${employeeNumber}`);
-    return count;
-  } catch (error) {
-    console.error(`Error syncing events for employee ${employeeNumber}:`, error.message);
-    return 0;
+  // Events already stored hit the natural key and are skipped
+  const result = await db.query(`
+    INSERT INTO time_events (employee_number, object_code, event_datetime, event_type)
+    SELECT $1, t.object_code, t.event_datetime, t.event_type
+    FROM UNNEST($2::text[], $3::timestamp[], $4::text[]) AS t(object_code, event_datetime, event_type)
+    ON CONFLICT DO NOTHING
+    RETURNING to_char(event_datetime, 'YYYY-MM-DD') as date
+  `, [
+    employeeNumber,
+    events.map(event => event.object_code),
+    events.map(event => event.event_datetime),
+    events.map(event => event.event_type)
+  ]);
+
+  const stats = eventStats(events.length, result.rowCount);
+
+  // Only days that got new events need recomputation
+  if (stats.inserted > 0) {
+    const days = [...new Set(result.rows.map(row => row.date))]
+      .map(date => ({ employee_number: employeeNumber, date }));
+    await dirtyDays.markDirtyDays(days, 'events');
+    await dailyAttendance.refreshDays(days);
   }
+
+  log.debug('Synced time events', { employeeNumber, ...stats });
+  return stats;
 }
 
 async function syncAllData() {
-  console.log('Starting data synchronization...');
+  log.info('Starting data synchronization');
   
   try {
-    const deptCount = await syncDepartments();
-    const posCount = await syncPositions();
-    const empCount = await syncEmployees();
+    const departments = await syncDepartments();
+    const positions = await syncPositions();
+    const employees = await syncEmployees();
     
-    console.log(`Sync completed: ${deptCount} departments, ${posCount} positions, ${empCount} employees`);
-    return { departments: deptCount, positions: posCount, employees: empCount };
+    log.info('Sync completed', { departments: departments.count, positions: positions.count, employees: employees.count });
+    return { departments, positions, employees };
   } catch (error) {
-    console.error('Sync failed:', error.message);
+    log.error('Sync failed', error);
     throw error;
   }
 }
 
-async function loadTimeEventsWithProgress({ tableNumber, dateFrom, dateTo, objectBin }, progressCallback) {
+// With replaceMonths the organization's events for whole months are loaded
+// into replacement partitions and swapped in at the end instead of being
+// deleted and re-inserted row by row
+// checkpoints (optional): { done: Map(employee_number -> events), save(employee_number, events) }.
+// Employees in `done` are skipped and every employee whose events were saved
+// is reported through save(), so an interrupted organization load can resume.
+async function loadTimeEventsWithProgress({ tableNumber, dateFrom, dateTo, objectBin, replaceMonths = false }, progressCallback, fetcherOptions = {}, checkpoints = null) {
+  let reloads = null;
   try {
-    const BATCH_SIZE = 100; // Process in smaller batches
+    const fetcher = createEventFetcher(API_BASE_URL, fetcherOptions);
     let totalEventsProcessed = 0;
+    let failedEmployees = 0;
+    
+    if (replaceMonths && tableNumber) {
+      throw new Error('Замена месяцев возможна только при загрузке всей организации');
+    }
+    
+    // Monthly partitions for the period must exist before the first insert
+    await timeEventPartitions.ensurePartitions(dateFrom, dateTo);
+    if (replaceMonths) {
+      reloads = await beginMonthReloads(dateFrom, dateTo, objectBin || DEFAULT_BIN);
+    }
+    
+    // New and already stored events among the saved ones; a month swap
+    // replaces whole partitions and does not tell them apart
+    const ingest = { eventsNew: 0, eventsKnown: 0 };
+    
+    // Requests run concurrently, but saves go through one chain so DB writes
+    // never interleave; waiting on the chain also throttles the fetchers
+    let saveChain = Promise.resolve();
+    const enqueueSave = (events) => {
+      const save = saveChain.then(async () => {
+        if (reloads) return addToReloads(reloads, events);
+        const totals = await saveTimeEvents(events);
+        ingest.eventsNew += totals.inserted;
+        ingest.eventsKnown += totals.known;
+      });
+      saveChain = save.catch(() => {});
+      return save;
+    };
     
     if (tableNumber) {
       // Если указан табельный номер конкретного сотрудника
@@ -341,26 +361,22 @@ async function loadTimeEventsWithProgress({ tableNumber, dateFrom, dateTo, objec
         processedEmployees: 0
       });
       
-      console.log('Loading events for employee:', params);
+      log.info('Loading events for employee', params);
       
-      const response = await axios.get(`${API_BASE_URL}/event/filter`, { params });
-      const events = response.data || [];
+      const events = await fetcher.fetchEvents(params);
       
-      // Process events immediately without storing in large array
       if (events.length > 0) {
-        const eventsWithTableNumber = events.map(e => ({
+        await enqueueSave(events.map(e => ({
           ...e,
           table_number: tableNumber
-        }));
-        
-        // Save events immediately in batches
-        await saveTimeEvents(eventsWithTableNumber);
+        })));
         totalEventsProcessed += events.length;
       }
       
       progressCallback({
         message: `Загружено ${events.length} событий для сотрудника ${tableNumber}`,
         eventsLoaded: totalEventsProcessed,
+        ...ingest,
         processedEmployees: 1
       });
       
@@ -373,7 +389,7 @@ async function loadTimeEventsWithProgress({ tableNumber, dateFrom, dateTo, objec
         currentDepartment: 'Инициализация'
       });
       
-      console.log('Loading events for organization:', targetBin);
+      log.info('Loading events for organization', { objectBin: targetBin });
       
       // Получаем список сотрудников организации с информацией о подразделениях
       const employees = await db.queryRows(`
@@ -384,199 +400,316 @@ async function loadTimeEventsWithProgress({ tableNumber, dateFrom, dateTo, objec
         ORDER BY d.object_name, e.table_number
       `, [targetBin]);
       
-      console.log(`Found ${employees.length} employees in organization ${targetBin}`);
+      log.info('Loading events of organization employees', { objectBin: targetBin, employees: employees.length, concurrency: fetcher.settings.concurrency, ratePerSecond: fetcher.settings.ratePerSecond });
       
-      progressCallback({
-        message: `Найдено ${employees.length} сотрудников. Начинаем загрузку событий...`,
-        totalEmployees: employees.length,
-        processedEmployees: 0,
-        eventsLoaded: 0
-      });
+      // Прогресс по подразделениям: всего / обработано сотрудников
+      const departments = {};
+      const pending = [];
+      let processedCount = 0;
+      let failedCount = 0;
       
-      // Группируем сотрудников по подразделениям для лучшего отображения прогресса
-      const employeesByDept = {};
       employees.forEach(emp => {
         const deptName = emp.department_name || 'Без подразделения';
-        if (!employeesByDept[deptName]) {
-          employeesByDept[deptName] = [];
+        if (!departments[deptName]) {
+          departments[deptName] = { total: 0, processed: 0 };
+        }
+        departments[deptName].total++;
+        
+        // Сотрудники, сохраненные до прерывания загрузки, не запрашиваются повторно
+        if (checkpoints && checkpoints.done.has(emp.table_number)) {
+          departments[deptName].processed++;
+          processedCount++;
+          totalEventsProcessed += checkpoints.done.get(emp.table_number);
+        } else {
+          pending.push(emp);
         }
-        employeesByDept[deptName].push(emp);
       });
       
-      let processedCount = 0;
+      progressCallback({
+        message: processedCount > 0
+          ? `Найдено ${employees.length} сотрудников, ${processedCount} уже загружены. Продолжаем загрузку событий...`
+          : `Найдено ${employees.length} сотрудников. Начинаем загрузку событий...`,
+        totalEmployees: employees.length,
+        processedEmployees: processedCount,
+        eventsLoaded: totalEventsProcessed,
+        departments
+      });
       
-      // Загружаем события для каждого подразделения
-      for (const [deptName, deptEmployees] of Object.entries(employeesByDept)) {
+      // Сотрудники идут в порядке подразделений, запросы выполняются параллельно
+      await runWithConcurrency(pending, fetcher.settings.concurrency, async (emp) => {
+        const deptName = emp.department_name || 'Без подразделения';
+        
+        try {
+          const events = await fetcher.fetchEvents({
+            dateStart: dateFrom,
+            dateStop: dateTo,
+            tableNumber: emp.table_number,
+            objectBIN: targetBin // Добавляем BIN организации
+          });
+          
+          if (events.length > 0) {
+            await enqueueSave(events.map(e => ({
+              ...e,
+              table_number: emp.table_number
+            })));
+            totalEventsProcessed += events.length;
+          }
+          if (checkpoints) {
+            await checkpoints.save(emp.table_number, events.length);
+          }
+        } catch (error) {
+          log.error('Error loading events', { employeeNumber: emp.table_number, error });
+          failedCount++;
+          failedEmployees++;
+          // Продолжаем загрузку для остальных сотрудников
+        }
+        
+        processedCount++;
+        const department = departments[deptName];
+        department.processed++;
+        
         progressCallback({
-          message: `Загружается подразделение "${deptName}" - ${deptEmployees.length} сотрудников`,
+          message: department.processed === department.total
+            ? `Подразделение "${deptName}" загружено (${processedCount}/${employees.length} сотрудников)`
+            : `Обработано ${processedCount}/${employees.length} сотрудников, текущее подразделение "${deptName}"`,
           currentDepartment: deptName,
           processedEmployees: processedCount,
-          eventsLoaded: totalEventsProcessed
+          failedEmployees: failedCount,
+          eventsLoaded: totalEventsProcessed,
+          ...ingest
         });
-        
-        for (const emp of deptEmployees) {
-          try {
-            const params = {
-              dateStart: dateFrom,
-              dateStop: dateTo,
-              tableNumber: emp.table_number,
-              objectBIN: targetBin // Добавляем BIN организации
-            };
-            
-            console.log(`Loading events for ${emp.table_number} (${deptName})...`);
-            
-            const response = await axios.get(`${API_BASE_URL}/event/filter`, { params });
-            const events = response.data || [];
-            
-            if (events.length > 0) {
-              console.log(`Found ${events.length} events for ${emp.table_number}`);
-              // Process events immediately without storing in large array
-              const eventsWithTableNumber = events.map(e => ({
-                ...e,
-                table_number: emp.table_number
-              }));
-              
-              // Save events in batches immediately
-              await saveTimeEvents(eventsWithTableNumber);
-              totalEventsProcessed += events.length;
-              
-              // Clear the events from memory after saving
-              eventsWithTableNumber.length = 0;
-            }
-            
-            processedCount++;
-            
-            progressCallback({
-              message: `Обработано ${processedCount}/${employees.length} сотрудников из "${deptName}"`,
-              currentDepartment: deptName,
-              processedEmployees: processedCount,
-              eventsLoaded: totalEvents
-            });
-            
-            // Небольшая задержка между запросами
-            await new Promise(resolve => setTimeout(resolve, 100));
-            
-          } catch (error) {
-            console.error(`Error loading events for ${emp.table_number}:`, error.message);
-            processedCount++;
-            // Продолжаем загрузку для остальных сотрудников
-          }
-        }
-      }
+      });
       
       progressCallback({
         message: `Загрузка завершена. Всего ${totalEventsProcessed} событий от ${processedCount} сотрудников`,
         processedEmployees: processedCount,
-        eventsLoaded: totalEventsProcessed
+        failedEmployees: failedCount,
+        eventsLoaded: totalEventsProcessed,
+        ...ingest
       });
     }
     
-    console.log(`Total events processed: ${totalEventsProcessed}`);
+    if (reloads) {
+      // A swap would drop the months' events of employees whose fetch failed
+      if (failedEmployees > 0) {
+        throw new Error(`Не удалось загрузить события ${failedEmployees} сотрудников, замена месяцев отменена`);
+      }
+      for (const reload of reloads.values()) {
+        const result = await reload.commit();
+        log.info('Swapped time_events partition', result);
+      }
+      reloads = null;
+    }
+    
+    log.info('Time events loaded', { events: totalEventsProcessed, ...ingest });
     return totalEventsProcessed;
     
   } catch (error) {
-    console.error('Error loading time events:', error);
+    log.error('Error loading time events', error);
+    if (reloads) {
+      await Promise.all([...reloads.values()].map(reload => reload.abort().catch(() => {})));
+    }
     throw error;
   }
 }
 
-async function saveTimeEvents(events) {
-  if (!events || events.length === 0) return;
-  
-  const BATCH_SIZE = 50; // Process in smaller batches
-  
-  // Process events in batches to avoid memory issues
-  for (let i = 0; i < events.length; i += BATCH_SIZE) {
-    const batch = events.slice(i, i + BATCH_SIZE);
-    await processBatchEvents(batch);
-    
-    // Yield control to event loop
-    await new Promise(resolve => setImmediate(resolve));
+// One replacement partition per month of [dateFrom, dateTo], which must
+// cover whole calendar months
+async function beginMonthReloads(dateFrom, dateTo, objectBin) {
+  const months = timeEventPartitions.monthsBetween(dateFrom, dateTo);
+  const first = monthBounds(months[0]);
+  const last = monthBounds(months[months.length - 1]);
+  if (!first || !last || dateFrom !== first.start || nextDay(dateTo) !== last.end) {
+    throw new Error('Замена возможна только для полных месяцев: период должен начинаться первого и заканчиваться последним числом месяца');
   }
+
+  const reloads = new Map();
+  try {
+    for (const month of months) {
+      reloads.set(month, await timeEventPartitions.beginMonthReload(month, { objectBin }));
+    }
+  } catch (error) {
+    await Promise.all([...reloads.values()].map(reload => reload.abort().catch(() => {})));
+    throw error;
+  }
+  return reloads;
+}
+
+async function addToReloads(reloads, events) {
+  const byMonth = new Map();
+  for (const event of events) {
+    const normalized = normalizeEvent(event);
+    if (!normalized) continue;
+    const month = normalized.eventDatetime.slice(0, 7);
+    if (!byMonth.has(month)) byMonth.set(month, []);
+    byMonth.get(month).push({
+      employee_number: normalized.tableNumber,
+      object_code: normalized.objectCode,
+      event_datetime: normalized.eventDatetime,
+      event_type: normalized.eventType
+    });
+  }
+
+  for (const [month, monthEvents] of byMonth) {
+    const reload = reloads.get(month);
+    if (reload) await reload.add(monthEvents);
+  }
+}
+
+// Нормализует поля события из разных форматов API
+function normalizeEvent(event) {
+  const tableNumber = event.table_number || event.tableNumber;
+  const eventDatetime = event.event_datetime || event.eventTime;
+  if (!tableNumber || !eventDatetime) return null;
+  
+  return {
+    tableNumber,
+    objectCode: event.object_code || event.objectСode || 'UNKNOWN',
+    eventDatetime,
+    eventType: event.event || event.event_type || event.passDirection || '0'
+  };
 }
 
-async function processBatchEvents(events) {
-  // Группируем события по сотрудникам и датам
-  const eventsByEmployee = {};
+// Rows per multi-row insert into the staging table
+const STAGING_CHUNK_SIZE = 10000;
+
+// Returns { count, inserted, known, deleted }: events received, new ones,
+// ones already stored and stored ones the API no longer returns
+async function saveTimeEvents(events) {
+  const totals = { ...eventStats(0, 0), deleted: 0 };
+  if (!events || events.length === 0) return totals;
+  
+  // Группируем события по сотрудникам, нормализуя поля из разных форматов API
+  const eventsByEmployee = new Map();
   for (const event of events) {
-    const tableNumber = event.table_number || event.tableNumber;
-    if (!tableNumber) continue;
+    const normalized = normalizeEvent(event);
+    if (!normalized) continue;
     
-    if (!eventsByEmployee[tableNumber]) {
-      eventsByEmployee[tableNumber] = {
-        events: [],
-        minDate: null,
-        maxDate: null
-      };
+    const { tableNumber, ...employeeEvent } = normalized;
+    if (!eventsByEmployee.has(tableNumber)) {
+      eventsByEmployee.set(tableNumber, []);
     }
+    eventsByEmployee.get(tableNumber).push(employeeEvent);
+  }
+  
+  // Один выделенный клиент на весь вызов: транзакции не разъезжаются по пулу
+  const client = await db.pool.connect();
+  try {
+    await client.query(`
+      CREATE TEMP TABLE IF NOT EXISTS time_events_staging (
+        employee_number TEXT NOT NULL,
+        object_code TEXT,
+        event_datetime TIMESTAMP NOT NULL,
+        event_type TEXT NOT NULL
+      ) ON COMMIT DELETE ROWS
+    `);
     
-    const eventDatetime = event.event_datetime || event.eventTime;
-    if (eventDatetime) {
-      eventsByEmployee[tableNumber].events.push(event);
-      const date = new Date(eventDatetime);
-      
-      if (!eventsByEmployee[tableNumber].minDate || date < eventsByEmployee[tableNumber].minDate) {
-        eventsByEmployee[tableNumber].minDate = date;
-      }
-      if (!eventsByEmployee[tableNumber].maxDate || date > eventsByEmployee[tableNumber].maxDate) {
-        eventsByEmployee[tableNumber].maxDate = date;
-      }
+    for (const [employeeNumber, employeeEvents] of eventsByEmployee) {
+      const result = await processBatchEvents(client, employeeNumber, employeeEvents);
+      totals.count += result.count;
+      totals.inserted += result.inserted;
+      totals.known += result.known;
+      totals.deleted += result.deleted;
     }
+  } finally {
+    client.release();
   }
   
-  // Для каждого сотрудника удаляем старые записи и вставляем новые
-  for (const [employeeNumber, data] of Object.entries(eventsByEmployee)) {
-    if (data.events.length === 0) continue;
+  return totals;
+}
+
+// Атомарно заменяет события сотрудника за период, покрытый новыми событиями:
+// события загружаются в staging-таблицу, затем один запрос удаляет исчезнувшие
+// и вставляет новые. Повторная загрузка того же периода ничего не меняет
+async function processBatchEvents(client, employeeNumber, events) {
+  try {
+    await client.query('BEGIN');
     
-    try {
-      // Начинаем транзакцию
-      await db.query('BEGIN');
-      
-      // Удаляем существующие записи за этот период
-      const minDateStr = data.minDate.toISOString().split('T')[0];
-      const maxDateStr = data.maxDate.toISOString().split('T')[0] + ' 23:59:59';
-      
-      const deleteResult = await db.query(`
-        DELETE FROM time_events 
-        WHERE employee_number = $1 
-        AND event_datetime >= $2::timestamp
-        AND event_datetime <= $3::timestamp
-      `, [employeeNumber, minDateStr, maxDateStr]);
-      
-      console.log(`Удалено ${deleteResult.rowCount || 0} старых записей для сотрудника ${employeeNumber}`);
-      
-      // Вставляем новые записи
-      let insertCount = 0;
-      for (const event of data.events) {
-        const tableNumber = event.table_number || event.tableNumber;
-        const objectCode = event.object_code || event.objectСode || 'UNKNOWN';
-        const eventDatetime = event.event_datetime || event.eventTime;
-        const eventType = event.event || event.event_type || event.passDirection || '0';
-        
-        if (!eventDatetime) continue;
-        
-        // Время из API в казахстанской зоне - сохраняем как timestamp без timezone
-        await db.query(`
-          INSERT INTO time_events (employee_number, object_code, event_datetime, event_type)
-          VALUES ($1, $2, $3::timestamp, $4)
-        `, [tableNumber, objectCode, eventDatetime, eventType]);
-        
-        insertCount++;
-      }
-      
-      // Коммитим транзакцию
-      await db.query('COMMIT');
-      console.log(`Вставлено ${insertCount} новых записей для сотрудника ${employeeNumber}`);
-      
-    } catch (error) {
-      // Откатываем транзакцию при ошибке
-      await db.query('ROLLBACK');
-      console.error(`Error saving time events for employee ${employeeNumber}:`, error);
+    for (let i = 0; i < events.length; i += STAGING_CHUNK_SIZE) {
+      const chunk = events.slice(i, i + STAGING_CHUNK_SIZE);
+      // Время из API в казахстанской зоне - сохраняем как timestamp без timezone
+      await client.query(`
+        INSERT INTO time_events_staging (employee_number, object_code, event_datetime, event_type)
+        SELECT $1, t.object_code, t.event_datetime, t.event_type
+        FROM UNNEST($2::text[], $3::timestamp[], $4::text[]) AS t(object_code, event_datetime, event_type)
+      `, [
+        employeeNumber,
+        chunk.map(e => e.objectCode),
+        chunk.map(e => e.eventDatetime),
+        chunk.map(e => e.eventType)
+      ]);
     }
+    
+    // За дни, покрытые новыми событиями, удаляются только события, которых
+    // больше нет в API, и вставляются только еще не сохраненные (естественный
+    // ключ time_events). Пересчет табеля нужен лишь дням, где что-то изменилось
+    const result = await client.query(`
+      WITH range AS (
+        SELECT MIN(event_datetime)::date as date_from, MAX(event_datetime)::date + 1 as date_to
+        FROM time_events_staging
+      ),
+      deleted AS (
+        DELETE FROM time_events te
+        USING range r
+        WHERE te.employee_number = $1
+        AND te.event_datetime >= r.date_from
+        AND te.event_datetime < r.date_to
+        AND NOT EXISTS (
+          SELECT 1 FROM time_events_staging s
+          WHERE s.event_datetime = te.event_datetime
+          AND s.event_type = te.event_type
+          AND s.object_code IS NOT DISTINCT FROM te.object_code
+        )
+        RETURNING te.event_datetime::date as date
+      ),
+      inserted AS (
+        INSERT INTO time_events (employee_number, object_code, event_datetime, event_type)
+        SELECT employee_number, object_code, event_datetime, event_type
+        FROM time_events_staging
+        ORDER BY event_datetime
+        ON CONFLICT DO NOTHING
+        RETURNING event_datetime::date as date
+      ),
+      days AS (
+        SELECT date FROM deleted
+        UNION
+        SELECT date FROM inserted
+      ),
+      dirty AS (
+        INSERT INTO time_records_dirty (employee_number, date, reason, marked_at)
+        SELECT $1, date, 'events', CURRENT_TIMESTAMP
+        FROM days
+        ON CONFLICT (employee_number, date) DO UPDATE SET
+          reason = EXCLUDED.reason,
+          marked_at = CURRENT_TIMESTAMP
+      )
+      SELECT
+        (SELECT COUNT(*)::int FROM time_events_staging) as count,
+        (SELECT COUNT(*)::int FROM inserted) as inserted,
+        (SELECT COUNT(*)::int FROM deleted) as deleted,
+        ARRAY(SELECT to_char(date, 'YYYY-MM-DD') FROM days) as days
+    `, [employeeNumber]);
+    const row = result.rows[0];
+    
+    // Сводка посещаемости пересчитывается в той же транзакции
+    await dailyAttendance.refreshDays(
+      row.days.map(date => ({ employee_number: employeeNumber, date })),
+      client
+    );
+    
+    await client.query('COMMIT');
+    
+    return { ...eventStats(row.count, row.inserted), deleted: row.deleted };
+  } catch (error) {
+    // Откатываем транзакцию при ошибке
+    await client.query('ROLLBACK');
+    log.error('Error saving time events', { employeeNumber, error });
+    return { ...eventStats(0, 0), deleted: 0 };
   }
 }
 
 module.exports = {
+  DEFAULT_BIN,
   syncDepartments,
   syncPositions,
   syncEmployees,
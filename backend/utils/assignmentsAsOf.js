@@ -0,0 +1,53 @@
+const db = require('../database_pg');
+
+// The one way readers resolve "which schedule was an employee on at a date".
+// employee_schedule_assignments.valid_during is the [start_date, end_date]
+// range of an assignment (open-ended while end_date is NULL), and the
+// exclusion constraint on (employee_number, valid_during) keeps the ranges of
+// an employee apart: at most one assignment is in force on any day, and the
+// constraint's GiST index finds it. No "latest start wins" ordering needed.
+
+// ON condition of a join to the assignment in force on `dateExpr`:
+//   LEFT JOIN employee_schedule_assignments esa ON ${asOfCondition('esa', 'm.table_number', 'd.date')}
+function asOfCondition(alias, employeeExpr, dateExpr) {
+  return `${alias}.employee_number = ${employeeExpr} AND ${alias}.valid_during @> (${dateExpr})::date`;
+}
+
+// Assignments of the employees in force at some point of [dateFrom, dateTo),
+// in employee and date order. date_from/date_to ('YYYY-MM-DD', date_to
+// exclusive) are clipped to the period, so each row says which days the
+// schedule applies to.
+async function assignmentsDuring(employeeNumbers, dateFrom, dateTo, executor = db) {
+  if (!employeeNumbers || employeeNumbers.length === 0) return [];
+
+  const result = await executor.query(`
+    SELECT
+      esa.employee_number,
+      esa.schedule_code,
+      esa.start_date,
+      esa.end_date,
+      to_char(GREATEST(lower(esa.valid_during), $2::date), 'YYYY-MM-DD') as date_from,
+      to_char(LEAST(COALESCE(upper(esa.valid_during), $3::date), $3::date), 'YYYY-MM-DD') as date_to
+    FROM employee_schedule_assignments esa
+    WHERE esa.employee_number = ANY($1)
+    AND esa.valid_during && daterange($2::date, $3::date)
+    ORDER BY esa.employee_number, esa.start_date
+  `, [employeeNumbers, dateFrom, dateTo]);
+  return result.rows;
+}
+
+// The assignment of one employee in force on a date, null when there is none
+async function assignmentOn(employeeNumber, date, executor = db) {
+  const result = await executor.query(`
+    SELECT esa.id, esa.employee_number, esa.schedule_code, esa.start_date, esa.end_date
+    FROM employee_schedule_assignments esa
+    WHERE ${asOfCondition('esa', '$1', '$2')}
+  `, [employeeNumber, date]);
+  return result.rows[0] || null;
+}
+
+module.exports = {
+  asOfCondition,
+  assignmentsDuring,
+  assignmentOn
+};
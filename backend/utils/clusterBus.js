@@ -0,0 +1,56 @@
+const cluster = require('cluster');
+
+// Messages between the processes of cluster.js, used to keep per-process
+// state (report caches, the schedule calendar) coherent. A worker sends its
+// messages to the primary, which handles them and passes them on to every
+// other worker; a message of the primary goes to all workers. The sender
+// handles its own message itself. Outside a cluster nothing is sent.
+
+const handlers = new Map();
+
+function isBusMessage(message) {
+  return Boolean(message && message.bus === true && typeof message.type === 'string');
+}
+
+function dispatch(message) {
+  const handler = handlers.get(message.type);
+  if (handler) handler(message.payload);
+}
+
+function relay(message, from = null) {
+  if (cluster.isWorker) {
+    if (!from && process.connected) process.send(message);
+    return;
+  }
+  for (const worker of Object.values(cluster.workers || {})) {
+    if (worker !== from && worker.isConnected()) worker.send(message);
+  }
+}
+
+if (cluster.isWorker) {
+  process.on('message', (message) => {
+    if (isBusMessage(message)) dispatch(message);
+  });
+} else {
+  cluster.on('message', (worker, message) => {
+    if (isBusMessage(message)) {
+      dispatch(message);
+      relay(message, worker);
+    }
+  });
+}
+
+// handler(payload) runs for messages of this type sent by other processes
+function subscribe(type, handler) {
+  handlers.set(type, handler);
+}
+
+// payload must survive JSON serialization
+function publish(type, payload) {
+  relay({ bus: true, type, payload });
+}
+
+module.exports = {
+  subscribe,
+  publish
+};
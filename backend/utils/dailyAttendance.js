@@ -0,0 +1,116 @@
+const db = require('../database_pg');
+const reportCache = require('./reportCache');
+
+// daily_attendance keeps first entry, last exit and event count per
+// employee-day so department statistics do not aggregate time_events on every
+// request. Whoever writes time_events refreshes the days it touched; a refresh
+// recomputes them from time_events, so repeating one is harmless.
+// Every function takes an optional executor (a pinned client or the db module)
+// so the rollup changes in the same transaction as the events.
+
+const UPSERT = `
+  INSERT INTO daily_attendance (employee_number, date, first_entry, last_exit, event_count, updated_at)
+  SELECT
+    te.employee_number,
+    te.event_datetime::date,
+    MIN(te.event_datetime),
+    MAX(te.event_datetime),
+    COUNT(*),
+    CURRENT_TIMESTAMP
+`;
+
+const ON_CONFLICT = `
+  GROUP BY te.employee_number, te.event_datetime::date
+  ON CONFLICT (employee_number, date) DO UPDATE SET
+    first_entry = EXCLUDED.first_entry,
+    last_exit = EXCLUDED.last_exit,
+    event_count = EXCLUDED.event_count,
+    updated_at = CURRENT_TIMESTAMP
+`;
+
+// 'YYYY-MM-DD' of the previous day
+function previousDay(date) {
+  const d = new Date(`${date}T00:00:00Z`);
+  d.setUTCDate(d.getUTCDate() - 1);
+  return d.toISOString().split('T')[0];
+}
+
+// Recompute explicit (employee_number, date) pairs
+async function refreshDays(pairs, executor = db) {
+  if (!pairs || pairs.length === 0) return 0;
+
+  const params = [
+    pairs.map(pair => pair.employee_number),
+    pairs.map(pair => pair.date)
+  ];
+
+  // Days without events any more lose their row
+  await executor.query(`
+    DELETE FROM daily_attendance da
+    USING UNNEST($1::text[], $2::date[]) AS d(employee_number, date)
+    WHERE da.employee_number = d.employee_number
+    AND da.date = d.date
+  `, params);
+
+  const result = await executor.query(`
+    ${UPSERT}
+    FROM (
+      SELECT DISTINCT employee_number, date
+      FROM UNNEST($1::text[], $2::date[]) AS t(employee_number, date)
+    ) d
+    JOIN time_events te ON te.employee_number = d.employee_number
+    AND te.event_datetime >= d.date
+    AND te.event_datetime < d.date + 1
+    ${ON_CONFLICT}
+  `, params);
+
+  reportCache.invalidateDays(pairs, executor);
+  return result.rowCount;
+}
+
+// Recompute every day in the half-open range [dateFrom, dateTo), optionally
+// only for the given employees, organization (object_bin) or department
+async function refreshRange(dateFrom, dateTo, { employeeNumbers = null, objectBin = null, department = null } = {}, executor = db) {
+  const params = [dateFrom, dateTo];
+  const scope = [];
+
+  if (employeeNumbers) {
+    params.push(employeeNumbers);
+    scope.push(`employee_number = ANY($${params.length})`);
+  }
+  if (objectBin) {
+    params.push(objectBin);
+    scope.push(`employee_number IN (SELECT table_number FROM employees WHERE object_bin = $${params.length})`);
+  }
+  if (department) {
+    params.push(department);
+    scope.push(`employee_number IN (SELECT table_number FROM employees WHERE object_code = $${params.length})`);
+  }
+  const scopeSql = scope.map(condition => `AND ${condition}`).join('\n    ');
+
+  await executor.query(`
+    DELETE FROM daily_attendance
+    WHERE date >= $1::date AND date < $2::date
+    ${scopeSql}
+  `, params);
+
+  const result = await executor.query(`
+    ${UPSERT}
+    FROM time_events te
+    WHERE te.event_datetime >= $1::date AND te.event_datetime < $2::date
+    ${scopeSql}
+    ${ON_CONFLICT}
+  `, params);
+
+  if (employeeNumbers) {
+    reportCache.invalidateEmployees(employeeNumbers, dateFrom, previousDay(dateTo), executor);
+  } else {
+    reportCache.invalidatePeriod(dateFrom, previousDay(dateTo), executor);
+  }
+  return result.rowCount;
+}
+
+module.exports = {
+  refreshDays,
+  refreshRange
+};
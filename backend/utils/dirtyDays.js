@@ -0,0 +1,132 @@
+const db = require('../database_pg');
+const reportCache = require('./reportCache');
+
+// Every function takes an optional executor (a pinned client or the db module)
+// so marks can be written inside the caller's transaction. Marking a day
+// dirty also drops the cached reports that show it.
+
+// Mark explicit (employee_number, date) pairs dirty
+async function markDirtyDays(pairs, reason, executor = db) {
+  if (!pairs || pairs.length === 0) return 0;
+
+  const result = await executor.query(`
+    INSERT INTO time_records_dirty (employee_number, date, reason, marked_at)
+    SELECT DISTINCT t.employee_number, t.date, $3, CURRENT_TIMESTAMP
+    FROM UNNEST($1::text[], $2::date[]) AS t(employee_number, date)
+    ON CONFLICT (employee_number, date) DO UPDATE SET
+      reason = EXCLUDED.reason,
+      marked_at = CURRENT_TIMESTAMP
+  `, [
+    pairs.map(pair => pair.employee_number),
+    pairs.map(pair => pair.date),
+    reason
+  ]);
+
+  reportCache.invalidateDays(pairs, executor);
+  return result.rowCount;
+}
+
+// Mark every day of the given employees that has events or an existing
+// time record in [dateFrom, dateTo]. A null dateTo means "no upper bound".
+async function markEmployeesDirty(employeeNumbers, dateFrom, dateTo, reason, executor = db) {
+  if (!employeeNumbers || employeeNumbers.length === 0) return 0;
+
+  const result = await executor.query(`
+    INSERT INTO time_records_dirty (employee_number, date, reason, marked_at)
+    SELECT employee_number, date, $4, CURRENT_TIMESTAMP
+    FROM (
+      SELECT DISTINCT employee_number, event_datetime::date as date
+      FROM time_events
+      WHERE employee_number = ANY($1)
+      AND event_datetime >= $2::date
+      AND ($3::date IS NULL OR event_datetime < $3::date + 1)
+      UNION
+      SELECT employee_number, date
+      FROM time_records
+      WHERE employee_number = ANY($1)
+      AND date >= $2::date
+      AND ($3::date IS NULL OR date <= $3::date)
+    ) days
+    ON CONFLICT (employee_number, date) DO UPDATE SET
+      reason = EXCLUDED.reason,
+      marked_at = CURRENT_TIMESTAMP
+  `, [employeeNumbers, dateFrom, dateTo, reason]);
+
+  reportCache.invalidateEmployees(employeeNumbers, dateFrom, dateTo, executor);
+  return result.rowCount;
+}
+
+// Mark the days of every employee assigned to one of the schedule codes
+// while the assignment was valid, limited to [dateFrom, dateTo]
+async function markSchedulesDirty(scheduleCodes, dateFrom, dateTo, reason, executor = db) {
+  if (!scheduleCodes || scheduleCodes.length === 0) return 0;
+
+  const result = await executor.query(`
+    WITH affected AS (
+      SELECT
+        employee_number,
+        GREATEST(start_date, $2::date) as date_from,
+        LEAST(COALESCE(end_date, $3::date), $3::date) as date_to
+      FROM employee_schedule_assignments
+      WHERE schedule_code = ANY($1)
+      AND valid_during && daterange($2::date, $3::date, '[]')
+    )
+    INSERT INTO time_records_dirty (employee_number, date, reason, marked_at)
+    SELECT employee_number, date, $4, CURRENT_TIMESTAMP
+    FROM (
+      SELECT DISTINCT te.employee_number, te.event_datetime::date as date
+      FROM affected a
+      JOIN time_events te ON te.employee_number = a.employee_number
+      AND te.event_datetime >= a.date_from
+      AND te.event_datetime < a.date_to + 1
+      UNION
+      SELECT tr.employee_number, tr.date
+      FROM affected a
+      JOIN time_records tr ON tr.employee_number = a.employee_number
+      AND tr.date BETWEEN a.date_from AND a.date_to
+    ) days
+    ON CONFLICT (employee_number, date) DO UPDATE SET
+      reason = EXCLUDED.reason,
+      marked_at = CURRENT_TIMESTAMP
+  `, [scheduleCodes, dateFrom, dateTo, reason]);
+
+  reportCache.invalidateSchedules(scheduleCodes, dateFrom, dateTo, executor);
+  return result.rowCount;
+}
+
+// Take up to `limit` dirty days off the queue, optionally only those of the
+// given employees. Must run inside a transaction: the rows are deleted, so a
+// rollback puts them back.
+async function claimDirtyDays(client, limit, employeeNumbers = null) {
+  const result = await client.query(`
+    DELETE FROM time_records_dirty
+    WHERE (employee_number, date) IN (
+      SELECT employee_number, date
+      FROM time_records_dirty
+      WHERE $2::text[] IS NULL OR employee_number = ANY($2)
+      ORDER BY employee_number, date
+      LIMIT $1
+      FOR UPDATE SKIP LOCKED
+    )
+    RETURNING employee_number, to_char(date, 'YYYY-MM-DD') as date
+  `, [limit, employeeNumbers]);
+
+  return result.rows;
+}
+
+// Forget dirty marks that a full recalculation has already covered
+async function clearDirtyDays(conditions, params, executor = db) {
+  const result = await executor.query(
+    `DELETE FROM time_records_dirty WHERE ${conditions.join(' AND ')}`,
+    params
+  );
+  return result.rowCount;
+}
+
+module.exports = {
+  markDirtyDays,
+  markEmployeesDirty,
+  markSchedulesDirty,
+  claimDirtyDays,
+  clearDirtyDays
+};
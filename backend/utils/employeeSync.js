@@ -0,0 +1,132 @@
+const db = require('../database_pg');
+const { syncEmployeeEvents } = require('./apiSync_pg');
+const timeRecordsEngine = require('./timeRecordsEngine');
+const log = require('./logger')('employeeSync');
+
+// Per-employee TCO event sync for the timesheet endpoints.
+// 'background' (stale-while-revalidate): the request is answered from the
+// current DB state and the sync runs afterwards on a deduplicated queue,
+// followed by recomputation of the employee's dirty days.
+// 'blocking': the request waits for the sync, as it used to.
+const SYNC_MODE = process.env.TIMESHEET_SYNC_MODE === 'blocking' ? 'blocking' : 'background';
+// An employee whose period was synced less than this long ago is not synced again
+const MIN_INTERVAL_MS = parseInt(process.env.EMPLOYEE_SYNC_INTERVAL_MS) || 5 * 60 * 1000;
+const CONCURRENCY = parseInt(process.env.EMPLOYEE_SYNC_CONCURRENCY) || 2;
+// Requests beyond this many waiting employees are dropped
+const MAX_QUEUED = parseInt(process.env.EMPLOYEE_SYNC_MAX_QUEUED) || 1000;
+
+const queued = new Map();      // employeeNumber -> job waiting to run
+const running = new Set();     // employeeNumbers being synced
+const lastSynced = new Map();  // employeeNumber -> { at, dateFrom, dateTo }
+const counters = { requested: 0, enqueued: 0, merged: 0, throttled: 0, dropped: 0, completed: 0, failed: 0 };
+
+function recentlySynced(employeeNumber, dateFrom, dateTo) {
+  const last = lastSynced.get(employeeNumber);
+  return Boolean(last)
+    && Date.now() - last.at < MIN_INTERVAL_MS
+    && last.dateFrom <= dateFrom
+    && last.dateTo >= dateTo;
+}
+
+function forgetExpired() {
+  const now = Date.now();
+  for (const [employeeNumber, last] of lastSynced) {
+    if (now - last.at >= MIN_INTERVAL_MS) lastSynced.delete(employeeNumber);
+  }
+}
+
+// Queue a sync of [dateFrom, dateTo] for the employee and return at once.
+// A waiting job for the same employee is widened instead of duplicated.
+function request(employeeNumber, dateFrom, dateTo, objectBin = null) {
+  counters.requested++;
+
+  if (recentlySynced(employeeNumber, dateFrom, dateTo)) {
+    counters.throttled++;
+    return false;
+  }
+
+  const waiting = queued.get(employeeNumber);
+  if (waiting) {
+    waiting.dateFrom = waiting.dateFrom < dateFrom ? waiting.dateFrom : dateFrom;
+    waiting.dateTo = waiting.dateTo > dateTo ? waiting.dateTo : dateTo;
+    waiting.objectBin = waiting.objectBin || objectBin;
+    counters.merged++;
+    return true;
+  }
+
+  if (queued.size >= MAX_QUEUED) {
+    counters.dropped++;
+    return false;
+  }
+
+  queued.set(employeeNumber, { employeeNumber, dateFrom, dateTo, objectBin });
+  counters.enqueued++;
+  if (lastSynced.size > MAX_QUEUED * 10) forgetExpired();
+  setImmediate(drain);
+  return true;
+}
+
+// Start waiting jobs up to CONCURRENCY; an employee never syncs twice at once
+function drain() {
+  for (const [employeeNumber, job] of queued) {
+    if (running.size >= CONCURRENCY) return;
+    if (running.has(employeeNumber)) continue;
+
+    queued.delete(employeeNumber);
+    running.add(employeeNumber);
+    runJob(job)
+      .then(() => { counters.completed++; })
+      .catch((error) => {
+        counters.failed++;
+        log.error('Background sync failed', { employeeNumber, error });
+      })
+      .finally(() => {
+        running.delete(employeeNumber);
+        drain();
+      });
+  }
+}
+
+async function runJob({ employeeNumber, dateFrom, dateTo, objectBin }) {
+  const bin = objectBin || (await db.queryRow(
+    'SELECT object_bin FROM employees WHERE table_number = $1',
+    [employeeNumber]
+  ) || {}).object_bin;
+
+  await syncEmployeeEvents(employeeNumber, dateFrom, dateTo, bin);
+
+  // New events marked their days dirty; rebuild those time_records now so
+  // the next timesheet read (and its cache entry) sees them
+  await timeRecordsEngine.recalculateDirtyDays({ employeeNumbers: [employeeNumber] });
+
+  // Only a successful sync throttles the next one; a failed job throws
+  // above, counts as failed and is retried on the next request
+  lastSynced.set(employeeNumber, { at: Date.now(), dateFrom, dateTo });
+}
+
+// What the timesheet handlers call before reading time_records
+async function refresh(employeeNumber, dateFrom, dateTo, objectBin) {
+  if (SYNC_MODE === 'blocking') {
+    await syncEmployeeEvents(employeeNumber, dateFrom, dateTo, objectBin);
+    return;
+  }
+  request(employeeNumber, dateFrom, dateTo, objectBin);
+}
+
+function stats() {
+  return {
+    mode: SYNC_MODE,
+    minIntervalMs: MIN_INTERVAL_MS,
+    concurrency: CONCURRENCY,
+    queued: queued.size,
+    running: running.size,
+    ...counters
+  };
+}
+
+module.exports = {
+  SYNC_MODE,
+  request,
+  refresh,
+  stats
+};
@@ -0,0 +1,111 @@
+// IIN / payroll / full name updates pushed from 1C
+
+// Validate one element of the update-iin payload.
+// Returns { update } with normalized values or { error }.
+function prepareEmployeeUpdate(employee) {
+  const { iin, table_number, payroll, full_name } = employee || {};
+
+  // Require at least table_number and one of iin/payroll/full_name
+  if (!table_number || (!iin && payroll === undefined && !full_name)) {
+    return { error: `Неполные данные: табельный номер=${table_number}, ИИН=${iin}, ФОТ=${payroll}, ФИО=${full_name}` };
+  }
+
+  // IIN must be 12 digits
+  if (iin && !/^\d{12}$/.test(iin)) {
+    return { error: `Неверный формат ИИН ${iin} для табельного номера ${table_number}. Ожидается 12 цифр.` };
+  }
+
+  // Payroll comes from 1C as a string with (non-breaking) spaces
+  let processedPayroll = payroll;
+  if (typeof processedPayroll === 'string') {
+    processedPayroll = processedPayroll.replace(/\s/g, '').replace(/\u00A0/g, '');
+    if (processedPayroll === '') {
+      processedPayroll = undefined;
+    }
+  }
+  if (processedPayroll !== undefined) {
+    processedPayroll = parseFloat(processedPayroll);
+    if (isNaN(processedPayroll) || processedPayroll < 0) {
+      return { error: `Неверный формат ФОТ "${payroll}" для табельного номера ${table_number}. Ожидается положительное число.` };
+    }
+  }
+
+  return { update: { table_number, iin, payroll: processedPayroll, full_name } };
+}
+
+// Apply a chunk of validated updates with one SELECT and one UPDATE.
+// Rules per element, applied in payload order:
+// IIN is only filled in when empty, payroll and full name always overwrite.
+async function applyEmployeeUpdates(client, updates) {
+  const stats = { processed: 0, updated: 0, skipped: 0 };
+  if (updates.length === 0) {
+    return stats;
+  }
+
+  const tableNumbers = [...new Set(updates.map(update => update.table_number))];
+  const existing = await client.query(`
+    SELECT table_number, iin, payroll, full_name
+    FROM employees
+    WHERE table_number = ANY($1)
+    FOR UPDATE
+  `, [tableNumbers]);
+
+  const employees = new Map(existing.rows.map(row => [row.table_number, row]));
+  const changed = new Set();
+
+  for (const update of updates) {
+    const employee = employees.get(update.table_number);
+    if (!employee) {
+      stats.skipped++;
+      continue;
+    }
+
+    let hasUpdates = false;
+    if (update.iin && (employee.iin === null || employee.iin === '')) {
+      employee.iin = update.iin;
+      hasUpdates = true;
+    }
+    if (update.payroll !== undefined) {
+      employee.payroll = update.payroll;
+      hasUpdates = true;
+    }
+    if (update.full_name) {
+      employee.full_name = update.full_name;
+      hasUpdates = true;
+    }
+
+    if (!hasUpdates) {
+      stats.skipped++;
+      continue;
+    }
+
+    changed.add(employee);
+    stats.updated++;
+    stats.processed++;
+  }
+
+  if (changed.size > 0) {
+    const rows = [...changed];
+    await client.query(`
+      UPDATE employees e SET
+        iin = u.iin,
+        payroll = u.payroll,
+        full_name = u.full_name,
+        updated_at = CURRENT_TIMESTAMP
+      FROM UNNEST($1::text[], $2::text[], $3::numeric[], $4::text[]) AS u(table_number, iin, payroll, full_name)
+      WHERE e.table_number = u.table_number
+    `, [
+      rows.map(row => row.table_number),
+      rows.map(row => row.iin),
+      rows.map(row => row.payroll),
+      rows.map(row => row.full_name)
+    ]);
+  }
+
+  return stats;
+}
+
+module.exports = {
+  prepareEmployeeUpdate,
+  applyEmployeeUpdates
+};
@@ -0,0 +1,104 @@
+const http = require('http');
+const https = require('https');
+const axios = require('axios');
+const log = require('./logger')('eventFetcher');
+
+// Tuning for requests to the TCO API
+const DEFAULT_OPTIONS = {
+  concurrency: parseInt(process.env.TCO_FETCH_CONCURRENCY) || 8,
+  ratePerSecond: parseFloat(process.env.TCO_RATE_LIMIT_RPS) || 20,
+  maxRetries: parseInt(process.env.TCO_FETCH_RETRIES) || 3,
+  timeout: parseInt(process.env.TCO_FETCH_TIMEOUT_MS) || 30000,
+  retryBaseDelay: 500
+};
+
+const RETRYABLE_ERROR_CODES = new Set(['ECONNABORTED', 'ETIMEDOUT', 'ECONNRESET', 'ECONNREFUSED', 'EPIPE', 'EAI_AGAIN']);
+
+const sleep = (ms) => new Promise(resolve => setTimeout(resolve, ms));
+
+// Token bucket: allows bursts up to `capacity`, refills at `ratePerSecond`
+function createTokenBucket(ratePerSecond, capacity = Math.max(1, Math.ceil(ratePerSecond))) {
+  let tokens = capacity;
+  let lastRefill = Date.now();
+  let queue = Promise.resolve();
+
+  const refill = () => {
+    const now = Date.now();
+    tokens = Math.min(capacity, tokens + ((now - lastRefill) / 1000) * ratePerSecond);
+    lastRefill = now;
+  };
+
+  // Callers are served in order: each take() waits for the previous one
+  function take() {
+    const turn = queue.then(async () => {
+      refill();
+      if (tokens < 1) {
+        await sleep(((1 - tokens) / ratePerSecond) * 1000);
+        refill();
+      }
+      tokens -= 1;
+    });
+    queue = turn.catch(() => {});
+    return turn;
+  }
+
+  return { take };
+}
+
+function isRetryable(error) {
+  if (error.response) {
+    return error.response.status >= 500 || error.response.status === 429;
+  }
+  return RETRYABLE_ERROR_CODES.has(error.code);
+}
+
+// Fetcher for GET /event/filter with keep-alive connections, rate limiting
+// and retry with exponential backoff on 5xx and timeouts
+function createEventFetcher(baseUrl, options = {}) {
+  const settings = { ...DEFAULT_OPTIONS, ...options };
+  const bucket = createTokenBucket(settings.ratePerSecond);
+
+  const client = axios.create({
+    baseURL: baseUrl,
+    timeout: settings.timeout,
+    httpAgent: new http.Agent({ keepAlive: true, maxSockets: settings.concurrency }),
+    httpsAgent: new https.Agent({ keepAlive: true, maxSockets: settings.concurrency })
+  });
+
+  async function fetchEvents(params) {
+    for (let attempt = 0; ; attempt++) {
+      await bucket.take();
+      try {
+        const response = await client.get('/event/filter', { params });
+        return response.data || [];
+      } catch (error) {
+        if (attempt >= settings.maxRetries || !isRetryable(error)) {
+          throw error;
+        }
+        const delay = settings.retryBaseDelay * 2 ** attempt * (1 + Math.random() / 2);
+        log.warn('Retrying events', { tableNumber: params.tableNumber, delayMs: Math.round(delay), attempt: attempt + 1, error: error.message });
+        await sleep(delay);
+      }
+    }
+  }
+
+  return { fetchEvents, settings };
+}
+
+// Run worker(item) for every item with at most `concurrency` in flight
+async function runWithConcurrency(items, concurrency, worker) {
+  let next = 0;
+  const runners = Array.from({ length: Math.min(concurrency, items.length) }, async () => {
+    while (next < items.length) {
+      const item = items[next++];
+      await worker(item);
+    }
+  });
+  await Promise.all(runners);
+}
+
+module.exports = {
+  createTokenBucket,
+  createEventFetcher,
+  runWithConcurrency
+};
@@ -0,0 +1,165 @@
+const log = require('./logger')('hoursCalculator');
+
+// Called for every recalculated time record: per-row details are sampled
+const rowLog = log.sampled();
+
+// ADVANCED HOURS CALCULATOR WITH SCHEDULE-BASED LOGIC
+function calculateAdvancedHours(checkIn, checkOut, scheduleData, workDate) {
+  if (!checkIn || !checkOut) {
+    return {
+      actual_hours: 0,
+      planned_hours: 0,
+      overtime_hours: 0,
+      is_scheduled_workday: false,
+      has_lunch_break: false
+    };
+  }
+  
+  const inTime = new Date(checkIn);
+  let outTime = new Date(checkOut);
+  
+  // Get schedule information
+  const startTime = scheduleData.work_start_time;
+  const endTime = scheduleData.work_end_time;
+  const plannedHours = parseFloat(scheduleData.work_hours) || 8;
+  const scheduleName = scheduleData.schedule_name || '';
+  
+  // Check if this is a scheduled workday
+  const isScheduledWorkday = !!scheduleData.schedule_name;
+  
+  // Determine if night shift
+  const isNightShift = startTime && endTime && (
+    startTime > endTime ||
+    plannedHours > 12 ||
+    (startTime >= "22:00" || startTime >= "23:00") ||
+    (endTime <= "08:00" || endTime <= "06:00") ||
+    scheduleName.toLowerCase().includes('ночная') ||
+    scheduleName.includes('00:00')
+  );
+  
+  // Handle night shift time calculation
+  if (isNightShift && outTime <= inTime) {
+    outTime.setDate(outTime.getDate() + 1);
+    rowLog.debug('Night shift: checkout moved to the next day', { workDate });
+  }
+  
+  // Calculate raw actual hours
+  let actualHours = (outTime - inTime) / (1000 * 60 * 60);
+  
+  // Handle edge cases
+  if (actualHours < 0) {
+    actualHours = actualHours + 24;
+  }
+  if (actualHours > 16) {
+    rowLog.warn('Unusually long shift, capped at 16h', { workDate, checkIn, checkOut, hours: Number(actualHours.toFixed(2)) });
+    actualHours = Math.min(actualHours, 16); // Cap at 16 hours
+  }
+  
+  // Determine if lunch break should be deducted
+  const hasLunchBreak = actualHours > 4 && !isNightShift;
+  
+  // Calculate final hours based on schedule logic
+  let finalHours, overtimeHours = 0;
+  
+  if (isScheduledWorkday) {
+    // Deduct lunch break if applicable
+    let workingHours = actualHours;
+    if (hasLunchBreak) {
+      workingHours = Math.max(0, actualHours - 1); // Deduct 1 hour lunch
+    }
+    
+    if (workingHours > plannedHours) {
+      // Overtime: cap at planned hours, calculate overtime separately
+      finalHours = plannedHours;
+      overtimeHours = workingHours - plannedHours;
+    } else {
+      // Within scheduled hours or early departure
+      finalHours = workingHours;
+    }
+  } else {
+    // No schedule: count actual hours
+    finalHours = hasLunchBreak ? Math.max(0, actualHours - 1) : actualHours;
+  }
+  
+  if (log.isEnabled('debug')) {
+    rowLog.debug('Hours calculated', {
+      workDate,
+      schedule: scheduleName || null,
+      plannedHours,
+      actualHours,
+      lunchBreak: hasLunchBreak,
+      finalHours,
+      overtimeHours
+    });
+  }
+  
+  return {
+    actual_hours: Math.max(0, actualHours),
+    planned_hours: isScheduledWorkday ? plannedHours : 0,
+    overtime_hours: Math.max(0, overtimeHours),
+    is_scheduled_workday: isScheduledWorkday,
+    has_lunch_break: hasLunchBreak,
+    final_hours: Math.max(0, finalHours)
+  };
+}
+
+// LEGACY FUNCTION - DEPRECATED BUT KEPT FOR COMPATIBILITY
+function calculateShiftHours(checkIn, checkOut, scheduleData) {
+  const result = calculateAdvancedHours(checkIn, checkOut, scheduleData, null);
+  return result.final_hours;
+}
+
+// Enhanced status determination for night shifts.
+// Pass the result of calculateAdvancedHours() to avoid computing the hours twice,
+// and the work date ('YYYY-MM-DD') of the shift the entry belongs to
+// (shiftPairing anchors a night shift to the day it starts).
+function determineShiftStatus(checkIn, checkOut, scheduleData, hoursCalculation, workDate) {
+  const actualHours = hoursCalculation
+    ? hoursCalculation.final_hours
+    : calculateShiftHours(checkIn, checkOut, scheduleData);
+  const expectedHours = parseInt(scheduleData.work_hours) || 8;
+  const startTime = scheduleData.work_start_time;
+  const endTime = scheduleData.work_end_time;
+  
+  // Check if employee worked without assigned schedule
+  const offSchedule = !scheduleData.schedule_name;
+  
+  if (!checkIn) return 'absent';
+  
+  const inTime = new Date(checkIn);
+  
+  // Parse expected start time for comparison
+  let expectedStart = new Date(inTime);
+  if (startTime) {
+    const [hours, minutes] = startTime.split(':').map(Number);
+    
+    if (workDate) {
+      // The scheduled start of the shift's own work date
+      const [year, month, day] = workDate.split('-').map(Number);
+      expectedStart = new Date(year, month - 1, day, hours, minutes, 0, 0);
+    } else {
+      expectedStart.setHours(hours, minutes, 0, 0);
+      
+      // For night shifts starting late (22:00+), adjust date if needed
+      if (hours >= 22 && inTime.getHours() < 12) {
+        expectedStart.setDate(expectedStart.getDate() - 1);
+      }
+    }
+  }
+  
+  // Calculate lateness in minutes
+  const lateness = (inTime - expectedStart) / (1000 * 60);
+  
+  // Determine status
+  if (lateness <= 5) return 'on_time';           // Within 5 minutes
+  if (lateness <= 30) return 'late';             // Up to 30 minutes late
+  if (actualHours < expectedHours * 0.8) return 'early_leave'; // Left significantly early
+  
+  return 'late';
+}
+
+module.exports = {
+  calculateAdvancedHours,
+  calculateShiftHours,
+  determineShiftStatus
+};
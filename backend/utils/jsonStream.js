@@ -0,0 +1,267 @@
+// Incremental parsing of large JSON request bodies from 1C.
+// Only one array is ever held element by element: either the top-level
+// array itself, or the array under one key of the top-level object.
+// Other top-level keys are parsed into `fields` as they arrive.
+
+// Request paths whose JSON body is read by the route as a stream
+const STREAMED_JSON_PATHS = new Set([
+  '/api/admin/schedules/import-1c',
+  '/api/admin/schedules/assign-employees-batch',
+  '/api/admin/employees/update-iin'
+]);
+
+const DEFAULT_CHUNK_SIZE = parseInt(process.env.JSON_STREAM_CHUNK_SIZE) || 1000;
+
+const WHITESPACE = new Set([' ', '\t', '\n', '\r']);
+
+class JsonArrayScanner {
+  constructor(arrayKey = null, fields = {}) {
+    this.arrayKey = arrayKey;
+    this.fields = fields;
+    this.itemDepth = arrayKey ? 2 : 1;
+    this.depth = 0;
+    this.started = false;
+    this.inArray = false;
+    this.inString = false;
+    this.escaped = false;
+    this.expectValue = false;
+    this.currentKey = null;
+    this.capture = null;
+  }
+
+  // Feed the next piece of text, returns the array elements completed in it
+  write(chunk) {
+    const items = [];
+
+    const begin = (kind, start, ch) => {
+      this.capture = {
+        kind,
+        start,
+        text: '',
+        depth: this.depth,
+        compound: ch === '{' || ch === '[',
+        string: ch === '"'
+      };
+    };
+
+    const finish = (end) => {
+      const capture = this.capture;
+      this.capture = null;
+      const value = JSON.parse(capture.text + chunk.slice(capture.start, end));
+      if (capture.kind === 'key') {
+        this.currentKey = value;
+      } else if (capture.kind === 'field') {
+        this.fields[this.currentKey] = value;
+      } else {
+        items.push(value);
+      }
+    };
+
+    for (let i = 0; i < chunk.length; i++) {
+      const ch = chunk[i];
+
+      if (this.inString) {
+        if (this.escaped) {
+          this.escaped = false;
+        } else if (ch === '\\') {
+          this.escaped = true;
+        } else if (ch === '"') {
+          this.inString = false;
+          if (this.capture && this.capture.string) {
+            finish(i + 1);
+          }
+        }
+        continue;
+      }
+
+      // Numbers and literals end at the first delimiter after them
+      if (this.capture && !this.capture.compound && !this.capture.string) {
+        if (ch !== ',' && ch !== '}' && ch !== ']' && !WHITESPACE.has(ch)) {
+          continue;
+        }
+        finish(i);
+      }
+
+      if (this.capture) {
+        if (ch === '"') {
+          this.inString = true;
+        } else if (ch === '{' || ch === '[') {
+          this.depth++;
+        } else if (ch === '}' || ch === ']') {
+          this.depth--;
+          if (this.depth === this.capture.depth) {
+            finish(i + 1);
+          }
+        }
+        continue;
+      }
+
+      if (WHITESPACE.has(ch)) {
+        continue;
+      }
+
+      if (this.depth === 0) {
+        const expected = this.arrayKey ? '{' : '[';
+        if (this.started || ch !== expected) {
+          throw new Error(`Invalid JSON: expected "${expected}" at the top level`);
+        }
+        this.started = true;
+        this.depth = 1;
+        this.inArray = !this.arrayKey;
+        continue;
+      }
+
+      if (this.inArray && this.depth === this.itemDepth) {
+        if (ch === ',') {
+          continue;
+        }
+        if (ch === ']') {
+          this.inArray = false;
+          this.depth--;
+          continue;
+        }
+        begin('item', i, ch);
+      } else if (this.arrayKey && this.depth === 1) {
+        if (ch === ':') {
+          this.expectValue = true;
+          continue;
+        }
+        if (ch === ',') {
+          this.expectValue = false;
+          continue;
+        }
+        if (ch === '}') {
+          this.depth = 0;
+          continue;
+        }
+        if (this.expectValue && ch === '[' && this.currentKey === this.arrayKey) {
+          this.inArray = true;
+          this.depth = 2;
+          continue;
+        }
+        if (!this.expectValue && ch !== '"') {
+          throw new Error(`Invalid JSON: unexpected "${ch}"`);
+        }
+        begin(this.expectValue ? 'field' : 'key', i, ch);
+      } else {
+        throw new Error(`Invalid JSON: unexpected "${ch}"`);
+      }
+
+      if (ch === '"') {
+        this.inString = true;
+      } else if (ch === '{' || ch === '[') {
+        this.depth++;
+      }
+    }
+
+    if (this.capture) {
+      this.capture.text += chunk.slice(this.capture.start);
+      this.capture.start = 0;
+    }
+    return items;
+  }
+
+  end() {
+    if (!this.started || this.depth !== 0 || this.inString || this.capture) {
+      throw new Error('Invalid JSON: unexpected end of input');
+    }
+  }
+}
+
+// Yield the elements of a JSON array from a request body without buffering it.
+// Falls back to an already parsed req.body when a body parser ran first.
+async function* streamJsonArray(req, arrayKey = null, fields = {}) {
+  if (req._body) {
+    const body = req.body || {};
+    if (arrayKey) {
+      Object.assign(fields, body);
+      delete fields[arrayKey];
+    }
+    const items = arrayKey ? body[arrayKey] : body;
+    if (Array.isArray(items)) {
+      yield* items;
+    }
+    return;
+  }
+
+  const scanner = new JsonArrayScanner(arrayKey, fields);
+  req.setEncoding('utf8');
+  for await (const chunk of req) {
+    yield* scanner.write(chunk);
+  }
+  scanner.end();
+}
+
+// Feed array elements to handler(chunk) in chunks of `chunkSize`. The request
+// is only read further once the previous chunk has been handled, so a slow
+// database pushes back on the client instead of filling memory.
+async function processJsonArrayInChunks(req, { arrayKey = null, fields = {}, chunkSize = DEFAULT_CHUNK_SIZE } = {}, handler) {
+  let chunk = [];
+  let total = 0;
+
+  for await (const item of streamJsonArray(req, arrayKey, fields)) {
+    chunk.push(item);
+    if (chunk.length >= chunkSize) {
+      total += chunk.length;
+      await handler(chunk);
+      chunk = [];
+    }
+  }
+  if (chunk.length > 0) {
+    total += chunk.length;
+    await handler(chunk);
+  }
+
+  return total;
+}
+
+// Clients sending "Accept: application/x-ndjson" get one line of running
+// statistics per chunk and the final response as the last line; everyone
+// else gets the usual single JSON response.
+function createProgressStream(req, res) {
+  const enabled = (req.headers.accept || '').includes('application/x-ndjson');
+
+  return {
+    enabled,
+    update(data) {
+      if (!enabled) return;
+      if (!res.headersSent) {
+        res.status(200);
+        res.setHeader('Content-Type', 'application/x-ndjson');
+      }
+      res.write(JSON.stringify(data) + '\n');
+    },
+    end(status, body) {
+      if (enabled && res.headersSent) {
+        res.end(JSON.stringify(body) + '\n');
+      } else {
+        res.status(status).json(body);
+      }
+    }
+  };
+}
+
+// Errors from malformed bodies are the client's fault
+function isJsonError(error) {
+  return error instanceof SyntaxError || error.message.startsWith('Invalid JSON');
+}
+
+// Wrap a body parser so it leaves streamed routes alone
+function skipStreamedPaths(parser) {
+  return (req, res, next) => {
+    if (STREAMED_JSON_PATHS.has(req.path)) {
+      return next();
+    }
+    return parser(req, res, next);
+  };
+}
+
+module.exports = {
+  STREAMED_JSON_PATHS,
+  JsonArrayScanner,
+  streamJsonArray,
+  processJsonArrayInChunks,
+  createProgressStream,
+  isJsonError,
+  skipStreamedPaths
+};
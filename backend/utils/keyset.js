@@ -0,0 +1,204 @@
+const db = require('../database_pg');
+const log = require('./logger')('keyset');
+
+// Keyset (cursor) pagination and streaming export for list endpoints.
+// A page is ordered by its key columns, all DESC; the cursor is the key of
+// the last row, so the next page is `(keys) < (cursor)` and uses the index
+// instead of an ever-growing OFFSET.
+
+const DEFAULT_PAGE_SIZE = 1000;
+const MAX_PAGE_SIZE = 10000;
+// Rows fetched from the server-side cursor per round trip during export
+const EXPORT_FETCH_SIZE = parseInt(process.env.EXPORT_FETCH_SIZE) || 2000;
+
+const EXPORT_FORMATS = {
+  ndjson: 'application/x-ndjson; charset=utf-8',
+  csv: 'text/csv; charset=utf-8'
+};
+
+function pageSize(limit) {
+  const size = parseInt(limit);
+  if (!size || size < 1) return DEFAULT_PAGE_SIZE;
+  return Math.min(size, MAX_PAGE_SIZE);
+}
+
+function encodeCursor(values) {
+  return Buffer.from(JSON.stringify(values)).toString('base64url');
+}
+
+// Key values from a cursor string, or null if it is not one of ours
+function decodeCursor(cursor, keyCount) {
+  try {
+    const values = JSON.parse(Buffer.from(cursor, 'base64url').toString());
+    return Array.isArray(values) && values.length === keyCount && values.every(v => typeof v === 'string')
+      ? values
+      : null;
+  } catch (error) {
+    return null;
+  }
+}
+
+// keys: [[column, pgType], ...] in ORDER BY order
+function orderBy(keys) {
+  return keys.map(([column]) => `${column} DESC`).join(', ');
+}
+
+// Extra select list items carrying the key values as text, so the cursor
+// round-trips timestamps exactly
+function keyColumns(keys) {
+  return keys.map(([column], i) => `${column}::text AS _key_${i}`).join(', ');
+}
+
+// `(keys) < (cursor)` condition continuing the numbering of `params`
+function after(keys, values, params) {
+  const placeholders = keys.map(([, type], i) => {
+    params.push(values[i]);
+    return `$${params.length}::${type}`;
+  });
+  return `(${keys.map(([column]) => column).join(', ')}) < (${placeholders.join(', ')})`;
+}
+
+// Rows were fetched with LIMIT size + 1: strip the key columns and return the
+// cursor of the last row if there is another page
+function takePage(rows, size, keyCount) {
+  const page = rows.slice(0, size);
+  const last = page[page.length - 1];
+  const nextCursor = rows.length > size && last
+    ? encodeCursor(Array.from({ length: keyCount }, (_, i) => last[`_key_${i}`]))
+    : null;
+
+  for (const row of page) {
+    for (let i = 0; i < keyCount; i++) delete row[`_key_${i}`];
+  }
+  return { rows: page, nextCursor };
+}
+
+function csvValue(value) {
+  if (value === null || value === undefined) return '';
+  const text = String(value);
+  return /[",\r\n]/.test(text) ? `"${text.replace(/"/g, '""')}"` : text;
+}
+
+// CSV cells are the database text representation, not JS-parsed values
+const rawTypes = { getTypeParser: () => (value) => value };
+
+// Resolves once the response can take more data or the client is gone. A
+// response destroyed before we got here has already emitted 'close'.
+function drained(res) {
+  return new Promise(resolve => {
+    if (res.destroyed || res.writableEnded) return resolve();
+    const done = () => {
+      res.off('drain', done);
+      res.off('close', done);
+      resolve();
+    };
+    res.on('drain', done);
+    res.on('close', done);
+  });
+}
+
+// Run `sql` through a server-side cursor, EXPORT_FETCH_SIZE rows at a time,
+// and write what writeBatch(rows, fields) returns for every batch and what
+// writeEnd() returns after the last one, so memory does not grow with the
+// result. Headers go out once the query has started, so a broken query still
+// gets a normal error response from the caller.
+async function streamCursor(res, { sql, params, headers, types }, writeBatch, writeEnd) {
+  const name = 'export_cursor';
+  let headersSent = false;
+
+  try {
+    await db.withTransaction(async (client) => {
+      await client.query(`DECLARE ${name} NO SCROLL CURSOR FOR ${sql}`, params);
+
+      res.status(200);
+      res.set(headers);
+      headersSent = true;
+
+      while (!res.destroyed) {
+        const result = await client.query({
+          text: `FETCH FORWARD ${EXPORT_FETCH_SIZE} FROM ${name}`,
+          types
+        });
+
+        const chunk = writeBatch(result.rows, result.fields);
+        if (chunk && !res.write(chunk)) await drained(res);
+
+        if (result.rows.length < EXPORT_FETCH_SIZE) break;
+      }
+    });
+    res.end(writeEnd());
+  } catch (error) {
+    if (!headersSent) throw error;
+    // The status line is gone; cut the stream so the client sees a failed download
+    log.error('Export stream failed', error);
+    res.destroy(error);
+  }
+}
+
+// Stream the result of `sql` as NDJSON or CSV
+async function streamExport(res, { sql, params, format, filename }) {
+  let header = format !== 'csv';
+
+  await streamCursor(res, {
+    sql,
+    params,
+    headers: {
+      'Content-Type': EXPORT_FORMATS[format],
+      'Content-Disposition': `attachment; filename="${filename}.${format}"`
+    },
+    types: format === 'csv' ? rawTypes : undefined
+  }, (rows, fields) => {
+    let chunk = '';
+    if (!header) {
+      chunk += fields.map(field => csvValue(field.name)).join(',') + '\r\n';
+      header = true;
+    }
+    for (const row of rows) {
+      chunk += format === 'csv'
+        ? fields.map(field => csvValue(row[field.name])).join(',') + '\r\n'
+        : JSON.stringify(row) + '\n';
+    }
+    return chunk;
+  }, () => '');
+}
+
+// Stream `{ success: true, data: [...], summary }` without holding the rows.
+// toItems(rows) turns one batch into data items and may keep back the last
+// ones if they continue in the next batch; finish() returns the kept-back
+// items and the summary once every row has been read.
+async function streamJson(res, { sql, params, toItems, finish }) {
+  let opened = false;
+  let count = 0;
+
+  const items = (list) => list
+    .map(item => (count++ > 0 ? ',' : '') + JSON.stringify(item))
+    .join('');
+
+  await streamCursor(res, {
+    sql,
+    params,
+    headers: { 'Content-Type': 'application/json; charset=utf-8' }
+  }, (rows) => {
+    const prefix = opened ? '' : '{"success":true,"data":[';
+    opened = true;
+    return prefix + items(toItems(rows));
+  }, () => {
+    const { items: rest = [], summary } = finish();
+    return `${items(rest)}],"summary":${JSON.stringify(summary)}}`;
+  });
+}
+
+module.exports = {
+  DEFAULT_PAGE_SIZE,
+  MAX_PAGE_SIZE,
+  EXPORT_FORMATS,
+  pageSize,
+  encodeCursor,
+  decodeCursor,
+  orderBy,
+  keyColumns,
+  after,
+  takePage,
+  streamExport,
+  streamJson
+};
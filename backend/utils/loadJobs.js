@@ -0,0 +1,417 @@
+const os = require('os');
+const { EventEmitter } = require('events');
+const db = require('../database_pg');
+const apiSync = require('./apiSync_pg');
+const timeRecordsEngine = require('./timeRecordsEngine');
+const log = require('./logger')('loadJobs');
+
+// Background loads queued in load_jobs. Any backend process may enqueue,
+// run or report a job:
+// - workers claim queued jobs with FOR UPDATE SKIP LOCKED and hold a lease
+//   (locked_until) that they extend while the job runs
+// - a job whose lease expired (the process died) is claimed again and
+//   resumes from its per-employee checkpoints
+// - an identical request joins the active job instead of starting another
+// - jobs with the same scope (organization or employee) run one at a time
+// - subscribe() delivers progress updates: those of jobs run by this process
+//   as they happen, those of other processes through NOTIFY on every write
+const WORKER_ID = `${os.hostname()}:${process.pid}`;
+// Jobs run at once by this process
+const CONCURRENCY = parseInt(process.env.LOAD_JOB_CONCURRENCY) || 1;
+const POLL_INTERVAL_MS = parseInt(process.env.LOAD_JOB_POLL_INTERVAL_MS) || 5000;
+const LEASE_MS = parseInt(process.env.LOAD_JOB_LEASE_MS) || 2 * 60 * 1000;
+// A job whose worker died this many times is failed instead of resumed
+const MAX_ATTEMPTS = parseInt(process.env.LOAD_JOB_MAX_ATTEMPTS) || 3;
+// Finished jobs are kept this long for the progress API
+const RETENTION_HOURS = parseInt(process.env.LOAD_JOB_RETENTION_HOURS) || 24;
+// Progress updates are written at most this often
+const PROGRESS_FLUSH_MS = 1000;
+// Serializes claims, so two workers never start jobs of the same scope
+const CLAIM_LOCK_KEY = 'load_jobs_claim';
+// NOTIFY channel carrying the id of a job whose progress row was written
+const PROGRESS_CHANNEL = 'load_job_progress';
+// The progress listener is reopened this long after its connection failed
+const LISTEN_RETRY_MS = 5000;
+
+const ACTIVE_STATUSES = ['queued', 'running'];
+const running = new Set();       // ids (as strings) of jobs run by this process
+const progressEvents = new EventEmitter();
+progressEvents.setMaxListeners(0);
+let pollTimer = null;
+let lastCleanup = 0;
+let listenerStarted = false;
+
+// Request parameters in a fixed key order, so equal requests get equal keys
+function timesheetParams({ tableNumber, dateFrom, dateTo, objectBin, replaceMonths }) {
+  return {
+    tableNumber: tableNumber || null,
+    dateFrom,
+    dateTo,
+    objectBin: objectBin || null,
+    replaceMonths: Boolean(replaceMonths)
+  };
+}
+
+function jobScope(params) {
+  return params.tableNumber
+    ? `employee:${params.tableNumber}`
+    : `organization:${params.objectBin || apiSync.DEFAULT_BIN}`;
+}
+
+// Queue a timesheet load. Returns { job, created }; created is false when an
+// identical load is already queued or running and `job` is that one.
+async function enqueueTimesheetLoad(request) {
+  const params = timesheetParams(request);
+  const dedupeKey = `timesheet:${JSON.stringify(params)}`;
+  const progress = {
+    message: 'Ожидание запуска загрузки...',
+    currentDepartment: '',
+    eventsLoaded: 0,
+    totalEmployees: 0,
+    processedEmployees: 0
+  };
+
+  const inserted = await db.queryRow(`
+    INSERT INTO load_jobs (kind, params, dedupe_key, scope, progress)
+    VALUES ('timesheet', $1, $2, $3, $4)
+    ON CONFLICT (dedupe_key) WHERE status IN ('queued', 'running') DO NOTHING
+    RETURNING *
+  `, [params, dedupeKey, jobScope(params), progress]);
+
+  if (inserted) {
+    setImmediate(poll);
+    return { job: inserted, created: true };
+  }
+
+  const existing = await db.queryRow(
+    'SELECT * FROM load_jobs WHERE dedupe_key = $1 AND status = ANY($2)',
+    [dedupeKey, ACTIVE_STATUSES]
+  );
+  // The active job finished in between: queue a new one
+  return existing ? { job: existing, created: false } : enqueueTimesheetLoad(request);
+}
+
+async function getJob(id) {
+  if (!/^\d+$/.test(String(id))) return null;
+  return db.queryRow('SELECT * FROM load_jobs WHERE id = $1', [id]);
+}
+
+// Progress in the shape the admin panel has always polled
+function progressView(job) {
+  return {
+    ...job.progress,
+    id: String(job.id),
+    status: job.status === 'running' ? job.progress.status || 'loading' : job.status === 'queued' ? 'starting' : job.status,
+    startTime: job.started_at || job.created_at,
+    endTime: job.finished_at || undefined,
+    error: job.error || undefined,
+    attempts: job.attempts
+  };
+}
+
+// Take the oldest runnable job: queued, or running under an expired lease,
+// and not sharing its scope with a job under a live lease
+async function claimJob() {
+  return db.withTransaction(async (client) => {
+    await client.query('SELECT pg_advisory_xact_lock(hashtext($1))', [CLAIM_LOCK_KEY]);
+
+    const result = await client.query(`
+      UPDATE load_jobs
+      SET status = 'running',
+        locked_by = $1,
+        locked_until = CURRENT_TIMESTAMP + $2::int * INTERVAL '1 millisecond',
+        attempts = attempts + 1,
+        started_at = COALESCE(started_at, CURRENT_TIMESTAMP),
+        updated_at = CURRENT_TIMESTAMP
+      WHERE id = (
+        SELECT j.id
+        FROM load_jobs j
+        WHERE (j.status = 'queued'
+          OR (j.status = 'running' AND j.locked_until < CURRENT_TIMESTAMP AND j.attempts < $3))
+        AND NOT EXISTS (
+          SELECT 1 FROM load_jobs r
+          WHERE r.scope = j.scope
+          AND r.id <> j.id
+          AND r.status = 'running'
+          AND r.locked_until >= CURRENT_TIMESTAMP
+        )
+        ORDER BY j.created_at, j.id
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+      )
+      RETURNING *
+    `, [WORKER_ID, LEASE_MS, MAX_ATTEMPTS]);
+
+    return result.rows[0] || null;
+  });
+}
+
+// Fail jobs whose workers kept dying and forget old finished ones
+async function cleanup() {
+  await db.query(`
+    UPDATE load_jobs
+    SET status = 'error',
+      error = 'Обработчик загрузки прерывался ' || attempts || ' раз',
+      finished_at = CURRENT_TIMESTAMP,
+      updated_at = CURRENT_TIMESTAMP
+    WHERE status = 'running'
+    AND locked_until < CURRENT_TIMESTAMP
+    AND attempts >= $1
+  `, [MAX_ATTEMPTS]);
+
+  await db.query(`
+    DELETE FROM load_jobs
+    WHERE status IN ('completed', 'error')
+    AND finished_at < CURRENT_TIMESTAMP - $1::int * INTERVAL '1 hour'
+  `, [RETENTION_HOURS]);
+}
+
+// Progress of one running job: merged in memory, written back throttled.
+// Every write also extends the lease; a timer keeps extending it while the
+// job waits on something slow.
+function createProgressWriter(job) {
+  const progress = { ...job.progress };
+  let timer = null;
+  let writing = Promise.resolve();
+
+  const write = () => {
+    timer = null;
+    writing = writing.then(() => db.query(`
+      WITH updated AS (
+        UPDATE load_jobs
+        SET progress = $2,
+          locked_until = CURRENT_TIMESTAMP + $4::int * INTERVAL '1 millisecond',
+          updated_at = CURRENT_TIMESTAMP
+        WHERE id = $1 AND locked_by = $3
+        RETURNING id
+      )
+      SELECT pg_notify($5, id::text) FROM updated
+    `, [job.id, progress, WORKER_ID, LEASE_MS, PROGRESS_CHANNEL])).catch(error => {
+      log.error('Failed to save load job progress', { jobId: job.id, error });
+    });
+    return writing;
+  };
+
+  const heartbeat = setInterval(write, Math.max(1000, Math.floor(LEASE_MS / 3)));
+  heartbeat.unref();
+
+  return {
+    progress,
+    // Every update gets the next seq, the event id of the progress stream
+    update(update) {
+      Object.assign(progress, update, { seq: (progress.seq || 0) + 1 });
+      progressEvents.emit(String(job.id), progressView({ ...job, status: 'running', progress }));
+      if (!timer) timer = setTimeout(write, PROGRESS_FLUSH_MS);
+    },
+    async close() {
+      clearInterval(heartbeat);
+      if (timer) clearTimeout(timer);
+      await writing;
+    }
+  };
+}
+
+// Employees a job already finished, for resuming it
+async function createCheckpoints(job) {
+  const rows = await db.queryRows(
+    'SELECT employee_number, events_loaded FROM load_job_checkpoints WHERE job_id = $1',
+    [job.id]
+  );
+
+  return {
+    done: new Map(rows.map(row => [row.employee_number, row.events_loaded])),
+    async save(employeeNumber, eventsLoaded) {
+      await db.query(`
+        INSERT INTO load_job_checkpoints (job_id, employee_number, events_loaded)
+        VALUES ($1, $2, $3)
+        ON CONFLICT (job_id, employee_number) DO UPDATE SET
+          events_loaded = EXCLUDED.events_loaded,
+          completed_at = CURRENT_TIMESTAMP
+      `, [job.id, employeeNumber, eventsLoaded]);
+    }
+  };
+}
+
+async function runTimesheetJob(job, writer) {
+  const params = job.params;
+
+  writer.update({
+    status: 'loading',
+    message: job.attempts > 1
+      ? 'Продолжение прерванной загрузки событий из внешнего API...'
+      : 'Загрузка событий из внешнего API...'
+  });
+
+  // A month swap cannot continue a half-built replacement partition
+  const checkpoints = params.replaceMonths ? null : await createCheckpoints(job);
+
+  // Загрузка событий из внешнего API с прогрессом
+  const totalEvents = await apiSync.loadTimeEventsWithProgress(params, writer.update, {}, checkpoints);
+
+  writer.update({
+    status: 'processing',
+    message: 'Обработка и сохранение записей...'
+  });
+
+  // Пересчитываем только дни, затронутые загрузкой
+  const recalculation = await timeRecordsEngine.recalculateDirtyDays();
+  const processed = recalculation.processedRecords;
+
+  writer.update({
+    status: 'completed',
+    message: params.replaceMonths
+      ? `Загрузка завершена! Загружено ${totalEvents} событий, обработано ${processed} записей`
+      : `Загрузка завершена! Загружено ${totalEvents} событий (новых ${writer.progress.eventsNew || 0}), обработано ${processed} записей`,
+    eventsLoaded: totalEvents,
+    recordsProcessed: processed
+  });
+}
+
+const HANDLERS = {
+  timesheet: runTimesheetJob
+};
+
+async function runJob(job) {
+  const writer = createProgressWriter(job);
+  let status = 'completed';
+  let errorMessage = null;
+
+  try {
+    const handler = HANDLERS[job.kind];
+    if (!handler) throw new Error(`Неизвестный тип задачи: ${job.kind}`);
+    await handler(job, writer);
+  } catch (error) {
+    log.error('Load job failed', { jobId: job.id, error });
+    status = 'error';
+    errorMessage = error.message;
+    writer.update({ status: 'error', message: 'Ошибка загрузки: ' + error.message });
+  }
+
+  await writer.close();
+  await db.query(`
+    WITH updated AS (
+      UPDATE load_jobs
+      SET status = $2,
+        error = $3,
+        progress = $4,
+        locked_by = NULL,
+        locked_until = NULL,
+        finished_at = CURRENT_TIMESTAMP,
+        updated_at = CURRENT_TIMESTAMP
+      WHERE id = $1 AND locked_by = $5
+      RETURNING id
+    )
+    SELECT pg_notify($6, id::text) FROM updated
+  `, [job.id, status, errorMessage, writer.progress, WORKER_ID, PROGRESS_CHANNEL]);
+  // The job is still in `running`, so local subscribers are not served by the NOTIFY
+  progressEvents.emit(String(job.id), progressView({
+    ...job,
+    status,
+    error: errorMessage,
+    progress: writer.progress,
+    finished_at: new Date()
+  }));
+}
+
+// Claim and start jobs until this process runs CONCURRENCY of them
+async function poll() {
+  try {
+    if (Date.now() - lastCleanup > 60 * 60 * 1000) {
+      lastCleanup = Date.now();
+      await cleanup();
+    }
+
+    while (running.size < CONCURRENCY) {
+      const job = await claimJob();
+      if (!job) return;
+
+      log.info('Load job claimed', { jobId: job.id, kind: job.kind, workerId: WORKER_ID, attempt: job.attempts });
+      running.add(String(job.id));
+      runJob(job)
+        .catch(error => log.error('Load job could not be finished', { jobId: job.id, error }))
+        .finally(() => {
+          running.delete(String(job.id));
+          setImmediate(poll);
+        });
+    }
+  } catch (error) {
+    log.error('Load job poll failed', error);
+  }
+}
+
+// Poll for jobs now and then every POLL_INTERVAL_MS
+function startWorker() {
+  if (pollTimer) return;
+  pollTimer = setInterval(poll, POLL_INTERVAL_MS);
+  pollTimer.unref();
+  return poll();
+}
+
+function stats() {
+  return {
+    workerId: WORKER_ID,
+    concurrency: CONCURRENCY,
+    running: [...running],
+    subscribers: progressEvents.eventNames().length
+  };
+}
+
+// A job written by another process: re-read it for the local subscribers
+async function onProgressNotification(id) {
+  if (running.has(id) || progressEvents.listenerCount(id) === 0) return;
+  try {
+    const job = await getJob(id);
+    if (job) progressEvents.emit(id, progressView(job));
+  } catch (error) {
+    log.error('Failed to read load job progress', { jobId: id, error });
+  }
+}
+
+// One pooled client per serving process LISTENs for progress writes. It is
+// opened at startup rather than by the first subscriber, so the connection it
+// keeps is not charged to a request (pool metrics, Server-Timing), and it is
+// reopened after a connection error.
+function startListener() {
+  if (listenerStarted) return;
+  listenerStarted = true;
+  return openListener();
+}
+
+async function openListener() {
+  let client = null;
+  let closed = false;
+  const fail = (message, error) => {
+    if (closed) return;
+    closed = true;
+    log.error(message, error);
+    if (client) client.release(error);
+    setTimeout(openListener, LISTEN_RETRY_MS).unref();
+  };
+
+  try {
+    client = await db.pool.connect();
+    client.on('notification', (message) => onProgressNotification(message.payload));
+    client.on('error', (error) => fail('Load job progress listener failed', error));
+    await client.query(`LISTEN ${PROGRESS_CHANNEL}`);
+  } catch (error) {
+    fail('Load job progress listener could not start', error);
+  }
+}
+
+// Call listener(view) with the progressView of every update of the job until
+// the returned function is called
+function subscribe(jobId, listener) {
+  const key = String(jobId);
+  progressEvents.on(key, listener);
+  return () => progressEvents.off(key, listener);
+}
+
+module.exports = {
+  enqueueTimesheetLoad,
+  getJob,
+  progressView,
+  subscribe,
+  startListener,
+  startWorker,
+  stats
+};
@@ -0,0 +1,160 @@
+const fs = require('fs');
+
+// Structured, leveled logging. One line per entry (JSON, or plain text with
+// LOG_FORMAT=text) with time, level, module, message and fields:
+//
+//   const log = require('../utils/logger')('apiSync');
+//   log.info('Synced departments', { count: 12 });
+//   log.error('Error syncing departments', error);
+//
+// LOG_LEVEL sets the default level (error, warn, info, debug); LOG_MODULES
+// overrides it per module, e.g. "hoursCalculator=debug,telegram=warn".
+// Disabled levels cost one comparison, so checks in hot loops are cheap;
+// per-row debug output should go through log.sampled(), which lets one call
+// in LOG_SAMPLE_EVERY through.
+//
+// Entries are buffered and written to stdout in batches after the current
+// tick instead of one synchronous write per line. While stdout is not
+// draining, at most LOG_BUFFER_LINES lines wait; the ones beyond that are
+// counted in stats().dropped and reported once the stream catches up.
+
+const LEVELS = { error: 0, warn: 1, info: 2, debug: 3 };
+const FORMAT = process.env.LOG_FORMAT === 'text' ? 'text' : 'json';
+const DEFAULT_LEVEL = LEVELS[process.env.LOG_LEVEL] !== undefined ? process.env.LOG_LEVEL : 'info';
+const SAMPLE_EVERY = parseInt(process.env.LOG_SAMPLE_EVERY) || 100;
+const BUFFER_LINES = parseInt(process.env.LOG_BUFFER_LINES) || 10000;
+
+// module name -> level name, from LOG_MODULES
+const moduleLevels = new Map(
+  (process.env.LOG_MODULES || '')
+    .split(',')
+    .map(entry => entry.trim().split('='))
+    .filter(([name, level]) => name && LEVELS[level] !== undefined)
+);
+
+const counters = { written: 0, dropped: 0, flushes: 0 };
+let reportedDropped = 0;
+let buffer = [];
+let flushScheduled = false;
+let waitingForDrain = false;
+
+function flush() {
+  flushScheduled = false;
+  if (waitingForDrain || buffer.length === 0) return;
+
+  if (counters.dropped > reportedDropped) {
+    buffer.push(format('warn', 'logger', 'Log lines dropped while stdout was busy', {
+      dropped: counters.dropped - reportedDropped
+    }));
+    reportedDropped = counters.dropped;
+  }
+
+  const chunk = buffer.join('');
+  counters.written += buffer.length;
+  counters.flushes++;
+  buffer = [];
+  if (!process.stdout.write(chunk)) {
+    waitingForDrain = true;
+    process.stdout.once('drain', () => {
+      waitingForDrain = false;
+      flush();
+    });
+  }
+}
+
+function enqueue(line) {
+  if (buffer.length >= BUFFER_LINES) {
+    counters.dropped++;
+    return;
+  }
+  buffer.push(line);
+  if (!flushScheduled) {
+    flushScheduled = true;
+    setImmediate(flush);
+  }
+}
+
+// Whatever is still buffered goes out synchronously when the process ends
+process.on('exit', () => {
+  if (buffer.length === 0) return;
+  try {
+    fs.writeSync(1, buffer.join(''));
+  } catch (error) {
+    // stdout is gone; nothing left to report to
+  }
+  buffer = [];
+});
+
+function serializeError(error) {
+  return { message: error.message, code: error.code, stack: error.stack };
+}
+
+// Second argument of a log call as fields: an Error, a plain value or an object
+function toFields(fields) {
+  if (fields === undefined || fields === null) return {};
+  if (fields instanceof Error) return { error: serializeError(fields) };
+  if (typeof fields !== 'object') return { detail: fields };
+  const result = {};
+  for (const [key, value] of Object.entries(fields)) {
+    result[key] = value instanceof Error ? serializeError(value) : value;
+  }
+  return result;
+}
+
+function format(level, module, message, fields) {
+  const time = new Date().toISOString();
+  const data = toFields(fields);
+  if (FORMAT === 'text') {
+    const extra = Object.keys(data).length > 0 ? ` ${JSON.stringify(data)}` : '';
+    return `${time} ${level.toUpperCase()} [${module}] ${message}${extra}\n`;
+  }
+  return JSON.stringify({ time, level, module, msg: message, ...data }) + '\n';
+}
+
+function levelOf(module) {
+  return LEVELS[moduleLevels.get(module) || DEFAULT_LEVEL];
+}
+
+function createLogger(module) {
+  const threshold = levelOf(module);
+
+  const logger = { module };
+  for (const level of Object.keys(LEVELS)) {
+    logger[level] = LEVELS[level] <= threshold
+      ? (message, fields) => enqueue(format(level, module, message, fields))
+      : () => {};
+  }
+
+  logger.isEnabled = (level) => LEVELS[level] <= threshold;
+
+  // Same methods, but only one call in `every` is written
+  logger.sampled = (every = SAMPLE_EVERY) => {
+    let calls = 0;
+    const sampled = { module };
+    for (const level of Object.keys(LEVELS)) {
+      sampled[level] = LEVELS[level] <= threshold
+        ? (message, fields) => {
+          if (calls++ % every === 0) logger[level](message, { ...toFields(fields), sampleEvery: every });
+        }
+        : () => {};
+    }
+    return sampled;
+  };
+
+  return logger;
+}
+
+function stats() {
+  return {
+    level: DEFAULT_LEVEL,
+    modules: Object.fromEntries(moduleLevels),
+    buffered: buffer.length,
+    written: counters.written,
+    dropped: counters.dropped,
+    flushes: counters.flushes
+  };
+}
+
+module.exports = createLogger;
+module.exports.stats = stats;
+module.exports.flush = flush;
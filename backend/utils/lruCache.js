@@ -0,0 +1,71 @@
+// Small in-process LRU cache with a per-entry TTL. A Map keeps insertion
+// order, so re-inserting on read moves an entry to the young end and the
+// first key is always the least recently used one.
+function createLruCache({ max = 1000, ttlMs = 0 } = {}) {
+  const entries = new Map();
+  const counters = { hits: 0, misses: 0, evictions: 0 };
+
+  function isExpired(entry) {
+    return ttlMs > 0 && Date.now() - entry.storedAt > ttlMs;
+  }
+
+  function get(key) {
+    const entry = entries.get(key);
+    if (!entry || isExpired(entry)) {
+      if (entry) entries.delete(key);
+      counters.misses++;
+      return undefined;
+    }
+    entries.delete(key);
+    entries.set(key, entry);
+    counters.hits++;
+    return entry.value;
+  }
+
+  // meta is kept next to the value for deleteWhere()
+  function set(key, value, meta = {}) {
+    entries.delete(key);
+    entries.set(key, { value, meta, storedAt: Date.now() });
+    while (entries.size > max) {
+      entries.delete(entries.keys().next().value);
+      counters.evictions++;
+    }
+  }
+
+  function del(key) {
+    return entries.delete(key);
+  }
+
+  // Delete every entry for which predicate(key, meta) is true
+  function deleteWhere(predicate) {
+    let deleted = 0;
+    for (const [key, entry] of entries) {
+      if (predicate(key, entry.meta)) {
+        entries.delete(key);
+        deleted++;
+      }
+    }
+    return deleted;
+  }
+
+  function clear() {
+    const size = entries.size;
+    entries.clear();
+    return size;
+  }
+
+  function stats() {
+    const lookups = counters.hits + counters.misses;
+    return {
+      size: entries.size,
+      max,
+      ttlMs,
+      ...counters,
+      hitRate: lookups > 0 ? Math.round((counters.hits / lookups) * 1000) / 1000 : null
+    };
+  }
+
+  return { get, set, delete: del, deleteWhere, clear, stats };
+}
+
+module.exports = { createLruCache };
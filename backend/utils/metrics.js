@@ -0,0 +1,149 @@
+// In-process metrics in the Prometheus text format, served by /api/metrics.
+//
+//   const metrics = require('../utils/metrics');
+//   const duration = metrics.histogram('db_query_duration_seconds', 'Query latency', ['label']);
+//   duration.observe({ label: 'select time_records' }, 0.012);
+//
+// Gauges read their value when scraped: metrics.gauge(name, help, collect)
+// where collect() returns a number or [{ labels, value }].
+//
+// Values are per process. Under cluster.js every worker keeps its own, and a
+// scrape through the shared port sees the worker that answered it; every
+// series carries that worker's pid so they do not mix.
+
+// Seconds; from a primary key lookup to a month recalculation
+const DEFAULT_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30];
+
+const CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8';
+
+const registry = new Map();
+const PID = String(process.pid);
+
+function register(name, metric) {
+  if (registry.has(name)) throw new Error(`Metric ${name} is already registered`);
+  registry.set(name, metric);
+  return metric;
+}
+
+function escapeLabel(value) {
+  return String(value).replace(/\\/g, '\\\\').replace(/\n/g, '\\n').replace(/"/g, '\\"');
+}
+
+function formatLabels(labels) {
+  const pairs = Object.entries({ ...labels, pid: PID })
+    .map(([key, value]) => `${key}="${escapeLabel(value)}"`);
+  return `{${pairs.join(',')}}`;
+}
+
+function formatValue(value) {
+  if (value === Infinity) return '+Inf';
+  if (value === -Infinity) return '-Inf';
+  return Number.isNaN(value) ? 'NaN' : String(value);
+}
+
+// Series of a labelled metric, keyed by its label values in labelNames order
+function seriesKey(labelNames, labels) {
+  return labelNames.map(name => (labels && labels[name] !== undefined ? String(labels[name]) : '')).join('\u0000');
+}
+
+function labelsOf(labelNames, key) {
+  const values = key.split('\u0000');
+  return Object.fromEntries(labelNames.map((name, i) => [name, values[i]]));
+}
+
+function histogram(name, help, labelNames = [], buckets = DEFAULT_BUCKETS) {
+  const series = new Map();
+
+  function observe(labels, value) {
+    const key = seriesKey(labelNames, labels);
+    let entry = series.get(key);
+    if (!entry) {
+      entry = { counts: new Array(buckets.length).fill(0), sum: 0, count: 0 };
+      series.set(key, entry);
+    }
+    // Cumulative buckets are summed up when rendered
+    const index = buckets.findIndex(bound => value <= bound);
+    if (index >= 0) entry.counts[index]++;
+    entry.sum += value;
+    entry.count++;
+  }
+
+  function render() {
+    const lines = [`# HELP ${name} ${help}`, `# TYPE ${name} histogram`];
+    for (const [key, entry] of series) {
+      const labels = labelsOf(labelNames, key);
+      let cumulative = 0;
+      buckets.forEach((bound, i) => {
+        cumulative += entry.counts[i];
+        lines.push(`${name}_bucket${formatLabels({ ...labels, le: formatValue(bound) })} ${cumulative}`);
+      });
+      lines.push(`${name}_bucket${formatLabels({ ...labels, le: '+Inf' })} ${entry.count}`);
+      lines.push(`${name}_sum${formatLabels(labels)} ${formatValue(entry.sum)}`);
+      lines.push(`${name}_count${formatLabels(labels)} ${entry.count}`);
+    }
+    return lines;
+  }
+
+  return register(name, { observe, render });
+}
+
+function counter(name, help, labelNames = []) {
+  const series = new Map();
+
+  function inc(labels, amount = 1) {
+    const key = seriesKey(labelNames, labels);
+    series.set(key, (series.get(key) || 0) + amount);
+  }
+
+  function render() {
+    const lines = [`# HELP ${name} ${help}`, `# TYPE ${name} counter`];
+    for (const [key, value] of series) {
+      lines.push(`${name}${formatLabels(labelsOf(labelNames, key))} ${formatValue(value)}`);
+    }
+    return lines;
+  }
+
+  return register(name, { inc, render });
+}
+
+function gauge(name, help, collect) {
+  function render() {
+    const lines = [`# HELP ${name} ${help}`, `# TYPE ${name} gauge`];
+    const value = collect();
+    const samples = Array.isArray(value) ? value : [{ labels: {}, value }];
+    for (const sample of samples) {
+      lines.push(`${name}${formatLabels(sample.labels)} ${formatValue(sample.value)}`);
+    }
+    return lines;
+  }
+
+  return register(name, { render });
+}
+
+// Every registered metric, in registration order
+function render() {
+  const lines = [];
+  for (const metric of registry.values()) lines.push(...metric.render());
+  return lines.join('\n') + '\n';
+}
+
+// GET /api/metrics. With METRICS_TOKEN set, the scraper has to send it as
+// "Authorization: Bearer <token>".
+function handler(req, res) {
+  const token = process.env.METRICS_TOKEN;
+  if (token && req.headers.authorization !== `Bearer ${token}`) {
+    return res.status(401).json({ error: 'Unauthorized' });
+  }
+  res.set('Content-Type', CONTENT_TYPE);
+  res.send(render());
+}
+
+module.exports = {
+  CONTENT_TYPE,
+  DEFAULT_BUCKETS,
+  histogram,
+  counter,
+  gauge,
+  render,
+  handler
+};
@@ -0,0 +1,76 @@
+const db = require('../database_pg');
+
+// payroll_shifts holds the schedule day of every employee-day covered by a 1C
+// schedule assignment: the expansion the payroll reports split payroll over.
+// Writers of assignments and schedule days rebuild the rows they affect; a
+// rebuild recomputes them from the source tables, so repeating one is harmless.
+// Payroll is not copied here, the reports read it from employees.
+// Every function takes an optional executor (a pinned client or the db module)
+// so the rows change in the same transaction as their sources.
+
+// Rebuild the rows of the given employees in [dateFrom, dateTo]; a null bound is open
+async function refreshEmployees(employeeNumbers, dateFrom = null, dateTo = null, executor = db) {
+  if (!employeeNumbers || employeeNumbers.length === 0) return 0;
+
+  const params = [employeeNumbers, dateFrom, dateTo];
+
+  await executor.query(`
+    DELETE FROM payroll_shifts
+    WHERE employee_number = ANY($1)
+    AND ($2::date IS NULL OR work_date >= $2::date)
+    AND ($3::date IS NULL OR work_date <= $3::date)
+  `, params);
+
+  // Every day takes the schedule of the one assignment in force on it
+  const result = await executor.query(`
+    INSERT INTO payroll_shifts (employee_number, work_date, schedule_code, schedule_name, time_type, work_hours, updated_at)
+    SELECT
+      esa.employee_number,
+      ws.work_date,
+      ws.schedule_code,
+      ws.schedule_name,
+      ws.time_type,
+      ws.work_hours,
+      CURRENT_TIMESTAMP
+    FROM employee_schedule_assignments esa
+    JOIN work_schedules_1c ws ON ws.schedule_code = esa.schedule_code
+      AND esa.valid_during @> ws.work_date
+    WHERE esa.employee_number = ANY($1)
+    AND esa.valid_during && daterange($2::date, $3::date, '[]')
+    AND ($2::date IS NULL OR ws.work_date >= $2::date)
+    AND ($3::date IS NULL OR ws.work_date <= $3::date)
+    ON CONFLICT (employee_number, work_date) DO UPDATE SET
+      schedule_code = EXCLUDED.schedule_code,
+      schedule_name = EXCLUDED.schedule_name,
+      time_type = EXCLUDED.time_type,
+      work_hours = EXCLUDED.work_hours,
+      updated_at = CURRENT_TIMESTAMP
+  `, params);
+
+  return result.rowCount;
+}
+
+// Rebuild [dateFrom, dateTo] of every employee assigned to one of the
+// schedule codes in that period
+async function refreshSchedules(scheduleCodes, dateFrom, dateTo, executor = db) {
+  if (!scheduleCodes || scheduleCodes.length === 0) return 0;
+
+  const assigned = await executor.query(`
+    SELECT DISTINCT employee_number
+    FROM employee_schedule_assignments
+    WHERE schedule_code = ANY($1)
+    AND valid_during && daterange($2::date, $3::date, '[]')
+  `, [scheduleCodes, dateFrom, dateTo]);
+
+  return refreshEmployees(
+    assigned.rows.map(row => row.employee_number),
+    dateFrom,
+    dateTo,
+    executor
+  );
+}
+
+module.exports = {
+  refreshEmployees,
+  refreshSchedules
+};
@@ -0,0 +1,114 @@
+// Month and date filters as half-open ranges on the raw column, so
+// `column >= start AND column < end` can use a btree index. Wrapping the
+// column instead (to_char, DATE(), ::date, EXTRACT) forces a scan.
+
+const MONTH_PATTERN = /^(\d{4})-(\d{2})$/;
+const DATE_PATTERN = /^\d{4}-\d{2}-\d{2}$/;
+
+const pad = (n) => n.toString().padStart(2, '0');
+
+// Half-open [start, end) range of a month given as year and month numbers
+function yearMonthBounds(year, month) {
+  const yearNumber = parseInt(year);
+  const monthNumber = parseInt(month);
+  if (!yearNumber || !(monthNumber >= 1 && monthNumber <= 12)) return null;
+
+  const nextYear = monthNumber === 12 ? yearNumber + 1 : yearNumber;
+  const nextMonth = monthNumber === 12 ? 1 : monthNumber + 1;
+
+  return {
+    start: `${yearNumber}-${pad(monthNumber)}-01`,
+    end: `${nextYear}-${pad(nextMonth)}-01`
+  };
+}
+
+// Convert 'YYYY-MM' into a half-open [start, end) date range
+function monthBounds(month) {
+  const match = MONTH_PATTERN.exec(month || '');
+  if (!match) return null;
+  return yearMonthBounds(match[1], match[2]);
+}
+
+// 'YYYY-MM-DD' of the day `days` days later (earlier when negative)
+function addDays(date, days) {
+  const d = new Date(`${date}T00:00:00Z`);
+  d.setUTCDate(d.getUTCDate() + days);
+  return d.toISOString().split('T')[0];
+}
+
+// 'YYYY-MM-DD' of the following day
+function nextDay(date) {
+  return addDays(date, 1);
+}
+
+function isValidDate(date) {
+  return DATE_PATTERN.test(date || '') && !isNaN(Date.parse(date));
+}
+
+// Inclusive 'YYYY-MM-DD' bounds (either may be missing) as [start, end)
+function dateBounds(dateFrom, dateTo) {
+  if ((dateFrom && !isValidDate(dateFrom)) || (dateTo && !isValidDate(dateTo))) return null;
+  return {
+    start: dateFrom || null,
+    end: dateTo ? nextDay(dateTo) : null
+  };
+}
+
+// Collects WHERE conditions with positional parameters, continuing the
+// numbering of `params`:
+//   const filters = createFilters(params).equals('e.object_bin', organization).month('tr.date', month);
+//   query += filters.toSql();
+function createFilters(params = []) {
+  const conditions = [];
+  const param = (value) => {
+    params.push(value);
+    return `$${params.length}`;
+  };
+
+  const filters = {
+    params,
+    conditions,
+
+    equals(column, value) {
+      if (value !== undefined && value !== null && value !== '') {
+        conditions.push(`${column} = ${param(value)}`);
+      }
+      return filters;
+    },
+
+    // An invalid range matches nothing rather than silently matching everything
+    range(column, bounds) {
+      if (!bounds) {
+        conditions.push('FALSE');
+        return filters;
+      }
+      if (bounds.start) conditions.push(`${column} >= ${param(bounds.start)}`);
+      if (bounds.end) conditions.push(`${column} < ${param(bounds.end)}`);
+      return filters;
+    },
+
+    month(column, month) {
+      return month ? filters.range(column, monthBounds(month)) : filters;
+    },
+
+    dates(column, dateFrom, dateTo) {
+      return dateFrom || dateTo ? filters.range(column, dateBounds(dateFrom, dateTo)) : filters;
+    },
+
+    // " AND ..." for appending to a query that already has a WHERE clause
+    toSql() {
+      return conditions.map(condition => ` AND ${condition}`).join('');
+    }
+  };
+
+  return filters;
+}
+
+module.exports = {
+  yearMonthBounds,
+  monthBounds,
+  addDays,
+  nextDay,
+  dateBounds,
+  createFilters
+};
@@ -0,0 +1,197 @@
+const { createLruCache } = require('./lruCache');
+const clusterBus = require('./clusterBus');
+
+// Computed monthly reports served to the mini app:
+// - timesheets: /employee/by-number/:tableNumber/timesheet, per (employee, month)
+// - departmentStats: /employee/by-number/:tableNumber/department-stats, per (department, month)
+// Every entry remembers the employees and schedule codes it was built from.
+// Writers of time_records, daily_attendance, schedule assignments and 1C
+// schedules invalidate the affected entries; the TTL only bounds staleness of
+// data nobody announces (employee names, department membership).
+// Under cluster.js every process has its own caches: invalidations are
+// described as plain data and published to the other processes (clusterBus).
+
+const counters = { invalidations: 0 };
+
+function monthKey(year, month) {
+  return `${year}-${month.toString().padStart(2, '0')}`;
+}
+
+function today() {
+  return new Date().toISOString().split('T')[0];
+}
+
+function createReportCache({ max, ttlMs }) {
+  const cache = createLruCache({ max, ttlMs });
+  const key = (id, year, month) => `${id}|${monthKey(year, month)}`;
+
+  function get(id, year, month) {
+    const entry = cache.get(key(id, year, month));
+    // Future days turn from 'planned' into real statuses at midnight
+    if (entry && entry.day !== today()) {
+      cache.delete(key(id, year, month));
+      return undefined;
+    }
+    return entry && entry.report;
+  }
+
+  function set(id, year, month, report, { employees = [], scheduleCodes = [] } = {}) {
+    cache.set(key(id, year, month), { report, day: today() }, {
+      month: monthKey(year, month),
+      employees: new Set(employees),
+      scheduleCodes: new Set(scheduleCodes.filter(Boolean))
+    });
+  }
+
+  return { get, set, cache };
+}
+
+const timesheets = createReportCache({
+  max: parseInt(process.env.TIMESHEET_CACHE_SIZE) || 5000,
+  ttlMs: parseInt(process.env.TIMESHEET_CACHE_TTL_MS) || 10 * 60 * 1000
+});
+
+const departmentStats = createReportCache({
+  max: parseInt(process.env.DEPARTMENT_STATS_CACHE_SIZE) || 500,
+  ttlMs: parseInt(process.env.DEPARTMENT_STATS_CACHE_TTL_MS) || 10 * 60 * 1000
+});
+
+const caches = [timesheets, departmentStats];
+
+const MESSAGE_TYPE = 'reportCache.invalidate';
+
+// 'YYYY-MM' of a 'YYYY-MM-DD' string or a DATE column parsed by pg
+function dateMonth(date) {
+  return date instanceof Date
+    ? monthKey(date.getFullYear(), date.getMonth() + 1)
+    : String(date).slice(0, 7);
+}
+
+// { from, to } 'YYYY-MM' months of [dateFrom, dateTo]; a missing bound stays null
+function months(dateFrom, dateTo) {
+  return {
+    from: dateFrom ? dateMonth(dateFrom) : null,
+    to: dateTo ? dateMonth(dateTo) : null
+  };
+}
+
+// Test for 'YYYY-MM' months in [from, to]; a missing bound is open
+function monthRange(from, to) {
+  const lower = from || '';
+  const upper = to || '9999-99';
+  return (month) => month >= lower && month <= upper;
+}
+
+function intersects(set, values) {
+  for (const value of values) {
+    if (set.has(value)) return true;
+  }
+  return false;
+}
+
+// Predicates over entry meta, built from the relayed descriptions; months
+// are 'YYYY-MM' strings, a missing bound is open. Kind 'all' clears everything.
+const PREDICATES = {
+  days: ({ employeesByMonth }) => {
+    const byMonth = new Map(employeesByMonth.map(([month, employees]) => [month, employees]));
+    return (meta) => byMonth.has(meta.month) && intersects(meta.employees, byMonth.get(meta.month));
+  },
+  employees: ({ employeeNumbers, from, to }) => {
+    const inRange = monthRange(from, to);
+    return (meta) => inRange(meta.month) && intersects(meta.employees, employeeNumbers);
+  },
+  schedules: ({ scheduleCodes, from, to }) => {
+    const inRange = monthRange(from, to);
+    return (meta) => inRange(meta.month) && intersects(meta.scheduleCodes, scheduleCodes);
+  },
+  period: ({ from, to }) => {
+    const inRange = monthRange(from, to);
+    return (meta) => inRange(meta.month);
+  }
+};
+
+function apply({ kind, spec }) {
+  if (kind === 'all') {
+    for (const { cache } of caches) {
+      counters.invalidations += cache.clear();
+    }
+    return;
+  }
+  const predicate = PREDICATES[kind](spec);
+  for (const { cache } of caches) {
+    counters.invalidations += cache.deleteWhere((cacheKey, meta) => predicate(meta));
+  }
+}
+
+clusterBus.subscribe(MESSAGE_TYPE, apply);
+
+// Inside a transaction the entries are dropped now and again after COMMIT,
+// so a request that read the old rows in between cannot keep them cached
+function invalidate(kind, spec, executor) {
+  const invalidation = { kind, spec };
+  const run = () => {
+    apply(invalidation);
+    clusterBus.publish(MESSAGE_TYPE, invalidation);
+  };
+  run();
+  if (executor && executor.afterCommit) executor.afterCommit(run);
+}
+
+// Explicit (employee_number, date) pairs, e.g. written time_records rows
+function invalidateDays(days, executor = null) {
+  if (!days || days.length === 0) return;
+  const employeesByMonth = new Map();
+  for (const day of days) {
+    const month = dateMonth(day.date);
+    if (!employeesByMonth.has(month)) employeesByMonth.set(month, new Set());
+    employeesByMonth.get(month).add(day.employee_number);
+  }
+  invalidate('days', {
+    employeesByMonth: [...employeesByMonth].map(([month, employees]) => [month, [...employees]])
+  }, executor);
+}
+
+function invalidateEmployees(employeeNumbers, dateFrom = null, dateTo = null, executor = null) {
+  if (!employeeNumbers || employeeNumbers.length === 0) return;
+  invalidate('employees', { employeeNumbers, ...months(dateFrom, dateTo) }, executor);
+}
+
+// Reports built from one of the schedule codes
+function invalidateSchedules(scheduleCodes, dateFrom = null, dateTo = null, executor = null) {
+  if (!scheduleCodes || scheduleCodes.length === 0) return;
+  invalidate('schedules', { scheduleCodes, ...months(dateFrom, dateTo) }, executor);
+}
+
+// Every report for a month touching [dateFrom, dateTo]
+function invalidatePeriod(dateFrom, dateTo, executor = null) {
+  invalidate('period', months(dateFrom, dateTo), executor);
+}
+
+// Every report for one 'YYYY-MM' month
+function invalidateMonth(month, executor = null) {
+  invalidate('period', { from: month, to: month }, executor);
+}
+
+function clear() {
+  invalidate('all', {}, null);
+}
+
+function stats() {
+  return {
+    timesheet: timesheets.cache.stats(),
+    departmentStats: departmentStats.cache.stats(),
+    ...counters
+  };
+}
+
+module.exports = {
+  timesheets,
+  departmentStats,
+  invalidateDays,
+  invalidateEmployees,
+  invalidateSchedules,
+  invalidatePeriod,
+  invalidateMonth,
+  clear,
+  stats
+};
@@ -0,0 +1,98 @@
+const { AsyncLocalStorage } = require('async_hooks');
+const { performance } = require('perf_hooks');
+
+// Where the time of an API request goes. middleware() gives every request a
+// timing record that follows it through its async work; database_pg.js adds
+// the time spent waiting for a pool connection and running queries to the
+// record of the request that checked the connection out. The response gets
+//
+//   Server-Timing: db;dur=12.4;desc="5 queries", pool;dur=0.3, compute;dur=3.1, total;dur=15.8
+//
+// db and pool count wall time with at least one query running (or one
+// checkout waiting), so queries run in parallel are not counted twice;
+// compute is what is left of total. The header goes out with the response
+// headers, so a streamed response reports the work done before its first
+// chunk.
+
+const storage = new AsyncLocalStorage();
+
+function createSpan() {
+  return { inFlight: 0, since: 0, ms: 0 };
+}
+
+function spanMs(span, now) {
+  return span.ms + (span.inFlight > 0 ? now - span.since : 0);
+}
+
+// Timing record of the request being served, undefined outside a request
+function current() {
+  return storage.getStore();
+}
+
+// Start a `db` or `pool` span of a timing record; returns the function that
+// ends it. Without a record (background work) both are no-ops.
+function begin(timing, kind) {
+  if (!timing) return () => {};
+  const span = timing[kind];
+  if (span.inFlight++ === 0) span.since = performance.now();
+  if (kind === 'db') timing.queries++;
+
+  let ended = false;
+  return () => {
+    if (ended) return;
+    ended = true;
+    if (--span.inFlight === 0) span.ms += performance.now() - span.since;
+  };
+}
+
+// "GET /api/employee/by-number/:tableNumber/timesheet/:year/:month": the
+// route pattern rather than the URL, so it can label metrics; 'background'
+// outside a request
+function endpointOf(timing) {
+  if (!timing) return 'background';
+  const { req } = timing;
+  if (!req.route) return `${req.method} unmatched`;
+  return `${req.method} ${req.baseUrl}${req.route.path}`;
+}
+
+function serverTiming(timing) {
+  const now = performance.now();
+  const total = now - timing.started;
+  const db = spanMs(timing.db, now);
+  const pool = spanMs(timing.pool, now);
+  const compute = Math.max(0, total - db - pool);
+  return [
+    `db;dur=${db.toFixed(1)};desc="${timing.queries} queries"`,
+    `pool;dur=${pool.toFixed(1)}`,
+    `compute;dur=${compute.toFixed(1)}`,
+    `total;dur=${total.toFixed(1)}`
+  ].join(', ');
+}
+
+// Mount after the body parsers: they call next() from stream events, which
+// would run the routes outside the request's async context
+function middleware(req, res, next) {
+  const timing = {
+    req,
+    started: performance.now(),
+    db: createSpan(),
+    pool: createSpan(),
+    queries: 0
+  };
+
+  // Every way of sending a response ends in writeHead
+  const writeHead = res.writeHead;
+  res.writeHead = function (...args) {
+    if (!res.headersSent) res.setHeader('Server-Timing', serverTiming(timing));
+    return writeHead.apply(this, args);
+  };
+
+  storage.run(timing, next);
+}
+
+module.exports = {
+  current,
+  begin,
+  endpointOf,
+  middleware
+};
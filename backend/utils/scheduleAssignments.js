@@ -0,0 +1,179 @@
+const dirtyDays = require('./dirtyDays');
+const payrollShifts = require('./payrollShifts');
+
+const DATE_PATTERN = /^\d{4}-\d{2}-\d{2}$/;
+
+// Insert open-ended assignments ({ employee_id, employee_number,
+// schedule_code, start_date }, at most one per employee and start date) and
+// fit them into the employees' histories so no two assignments overlap, as
+// the exclusion constraint on valid_during requires by COMMIT:
+// an assignment with the same start is replaced, and every assignment ends
+// the day before the next one starts, the same "later start wins" readers
+// used to apply. Must run inside a transaction.
+// Returns the inserted rows and the ids of the other assignments that were
+// replaced or shortened.
+async function placeAssignments(client, assignments) {
+  if (assignments.length === 0) return { inserted: [], changed: [] };
+
+  const employeeNumbers = [...new Set(assignments.map(entry => entry.employee_number))];
+
+  const replaced = await client.query(`
+    DELETE FROM employee_schedule_assignments esa
+    USING UNNEST($1::text[], $2::date[]) AS v(employee_number, start_date)
+    WHERE esa.employee_number = v.employee_number
+    AND esa.start_date = v.start_date
+    RETURNING esa.id
+  `, [
+    assignments.map(entry => entry.employee_number),
+    assignments.map(entry => entry.start_date)
+  ]);
+
+  const inserted = await client.query(`
+    INSERT INTO employee_schedule_assignments
+    (employee_id, employee_number, schedule_code, start_date, assigned_by)
+    SELECT employee_id, employee_number, schedule_code, start_date, '1C'
+    FROM UNNEST($1::int[], $2::text[], $3::text[], $4::date[])
+      AS v(employee_id, employee_number, schedule_code, start_date)
+    RETURNING *
+  `, [
+    assignments.map(entry => entry.employee_id),
+    assignments.map(entry => entry.employee_number),
+    assignments.map(entry => entry.schedule_code),
+    assignments.map(entry => entry.start_date)
+  ]);
+
+  const trimmed = await client.query(`
+    UPDATE employee_schedule_assignments esa
+    SET end_date = n.next_start_date - 1, updated_at = CURRENT_TIMESTAMP
+    FROM (
+      SELECT id, LEAD(start_date) OVER (PARTITION BY employee_number ORDER BY start_date) as next_start_date
+      FROM employee_schedule_assignments
+      WHERE employee_number = ANY($1)
+    ) n
+    WHERE esa.id = n.id
+    AND n.next_start_date IS NOT NULL
+    AND (esa.end_date IS NULL OR esa.end_date >= n.next_start_date)
+    RETURNING esa.id
+  `, [employeeNumbers]);
+
+  const insertedIds = new Set(inserted.rows.map(row => row.id));
+  return {
+    inserted: inserted.rows,
+    changed: [...replaced.rows, ...trimmed.rows]
+      .map(row => row.id)
+      .filter(id => !insertedIds.has(id))
+  };
+}
+
+// Assign 1C schedules to a batch of employees with a fixed number of
+// statements: one lookup for employees, one for schedules and the three of
+// placeAssignments().
+// Items are reported in the same way as when they were handled one by one.
+async function assignSchedules(client, assignments) {
+  const result = { assigned: 0, skipped: 0, errors: [], assignments: [] };
+
+  // One entry per payload item, in payload order; `error` marks skipped ones
+  const entries = assignments.map(assignment => {
+    const { employee_number, schedule_code, start_date } = assignment || {};
+    if (!employee_number || !schedule_code || !start_date) {
+      return { error: `Неполные данные: ${JSON.stringify(assignment)}` };
+    }
+    if (!DATE_PATTERN.test(start_date) || isNaN(Date.parse(start_date))) {
+      return { error: `Ошибка для ${employee_number}: неверная дата ${start_date}` };
+    }
+    return { employee_number, schedule_code, start_date };
+  });
+  const complete = entries.filter(entry => !entry.error);
+
+  const employees = new Map();
+  const schedules = new Map();
+  if (complete.length > 0) {
+    const employeeRows = await client.query(
+      'SELECT id, table_number, full_name FROM employees WHERE table_number = ANY($1)',
+      [[...new Set(complete.map(entry => entry.employee_number))]]
+    );
+    employeeRows.rows.forEach(row => employees.set(row.table_number, row));
+
+    const scheduleRows = await client.query(`
+      SELECT schedule_code, schedule_name
+      FROM schedules_1c
+      WHERE schedule_code = ANY($1)
+    `, [[...new Set(complete.map(entry => entry.schedule_code))]]);
+    scheduleRows.rows.forEach(row => schedules.set(row.schedule_code, row));
+  }
+
+  // Valid entries grouped by employee, in payload order
+  const byEmployee = new Map();
+  for (const entry of complete) {
+    entry.employee = employees.get(entry.employee_number);
+    entry.schedule = schedules.get(entry.schedule_code);
+    if (!entry.employee) {
+      entry.error = `Сотрудник ${entry.employee_number} не найден`;
+    } else if (!entry.schedule) {
+      entry.error = `График ${entry.schedule_code} не найден`;
+    } else {
+      if (!byEmployee.has(entry.employee_number)) {
+        byEmployee.set(entry.employee_number, []);
+      }
+      byEmployee.get(entry.employee_number).push(entry);
+    }
+  }
+
+  if (byEmployee.size > 0) {
+    // An employee listed several times ends up with a chain of assignments,
+    // each one closed the day before the next one starts; of several items
+    // with the same start date the last one is kept
+    const rows = [];
+    for (const items of byEmployee.values()) {
+      const byStartDate = new Map(items.map(entry => [entry.start_date, entry]));
+      rows.push(...byStartDate.values());
+    }
+    await placeAssignments(client, rows.map(entry => ({
+      employee_id: entry.employee.id,
+      employee_number: entry.employee_number,
+      schedule_code: entry.schedule_code,
+      start_date: entry.start_date
+    })));
+
+    // Earliest start date of every employee
+    const firstEntries = [...byEmployee.values()].map(items =>
+      items.reduce((first, entry) => (entry.start_date < first.start_date ? entry : first))
+    );
+
+    // Days from the first start date on need recalculation; batches usually share one date
+    const byStartDate = new Map();
+    for (const entry of firstEntries) {
+      if (!byStartDate.has(entry.start_date)) {
+        byStartDate.set(entry.start_date, []);
+      }
+      byStartDate.get(entry.start_date).push(entry.employee_number);
+    }
+    for (const [startDate, employeeNumbers] of byStartDate) {
+      await dirtyDays.markEmployeesDirty(employeeNumbers, startDate, null, 'assignment', client);
+      await payrollShifts.refreshEmployees(employeeNumbers, startDate, null, client);
+    }
+  }
+
+  for (const entry of entries) {
+    if (entry.error) {
+      result.errors.push(entry.error);
+      result.skipped++;
+      continue;
+    }
+    result.assigned++;
+    result.assignments.push({
+      employee_number: entry.employee_number,
+      employee_name: entry.employee.full_name,
+      schedule_code: entry.schedule_code,
+      schedule_name: entry.schedule.schedule_name,
+      start_date: entry.start_date
+    });
+  }
+
+  return result;
+}
+
+module.exports = {
+  placeAssignments,
+  assignSchedules
+};
@@ -0,0 +1,234 @@
+const db = require('../database_pg');
+const clusterBus = require('./clusterBus');
+
+// Process-level index of work_schedules_1c, so work-day, planned-hours and
+// shift-window lookups need no DB round trip. Per schedule and year:
+//   workDays  bitmap, one bit per day of the year, set when work_hours > 0
+//   hours     planned hours of the day
+//   start/end shift window in minutes from midnight, -1 when unknown
+//   types     index into timeTypes, 0 when the schedule has no such day
+// A schedule is loaded whole on first use (load()) and dropped by
+// invalidate(), which the import-1c and update-times writers call once their
+// changes are committed; the next load() reads it again.
+//
+//   await scheduleCalendar.load(codes);
+//   scheduleCalendar.isWorkDay(code, '2025-05-14');
+
+const MESSAGE_TYPE = 'scheduleCalendar.invalidate';
+const NO_TIME = -1;
+
+// time_type strings ('Рабочее', 'В', ...), shared by every schedule
+const timeTypes = [null];
+const timeTypeIndex = new Map();
+
+const schedules = new Map();   // schedule_code -> { name, years: Map(year -> YearEntry) }
+const loading = new Map();     // schedule_code -> Promise of the running load
+const counters = { loads: 0, invalidations: 0 };
+let generation = 0;            // bumped by invalidate(); stale loads are discarded
+
+function timeTypeId(timeType) {
+  if (!timeTypeIndex.has(timeType)) {
+    timeTypeIndex.set(timeType, timeTypes.length);
+    timeTypes.push(timeType);
+  }
+  return timeTypeIndex.get(timeType);
+}
+
+function isLeapYear(year) {
+  return (year % 4 === 0 && year % 100 !== 0) || year % 400 === 0;
+}
+
+function createYear(year) {
+  const days = isLeapYear(year) ? 366 : 365;
+  return {
+    workDays: new Uint8Array(Math.ceil(days / 8)),
+    hours: new Int16Array(days),
+    start: new Int16Array(days).fill(NO_TIME),
+    end: new Int16Array(days).fill(NO_TIME),
+    types: new Uint16Array(days)
+  };
+}
+
+// [year, zero-based day of the year] of a 'YYYY-MM-DD' string
+function locate(date) {
+  const year = parseInt(date.slice(0, 4));
+  const dayOfYear = (Date.UTC(year, parseInt(date.slice(5, 7)) - 1, parseInt(date.slice(8, 10))) - Date.UTC(year, 0, 1)) / 86400000;
+  return [year, dayOfYear];
+}
+
+function formatMinutes(minutes) {
+  if (minutes === NO_TIME) return null;
+  const hh = Math.floor(minutes / 60).toString().padStart(2, '0');
+  const mm = (minutes % 60).toString().padStart(2, '0');
+  return `${hh}:${mm}:00`;
+}
+
+function buildSchedule(rows) {
+  const schedule = { name: null, years: new Map() };
+  for (const row of rows) {
+    const [year, day] = locate(row.work_date);
+    if (!schedule.years.has(year)) schedule.years.set(year, createYear(year));
+    const entry = schedule.years.get(year);
+
+    schedule.name = row.schedule_name;
+    entry.types[day] = timeTypeId(row.time_type);
+    entry.hours[day] = row.work_hours;
+    entry.start[day] = row.start_minutes === null ? NO_TIME : row.start_minutes;
+    entry.end[day] = row.end_minutes === null ? NO_TIME : row.end_minutes;
+    if (row.work_hours > 0) entry.workDays[day >> 3] |= 1 << (day & 7);
+  }
+  return schedule;
+}
+
+// Read the given schedules into the index with one query
+function startLoad(codes) {
+  const startedAt = generation;
+  const promise = db.query(`
+    SELECT
+      schedule_code,
+      schedule_name,
+      to_char(work_date, 'YYYY-MM-DD') as work_date,
+      time_type,
+      work_hours,
+      (EXTRACT(HOUR FROM work_start_time) * 60 + EXTRACT(MINUTE FROM work_start_time))::int as start_minutes,
+      (EXTRACT(HOUR FROM work_end_time) * 60 + EXTRACT(MINUTE FROM work_end_time))::int as end_minutes
+    FROM work_schedules_1c
+    WHERE schedule_code = ANY($1)
+    ORDER BY schedule_code, work_date
+  `, [codes]).then(result => {
+    counters.loads++;
+    // Rows read while an invalidation went by may predate it
+    if (startedAt !== generation) return;
+    const rowsByCode = new Map(codes.map(code => [code, []]));
+    for (const row of result.rows) rowsByCode.get(row.schedule_code).push(row);
+    for (const [code, rows] of rowsByCode) schedules.set(code, buildSchedule(rows));
+  }).finally(() => {
+    for (const code of codes) loading.delete(code);
+  });
+  for (const code of codes) loading.set(code, promise);
+}
+
+// Make sure the given schedules are indexed. Reads outside any transaction:
+// the index must only ever hold committed days.
+async function load(scheduleCodes) {
+  const codes = [...new Set(scheduleCodes.filter(Boolean))];
+  while (!codes.every(code => schedules.has(code))) {
+    const missing = codes.filter(code => !schedules.has(code) && !loading.has(code));
+    if (missing.length > 0) startLoad(missing);
+    await Promise.all(codes.map(code => loading.get(code)).filter(Boolean));
+  }
+}
+
+function yearEntry(scheduleCode, date) {
+  const schedule = schedules.get(scheduleCode);
+  if (!schedule) return [null, 0];
+  const [year, day] = locate(date);
+  return [schedule.years.get(year) || null, day];
+}
+
+// Lookups below expect load() to have been awaited for the schedule; an
+// unloaded schedule looks like one without days.
+
+// work_hours > 0 on that day
+function isWorkDay(scheduleCode, date) {
+  const [entry, day] = yearEntry(scheduleCode, date);
+  return Boolean(entry) && (entry.workDays[day >> 3] & (1 << (day & 7))) !== 0;
+}
+
+function plannedHours(scheduleCode, date) {
+  const [entry, day] = yearEntry(scheduleCode, date);
+  return entry ? entry.hours[day] : 0;
+}
+
+// { start, end } in minutes from midnight, null when the day has no times
+function shiftWindow(scheduleCode, date) {
+  const [entry, day] = yearEntry(scheduleCode, date);
+  if (!entry || entry.start[day] === NO_TIME || entry.end[day] === NO_TIME) return null;
+  return { start: entry.start[day], end: entry.end[day] };
+}
+
+// The day as a work_schedules_1c row (times as 'HH:MM:SS'), null when the
+// schedule has no such day
+function getDay(scheduleCode, date) {
+  const [entry, day] = yearEntry(scheduleCode, date);
+  if (!entry || entry.types[day] === 0) return null;
+  return {
+    work_date: date,
+    schedule_name: schedules.get(scheduleCode).name,
+    time_type: timeTypes[entry.types[day]],
+    work_hours: entry.hours[day],
+    work_start_time: formatMinutes(entry.start[day]),
+    work_end_time: formatMinutes(entry.end[day])
+  };
+}
+
+// Days of the schedule in [dateFrom, dateTo), in date order
+function getDays(scheduleCode, dateFrom, dateTo) {
+  const days = [];
+  const cursor = new Date(`${dateFrom}T00:00:00Z`);
+  for (let date = dateFrom; date < dateTo; date = cursor.toISOString().split('T')[0]) {
+    const row = getDay(scheduleCode, date);
+    if (row) days.push(row);
+    cursor.setUTCDate(cursor.getUTCDate() + 1);
+  }
+  return days;
+}
+
+// The earliest day of the schedule, what callers use when a date is missing
+// from the 1C calendar
+function firstDay(scheduleCode) {
+  const schedule = schedules.get(scheduleCode);
+  if (!schedule || schedule.years.size === 0) return null;
+  const year = Math.min(...schedule.years.keys());
+  const entry = schedule.years.get(year);
+  const day = entry.types.findIndex(type => type !== 0);
+  const date = new Date(Date.UTC(year, 0, 1 + day)).toISOString().split('T')[0];
+  return getDay(scheduleCode, date);
+}
+
+function drop(scheduleCodes) {
+  generation++;
+  for (const code of scheduleCodes) {
+    if (schedules.delete(code)) counters.invalidations++;
+  }
+}
+
+clusterBus.subscribe(MESSAGE_TYPE, drop);
+
+// Forget the schedules in this and every other process. Inside a
+// transaction this happens after COMMIT, so nobody re-reads the old days.
+function invalidate(scheduleCodes, executor = null) {
+  if (!scheduleCodes || scheduleCodes.length === 0) return;
+  const run = () => {
+    drop(scheduleCodes);
+    clusterBus.publish(MESSAGE_TYPE, scheduleCodes);
+  };
+  if (executor && executor.afterCommit) {
+    executor.afterCommit(run);
+  } else {
+    run();
+  }
+}
+
+function stats() {
+  let years = 0;
+  for (const schedule of schedules.values()) years += schedule.years.size;
+  return {
+    schedules: schedules.size,
+    years,
+    timeTypes: timeTypes.length - 1,
+    ...counters
+  };
+}
+
+module.exports = {
+  load,
+  isWorkDay,
+  plannedHours,
+  shiftWindow,
+  getDay,
+  getDays,
+  firstDay,
+  invalidate,
+  stats
+};
@@ -0,0 +1,187 @@
+const db = require('../database_pg');
+const dirtyDays = require('./dirtyDays');
+const payrollShifts = require('./payrollShifts');
+const scheduleCalendar = require('./scheduleCalendar');
+
+// Extract work times from a 1C schedule name like "08:00-17:00 (5/2)"
+function extractWorkTimesFromScheduleName(scheduleName) {
+  const match = scheduleName && scheduleName.match(/^(\d{2}:\d{2})-(\d{2}:\d{2})/);
+  if (!match) {
+    return { work_start_time: null, work_end_time: null };
+  }
+  return { work_start_time: match[1], work_end_time: match[2] };
+}
+
+// Validate one schedule from the 1C export in memory.
+// Returns { schedule, errors }; schedule is null when it cannot be imported.
+function prepareSchedule(график) {
+  const { НаименованиеГрафика, КодГрафика, РабочиеДни } = график || {};
+  const errors = [];
+
+  if (!НаименованиеГрафика || !КодГрафика || !РабочиеДни || !Array.isArray(РабочиеДни)) {
+    errors.push(`Неполные данные для графика: ${НаименованиеГрафика || КодГрафика || 'UNKNOWN'}`);
+    return { schedule: null, errors };
+  }
+
+  // Times from the name are the fallback when 1C sends none for a day
+  const extractedTimes = extractWorkTimesFromScheduleName(НаименованиеГрафика);
+
+  // Keyed by date: a repeated day in the export replaces the earlier one
+  const days = new Map();
+  for (const рабочийДень of РабочиеДни) {
+    const {
+      Дата,
+      Месяц,
+      ВидУчетаВремени,
+      ДополнительноеЗначение,
+      ВремяНачалоРаботы,
+      ВремяЗавершениеРаботы
+    } = рабочийДень || {};
+
+    if (!Дата || !Месяц || !ВидУчетаВремени || ДополнительноеЗначение === undefined) {
+      errors.push(`Неполные данные для рабочего дня в графике ${НаименованиеГрафика}: ${JSON.stringify(рабочийДень)}`);
+      continue;
+    }
+
+    days.set(Дата, {
+      work_date: Дата,
+      work_month: Месяц,
+      time_type: ВидУчетаВремени,
+      work_hours: ДополнительноеЗначение,
+      work_start_time: ВремяНачалоРаботы || extractedTimes.work_start_time,
+      work_end_time: ВремяЗавершениеРаботы || extractedTimes.work_end_time
+    });
+  }
+
+  return {
+    schedule: { code: КодГрафика, name: НаименованиеГрафика, days: [...days.values()] },
+    errors
+  };
+}
+
+// Replace the stored days of one schedule with the imported ones in a single
+// statement: days missing from the export are deleted, new days inserted and
+// existing days rewritten only when something in them changed.
+async function importSchedule(client, schedule) {
+  const column = (name) => schedule.days.map(day => day[name]);
+
+  const result = await client.query(`
+    WITH incoming AS (
+      SELECT * FROM UNNEST($3::date[], $4::date[], $5::text[], $6::int[], $7::time[], $8::time[])
+        AS t(work_date, work_month, time_type, work_hours, work_start_time, work_end_time)
+    ),
+    existing AS (
+      SELECT COUNT(*)::int AS rows FROM work_schedules_1c WHERE schedule_code = $1
+    ),
+    deleted AS (
+      DELETE FROM work_schedules_1c ws
+      WHERE ws.schedule_code = $1
+        AND NOT EXISTS (SELECT 1 FROM incoming i WHERE i.work_date = ws.work_date)
+      RETURNING ws.work_date
+    ),
+    upserted AS (
+      INSERT INTO work_schedules_1c AS ws
+        (schedule_name, schedule_code, work_date, work_month, time_type, work_hours, work_start_time, work_end_time)
+      SELECT $2, $1, work_date, work_month, time_type, work_hours, work_start_time, work_end_time
+      FROM incoming
+      ON CONFLICT (schedule_code, work_date) DO UPDATE SET
+        schedule_name = EXCLUDED.schedule_name,
+        work_month = EXCLUDED.work_month,
+        time_type = EXCLUDED.time_type,
+        work_hours = EXCLUDED.work_hours,
+        work_start_time = EXCLUDED.work_start_time,
+        work_end_time = EXCLUDED.work_end_time,
+        updated_at = CURRENT_TIMESTAMP
+      WHERE (ws.schedule_name, ws.work_month, ws.time_type, ws.work_hours, ws.work_start_time, ws.work_end_time)
+        IS DISTINCT FROM
+        (EXCLUDED.schedule_name, EXCLUDED.work_month, EXCLUDED.time_type, EXCLUDED.work_hours, EXCLUDED.work_start_time, EXCLUDED.work_end_time)
+      RETURNING ws.work_date, (ws.xmax = 0) AS inserted
+    ),
+    changed AS (
+      SELECT work_date FROM deleted
+      UNION ALL
+      SELECT work_date FROM upserted
+    )
+    SELECT
+      (SELECT rows FROM existing) AS existing,
+      (SELECT COUNT(*)::int FROM deleted) AS deleted,
+      (SELECT COUNT(*)::int FROM upserted WHERE inserted) AS inserted,
+      (SELECT COUNT(*)::int FROM upserted WHERE NOT inserted) AS updated,
+      (SELECT TO_CHAR(MIN(work_date), 'YYYY-MM-DD') FROM changed) AS changed_from,
+      (SELECT TO_CHAR(MAX(work_date), 'YYYY-MM-DD') FROM changed) AS changed_to
+  `, [
+    schedule.code,
+    schedule.name,
+    column('work_date'),
+    column('work_month'),
+    column('time_type'),
+    column('work_hours'),
+    column('work_start_time'),
+    column('work_end_time')
+  ]);
+
+  const row = result.rows[0];
+
+  // Only the days that actually changed need their time records recomputed
+  if (row.changed_from) {
+    await dirtyDays.markSchedulesDirty([schedule.code], row.changed_from, row.changed_to, 'schedule', client);
+    await payrollShifts.refreshSchedules([schedule.code], row.changed_from, row.changed_to, client);
+    await refreshScheduleCatalog([schedule.code], client);
+    scheduleCalendar.invalidate([schedule.code], client);
+  }
+
+  return {
+    existing: row.existing,
+    inserted: row.inserted,
+    updated: row.updated,
+    deleted: row.deleted,
+    unchanged: schedule.days.length - row.inserted - row.updated
+  };
+}
+
+// Rebuild the schedules_1c catalog rows of the given codes from their days
+async function refreshScheduleCatalog(scheduleCodes, executor = db) {
+  if (!scheduleCodes || scheduleCodes.length === 0) return;
+
+  await executor.query(`
+    WITH summary AS (
+      SELECT
+        schedule_code,
+        MAX(schedule_name) as schedule_name,
+        MODE() WITHIN GROUP (ORDER BY work_start_time) as work_start_time,
+        MODE() WITHIN GROUP (ORDER BY work_end_time) as work_end_time,
+        MIN(work_date) as start_date,
+        MAX(work_date) as end_date,
+        COUNT(*) as work_days_count,
+        AVG(work_hours) as avg_hours
+      FROM work_schedules_1c
+      WHERE schedule_code = ANY($1)
+      GROUP BY schedule_code
+    ),
+    removed AS (
+      DELETE FROM schedules_1c s
+      WHERE s.schedule_code = ANY($1)
+        AND NOT EXISTS (SELECT 1 FROM summary WHERE summary.schedule_code = s.schedule_code)
+    )
+    INSERT INTO schedules_1c
+      (schedule_code, schedule_name, work_start_time, work_end_time, start_date, end_date, work_days_count, avg_hours)
+    SELECT schedule_code, schedule_name, work_start_time, work_end_time, start_date, end_date, work_days_count, avg_hours
+    FROM summary
+    ON CONFLICT (schedule_code) DO UPDATE SET
+      schedule_name = EXCLUDED.schedule_name,
+      work_start_time = EXCLUDED.work_start_time,
+      work_end_time = EXCLUDED.work_end_time,
+      start_date = EXCLUDED.start_date,
+      end_date = EXCLUDED.end_date,
+      work_days_count = EXCLUDED.work_days_count,
+      avg_hours = EXCLUDED.avg_hours,
+      updated_at = CURRENT_TIMESTAMP
+  `, [scheduleCodes]);
+}
+
+module.exports = {
+  extractWorkTimesFromScheduleName,
+  prepareSchedule,
+  importSchedule,
+  refreshScheduleCatalog
+};
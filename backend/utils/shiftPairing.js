@@ -0,0 +1,183 @@
+const { addDays, nextDay } = require('./queryFilters');
+
+// Pair time_events into shifts in one pass over an event stream ordered by
+// (employee_number, event_datetime). A shift is anchored to the work date of
+// the scheduled shift its events belong to, not to their calendar date, so a
+// night or 24h shift that ends the next morning is one shift of the day it
+// started, and an entry shortly before midnight for a shift that starts at
+// midnight belongs to the next day. Only the shift being built is kept in
+// memory, however many events an employee has.
+//
+//   const events = readEvents(client, 'SELECT ... ORDER BY employee_number, event_datetime', params);
+//   for await (const shift of pairShifts(events, scheduleFor)) { ... }
+//
+// Events need employee_number, date ('YYYY-MM-DD'), minute (minutes from
+// midnight), event_datetime and event_type; EVENT_COLUMNS selects them.
+// scheduleFor(employeeNumber, date) returns the schedule day (a
+// work_schedules_1c row) or nothing.
+
+// An entry this long before the scheduled start opens that shift
+const EARLY_ENTRY_MINUTES = 180;
+// Events up to this long after the scheduled end of a shift that runs past
+// midnight still belong to it
+const LATE_EXIT_MINUTES = 360;
+// Rows fetched from the cursor per round trip
+const CURSOR_FETCH_SIZE = 5000;
+
+const MINUTES_PER_DAY = 1440;
+
+// SELECT list for readEvents() over time_events
+const EVENT_COLUMNS = `
+  employee_number,
+  to_char(event_datetime, 'YYYY-MM-DD') as date,
+  (EXTRACT(HOUR FROM event_datetime) * 60 + EXTRACT(MINUTE FROM event_datetime))::int as minute,
+  event_datetime,
+  event_type`;
+
+function minutesOf(time) {
+  const [hours, minutes] = time.split(':').map(Number);
+  return hours * 60 + minutes;
+}
+
+// Scheduled shift of a schedule day as { start, end } minutes from the
+// midnight of its work date; end is past MINUTES_PER_DAY for a shift that
+// ends the next day, and a start equal to the end is a 24h shift
+function shiftBounds(day) {
+  if (!day || !(day.work_hours > 0) || !day.work_start_time || !day.work_end_time) return null;
+  const start = minutesOf(day.work_start_time);
+  let end = minutesOf(day.work_end_time);
+  if (end <= start) end += MINUTES_PER_DAY;
+  return { start, end };
+}
+
+// Work date of the shift an event belongs to
+function anchorOf(event, scheduleFor) {
+  const { employee_number, date, minute, event_type } = event;
+  const today = shiftBounds(scheduleFor(employee_number, date));
+
+  // Still in (or just out of) yesterday's shift running past midnight,
+  // unless it is the entry of today's shift
+  const yesterday = shiftBounds(scheduleFor(employee_number, addDays(date, -1)));
+  if (yesterday && yesterday.end > MINUTES_PER_DAY &&
+      minute < yesterday.end - MINUTES_PER_DAY + LATE_EXIT_MINUTES) {
+    const opensToday = event_type === '1' && today && minute >= today.start - EARLY_ENTRY_MINUTES;
+    if (!opensToday) return addDays(date, -1);
+  }
+
+  // Early for tomorrow's shift starting around midnight, with today's over
+  const tomorrow = shiftBounds(scheduleFor(employee_number, nextDay(date)));
+  if (tomorrow && event_type !== '2' &&
+      minute >= MINUTES_PER_DAY + tomorrow.start - EARLY_ENTRY_MINUTES &&
+      !(today && minute < today.end)) {
+    return nextDay(date);
+  }
+
+  return date;
+}
+
+function openShift(event, date) {
+  return {
+    employee_number: event.employee_number,
+    date,
+    firstEntry: null,
+    lastExit: null,
+    first: event,
+    last: event,
+    event_count: 0
+  };
+}
+
+function addEvent(shift, event) {
+  if (event.event_type === '1' && !shift.firstEntry) {
+    shift.firstEntry = event.event_datetime; // FIRST entry of the shift
+  } else if (event.event_type === '2') {
+    shift.lastExit = event.event_datetime; // LAST exit of the shift
+  }
+  shift.last = event;
+  shift.event_count++;
+}
+
+// { employee_number, date, check_in, check_out, event_count }
+function closeShift(shift) {
+  let checkIn = shift.firstEntry;
+  let checkOut = shift.lastExit;
+
+  // Fallback for type 0 events if no typed events exist
+  if (!checkIn && !checkOut) {
+    if (shift.event_count === 1) {
+      if (shift.first.minute < 720) {
+        checkIn = shift.first.event_datetime;
+      } else {
+        checkOut = shift.first.event_datetime;
+      }
+    } else {
+      checkIn = shift.first.event_datetime;
+      checkOut = shift.last.event_datetime;
+    }
+  }
+
+  return {
+    employee_number: shift.employee_number,
+    date: shift.date,
+    check_in: checkIn,
+    check_out: checkOut,
+    event_count: shift.event_count
+  };
+}
+
+// Shifts of an ordered event stream (any iterable or async iterable), in
+// the same order. Anchors never go back within an employee, so an exit that
+// comes after the next shift's entry stays with that shift.
+async function* pairShifts(events, scheduleFor) {
+  let shift = null;
+
+  for await (const event of events) {
+    if (shift && shift.employee_number !== event.employee_number) {
+      yield closeShift(shift);
+      shift = null;
+    }
+
+    let date = anchorOf(event, scheduleFor);
+    if (shift && date < shift.date) date = shift.date;
+    if (shift && date !== shift.date) {
+      yield closeShift(shift);
+      shift = null;
+    }
+
+    if (!shift) shift = openShift(event, date);
+    addEvent(shift, event);
+  }
+
+  if (shift) yield closeShift(shift);
+}
+
+// Rows of `sql` through a server-side cursor, CURSOR_FETCH_SIZE at a time.
+// The client must be inside a transaction (db.withTransaction).
+async function* readEvents(client, sql, params, name = 'shift_events') {
+  await client.query(`DECLARE ${name} NO SCROLL CURSOR FOR ${sql}`, params);
+
+  let failed = false;
+  try {
+    for (;;) {
+      let result;
+      try {
+        result = await client.query(`FETCH FORWARD ${CURSOR_FETCH_SIZE} FROM ${name}`);
+      } catch (error) {
+        failed = true;
+        throw error;
+      }
+      yield* result.rows;
+      if (result.rows.length < CURSOR_FETCH_SIZE) break;
+    }
+  } finally {
+    // A failed FETCH aborted the transaction, which drops the cursor anyway
+    if (!failed) await client.query(`CLOSE ${name}`);
+  }
+}
+
+module.exports = {
+  EVENT_COLUMNS,
+  anchorOf,
+  pairShifts,
+  readEvents
+};
@@ -0,0 +1,45 @@
+const db = require('../database_pg');
+const apiSync = require('./apiSync_pg');
+const timeEventPartitions = require('./timeEventPartitions');
+const loadJobs = require('./loadJobs');
+const log = require('./logger')('startup');
+
+// Work that runs once per deployment rather than once per serving process.
+// server.js and server_https.js run it themselves; under cluster.js only the
+// primary does, before it starts the workers.
+
+// Schema, partition maintenance and the load job worker; exits the process
+// when the database cannot be initialized
+async function initialize() {
+  try {
+    await db.initializeDatabase();
+    await timeEventPartitions.startPartitionMaintenance();
+    await loadJobs.startWorker();
+    log.info('Database initialized successfully');
+  } catch (error) {
+    log.error('Database initialization failed', error);
+    process.exit(1);
+  }
+}
+
+// Full sync from the external API, in production only
+async function initialSync() {
+  // Skip initial sync for faster startup in development
+  if (process.env.NODE_ENV !== 'production') {
+    log.info('Development mode: Skipping data sync');
+    return;
+  }
+
+  log.info('Starting initial data sync');
+  try {
+    await apiSync.syncAllData();
+    log.info('Initial data sync completed');
+  } catch (error) {
+    log.error('Initial sync failed', error);
+  }
+}
+
+module.exports = {
+  initialize,
+  initialSync
+};
@@ -0,0 +1,276 @@
+const db = require('../database_pg');
+const { monthBounds } = require('./queryFilters');
+const dailyAttendance = require('./dailyAttendance');
+const log = require('./logger')('timeEventPartitions');
+
+// time_events is range-partitioned by event_datetime, one partition per month
+// (time_events_y2025m05). Rows outside every monthly partition land in
+// time_events_default until their month is created.
+const PARTITIONS_AHEAD = parseInt(process.env.TIME_EVENTS_PARTITIONS_AHEAD) || 3;
+// Months kept attached to time_events; 0 keeps everything
+const RETENTION_MONTHS = parseInt(process.env.TIME_EVENTS_RETENTION_MONTHS) || 0;
+// 'archive' detaches old months as standalone time_events_archive_* tables, 'drop' deletes them
+const RETENTION_MODE = process.env.TIME_EVENTS_RETENTION_MODE === 'drop' ? 'drop' : 'archive';
+// Rows per multi-row insert into a reload table
+const RELOAD_CHUNK_SIZE = 10000;
+
+const PARTITION_PATTERN = /^time_events_y(\d{4})m(\d{2})$/;
+// Serializes partition DDL between concurrent callers
+const PARTITION_LOCK_KEY = 'time_events_partitions';
+
+function partitionName(month) {
+  const [year, monthNumber] = month.split('-');
+  return `time_events_y${year}m${monthNumber}`;
+}
+
+function addMonths(month, count) {
+  const [year, monthNumber] = month.split('-').map(Number);
+  const index = year * 12 + (monthNumber - 1) + count;
+  return `${Math.floor(index / 12)}-${(index % 12 + 1).toString().padStart(2, '0')}`;
+}
+
+function currentMonth() {
+  return new Date().toLocaleDateString('sv-SE', { timeZone: 'Asia/Almaty' }).slice(0, 7);
+}
+
+// 'YYYY-MM' of every month touched by the inclusive 'YYYY-MM-DD' range
+function monthsBetween(dateFrom, dateTo) {
+  const months = [];
+  const last = dateTo.slice(0, 7);
+  for (let month = dateFrom.slice(0, 7); month <= last; month = addMonths(month, 1)) {
+    months.push(month);
+  }
+  return months;
+}
+
+function checkMonth(month) {
+  const bounds = monthBounds(month);
+  if (!bounds) {
+    throw new Error(`Некорректный формат месяца: ${month}. Ожидается YYYY-MM`);
+  }
+  return bounds;
+}
+
+// Runs fn inside a transaction: the caller's one if it passed a client
+async function inTransaction(executor, fn) {
+  return executor === db ? db.withTransaction(fn) : fn(executor);
+}
+
+async function lockPartitions(client) {
+  await client.query('SELECT pg_advisory_xact_lock(hashtext($1))', [PARTITION_LOCK_KEY]);
+}
+
+// Monthly partitions currently attached to time_events, oldest first
+async function listPartitions(executor = db) {
+  const result = await executor.query(`
+    SELECT c.relname as name
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = 'time_events'::regclass
+    ORDER BY c.relname
+  `);
+
+  return result.rows
+    .map(row => PARTITION_PATTERN.exec(row.name))
+    .filter(Boolean)
+    .map(match => ({ name: match[0], month: `${match[1]}-${match[2]}` }));
+}
+
+async function partitionExists(client, name) {
+  const result = await client.query('SELECT to_regclass($1) IS NOT NULL as exists', [name]);
+  return result.rows[0].exists;
+}
+
+// Create the partition for one month. Rows of that month already sitting in
+// the default partition are moved into it, otherwise ATTACH would fail.
+async function ensurePartition(month, executor = db) {
+  const bounds = checkMonth(month);
+  const name = partitionName(month);
+
+  return inTransaction(executor, async (client) => {
+    await lockPartitions(client);
+    if (await partitionExists(client, name)) return false;
+
+    await client.query(`CREATE TABLE ${name} (LIKE time_events INCLUDING DEFAULTS)`);
+    await client.query(`
+      WITH moved AS (
+        DELETE FROM time_events_default
+        WHERE event_datetime >= $1 AND event_datetime < $2
+        RETURNING *
+      )
+      INSERT INTO ${name} SELECT * FROM moved
+    `, [bounds.start, bounds.end]);
+    await client.query(`
+      ALTER TABLE time_events ATTACH PARTITION ${name}
+      FOR VALUES FROM ('${bounds.start}') TO ('${bounds.end}')
+    `);
+    return true;
+  });
+}
+
+// Make sure every month of the inclusive 'YYYY-MM-DD' range has a partition
+async function ensurePartitions(dateFrom, dateTo, executor = db) {
+  const created = [];
+  for (const month of monthsBetween(dateFrom, dateTo)) {
+    if (await ensurePartition(month, executor)) created.push(month);
+  }
+  return created;
+}
+
+// Current month and `ahead` following months
+async function ensureFuturePartitions(ahead = PARTITIONS_AHEAD) {
+  const month = currentMonth();
+  return ensurePartitions(`${month}-01`, `${addMonths(month, ahead)}-01`);
+}
+
+// Detach monthly partitions older than `retentionMonths` full months before
+// the current one. Archived months stay queryable as time_events_archive_*.
+async function applyRetention(retentionMonths = RETENTION_MONTHS, mode = RETENTION_MODE) {
+  if (!retentionMonths) return [];
+
+  const oldestKept = addMonths(currentMonth(), -retentionMonths);
+  const expired = (await listPartitions()).filter(partition => partition.month < oldestKept);
+
+  for (const partition of expired) {
+    await db.withTransaction(async (client) => {
+      await lockPartitions(client);
+      await client.query(`ALTER TABLE time_events DETACH PARTITION ${partition.name}`);
+      if (mode === 'drop') {
+        await client.query(`DROP TABLE ${partition.name}`);
+      } else {
+        await client.query(`ALTER TABLE ${partition.name} RENAME TO ${partition.name.replace('time_events_', 'time_events_archive_')}`);
+      }
+    });
+  }
+
+  return expired.map(partition => partition.month);
+}
+
+// Periodic maintenance: partitions ahead of time, then retention
+async function maintainPartitions() {
+  const created = await ensureFuturePartitions();
+  const expired = await applyRetention();
+
+  if (created.length > 0 || expired.length > 0) {
+    log.info('time_events partitions maintained', { created, expired, retention: RETENTION_MODE });
+  }
+  return { created, expired };
+}
+
+// Run maintenance now and then once a day
+function startPartitionMaintenance(intervalMs = 24 * 60 * 60 * 1000) {
+  const run = () => maintainPartitions().catch(error => {
+    log.error('time_events partition maintenance failed', error);
+  });
+  const timer = setInterval(run, intervalMs);
+  timer.unref();
+  return run();
+}
+
+// Reload one month by building a replacement partition and swapping it in,
+// instead of deleting and re-inserting rows in the live table.
+//   const reload = await beginMonthReload('2025-05', { objectBin });
+//   await reload.add(events);   // { employee_number, object_code, event_datetime, event_type }
+//   await reload.commit();      // or reload.abort()
+// With objectBin only that organization's events are replaced; rows of other
+// employees are carried over from the current partition at swap time.
+async function beginMonthReload(month, { objectBin = null } = {}) {
+  const bounds = checkMonth(month);
+  const name = partitionName(month);
+  const reloadName = `${name}_reload`;
+
+  await ensurePartition(month);
+  await db.query(`DROP TABLE IF EXISTS ${reloadName}`);
+  await db.query(`CREATE TABLE ${reloadName} (LIKE time_events INCLUDING DEFAULTS INCLUDING INDEXES)`);
+
+  let loaded = 0;
+
+  // Events outside the month are ignored, repeated ones are stored once
+  async function add(events) {
+    for (let i = 0; i < events.length; i += RELOAD_CHUNK_SIZE) {
+      const chunk = events.slice(i, i + RELOAD_CHUNK_SIZE);
+      const result = await db.query(`
+        INSERT INTO ${reloadName} (employee_number, object_code, event_datetime, event_type)
+        SELECT * FROM UNNEST($1::text[], $2::text[], $3::timestamp[], $4::text[])
+          AS t(employee_number, object_code, event_datetime, event_type)
+        WHERE t.event_datetime >= $5 AND t.event_datetime < $6
+        ON CONFLICT DO NOTHING
+      `, [
+        chunk.map(e => e.employee_number),
+        chunk.map(e => e.object_code),
+        chunk.map(e => e.event_datetime),
+        chunk.map(e => e.event_type),
+        bounds.start,
+        bounds.end
+      ]);
+      loaded += result.rowCount;
+    }
+    return loaded;
+  }
+
+  async function commit() {
+    return db.withTransaction(async (client) => {
+      await lockPartitions(client);
+
+      const replaced = objectBin
+        ? 'employee_number IN (SELECT table_number FROM employees WHERE object_bin = $1)'
+        : 'TRUE';
+      const params = objectBin ? [objectBin] : [];
+
+      if (objectBin) {
+        await client.query(`
+          INSERT INTO ${reloadName}
+          SELECT * FROM ${name} WHERE NOT (${replaced})
+        `, params);
+      }
+
+      // Every day that had or now has events of the replaced employees
+      await client.query(`
+        INSERT INTO time_records_dirty (employee_number, date, reason, marked_at)
+        SELECT employee_number, date, 'events', CURRENT_TIMESTAMP
+        FROM (
+          SELECT employee_number, event_datetime::date as date FROM ${name} WHERE ${replaced}
+          UNION
+          SELECT employee_number, event_datetime::date FROM ${reloadName} WHERE ${replaced}
+        ) days
+        ON CONFLICT (employee_number, date) DO UPDATE SET
+          reason = EXCLUDED.reason,
+          marked_at = CURRENT_TIMESTAMP
+      `, params);
+
+      const deleted = await client.query(`SELECT COUNT(*)::int as count FROM ${name} WHERE ${replaced}`, params);
+
+      await client.query(`ALTER TABLE time_events DETACH PARTITION ${name}`);
+      await client.query(`DROP TABLE ${name}`);
+      await client.query(`ALTER TABLE ${reloadName} RENAME TO ${name}`);
+      await client.query(`
+        ALTER TABLE time_events ATTACH PARTITION ${name}
+        FOR VALUES FROM ('${bounds.start}') TO ('${bounds.end}')
+      `);
+      await dailyAttendance.refreshRange(bounds.start, bounds.end, { objectBin }, client);
+
+      return { month, inserted: loaded, deleted: deleted.rows[0].count };
+    });
+  }
+
+  async function abort() {
+    await db.query(`DROP TABLE IF EXISTS ${reloadName}`);
+  }
+
+  return { month, add, commit, abort };
+}
+
+module.exports = {
+  PARTITIONS_AHEAD,
+  RETENTION_MONTHS,
+  partitionName,
+  monthsBetween,
+  listPartitions,
+  ensurePartition,
+  ensurePartitions,
+  ensureFuturePartitions,
+  applyRetention,
+  maintainPartitions,
+  startPartitionMaintenance,
+  beginMonthReload
+};
@@ -0,0 +1,384 @@
+const db = require('../database_pg');
+const { calculateAdvancedHours, determineShiftStatus } = require('./hoursCalculator');
+const dirtyDays = require('./dirtyDays');
+const dailyAttendance = require('./dailyAttendance');
+const reportCache = require('./reportCache');
+const scheduleCalendar = require('./scheduleCalendar');
+const assignmentsAsOf = require('./assignmentsAsOf');
+const shiftPairing = require('./shiftPairing');
+const log = require('./logger')('timeRecordsEngine');
+const { monthBounds, addDays, nextDay } = require('./queryFilters');
+
+// Employees are processed in chunks so a whole organization-month never sits in memory
+const EMPLOYEE_CHUNK_SIZE = 500;
+// Maximum number of time_records rows written by one bulk upsert statement
+const UPSERT_BATCH_SIZE = 5000;
+// Number of dirty employee-days claimed per transaction in incremental mode
+const DIRTY_BATCH_SIZE = 5000;
+
+// CHECK IF DATE IS SCHEDULED WORKDAY
+async function isScheduledWorkday(employeeNumber, workDate) {
+  try {
+    // The schedule day of the assignment in force on that date
+    const assignment = await assignmentsAsOf.assignmentOn(employeeNumber, workDate);
+    if (!assignment) return null;
+
+    await scheduleCalendar.load([assignment.schedule_code]);
+    return scheduleCalendar.getDay(assignment.schedule_code, workDate);
+  } catch (error) {
+    log.error('Error checking scheduled workday', { employeeNumber, workDate, error });
+    return null;
+  }
+}
+
+// Load schedule context for a chunk of employees: the concrete schedule day
+// for every (employee, date) in [dateFrom, dateTo), taken from the
+// assignment in force on that date, plus the general schedule info used when
+// a day is missing from the 1C calendar (that of the employee's latest
+// assignment in the range). Only the assignments are read from the
+// database, the days come from the in-memory schedule calendar.
+async function loadScheduleContext(client, employeeNumbers, dateFrom, dateTo) {
+  const assignments = await assignmentsAsOf.assignmentsDuring(employeeNumbers, dateFrom, dateTo, client);
+
+  await scheduleCalendar.load(assignments.map(row => row.schedule_code));
+
+  // Assignments are listed in date order and never overlap
+  const days = new Map();
+  const defaults = new Map();
+  for (const { employee_number, schedule_code, date_from, date_to } of assignments) {
+    for (const day of scheduleCalendar.getDays(schedule_code, date_from, date_to)) {
+      days.set(`${employee_number}_${day.work_date}`, { employee_number, ...day });
+    }
+    defaults.set(employee_number, { employee_number, ...scheduleCalendar.firstDay(schedule_code) });
+  }
+
+  return { days, defaults };
+}
+
+// Schedule day lookup for shiftPairing: the concrete days only
+function scheduleLookup(scheduleContext) {
+  return (employeeNumber, date) => scheduleContext.days.get(`${employeeNumber}_${date}`);
+}
+
+// Compute one time_records row for a shift from shiftPairing.pairShifts()
+function computeShiftRecord(shift, employeeId, scheduleContext) {
+  const { employee_number, date, check_in: checkIn, check_out: checkOut } = shift;
+
+  const scheduleForCalculation =
+    scheduleContext.days.get(`${employee_number}_${date}`) ||
+    scheduleContext.defaults.get(employee_number) ||
+    {};
+
+  const hoursCalculation = calculateAdvancedHours(checkIn, checkOut, scheduleForCalculation, date);
+  const status = determineShiftStatus(checkIn, checkOut, scheduleForCalculation, hoursCalculation, date);
+
+  return {
+    employee_id: employeeId,
+    employee_number,
+    date,
+    check_in: checkIn,
+    check_out: checkOut,
+    hours_worked: hoursCalculation.final_hours, // legacy hours_worked field
+    planned_hours: hoursCalculation.planned_hours,
+    actual_hours: hoursCalculation.actual_hours,
+    overtime_hours: hoursCalculation.overtime_hours,
+    status,
+    off_schedule: !hoursCalculation.is_scheduled_workday,
+    is_scheduled_workday: hoursCalculation.is_scheduled_workday,
+    has_lunch_break: hoursCalculation.has_lunch_break
+  };
+}
+
+const RECORD_COLUMNS = [
+  ['employee_id', 'int'],
+  ['employee_number', 'text'],
+  ['date', 'date'],
+  ['check_in', 'timestamp'],
+  ['check_out', 'timestamp'],
+  ['hours_worked', 'numeric'],
+  ['planned_hours', 'numeric'],
+  ['actual_hours', 'numeric'],
+  ['overtime_hours', 'numeric'],
+  ['status', 'text'],
+  ['off_schedule', 'boolean'],
+  ['is_scheduled_workday', 'boolean'],
+  ['has_lunch_break', 'boolean']
+];
+
+// Write time_records rows with one multi-row UNNEST upsert
+async function upsertTimeRecords(client, records) {
+  if (records.length === 0) return 0;
+
+  const columnNames = RECORD_COLUMNS.map(([name]) => name);
+  const unnestArgs = RECORD_COLUMNS.map(([, type], index) => `$${index + 1}::${type}[]`);
+  const updates = columnNames
+    .filter(name => name !== 'employee_number' && name !== 'date')
+    .map(name => `${name} = EXCLUDED.${name}`);
+  const params = RECORD_COLUMNS.map(([name]) =>
+    records.map(record => (record[name] === undefined ? null : record[name]))
+  );
+
+  const result = await client.query(`
+    INSERT INTO time_records (${columnNames.join(', ')}, created_at, updated_at)
+    SELECT t.*, NOW(), NOW()
+    FROM UNNEST(${unnestArgs.join(', ')}) AS t(${columnNames.join(', ')})
+    ON CONFLICT (employee_number, date) DO UPDATE SET
+      ${updates.join(',\n      ')},
+      updated_at = NOW()
+  `, params);
+
+  reportCache.invalidateDays(records, client);
+  return result.rowCount;
+}
+
+// Pair an event stream sorted by (employee_number, event_datetime) into
+// shifts and emit a record per shift whose work date accept() takes (shifts
+// read only partly at the edges of the event window are left out). Calls
+// flush() whenever the buffer is full. Returns the number of records and of
+// the events in their shifts.
+async function computeRecords(events, employeeIds, scheduleContext, flush, accept = () => true) {
+  let buffer = [];
+  const stats = { records: 0, events: 0 };
+
+  for await (const shift of shiftPairing.pairShifts(events, scheduleLookup(scheduleContext))) {
+    if (!accept(shift)) continue;
+    const employeeId = employeeIds.get(shift.employee_number) || null;
+    buffer.push(computeShiftRecord(shift, employeeId, scheduleContext));
+    stats.records++;
+    stats.events += shift.event_count;
+    if (buffer.length >= UPSERT_BATCH_SIZE) {
+      await flush(buffer);
+      buffer = [];
+    }
+  }
+
+  if (buffer.length > 0) {
+    await flush(buffer);
+  }
+
+  return stats;
+}
+
+// Recalculate time_records for one month with optional organization/department filters
+async function recalculateMonth({ organization, department, month }) {
+  const bounds = monthBounds(month);
+  if (!bounds) {
+    throw new Error(`Некорректный формат месяца: ${month}. Ожидается YYYY-MM`);
+  }
+
+  const startedAt = Date.now();
+
+  return db.withTransaction(async (client) => {
+    const scopeConditions = ['te.event_datetime >= $1', 'te.event_datetime < $2'];
+    const scopeParams = [bounds.start, bounds.end];
+    const deleteConditions = ['date >= $1', 'date < $2'];
+    const deleteParams = [bounds.start, bounds.end];
+
+    if (organization) {
+      scopeConditions.push(`e.object_bin = $${scopeParams.length + 1}`);
+      scopeParams.push(organization);
+      deleteConditions.push(`employee_number IN (SELECT table_number FROM employees WHERE object_bin = $${deleteParams.length + 1})`);
+      deleteParams.push(organization);
+    }
+
+    if (department) {
+      scopeConditions.push(`e.object_code = $${scopeParams.length + 1}`);
+      scopeParams.push(department);
+      deleteConditions.push(`employee_number IN (SELECT table_number FROM employees WHERE object_code = $${deleteParams.length + 1})`);
+      deleteParams.push(department);
+    }
+
+    // Delete existing filtered time_records (not all records)
+    const deleteResult = await client.query(
+      `DELETE FROM time_records WHERE ${deleteConditions.join(' AND ')}`,
+      deleteParams
+    );
+
+    // The whole filtered month is rebuilt, so its dirty marks are covered
+    await dirtyDays.clearDirtyDays(deleteConditions, deleteParams, client);
+    reportCache.invalidateMonth(month, client);
+    await dailyAttendance.refreshRange(bounds.start, bounds.end, { objectBin: organization, department }, client);
+
+    // Employees that have events in the period
+    const scope = await client.query(`
+      SELECT te.employee_number, MIN(e.id) as employee_id
+      FROM time_events te
+      LEFT JOIN employees e ON te.employee_number = e.table_number
+      WHERE ${scopeConditions.join(' AND ')}
+      GROUP BY te.employee_number
+      ORDER BY te.employee_number
+    `, scopeParams);
+
+    const employeeIds = new Map(scope.rows.map(row => [row.employee_number, row.employee_id]));
+    const employeeNumbers = scope.rows.map(row => row.employee_number);
+
+    let totalEvents = 0;
+    let processedRecords = 0;
+
+    for (let i = 0; i < employeeNumbers.length; i += EMPLOYEE_CHUNK_SIZE) {
+      const chunk = employeeNumbers.slice(i, i + EMPLOYEE_CHUNK_SIZE);
+
+      // Events from the day before the month to the day after it, so
+      // shifts crossing the month's edges are read whole; only shifts of
+      // the month's work dates are written
+      const scheduleContext = await loadScheduleContext(
+        client,
+        chunk,
+        addDays(bounds.start, -2),
+        addDays(bounds.end, 2)
+      );
+
+      const events = shiftPairing.readEvents(client, `
+        SELECT ${shiftPairing.EVENT_COLUMNS}
+        FROM time_events
+        WHERE employee_number = ANY($1)
+        AND event_datetime >= $2::date - 1
+        AND event_datetime < $3::date + 1
+        ORDER BY employee_number, event_datetime
+      `, [chunk, bounds.start, bounds.end]);
+
+      const computed = await computeRecords(
+        events,
+        employeeIds,
+        scheduleContext,
+        (records) => upsertTimeRecords(client, records),
+        (shift) => shift.date >= bounds.start && shift.date < bounds.end
+      );
+      totalEvents += computed.events;
+      processedRecords += computed.records;
+    }
+
+    const durationMs = Date.now() - startedAt;
+
+    return {
+      processedRecords,
+      totalEvents,
+      deletedRecords: deleteResult.rowCount,
+      employees: employeeNumbers.length,
+      durationMs,
+      employeeDaysPerSecond: durationMs > 0
+        ? Math.round(processedRecords / (durationMs / 1000))
+        : processedRecords
+    };
+  });
+}
+
+// Recompute only the employee-days marked dirty by ingest and schedule changes,
+// optionally only those of the given employees. Days are claimed in batches;
+// each batch is one transaction.
+async function recalculateDirtyDays({ batchSize = DIRTY_BATCH_SIZE, employeeNumbers = null } = {}) {
+  const startedAt = Date.now();
+  const stats = {
+    dirtyDays: 0,
+    processedRecords: 0,
+    deletedRecords: 0,
+    totalEvents: 0
+  };
+
+  for (;;) {
+    const claimedCount = await db.withTransaction(async (client) => {
+      const claimed = await dirtyDays.claimDirtyDays(client, batchSize, employeeNumbers);
+      if (claimed.length === 0) return 0;
+
+      await dailyAttendance.refreshDays(claimed, client);
+
+      const employeeNumbers = [...new Set(claimed.map(day => day.employee_number))];
+      const dates = claimed.map(day => day.date).sort();
+
+      const employees = await client.query(
+        'SELECT id, table_number FROM employees WHERE table_number = ANY($1)',
+        [employeeNumbers]
+      );
+      const employeeIds = new Map(employees.rows.map(row => [row.table_number, row.id]));
+
+      // A changed day can move shifts of the days next to it (a night
+      // shift's exit, an early entry before midnight), so those work dates
+      // are recomputed too, from events two days around them
+      const affected = new Map();
+      for (const day of claimed) {
+        for (const date of [addDays(day.date, -1), day.date, nextDay(day.date)]) {
+          affected.set(`${day.employee_number}_${date}`, { employee_number: day.employee_number, date });
+        }
+      }
+
+      const scheduleContext = await loadScheduleContext(
+        client,
+        employeeNumbers,
+        addDays(dates[0], -3),
+        addDays(dates[dates.length - 1], 4)
+      );
+
+      const events = shiftPairing.readEvents(client, `
+        SELECT ${shiftPairing.EVENT_COLUMNS}
+        FROM time_events te
+        WHERE te.employee_number = ANY($1)
+        AND te.event_datetime >= $3::date - 2
+        AND te.event_datetime < $4::date + 3
+        AND EXISTS (
+          SELECT 1
+          FROM UNNEST($1::text[], $2::date[]) AS d(employee_number, date)
+          WHERE d.employee_number = te.employee_number
+          AND te.event_datetime >= d.date - 2
+          AND te.event_datetime < d.date + 3
+        )
+        ORDER BY te.employee_number, te.event_datetime
+      `, [
+        claimed.map(day => day.employee_number),
+        claimed.map(day => day.date),
+        dates[0],
+        dates[dates.length - 1]
+      ]);
+
+      const written = new Set();
+      const computed = await computeRecords(
+        events,
+        employeeIds,
+        scheduleContext,
+        (records) => upsertTimeRecords(client, records),
+        (shift) => {
+          const key = `${shift.employee_number}_${shift.date}`;
+          if (!affected.has(key)) return false;
+          written.add(key);
+          return true;
+        }
+      );
+      stats.totalEvents += computed.events;
+      stats.processedRecords += computed.records;
+
+      // Work dates that no longer have a shift lose their time record
+      const emptyDays = [...affected].filter(([key]) => !written.has(key)).map(([, day]) => day);
+      if (emptyDays.length > 0) {
+        const deleteResult = await client.query(`
+          DELETE FROM time_records tr
+          USING UNNEST($1::text[], $2::date[]) AS d(employee_number, date)
+          WHERE tr.employee_number = d.employee_number
+          AND tr.date = d.date
+        `, [emptyDays.map(day => day.employee_number), emptyDays.map(day => day.date)]);
+        stats.deletedRecords += deleteResult.rowCount;
+        reportCache.invalidateDays(emptyDays, client);
+      }
+
+      return claimed.length;
+    });
+
+    if (claimedCount === 0) break;
+    stats.dirtyDays += claimedCount;
+  }
+
+  stats.durationMs = Date.now() - startedAt;
+  stats.employeeDaysPerSecond = stats.durationMs > 0
+    ? Math.round(stats.dirtyDays / (stats.durationMs / 1000))
+    : stats.dirtyDays;
+
+  return stats;
+}
+
+module.exports = {
+  isScheduledWorkday,
+  loadScheduleContext,
+  computeShiftRecord,
+  computeRecords,
+  upsertTimeRecords,
+  recalculateMonth,
+  recalculateDirtyDays
+};
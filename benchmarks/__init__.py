@@ -0,0 +1,7 @@
+"""
+Нагрузочные тесты и замеры задержек HR Mini App.
+
+Используют те же DB_CONFIG и API_BASE_URL, что и pytest-тесты в
+archive/test_files. Запуск отдельно: python -m benchmarks, или через pytest:
+pytest benchmarks -v
+"""
@@ -0,0 +1,72 @@
+"""
+Запуск: python -m benchmarks [--scenarios timesheet,recalculate] [--baseline old.json]
+
+Засевает синтетическую организацию, прогоняет сценарии и пишет JSON-отчет
+с p50/p95/p99 и пропускной способностью.
+"""
+
+import argparse
+import json
+import sys
+
+import psycopg2
+
+from . import config
+from .runner import build_report, compare, prepare, run_benchmark, write_report
+from .scenarios import SCENARIOS
+from .seed import drop_organization, seed_organization
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Нагрузочные тесты HR Mini App')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='Список сценариев через запятую')
+    parser.add_argument('--departments', type=int, default=config.DEPARTMENTS)
+    parser.add_argument('--employees', type=int, default=config.EMPLOYEES_PER_DEPARTMENT, help='Сотрудников в подразделении')
+    parser.add_argument('--months', type=int, default=config.MONTHS)
+    parser.add_argument('--concurrency', type=int, default=config.CONCURRENCY)
+    parser.add_argument('--requests', type=int, default=config.REQUESTS_PER_SCENARIO, help='Запросов на сценарий')
+    parser.add_argument('--output', default=config.OUTPUT_PATH)
+    parser.add_argument('--baseline', help='Отчет прошлого прогона для сравнения')
+    parser.add_argument('--keep-data', action='store_true', help='Не удалять синтетические данные после прогона')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        print(f'Неизвестные сценарии: {", ".join(unknown)}', file=sys.stderr)
+        return 2
+
+    conn = psycopg2.connect(**config.DB_CONFIG)
+    try:
+        print(f'Seeding {args.departments}x{args.employees} employees, {args.months} months...')
+        org = seed_organization(conn, config.PREFIX, args.departments, args.employees, args.months)
+        print(f'Seeded {len(org["employees"])} employees, {org["time_events"]} time events')
+
+        prepare(config.API_BASE_URL, org)
+
+        results = {}
+        for name in scenarios:
+            results[name] = run_benchmark(config.API_BASE_URL, org, name, args.concurrency, args.requests)
+            latency = results[name]['latency_ms']
+            print(f'{name:20s} p50={latency["p50"]}ms p95={latency["p95"]}ms p99={latency["p99"]}ms '
+                  f'{results[name]["throughput_rps"]} req/s, errors={results[name]["errors"]}')
+
+        report = build_report(org, results, args.concurrency, args.requests)
+        if args.baseline:
+            with open(args.baseline, encoding='utf-8') as file:
+                report['comparison'] = compare(report, json.load(file))
+        write_report(report, args.output)
+        print(f'Report written to {args.output}')
+    finally:
+        if not args.keep_data:
+            drop_organization(conn, config.PREFIX)
+        conn.close()
+
+    return 1 if any(result['errors'] for result in results.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
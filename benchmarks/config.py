@@ -0,0 +1,38 @@
+"""
+Настройки бенчмарков.
+
+Подключение к БД и адрес API берутся из pytest-тестов в archive/test_files,
+чтобы бенчмарки и тесты всегда работали с одним и тем же окружением.
+Любое значение можно переопределить переменной окружения BENCH_*.
+"""
+
+import os
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'archive', 'test_files'))
+
+from test_schedule_assignment import API_BASE_URL as _API_BASE_URL, DB_CONFIG as _DB_CONFIG  # noqa: E402
+
+API_BASE_URL = os.environ.get('BENCH_API_BASE_URL', _API_BASE_URL)
+
+DB_CONFIG = dict(_DB_CONFIG)
+for key, env in (('host', 'BENCH_DB_HOST'), ('port', 'BENCH_DB_PORT'), ('database', 'BENCH_DB_NAME'),
+                 ('user', 'BENCH_DB_USER'), ('password', 'BENCH_DB_PASSWORD')):
+    if os.environ.get(env):
+        DB_CONFIG[key] = os.environ[env]
+
+# Префикс всех синтетических данных: по нему они и удаляются
+PREFIX = os.environ.get('BENCH_PREFIX', 'BENCH')
+
+# Размер синтетической организации
+DEPARTMENTS = int(os.environ.get('BENCH_DEPARTMENTS', 10))
+EMPLOYEES_PER_DEPARTMENT = int(os.environ.get('BENCH_EMPLOYEES_PER_DEPARTMENT', 50))
+MONTHS = int(os.environ.get('BENCH_MONTHS', 3))
+
+# Нагрузка
+CONCURRENCY = int(os.environ.get('BENCH_CONCURRENCY', 8))
+REQUESTS_PER_SCENARIO = int(os.environ.get('BENCH_REQUESTS', 100))
+REQUEST_TIMEOUT = float(os.environ.get('BENCH_REQUEST_TIMEOUT', 300))
+
+OUTPUT_PATH = os.environ.get('BENCH_OUTPUT', os.path.join(ROOT_DIR, 'benchmark_results.json'))
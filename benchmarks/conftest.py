@@ -0,0 +1,49 @@
+"""
+Фикстуры pytest для бенчмарков: подключение к БД как в archive/test_files,
+синтетическая организация на всю сессию и общий JSON-отчет.
+"""
+
+import os
+
+import psycopg2
+import pytest
+from psycopg2.extras import RealDictCursor
+
+from . import config
+from .runner import build_report, prepare, write_report
+from .seed import drop_organization, seed_organization
+
+
+@pytest.fixture(scope='session')
+def db_connection():
+    conn = psycopg2.connect(**config.DB_CONFIG)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture(scope='session')
+def db_cursor(db_connection):
+    cursor = db_connection.cursor(cursor_factory=RealDictCursor)
+    yield cursor
+    cursor.close()
+
+
+@pytest.fixture(scope='session')
+def bench_org(db_connection):
+    """Организация размера BENCH_DEPARTMENTS x BENCH_EMPLOYEES_PER_DEPARTMENT с пересчитанными табелями."""
+    org = seed_organization(db_connection, config.PREFIX, config.DEPARTMENTS,
+                            config.EMPLOYEES_PER_DEPARTMENT, config.MONTHS)
+    prepare(config.API_BASE_URL, org)
+    yield org
+    if not os.environ.get('BENCH_KEEP_DATA'):
+        drop_organization(db_connection, config.PREFIX)
+
+
+@pytest.fixture(scope='session')
+def bench_results(bench_org):
+    """Результаты сценариев; в конце сессии пишутся в BENCH_OUTPUT."""
+    results = {}
+    yield results
+    if results:
+        report = build_report(bench_org, results, config.CONCURRENCY, config.REQUESTS_PER_SCENARIO)
+        write_report(report, config.OUTPUT_PATH)
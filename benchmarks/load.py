@@ -0,0 +1,84 @@
+"""
+Конкурентный прогон HTTP-запросов и сводка по задержкам.
+"""
+
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+def percentile(sorted_values, p):
+    """Процентиль методом ближайшего ранга по отсортированному списку."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies_ms, elapsed_s, errors):
+    latencies = sorted(latencies_ms)
+    total = len(latencies) + errors
+    return {
+        'requests': total,
+        'errors': errors,
+        'elapsed_s': round(elapsed_s, 3),
+        'throughput_rps': round(total / elapsed_s, 2) if elapsed_s > 0 else None,
+        'latency_ms': {
+            'min': round(latencies[0], 2) if latencies else None,
+            'mean': round(sum(latencies) / len(latencies), 2) if latencies else None,
+            'p50': _round(percentile(latencies, 50)),
+            'p95': _round(percentile(latencies, 95)),
+            'p99': _round(percentile(latencies, 99)),
+            'max': round(latencies[-1], 2) if latencies else None,
+        },
+    }
+
+
+def _round(value):
+    return round(value, 2) if value is not None else None
+
+
+def run_scenario(make_request, total_requests, concurrency, timeout):
+    """
+    Выполнить `total_requests` запросов в `concurrency` потоков.
+
+    make_request(session, index, timeout) отправляет один запрос и возвращает
+    requests.Response; ответ не 2xx считается ошибкой и в задержки не входит.
+    """
+    local = threading.local()
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def worker(index):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        started = time.perf_counter()
+        try:
+            response = make_request(local.session, index, timeout)
+            # Потоковые ответы учитываются целиком
+            _ = response.content
+            ok = response.ok
+            detail = None if ok else f'HTTP {response.status_code}: {response.text[:200]}'
+        except requests.RequestException as error:
+            ok, detail = False, str(error)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with lock:
+            if ok:
+                latencies.append(elapsed_ms)
+            else:
+                errors.append(detail)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(total_requests)))
+    elapsed = time.perf_counter() - started
+
+    summary = summarize(latencies, elapsed, len(errors))
+    summary['concurrency'] = concurrency
+    if errors:
+        summary['sample_errors'] = errors[:5]
+    return summary
@@ -0,0 +1,81 @@
+"""
+Сборка отчета: подготовка данных, прогон сценариев, JSON для сравнения между коммитами.
+"""
+
+import json
+import platform
+import subprocess
+from datetime import datetime
+
+import requests
+
+from . import config
+from .load import run_scenario
+from .scenarios import SCENARIOS
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=config.ROOT_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def prepare(api, org, timeout=config.REQUEST_TIMEOUT):
+    """Пересчет time_records по всем подразделениям и месяцам, чтобы чтения шли по заполненным таблицам."""
+    with requests.Session() as session:
+        for year, month in org['months']:
+            for department in org['departments']:
+                response = session.post(f'{api}/admin/recalculate-time-records', json={
+                    'month': f'{year}-{month:02d}',
+                    'department': department['object_code'],
+                }, timeout=timeout)
+                response.raise_for_status()
+
+
+def run_benchmark(api, org, scenario_name, concurrency=config.CONCURRENCY,
+                  total_requests=config.REQUESTS_PER_SCENARIO, timeout=config.REQUEST_TIMEOUT):
+    make_request = SCENARIOS[scenario_name](api, org)
+    return run_scenario(make_request, total_requests, concurrency, timeout)
+
+
+def build_report(org, results, concurrency, total_requests):
+    return {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'api': config.API_BASE_URL,
+        'organization': {
+            'departments': len(org['departments']),
+            'employees': len(org['employees']),
+            'months': [f'{year}-{month:02d}' for year, month in org['months']],
+            'time_events': org['time_events'],
+        },
+        'load': {'concurrency': concurrency, 'requests_per_scenario': total_requests},
+        'scenarios': results,
+    }
+
+
+def write_report(report, path):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+
+
+def compare(report, baseline):
+    """Изменение p50/p95/p99 и пропускной способности относительно прошлого отчета, в процентах."""
+    def change(new, old):
+        if new is None or not old:
+            return None
+        return round((new - old) / old * 100, 1)
+
+    deltas = {}
+    for name, result in report['scenarios'].items():
+        old = baseline.get('scenarios', {}).get(name)
+        if not old:
+            continue
+        deltas[name] = {
+            key: change(result['latency_ms'][key], old['latency_ms'][key])
+            for key in ('p50', 'p95', 'p99')
+        }
+        deltas[name]['throughput_rps'] = change(result['throughput_rps'], old['throughput_rps'])
+    return {'baseline_commit': baseline.get('commit'), 'change_percent': deltas}
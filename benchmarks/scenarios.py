@@ -0,0 +1,117 @@
+"""
+Сценарии нагрузки на горячие эндпоинты.
+
+Каждый сценарий получает описание организации из seed.seed_organization и
+возвращает функцию make_request(session, index, timeout) для load.run_scenario.
+Запросы перебирают сотрудников, подразделения и месяцы по кругу.
+"""
+
+import calendar
+from datetime import date, timedelta
+
+
+def _month_range(year, month):
+    return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+
+
+def timesheet(api, org):
+    employees, months = org['employees'], org['months']
+
+    def make_request(session, index, timeout):
+        year, month = months[index % len(months)]
+        table_number = employees[index % len(employees)]
+        return session.get(f'{api}/employee/by-number/{table_number}/timesheet/{year}/{month}', timeout=timeout)
+    return make_request
+
+
+def department_stats(api, org):
+    employees, months = org['employees'], org['months']
+    # Один сотрудник на подразделение: статистика считается по подразделению
+    per_department = max(1, len(employees) // len(org['departments']))
+
+    def make_request(session, index, timeout):
+        year, month = months[index % len(months)]
+        table_number = employees[(index * per_department) % len(employees)]
+        return session.get(f'{api}/employee/by-number/{table_number}/department-stats/{year}/{month}', timeout=timeout)
+    return make_request
+
+
+def recalculate(api, org):
+    departments, months = org['departments'], org['months']
+
+    def make_request(session, index, timeout):
+        year, month = months[index % len(months)]
+        department = departments[index % len(departments)]['object_code']
+        return session.post(f'{api}/admin/recalculate-time-records',
+                            json={'month': f'{year}-{month:02d}', 'department': department},
+                            timeout=timeout)
+    return make_request
+
+
+def payroll_report(api, org):
+    departments, months = org['departments'], org['months']
+
+    def make_request(session, index, timeout):
+        date_from, date_to = _month_range(*months[index % len(months)])
+        department = departments[index % len(departments)]['object_code']
+        return session.get(f'{api}/admin/reports/payroll', params={
+            'department': department,
+            'dateFrom': date_from.isoformat(),
+            'dateTo': date_to.isoformat(),
+        }, timeout=timeout)
+    return make_request
+
+
+def payroll_attendance(api, org):
+    departments, months = org['departments'], org['months']
+
+    def make_request(session, index, timeout):
+        date_from, date_to = _month_range(*months[index % len(months)])
+        return session.get(f'{api}/admin/payroll/attendance', params={
+            'department_id': departments[index % len(departments)]['id_iiko'],
+            'from_date': date_from.isoformat(),
+            'to_date': date_to.isoformat(),
+        }, timeout=timeout)
+    return make_request
+
+
+def import_1c(api, org, schedules_per_request=20):
+    """Выгрузка 1С: `schedules_per_request` графиков на год вперед от первого месяца."""
+    year, month = org['months'][0]
+    start = date(year, month, 1)
+    days = [start + timedelta(days=offset) for offset in range(365)]
+
+    def payload(index):
+        schedules = []
+        for number in range(schedules_per_request):
+            # Каждый второй запрос меняет часы, чтобы нагружать и обновление, и пропуск без изменений
+            hours = 8 if (index + number) % 2 == 0 else 7
+            schedules.append({
+                'НаименованиеГрафика': f'09:00-18:00 {org["prefix"]} импорт {number}',
+                'КодГрафика': f'{org["prefix"]}-IMPORT-{number:03d}',
+                'РабочиеДни': [{
+                    'Дата': day.isoformat(),
+                    'Месяц': day.replace(day=1).isoformat(),
+                    'ВидУчетаВремени': 'Я' if day.weekday() < 5 else 'В',
+                    'ДополнительноеЗначение': hours if day.weekday() < 5 else 0,
+                } for day in days],
+            })
+        return {
+            'ДатаВыгрузки': start.isoformat(),
+            'КоличествоГрафиков': len(schedules),
+            'Графики': schedules,
+        }
+
+    def make_request(session, index, timeout):
+        return session.post(f'{api}/admin/schedules/import-1c', json=payload(index), timeout=timeout)
+    return make_request
+
+
+SCENARIOS = {
+    'timesheet': timesheet,
+    'department_stats': department_stats,
+    'recalculate': recalculate,
+    'payroll_report': payroll_report,
+    'payroll_attendance': payroll_attendance,
+    'import_1c': import_1c,
+}
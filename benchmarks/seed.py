@@ -0,0 +1,219 @@
+"""
+Синтетическая организация для бенчмарков.
+
+Все строки загружаются через COPY ... FROM STDIN из генераторов, поэтому
+размер организации ограничен только базой, а не памятью процесса.
+"""
+
+import calendar
+import io
+import random
+import uuid
+from datetime import date, datetime, timedelta
+
+# БИН синтетической организации (employees.object_bin)
+BIN_NUMBER = '000000000000'
+
+# Графики: код -> (название, начало, конец, часы, функция "рабочий ли день")
+SCHEDULES = {
+    'SCH-52': ('09:00-18:00 5/2', '09:00', '18:00', 8, lambda day, index: day.weekday() < 5),
+    'SCH-22': ('08:00-20:00 2/2', '08:00', '20:00', 11, lambda day, index: index % 4 < 2),
+}
+
+
+class _RowStream(io.TextIOBase):
+    """Файл для COPY, строки которого генерируются по мере чтения."""
+
+    def __init__(self, rows):
+        self._lines = ('\t'.join(_copy_value(value) for value in row) + '\n' for row in rows)
+        self._buffer = ''
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size is None or size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += next(self._lines)
+            except StopIteration:
+                break
+        if size is None or size < 0:
+            chunk, self._buffer = self._buffer, ''
+        else:
+            chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        return chunk
+
+    readline = read
+
+
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    return str(value)
+
+
+def _copy(cursor, table, columns, rows):
+    cursor.copy_expert(
+        f"COPY {table} ({', '.join(columns)}) FROM STDIN",
+        _RowStream(rows),
+        size=65536
+    )
+    return cursor.rowcount
+
+
+def recent_months(count, today=None):
+    """Последние `count` полных месяцев, от старого к новому, как (год, месяц)."""
+    today = today or date.today()
+    year, month = today.year, today.month
+    months = []
+    for _ in range(count):
+        month -= 1
+        if month == 0:
+            year, month = year - 1, 12
+        months.append((year, month))
+    return list(reversed(months))
+
+
+def _month_days(year, month):
+    for day in range(1, calendar.monthrange(year, month)[1] + 1):
+        yield date(year, month, day)
+
+
+def drop_organization(conn, prefix):
+    """Удаление всех данных с префиксом бенчмарка."""
+    pattern = f'{prefix}-%'
+    with conn.cursor() as cursor:
+        cursor.execute("DELETE FROM time_records_dirty WHERE employee_number LIKE %s", (pattern,))
+        cursor.execute("DELETE FROM time_records WHERE employee_number LIKE %s", (pattern,))
+        cursor.execute("DELETE FROM time_events WHERE employee_number LIKE %s", (pattern,))
+        cursor.execute("DELETE FROM daily_attendance WHERE employee_number LIKE %s", (pattern,))
+        cursor.execute("DELETE FROM payroll_shifts WHERE employee_number LIKE %s", (pattern,))
+        cursor.execute("DELETE FROM employee_schedule_assignments WHERE employee_number LIKE %s", (pattern,))
+        cursor.execute("DELETE FROM work_schedules_1c WHERE schedule_code LIKE %s", (pattern,))
+        cursor.execute("DELETE FROM schedules_1c WHERE schedule_code LIKE %s", (pattern,))
+        cursor.execute("DELETE FROM employees WHERE table_number LIKE %s", (pattern,))
+        cursor.execute("DELETE FROM positions WHERE staff_position_code LIKE %s", (pattern,))
+        cursor.execute("DELETE FROM departments WHERE object_code LIKE %s", (pattern,))
+    conn.commit()
+
+
+def seed_organization(conn, prefix, departments, employees_per_department, months, seed=42):
+    """
+    Создание организации: подразделения, сотрудники, графики 1С с назначениями
+    и события проходной за `months` последних месяцев.
+
+    Возвращает словарь с тем, что нужно сценариям нагрузки.
+    """
+    rng = random.Random(seed)
+    period = recent_months(months)
+
+    drop_organization(conn, prefix)
+
+    department_rows = [
+        (f'{prefix}-DEPT-{d:03d}', f'{prefix} Подразделение {d}', f'{prefix} Компания', BIN_NUMBER, str(uuid.UUID(int=rng.getrandbits(128), version=4)))
+        for d in range(departments)
+    ]
+    schedule_codes = [f'{prefix}-{code}' for code in SCHEDULES]
+    employees = [
+        (f'{prefix}-{d:03d}-{e:05d}', department_rows[d][0], schedule_codes[e % len(schedule_codes)])
+        for d in range(departments)
+        for e in range(employees_per_department)
+    ]
+    first_day = date(period[0][0], period[0][1], 1)
+
+    def schedule_days():
+        for code, (name, start, end, hours, is_workday) in SCHEDULES.items():
+            index = 0
+            for year, month in period:
+                for day in _month_days(year, month):
+                    workday = is_workday(day, index)
+                    index += 1
+                    yield (name, f'{prefix}-{code}', day, date(year, month, 1),
+                           'Я' if workday else 'В', hours if workday else 0, start, end)
+
+    def events():
+        workdays = {}
+        for code, (name, start, end, hours, is_workday) in SCHEDULES.items():
+            index = 0
+            days = []
+            for year, month in period:
+                for day in _month_days(year, month):
+                    if is_workday(day, index):
+                        days.append(day)
+                    index += 1
+            workdays[f'{prefix}-{code}'] = (days, start, end)
+
+        for table_number, object_code, schedule_code in employees:
+            days, start, end = workdays[schedule_code]
+            for day in days:
+                # ~5% прогулов
+                if rng.random() < 0.05:
+                    continue
+                check_in = datetime.combine(day, datetime.strptime(start, '%H:%M').time()) + timedelta(minutes=rng.randint(-15, 20))
+                check_out = datetime.combine(day, datetime.strptime(end, '%H:%M').time()) + timedelta(minutes=rng.randint(-10, 30))
+                yield (table_number, object_code, check_in, '1')
+                yield (table_number, object_code, check_out, '2')
+
+    with conn.cursor() as cursor:
+        _copy(cursor, 'departments', ('object_code', 'object_name', 'object_company', 'object_bin', 'id_iiko'), department_rows)
+        _copy(cursor, 'positions', ('staff_position_code', 'staff_position_name', 'object_bin'),
+              [(f'{prefix}-POS', f'{prefix} Должность', BIN_NUMBER)])
+        _copy(cursor, 'employees', ('object_code', 'staff_position_code', 'table_number', 'full_name', 'status', 'object_bin', 'payroll'),
+              ((object_code, f'{prefix}-POS', table_number, f'{prefix} Сотрудник {table_number}', 1, BIN_NUMBER, 300000)
+               for table_number, object_code, _ in employees))
+        _copy(cursor, 'work_schedules_1c',
+              ('schedule_name', 'schedule_code', 'work_date', 'work_month', 'time_type', 'work_hours', 'work_start_time', 'work_end_time'),
+              schedule_days())
+        cursor.execute("""
+            INSERT INTO schedules_1c
+                (schedule_code, schedule_name, work_start_time, work_end_time, start_date, end_date, work_days_count, avg_hours)
+            SELECT schedule_code, MAX(schedule_name),
+                   MODE() WITHIN GROUP (ORDER BY work_start_time), MODE() WITHIN GROUP (ORDER BY work_end_time),
+                   MIN(work_date), MAX(work_date), COUNT(*), AVG(work_hours)
+            FROM work_schedules_1c
+            WHERE schedule_code LIKE %s
+            GROUP BY schedule_code
+        """, (f'{prefix}-%',))
+
+        _copy(cursor, 'employee_schedule_assignments', ('employee_number', 'schedule_code', 'start_date', 'assigned_by'),
+              ((table_number, schedule_code, first_day, 'benchmark') for table_number, _, schedule_code in employees))
+        cursor.execute("""
+            UPDATE employee_schedule_assignments esa
+            SET employee_id = e.id
+            FROM employees e
+            WHERE e.table_number = esa.employee_number
+              AND esa.employee_number LIKE %s
+        """, (f'{prefix}-%',))
+
+        # Смены для отчетов по ФОТ, как их строит backend/utils/payrollShifts.js
+        cursor.execute("""
+            INSERT INTO payroll_shifts (employee_number, work_date, schedule_code, schedule_name, time_type, work_hours)
+            SELECT esa.employee_number, ws.work_date, ws.schedule_code, ws.schedule_name, ws.time_type, ws.work_hours
+            FROM employee_schedule_assignments esa
+            JOIN work_schedules_1c ws ON ws.schedule_code = esa.schedule_code AND ws.work_date >= esa.start_date
+            WHERE esa.employee_number LIKE %s
+        """, (f'{prefix}-%',))
+
+        _copy(cursor, 'time_events', ('employee_number', 'object_code', 'event_datetime', 'event_type'), events())
+        events_count = cursor.rowcount
+
+        # COPY идет мимо приложения, поэтому сводку посещаемости строим здесь
+        cursor.execute("""
+            INSERT INTO daily_attendance (employee_number, date, first_entry, last_exit, event_count)
+            SELECT employee_number, event_datetime::date, MIN(event_datetime), MAX(event_datetime), COUNT(*)
+            FROM time_events
+            WHERE employee_number LIKE %s
+            GROUP BY employee_number, event_datetime::date
+        """, (f'{prefix}-%',))
+
+        for table in ('departments', 'employees', 'work_schedules_1c', 'schedules_1c', 'employee_schedule_assignments', 'time_events', 'daily_attendance', 'payroll_shifts'):
+            cursor.execute(f'ANALYZE {table}')
+    conn.commit()
+
+    return {
+        'prefix': prefix,
+        'departments': [{'object_code': row[0], 'id_iiko': row[4]} for row in department_rows],
+        'employees': [table_number for table_number, _, _ in employees],
+        'months': period,
+        'time_events': events_count,
+    }
@@ -0,0 +1,36 @@
+"""
+Замеры задержек горячих эндпоинтов под конкурентной нагрузкой.
+
+Запуск: pytest benchmarks -v
+Размер данных и нагрузки задаются переменными BENCH_* (см. config.py),
+отчет с p50/p95/p99 пишется в BENCH_OUTPUT.
+"""
+
+import pytest
+
+from . import config
+from .runner import run_benchmark
+from .scenarios import SCENARIOS
+
+
+def test_seeded_organization(db_cursor, bench_org):
+    """Синтетические данные загружены полностью"""
+    db_cursor.execute("SELECT COUNT(*) AS count FROM employees WHERE table_number LIKE %s",
+                      (f"{bench_org['prefix']}-%",))
+    assert db_cursor.fetchone()['count'] == len(bench_org['employees'])
+
+    db_cursor.execute("SELECT COUNT(*) AS count FROM time_records WHERE employee_number LIKE %s",
+                      (f"{bench_org['prefix']}-%",))
+    assert db_cursor.fetchone()['count'] > 0
+
+
+@pytest.mark.parametrize('scenario', list(SCENARIOS))
+def test_latency(scenario, bench_org, bench_results):
+    """Сценарий проходит без ошибок; задержки попадают в отчет"""
+    result = run_benchmark(config.API_BASE_URL, bench_org, scenario)
+    bench_results[scenario] = result
+
+    latency = result['latency_ms']
+    print(f"\n{scenario}: p50={latency['p50']}ms p95={latency['p95']}ms p99={latency['p99']}ms "
+          f"{result['throughput_rps']} req/s")
+    assert result['errors'] == 0, result.get('sample_errors')
@@ -0,0 +1,137 @@
+"""
+Регрессия планов: горячие запросы не должны откатываться на Seq Scan.
+
+Фильтры повторяют запросы маршрутов после перевода на полуинтервалы
+(backend/utils/queryFilters.js). Запрос, обернувший индексированную колонку
+в функцию (DATE(), to_char, EXTRACT), или пропавший индекс из миграций
+016-023 дают Seq Scan и валят тест.
+
+Запуск: pytest benchmarks/test_query_plans.py -v
+"""
+
+import json
+from datetime import date
+
+import pytest
+
+from .seed import BIN_NUMBER
+
+# Таблицы, по которым полный просмотр на больших данных недопустим
+INDEXED_TABLES = {'time_events', 'time_records', 'employees', 'work_schedules_1c', 'daily_attendance', 'payroll_shifts',
+                  'employee_schedule_assignments'}
+
+HOT_QUERIES = {
+    'admin_time_events': """
+        SELECT te.*, e.full_name
+        FROM time_events te
+        LEFT JOIN employees e ON te.employee_number = e.table_number
+        WHERE 1=1 AND e.object_code = %(department)s
+        AND te.event_datetime >= %(date_from)s AND te.event_datetime < %(date_to)s
+        ORDER BY te.event_datetime DESC, te.id DESC LIMIT 1001
+    """,
+    'admin_time_records': """
+        SELECT tr.*, e.full_name
+        FROM time_records tr
+        LEFT JOIN employees e ON tr.employee_number = e.table_number
+        WHERE 1=1 AND e.object_bin = %(organization)s AND e.object_code = %(department)s
+        AND tr.date >= %(date_from)s AND tr.date < %(date_to)s
+        ORDER BY tr.date DESC, tr.employee_number DESC LIMIT 1001
+    """,
+    'late_employees': """
+        SELECT DISTINCT ON (employee_number) employee_number, event_datetime
+        FROM time_events
+        WHERE event_type = 'вход'
+        AND event_datetime >= %(date_from)s::date AND event_datetime < %(date_from)s::date + 1
+        ORDER BY employee_number, event_datetime
+    """,
+    'department_stats_attendance': """
+        SELECT e.table_number, d.date, da.first_entry, da.last_exit
+        FROM employees e
+        CROSS JOIN generate_series(%(date_from)s::date, %(date_to)s::date - 1, interval '1 day') d(date)
+        LEFT JOIN daily_attendance da ON da.employee_number = e.table_number AND da.date = d.date
+        WHERE e.object_code = %(department)s
+    """,
+    'payroll_attendance': """
+        SELECT e.table_number, ps.work_date, ps.work_hours,
+               COUNT(*) OVER (PARTITION BY e.id) AS shift_count
+        FROM employees e
+        JOIN payroll_shifts ps ON ps.employee_number = e.table_number
+        WHERE e.object_code = %(department)s
+        AND e.status = 1 AND e.payroll > 0
+        AND ps.work_date >= %(date_from)s AND ps.work_date < %(date_to)s
+        AND ps.time_type != 'В'
+    """,
+    'employee_time_events': """
+        SELECT DATE(event_datetime) AS date, COUNT(*)
+        FROM time_events
+        WHERE employee_number = %(employee)s
+        AND event_datetime >= %(date_from)s AND event_datetime < %(date_to)s
+        GROUP BY DATE(event_datetime)
+    """,
+    'department_stats_assignments': """
+        SELECT e.table_number, d.date, esa.schedule_code
+        FROM employees e
+        CROSS JOIN generate_series(%(date_from)s::date, %(date_to)s::date - 1, interval '1 day') d(date)
+        LEFT JOIN employee_schedule_assignments esa
+            ON esa.employee_number = e.table_number AND esa.valid_during @> (d.date)::date
+        WHERE e.object_code = %(department)s
+    """,
+    'assignments_during': """
+        SELECT employee_number, schedule_code, lower(valid_during), upper(valid_during)
+        FROM employee_schedule_assignments
+        WHERE employee_number = ANY(%(employees)s)
+        AND valid_during && daterange(%(date_from)s::date, %(date_to)s::date)
+        ORDER BY employee_number, start_date
+    """,
+    'schedule_calendar_load': """
+        SELECT schedule_code, work_date, time_type, work_hours, work_start_time, work_end_time
+        FROM work_schedules_1c
+        WHERE schedule_code = ANY(%(schedules)s)
+        ORDER BY schedule_code, work_date
+    """,
+}
+
+
+def _seq_scans(plan):
+    """Таблицы из INDEXED_TABLES, которые план читает последовательным просмотром."""
+    found = []
+    if plan.get('Node Type') == 'Seq Scan' and plan.get('Relation Name') in INDEXED_TABLES:
+        found.append(plan['Relation Name'])
+    for child in plan.get('Plans', []):
+        found.extend(_seq_scans(child))
+    return found
+
+
+@pytest.fixture(scope='module')
+def query_params(db_cursor, bench_org):
+    """Последний засеянный месяц первого подразделения как полуинтервал [date_from, date_to)."""
+    year, month = bench_org['months'][-1]
+    db_cursor.execute('SELECT schedule_code FROM employee_schedule_assignments WHERE employee_number = %s LIMIT 1',
+                      (bench_org['employees'][0],))
+    return {
+        'organization': BIN_NUMBER,
+        'department': bench_org['departments'][0]['object_code'],
+        'employee': bench_org['employees'][0],
+        'employees': bench_org['employees'][:500],
+        'schedules': [db_cursor.fetchone()['schedule_code']],
+        'date_from': date(year, month, 1).isoformat(),
+        'date_to': date(year + month // 12, month % 12 + 1, 1).isoformat(),
+    }
+
+
+@pytest.mark.parametrize('name', list(HOT_QUERIES))
+def test_hot_query_uses_index(name, db_connection, query_params):
+    """Запрос обходится без Seq Scan по большим таблицам"""
+    with db_connection.cursor() as cursor:
+        try:
+            # Seq Scan остается в плане, только если подходящего индекса нет
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + HOT_QUERIES[name], query_params)
+            plan = cursor.fetchone()[0]
+        finally:
+            db_connection.rollback()
+
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    scans = _seq_scans(plan[0]['Plan'])
+    assert not scans, f'{name}: Seq Scan по {", ".join(scans)}'
@@ -0,0 +1,18 @@
+-- Migration 014: Dirty employee-days for incremental time_records recomputation
+-- Date: 2026-10-18
+-- Purpose: Ingest and schedule changes record which (employee_number, date) pairs
+--          must be recomputed, so the nightly load only rebuilds what changed
+
+CREATE TABLE IF NOT EXISTS time_records_dirty (
+    employee_number TEXT NOT NULL,
+    date DATE NOT NULL,
+    reason TEXT,
+    marked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (employee_number, date)
+);
+
+CREATE INDEX IF NOT EXISTS idx_time_records_dirty_marked_at
+    ON time_records_dirty(marked_at);
+
+COMMENT ON TABLE time_records_dirty IS 'Employee-days whose time_records must be recomputed';
+COMMENT ON COLUMN time_records_dirty.reason IS 'What marked the day dirty: events, schedule, assignment';
@@ -0,0 +1,48 @@
+-- Migration 015: Catalog of 1C schedule codes
+-- Date: 2026-10-18
+-- Purpose: One row per schedule_code with the summary that list and lookup
+--          queries used to compute with SELECT DISTINCT / GROUP BY over the
+--          day-level work_schedules_1c table. Maintained by import-1c and
+--          update-times (see backend/utils/scheduleImport.js)
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS schedules_1c (
+    schedule_code VARCHAR(255) PRIMARY KEY,
+    schedule_name VARCHAR(255) NOT NULL,
+    work_start_time TIME,
+    work_end_time TIME,
+    start_date DATE,
+    end_date DATE,
+    work_days_count INTEGER NOT NULL DEFAULT 0,
+    avg_hours NUMERIC(5,2),
+    created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_schedules_1c_name
+    ON schedules_1c(schedule_name);
+
+-- Backfill from the already imported schedule days
+INSERT INTO schedules_1c
+    (schedule_code, schedule_name, work_start_time, work_end_time, start_date, end_date, work_days_count, avg_hours, updated_at)
+SELECT
+    schedule_code,
+    MAX(schedule_name),
+    MODE() WITHIN GROUP (ORDER BY work_start_time),
+    MODE() WITHIN GROUP (ORDER BY work_end_time),
+    MIN(work_date),
+    MAX(work_date),
+    COUNT(*),
+    AVG(work_hours),
+    MAX(updated_at)
+FROM work_schedules_1c
+GROUP BY schedule_code
+ON CONFLICT (schedule_code) DO NOTHING;
+
+COMMENT ON TABLE schedules_1c IS 'One row per 1C schedule code, summary of work_schedules_1c';
+COMMENT ON COLUMN schedules_1c.work_start_time IS 'Most common work start time of the schedule days';
+COMMENT ON COLUMN schedules_1c.work_end_time IS 'Most common work end time of the schedule days';
+COMMENT ON COLUMN schedules_1c.work_days_count IS 'Number of days in work_schedules_1c for the code';
+
+COMMIT;
@@ -0,0 +1,26 @@
+-- Migration 016: Indexes for half-open date range filters
+-- Date: 2026-10-18
+-- Purpose: Month and date filters are now written as `column >= start AND
+--          column < end` on the raw column (see backend/utils/queryFilters.js).
+--          These indexes serve the range scans that are not led by
+--          employee_number, plus the organization/department filters they
+--          are combined with. Check with `python -m pytest benchmarks/test_query_plans.py`
+
+-- /admin/time-events, late-employees: range over all employees
+CREATE INDEX IF NOT EXISTS idx_time_events_datetime
+    ON time_events(event_datetime);
+
+-- /admin/time-records month filter
+CREATE INDEX IF NOT EXISTS idx_time_records_date
+    ON time_records(date);
+
+-- Organization and department filters joined to events and records
+CREATE INDEX IF NOT EXISTS idx_employees_object_bin_code
+    ON employees(object_bin, object_code);
+
+CREATE INDEX IF NOT EXISTS idx_employees_object_code
+    ON employees(object_code);
+
+ANALYZE time_events;
+ANALYZE time_records;
+ANALYZE employees;
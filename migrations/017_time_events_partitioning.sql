@@ -0,0 +1,66 @@
+-- Migration 017: Monthly range partitioning of time_events
+-- Date: 2026-10-18
+-- Purpose: Month-scoped queries only touch their month's partition, old
+--          months can be detached by the retention policy and a month can be
+--          reloaded by swapping one partition (backend/utils/timeEventPartitions.js).
+--          initializeDatabase() creates the plain table, so new databases
+--          run it too.
+-- Note: rewrites the whole table; run in a maintenance window.
+
+BEGIN;
+
+ALTER TABLE time_events RENAME TO time_events_unpartitioned;
+ALTER TABLE time_events_unpartitioned RENAME CONSTRAINT time_events_pkey TO time_events_unpartitioned_pkey;
+DROP INDEX IF EXISTS idx_time_events_employee_date;
+DROP INDEX IF EXISTS idx_time_events_datetime;
+
+-- The primary key of a partitioned table must include the partition key
+CREATE TABLE time_events (
+    id INTEGER NOT NULL DEFAULT nextval('time_events_id_seq'),
+    employee_number TEXT NOT NULL,
+    object_code TEXT,
+    event_datetime TIMESTAMP NOT NULL,
+    event_type TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, event_datetime)
+) PARTITION BY RANGE (event_datetime);
+
+ALTER SEQUENCE time_events_id_seq OWNED BY time_events.id;
+
+CREATE TABLE time_events_default PARTITION OF time_events DEFAULT;
+
+-- One partition per month from the first stored event to three months ahead
+DO $$
+DECLARE
+    month_start DATE;
+BEGIN
+    FOR month_start IN
+        SELECT generate_series(
+            date_trunc('month', LEAST(COALESCE(MIN(event_datetime), CURRENT_DATE), CURRENT_DATE)),
+            date_trunc('month', GREATEST(COALESCE(MAX(event_datetime), CURRENT_DATE), CURRENT_DATE + INTERVAL '3 months')),
+            INTERVAL '1 month'
+        )::date
+        FROM time_events_unpartitioned
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF time_events FOR VALUES FROM (%L) TO (%L)',
+            'time_events_y' || to_char(month_start, 'YYYY') || 'm' || to_char(month_start, 'MM'),
+            month_start,
+            (month_start + INTERVAL '1 month')::date
+        );
+    END LOOP;
+END $$;
+
+INSERT INTO time_events (id, employee_number, object_code, event_datetime, event_type, created_at)
+SELECT id, employee_number, object_code, event_datetime, event_type, created_at
+FROM time_events_unpartitioned;
+
+DROP TABLE time_events_unpartitioned;
+
+-- Created on the parent, so every current and future partition gets them
+CREATE INDEX idx_time_events_employee_date ON time_events(employee_number, event_datetime);
+CREATE INDEX idx_time_events_datetime ON time_events(event_datetime);
+
+COMMIT;
+
+ANALYZE time_events;
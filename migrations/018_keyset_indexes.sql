@@ -0,0 +1,14 @@
+-- Migration 018: Indexes matching the keyset order of the admin list endpoints
+-- Date: 2026-10-18
+-- Purpose: /admin/time-events pages by (event_datetime, id) and
+--          /admin/time-records by (date, employee_number), see
+--          backend/utils/keyset.js. The composite indexes also serve every
+--          range filter the single-column indexes from migrations 016/017 did.
+
+CREATE INDEX IF NOT EXISTS idx_time_events_datetime_id
+    ON time_events(event_datetime, id);
+DROP INDEX IF EXISTS idx_time_events_datetime;
+
+CREATE INDEX IF NOT EXISTS idx_time_records_date_employee
+    ON time_records(date, employee_number);
+DROP INDEX IF EXISTS idx_time_records_date;
@@ -0,0 +1,39 @@
+-- Migration 019: Daily attendance rollup
+-- Date: 2026-10-18
+-- Purpose: First entry, last exit and event count per employee-day, kept in
+--          step with time_events at ingest and recalculation time, so
+--          department statistics do not aggregate raw events on every request
+
+CREATE TABLE IF NOT EXISTS daily_attendance (
+    employee_number TEXT NOT NULL,
+    date DATE NOT NULL,
+    first_entry TIMESTAMP NOT NULL,
+    last_exit TIMESTAMP NOT NULL,
+    event_count INTEGER NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (employee_number, date)
+);
+
+CREATE INDEX IF NOT EXISTS idx_daily_attendance_date
+    ON daily_attendance(date);
+
+-- Backfill from the events already loaded
+INSERT INTO daily_attendance (employee_number, date, first_entry, last_exit, event_count, updated_at)
+SELECT
+    employee_number,
+    event_datetime::date,
+    MIN(event_datetime),
+    MAX(event_datetime),
+    COUNT(*),
+    CURRENT_TIMESTAMP
+FROM time_events
+GROUP BY employee_number, event_datetime::date
+ON CONFLICT (employee_number, date) DO UPDATE SET
+    first_entry = EXCLUDED.first_entry,
+    last_exit = EXCLUDED.last_exit,
+    event_count = EXCLUDED.event_count,
+    updated_at = CURRENT_TIMESTAMP;
+
+COMMENT ON TABLE daily_attendance IS 'Per employee-day rollup of time_events: earliest and latest event and their count';
+COMMENT ON COLUMN daily_attendance.first_entry IS 'Earliest event of the day, regardless of event type';
+COMMENT ON COLUMN daily_attendance.last_exit IS 'Latest event of the day, regardless of event type';
@@ -0,0 +1,41 @@
+-- Migration 020: Payroll shift allocation
+-- Date: 2026-10-18
+-- Purpose: One row per (employee, work_date) of the 1C schedule assigned to the
+--          employee that day, so the payroll reports split payroll over
+--          precomputed shifts instead of joining assignments with schedule
+--          days on every request. Maintained by the assignment and 1C schedule
+--          import code; payroll itself stays in employees.
+
+CREATE TABLE IF NOT EXISTS payroll_shifts (
+    employee_number TEXT NOT NULL,
+    work_date DATE NOT NULL,
+    schedule_code TEXT NOT NULL,
+    schedule_name TEXT,
+    time_type TEXT,
+    work_hours INTEGER,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (employee_number, work_date)
+);
+
+CREATE INDEX IF NOT EXISTS idx_payroll_shifts_schedule_date
+    ON payroll_shifts(schedule_code, work_date);
+
+-- Backfill: the assignment covering the day wins, the latest one if several overlap
+INSERT INTO payroll_shifts (employee_number, work_date, schedule_code, schedule_name, time_type, work_hours, updated_at)
+SELECT DISTINCT ON (esa.employee_number, ws.work_date)
+    esa.employee_number,
+    ws.work_date,
+    ws.schedule_code,
+    ws.schedule_name,
+    ws.time_type,
+    ws.work_hours,
+    CURRENT_TIMESTAMP
+FROM employee_schedule_assignments esa
+JOIN work_schedules_1c ws ON ws.schedule_code = esa.schedule_code
+    AND ws.work_date >= esa.start_date
+    AND (esa.end_date IS NULL OR ws.work_date <= esa.end_date)
+ORDER BY esa.employee_number, ws.work_date, esa.start_date DESC, esa.created_at DESC
+ON CONFLICT (employee_number, work_date) DO NOTHING;
+
+COMMENT ON TABLE payroll_shifts IS 'Schedule day of every employee-day covered by a 1C schedule assignment; payroll is split over these rows';
+COMMENT ON COLUMN payroll_shifts.time_type IS 'work_schedules_1c.time_type of the day; В marks days off';
@@ -0,0 +1,47 @@
+-- Migration 021: Durable background load jobs
+-- Date: 2026-10-18
+-- Purpose: Timesheet loads started from the admin panel are queued in the
+--          database and claimed by workers with FOR UPDATE SKIP LOCKED, so a
+--          restart resumes them, identical requests share one job and any
+--          backend process can report their progress
+
+CREATE TABLE IF NOT EXISTS load_jobs (
+    id BIGSERIAL PRIMARY KEY,
+    kind TEXT NOT NULL,
+    params JSONB NOT NULL,
+    -- Identical requests have the same key; only one of them may be active
+    dedupe_key TEXT NOT NULL,
+    -- Jobs with the same scope (organization or employee) never run at once
+    scope TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    progress JSONB NOT NULL DEFAULT '{}',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    locked_by TEXT,
+    locked_until TIMESTAMP,
+    error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT load_jobs_status_check CHECK (status IN ('queued', 'running', 'completed', 'error'))
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_load_jobs_active_dedupe
+    ON load_jobs(dedupe_key)
+    WHERE status IN ('queued', 'running');
+
+CREATE INDEX IF NOT EXISTS idx_load_jobs_status_created
+    ON load_jobs(status, created_at);
+
+-- Employees whose events a job has already saved; a resumed job skips them
+CREATE TABLE IF NOT EXISTS load_job_checkpoints (
+    job_id BIGINT NOT NULL REFERENCES load_jobs(id) ON DELETE CASCADE,
+    employee_number TEXT NOT NULL,
+    events_loaded INTEGER NOT NULL DEFAULT 0,
+    completed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (job_id, employee_number)
+);
+
+COMMENT ON TABLE load_jobs IS 'Background load jobs (e.g. timesheet loads from the TCO API) with their progress';
+COMMENT ON COLUMN load_jobs.locked_until IS 'Lease of the worker running the job; an expired lease lets another worker resume it';
+COMMENT ON TABLE load_job_checkpoints IS 'Per-employee completion marks of a load job';
@@ -0,0 +1,64 @@
+-- Migration 022: Natural key for time_events
+-- Date: 2026-10-18
+-- Purpose: An event is identified by (employee_number, event_datetime,
+--          event_type, object_code), so re-syncing a period inserts only the
+--          events that are not stored yet (ON CONFLICT DO NOTHING used to
+--          have no constraint to fire on). Existing duplicates are removed,
+--          keeping the oldest copy, and their days are recomputed.
+-- Note: scans the whole table; run in a maintenance window.
+
+BEGIN;
+
+CREATE TEMP TABLE time_events_duplicates ON COMMIT DROP AS
+SELECT id, employee_number, event_datetime
+FROM (
+    SELECT id, employee_number, event_datetime,
+        ROW_NUMBER() OVER (
+            PARTITION BY employee_number, event_datetime, event_type, object_code
+            ORDER BY id
+        ) AS copy
+    FROM time_events
+) numbered
+WHERE copy > 1;
+
+DELETE FROM time_events te
+USING time_events_duplicates d
+WHERE te.id = d.id
+AND te.event_datetime = d.event_datetime;
+
+-- Event counts and time records of the affected days
+UPDATE daily_attendance da
+SET event_count = c.event_count, updated_at = CURRENT_TIMESTAMP
+FROM (
+    SELECT te.employee_number, te.event_datetime::date AS date, COUNT(*) AS event_count
+    FROM time_events te
+    JOIN (
+        SELECT DISTINCT employee_number, event_datetime::date AS date
+        FROM time_events_duplicates
+    ) d ON te.employee_number = d.employee_number
+        AND te.event_datetime >= d.date
+        AND te.event_datetime < d.date + 1
+    GROUP BY te.employee_number, te.event_datetime::date
+) c
+WHERE da.employee_number = c.employee_number
+AND da.date = c.date;
+
+INSERT INTO time_records_dirty (employee_number, date, reason, marked_at)
+SELECT DISTINCT employee_number, event_datetime::date, 'events', CURRENT_TIMESTAMP
+FROM time_events_duplicates
+ON CONFLICT (employee_number, date) DO UPDATE SET
+    reason = EXCLUDED.reason,
+    marked_at = CURRENT_TIMESTAMP;
+
+-- Includes the partition key, as every unique constraint of a partitioned
+-- table must; events without an object code are equal to each other
+ALTER TABLE time_events
+    ADD CONSTRAINT time_events_natural_key
+    UNIQUE NULLS NOT DISTINCT (employee_number, event_datetime, event_type, object_code);
+
+-- The constraint's index starts with (employee_number, event_datetime)
+DROP INDEX IF EXISTS idx_time_events_employee_date;
+
+COMMIT;
+
+ANALYZE time_events;
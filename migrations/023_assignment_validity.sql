@@ -0,0 +1,142 @@
+-- Migration 023: Validity ranges for employee_schedule_assignments
+-- Date: 2026-10-18
+-- Purpose: Each assignment gets valid_during, the daterange [start_date,
+--          end_date] it is in force, and an exclusion constraint keeps the
+--          ranges of one employee from overlapping. Recalculation, timesheets
+--          and payroll resolve the schedule of a day with
+--          valid_during @> date (backend/utils/assignmentsAsOf.js) instead
+--          of reading only the open-ended assignment or re-deriving overlaps
+--          with "latest start wins".
+--          Existing overlaps are resolved the way the readers resolved them:
+--          the later start wins, the later created one on the same start. An
+--          assignment with a later one inside it is split around it, so it is
+--          still in force after the inner one ends. Assignments ending before
+--          they start cover no day and are removed.
+-- Note: the constraint is DEFERRABLE INITIALLY DEFERRED so a writer may
+--       insert an assignment and trim its neighbours in one transaction
+--       (scheduleAssignments.placeAssignments).
+
+BEGIN;
+
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+-- Covers no day
+DELETE FROM employee_schedule_assignments
+WHERE end_date < start_date;
+
+-- Shadowed by a later created assignment with the same start
+DELETE FROM employee_schedule_assignments esa
+WHERE EXISTS (
+    SELECT 1
+    FROM employee_schedule_assignments later
+    WHERE later.employee_number = esa.employee_number
+    AND later.start_date = esa.start_date
+    AND (later.created_at, later.id) > (esa.created_at, esa.id)
+);
+
+-- Which assignment is in force on each day, the later start winning, as runs
+-- of consecutive days. The timeline of an employee is cut at every start and
+-- every day after an end, each piece goes to the latest started assignment
+-- covering it, and adjacent pieces of the same assignment are joined. An
+-- assignment always keeps its own start day, so its first run starts there;
+-- it has more runs when a later one sits inside it and it resumes afterwards.
+CREATE TEMP TABLE assignment_runs ON COMMIT DROP AS
+WITH bounds AS (
+    SELECT employee_number, start_date AS at
+    FROM employee_schedule_assignments
+    UNION
+    SELECT employee_number, COALESCE(end_date + 1, 'infinity'::date)
+    FROM employee_schedule_assignments
+),
+pieces AS (
+    SELECT employee_number, at AS piece_start,
+        LEAD(at) OVER (PARTITION BY employee_number ORDER BY at) AS piece_end
+    FROM bounds
+),
+winners AS (
+    SELECT p.employee_number, p.piece_start, p.piece_end, w.id
+    FROM pieces p
+    CROSS JOIN LATERAL (
+        SELECT esa.id
+        FROM employee_schedule_assignments esa
+        WHERE esa.employee_number = p.employee_number
+        AND esa.start_date <= p.piece_start
+        AND (esa.end_date IS NULL OR esa.end_date >= p.piece_start)
+        ORDER BY esa.start_date DESC
+        LIMIT 1
+    ) w
+    WHERE p.piece_end IS NOT NULL
+),
+flagged AS (
+    SELECT *,
+        CASE WHEN LAG(id) OVER w = id AND LAG(piece_end) OVER w = piece_start THEN 0 ELSE 1 END AS new_run
+    FROM winners
+    WINDOW w AS (PARTITION BY employee_number ORDER BY piece_start)
+),
+numbered AS (
+    SELECT *, SUM(new_run) OVER (PARTITION BY employee_number ORDER BY piece_start) AS run
+    FROM flagged
+)
+SELECT
+    id,
+    MIN(piece_start) AS run_start,
+    CASE WHEN MAX(piece_end) = 'infinity' THEN NULL ELSE MAX(piece_end) - 1 END AS run_end
+FROM numbered
+GROUP BY employee_number, id, run;
+
+DO $$
+DECLARE
+    trimmed INTEGER;
+    split INTEGER;
+BEGIN
+    SELECT COUNT(*) INTO trimmed
+    FROM employee_schedule_assignments esa
+    JOIN assignment_runs r ON r.id = esa.id AND r.run_start = esa.start_date
+    WHERE r.run_end IS DISTINCT FROM esa.end_date;
+
+    SELECT COUNT(DISTINCT id) INTO split
+    FROM assignment_runs r
+    WHERE EXISTS (
+        SELECT 1 FROM employee_schedule_assignments esa
+        WHERE esa.id = r.id AND esa.start_date <> r.run_start
+    );
+
+    RAISE NOTICE 'Assignments ending at a later start: %, split around a later one inside them: %', trimmed, split;
+END $$;
+
+-- First run: the assignment itself ends where it stops being in force
+UPDATE employee_schedule_assignments esa
+SET end_date = r.run_end, updated_at = CURRENT_TIMESTAMP
+FROM assignment_runs r
+WHERE r.id = esa.id
+AND r.run_start = esa.start_date
+AND r.run_end IS DISTINCT FROM esa.end_date;
+
+-- Later runs: the remainder after an assignment inside it, as a copy
+INSERT INTO employee_schedule_assignments
+(employee_id, employee_number, schedule_code, start_date, end_date, assigned_by, created_at, updated_at)
+SELECT esa.employee_id, esa.employee_number, esa.schedule_code, r.run_start, r.run_end,
+    esa.assigned_by, esa.created_at, CURRENT_TIMESTAMP
+FROM assignment_runs r
+JOIN employee_schedule_assignments esa ON esa.id = r.id
+WHERE r.run_start <> esa.start_date;
+
+ALTER TABLE employee_schedule_assignments
+    ADD COLUMN valid_during DATERANGE
+    GENERATED ALWAYS AS (daterange(start_date, end_date, '[]')) STORED;
+
+ALTER TABLE employee_schedule_assignments
+    ADD CONSTRAINT employee_schedule_assignments_no_overlap
+    EXCLUDE USING gist (employee_number WITH =, valid_during WITH &&)
+    DEFERRABLE INITIALLY DEFERRED;
+
+-- Assignments of a schedule during a period (markSchedulesDirty,
+-- refreshSchedules); replaces the (start_date, end_date) btree
+CREATE INDEX IF NOT EXISTS idx_employee_schedule_assignments_schedule_validity
+ON employee_schedule_assignments USING gist (schedule_code, valid_during);
+
+DROP INDEX IF EXISTS idx_employee_schedule_assignments_dates;
+
+COMMIT;
+
+ANALYZE employee_schedule_assignments;
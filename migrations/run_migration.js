@@ -1,6 +1,6 @@
 const fs = require('fs');
 const path = require('path');
-const { pool } = require('../backend/database_pg');
+const { pool, createBaseTables, pendingMigrations } = require('../backend/database_pg');
 
 async function runMigration(migrationFile) {
   console.log(`\n🚀 Running migration: ${migrationFile}`);
@@ -20,18 +20,46 @@ async function runMigration(migrationFile) {
   }
 }
 
+// Creates the base tables and runs every required migration the database
+// is missing, in order. The schema is checked again after each file: 017
+// recreates time_events, dropping indexes a 018 run out of order put there.
+async function runPendingMigrations() {
+  await createBaseTables();
+
+  let pending = await pendingMigrations();
+  if (pending.length === 0) {
+    console.log('✅ Database schema is up to date');
+    return;
+  }
+  console.log(`Pending migrations: ${pending.join(', ')}`);
+
+  while (pending.length > 0) {
+    const migrationFile = pending[0];
+    await runMigration(migrationFile);
+    pending = await pendingMigrations();
+    if (pending.includes(migrationFile)) {
+      throw new Error(`Migration ${migrationFile} ran but its schema is still missing`);
+    }
+  }
+}
+
 async function main() {
   const migrationFile = process.argv[2];
   
   if (!migrationFile) {
     console.error('❌ Please specify a migration file to run');
     console.log('Usage: node migrations/run_migration.js <migration_file>');
+    console.log('       node migrations/run_migration.js --pending');
     console.log('Example: node migrations/run_migration.js 002_work_schedules.sql');
     process.exit(1);
   }
   
   try {
-    await runMigration(migrationFile);
+    if (migrationFile === '--pending') {
+      await runPendingMigrations();
+    } else {
+      await runMigration(migrationFile);
+    }
   } catch (error) {
     console.error('Migration failed:', error);
     process.exit(1);
@@ -45,4 +73,4 @@ if (require.main === module) {
   main();
 }
 
-module.exports = { runMigration };
\ No newline at end of file
+module.exports = { runMigration, runPendingMigrations };
\ No newline at end of file
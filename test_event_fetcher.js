@@ -0,0 +1,94 @@
+#!/usr/bin/env node
+
+// Test script for the concurrent TCO event fetcher against a local stand-in server
+const http = require('http');
+const { createEventFetcher, runWithConcurrency } = require('./backend/utils/eventFetcher');
+
+const EMPLOYEES = 60;
+const CONCURRENCY = 6;
+const RATE_PER_SECOND = 40;
+
+function startStandInServer() {
+    const stats = { requests: 0, inFlight: 0, maxInFlight: 0, failedOnce: new Set(), sockets: 0 };
+
+    const server = http.createServer((req, res) => {
+        const url = new URL(req.url, 'http://localhost');
+        const tableNumber = url.searchParams.get('tableNumber');
+
+        stats.requests++;
+        stats.inFlight++;
+        stats.maxInFlight = Math.max(stats.maxInFlight, stats.inFlight);
+
+        setTimeout(() => {
+            stats.inFlight--;
+
+            // Every 5th employee fails once with 503 to exercise the retry path
+            const number = parseInt(tableNumber.split('-')[1]);
+            if (number % 5 === 0 && !stats.failedOnce.has(tableNumber)) {
+                stats.failedOnce.add(tableNumber);
+                res.writeHead(503);
+                return res.end('Service Unavailable');
+            }
+
+            res.writeHead(200, { 'Content-Type': 'application/json' });
+            res.end(JSON.stringify([
+                { event_datetime: '2025-05-15T09:00:00', event: '1', object_code: 'TEST_DEPT' },
+                { event_datetime: '2025-05-15T18:00:00', event: '2', object_code: 'TEST_DEPT' }
+            ]));
+        }, 50);
+    });
+
+    server.on('connection', () => stats.sockets++);
+
+    return new Promise(resolve => {
+        server.listen(0, '127.0.0.1', () => resolve({ server, stats }));
+    });
+}
+
+async function testEventFetcher() {
+    console.log('🚀 Testing concurrent event fetcher');
+    console.log('='.repeat(60));
+
+    const { server, stats } = await startStandInServer();
+    const baseUrl = `http://127.0.0.1:${server.address().port}`;
+
+    try {
+        const fetcher = createEventFetcher(baseUrl, {
+            concurrency: CONCURRENCY,
+            ratePerSecond: RATE_PER_SECOND,
+            retryBaseDelay: 20
+        });
+
+        const employees = Array.from({ length: EMPLOYEES }, (_, i) => `TEST-${i + 1}`);
+        let eventsLoaded = 0;
+
+        const startedAt = Date.now();
+        await runWithConcurrency(employees, CONCURRENCY, async (tableNumber) => {
+            const events = await fetcher.fetchEvents({ tableNumber, dateStart: '2025-05-01', dateStop: '2025-05-31' });
+            eventsLoaded += events.length;
+        });
+        const elapsed = (Date.now() - startedAt) / 1000;
+
+        const checks = [
+            ['All events loaded', eventsLoaded === EMPLOYEES * 2],
+            ['Failed requests retried', stats.requests === EMPLOYEES + stats.failedOnce.size],
+            [`In-flight requests never exceeded ${CONCURRENCY}`, stats.maxInFlight <= CONCURRENCY],
+            [`Rate stayed under ${RATE_PER_SECOND} req/s (+ burst)`, stats.requests <= RATE_PER_SECOND * elapsed + RATE_PER_SECOND],
+            ['Keep-alive sockets reused', stats.sockets <= CONCURRENCY]
+        ];
+
+        console.log(`📊 ${stats.requests} requests in ${elapsed.toFixed(2)}s, max in flight ${stats.maxInFlight}, sockets ${stats.sockets}`);
+        checks.forEach(([name, ok]) => console.log(`${ok ? '✅' : '❌'} ${name}`));
+
+        if (checks.some(([, ok]) => !ok)) {
+            process.exitCode = 1;
+        }
+    } catch (error) {
+        console.error('❌ Error:', error.message);
+        process.exitCode = 1;
+    } finally {
+        server.close();
+    }
+}
+
+testEventFetcher().then(() => process.exit());